@@ -0,0 +1,143 @@
+"""Benchmark the read cache: dashboard reads replayed with and without CachedDatabase, per backend"""
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, '.')
+# The global database is swapped per run below; never open the configured one
+os.environ["USE_IN_MEMORY_DB"] = "true"
+os.environ["USE_SQLITE_DB"] = "false"
+
+# Synthetic project: FILES files with SMELLS_PER_FILE smells each and SCANS snapshots of history
+FILES = int(os.getenv("BENCH_FILES", "2000"))
+SMELLS_PER_FILE = int(os.getenv("BENCH_SMELLS_PER_FILE", "10"))
+SCANS = int(os.getenv("BENCH_SCANS", "60"))
+# Reads replayed per run, CONCURRENCY at a time
+REQUESTS = int(os.getenv("BENCH_REQUESTS", "2000"))
+CONCURRENCY = int(os.getenv("BENCH_CONCURRENCY", "8"))
+# MongoDB is only benchmarked on a server given for it, in a scratch database
+# dropped afterwards; never on the application's MONGODB_URI
+BENCH_URI = os.getenv("BENCH_MONGODB_URI")
+BENCH_DB = os.getenv("BENCH_DB_NAME", "codesensex_bench")
+
+
+async def load(db, project_id: str) -> None:
+    """Rows of one scan, its summary, and SCANS snapshots spread over the last days."""
+    from services.summary_service import SummaryService
+
+    metrics = [{"path": f"src/f{i}.py", "loc": i % 900, "sloc": 10, "cyclomatic_max": i % 30,
+                "language": "python"} for i in range(FILES)]
+    risks = [{"path": f"src/f{i}.py", "risk_score": i % 100, "tier": ("Low", "Medium", "High", "Critical")[i % 4]}
+             for i in range(FILES)]
+    smells = [{"path": f"src/f{i}.py", "type": f"T{j}", "severity": j % 5 + 1, "line": j, "message": "m",
+               "fingerprint": f"{i}-{j}"} for i in range(FILES) for j in range(SMELLS_PER_FILE)]
+    await db.upsert_project({"_id": project_id, "name": project_id, "status": "completed"})
+    generation = await db.begin_generation(project_id)
+    await db.set_metrics(project_id, metrics, generation)
+    await db.set_risks(project_id, risks, generation)
+    await db.set_smells(project_id, smells, generation)
+    await db.commit_generation(project_id, generation)
+    start = datetime.utcnow() - timedelta(days=20)
+    for i in range(SCANS):
+        completed_at = (start + timedelta(days=20) * i / SCANS).isoformat()
+        await SummaryService.materialize(project_id, {"_id": f"scan-{i}", "completed_at": completed_at})
+
+
+def requests(project_id: str) -> list:
+    """What a dashboard polls: the endpoints' service calls, with a few parameter variants each."""
+    from services.analytics_service import AnalyticsService
+    from services.history_service import get_trend_data
+
+    return [
+        ("/metrics", lambda: AnalyticsService.fetch_metrics(project_id, 50, None)),
+        ("/metrics", lambda: AnalyticsService.fetch_metrics(project_id, 50, "cyclomatic_max:-1", "path,cyclomatic_max")),
+        ("/risks", lambda: AnalyticsService.fetch_risks(project_id, None, 10, None)),
+        ("/risks", lambda: AnalyticsService.fetch_risks(project_id, "High", 10, None)),
+        ("/smells", lambda: AnalyticsService.fetch_smells(project_id, None, None)),
+        ("/smells", lambda: AnalyticsService.fetch_smells(project_id, 3, None)),
+        ("/history", lambda: get_trend_data(project_id, days=30, limit=30)),
+    ]
+
+
+async def replay(label: str, db, project_id: str) -> None:
+    from services import db as db_module
+
+    db_module._db_instance = db
+    calls = requests(project_id)
+    latencies = {}
+
+    async def one(i: int) -> None:
+        endpoint, call = calls[i % len(calls)]
+        start = time.perf_counter()
+        result = await call()
+        assert not (isinstance(result, dict) and result.get("error")), result
+        latencies.setdefault(endpoint, []).append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    for i in range(0, REQUESTS, CONCURRENCY):
+        await asyncio.gather(*(one(j) for j in range(i, min(i + CONCURRENCY, REQUESTS))))
+    elapsed = time.perf_counter() - start
+
+    stats = db.cache_stats()
+    print(f"  {label:9} {REQUESTS / elapsed:7.0f} req/s | hit rate {stats['hit_rate']:6.1%} "
+          f"({stats['hits']} hits, {stats['misses']} misses)")
+    for endpoint, times in sorted(latencies.items()):
+        times.sort()
+        mean = sum(times) / len(times)
+        p95 = times[int(len(times) * 0.95)]
+        print(f"    {endpoint:9} mean {mean:7.2f} ms | p95 {p95:7.2f} ms")
+
+
+async def bench(inner) -> None:
+    from services import db as db_module
+    from services.cached_db import CachedDatabase
+
+    project_id = "bench"
+    # Written through a cache with nothing kept, so data versions are bumped as in production
+    db_module._db_instance = CachedDatabase(inner, 0)
+    await load(db_module._db_instance, project_id)
+    print(type(inner).__name__)
+    # DB_CACHE_SIZE=0: identical concurrent reads still share one query, nothing is kept
+    await replay("uncached", CachedDatabase(inner, 0), project_id)
+    await replay("cached", CachedDatabase(inner, db_module.DB_CACHE_SIZE or 1000, db_module.DB_CACHE_TTL,
+                                          db_module.DB_CACHE_VERSION_TTL), project_id)
+
+
+async def main() -> None:
+    from services.db import InMemoryDB, MongoDBAtlas
+    from services.sqlite_db import SQLiteDB
+
+    print(f"{FILES} files, {FILES * SMELLS_PER_FILE} smells, {SCANS} scans of history; "
+          f"{REQUESTS} reads, {CONCURRENCY} at a time")
+    await bench(InMemoryDB())
+
+    scratch = tempfile.mkdtemp(prefix="bench_cache_")
+    sqlite = SQLiteDB(os.path.join(scratch, "bench.db"))
+    try:
+        await bench(sqlite)
+    finally:
+        await sqlite.close()
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    if not BENCH_URI:
+        print("MongoDB skipped: set BENCH_MONGODB_URI to a server the benchmark may write to")
+        return
+    # Read by MongoDBAtlas.connect; set after services.db has loaded .env
+    os.environ["MONGODB_URI"] = BENCH_URI
+    os.environ["MONGODB_DB_NAME"] = BENCH_DB
+    mongo = MongoDBAtlas()
+    if not await mongo.connect():
+        return
+    try:
+        await bench(mongo)
+    finally:
+        await mongo._client.drop_database(BENCH_DB)
+        await mongo.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,115 @@
+"""Benchmark clone detection: a full scan, then incremental rescans against the persisted sorted index"""
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, '.')
+
+# Synthetic repository: FILES files of BLOCKS_PER_FILE blocks, each block
+# drawn from a pool where about one draw in DUPLICATE_EVERY repeats a block
+FILES = int(os.getenv("BENCH_FILES", "5000"))
+BLOCKS_PER_FILE = int(os.getenv("BENCH_BLOCKS_PER_FILE", "8"))
+DUPLICATE_EVERY = 20
+LINES_PER_BLOCK = 12
+# Files changed between the two commits of an incremental rescan
+CHANGED = int(os.getenv("BENCH_CHANGED", "20"))
+
+STATEMENTS = (
+    "{a} = {b} + {n}", "{a} = {b} * {c}", "{a} -= {n}", "if {a} > {b}:", "if not {a}:", "while {a} < {n}:",
+    "for {a} in range({n}):", "{a}.append({b})", "return {a}", "{a} = [{b}, {c}]", "{a} = {b}[{n}]",
+    "{a} = {{'{b}': {c}}}", "try:", "except ValueError:", "{a} = {b}({c}, {n})", "del {a}[{n}]",
+    "{a} = {b} if {c} else {n}", "print({a}, {b})", "{a} = len({b}) // {n}", "assert {a} != {b}",
+)
+NAMES = ("items", "total", "value", "node", "count", "result", "key", "data", "index", "row")
+
+
+def make_block(rng: random.Random) -> str:
+    lines = []
+    for _ in range(LINES_PER_BLOCK):
+        a, b, c = rng.sample(NAMES, 3)
+        lines.append("    " + rng.choice(STATEMENTS).format(a=a, b=b, c=c, n=rng.randint(0, 99)))
+    return "\n".join(lines)
+
+
+def make_repo(seed: int = 7) -> dict:
+    rng = random.Random(seed)
+    pool = [make_block(rng) for _ in range(FILES * BLOCKS_PER_FILE // DUPLICATE_EVERY)]
+    files = {}
+    for f in range(FILES):
+        blocks = [rng.choice(pool) if rng.randrange(DUPLICATE_EVERY) == 0 else make_block(rng)
+                  for _ in range(BLOCKS_PER_FILE)]
+        files[f"pkg/module_{f}.py"] = "".join(f"def f{i}():\n{block}\n\n" for i, block in enumerate(blocks))
+    return files
+
+
+def timed(label: str, fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    print(f"  {label}: {(time.perf_counter() - start) * 1000:.0f} ms")
+    return result
+
+
+def bench() -> None:
+    from services.clone_detector import CloneDetector, fingerprint
+    from services.source_reader import SourceReader
+
+    files = make_repo()
+    reader = SourceReader()
+    sources = {path: reader.from_bytes(path, text.encode()) for path, text in files.items()}
+    print(f"{FILES} files, {sum(len(t) for t in files.values()) / 1e6:.1f} MB, {CHANGED} changed per rescan")
+
+    print("\nFull scan")
+    detector = CloneDetector("base")
+
+    def add_all():
+        for source in sources.values():
+            detector.add(source)
+    timed("fingerprint every file", add_all)
+    report = timed("detect (sorts the index once)", detector.detect)
+    duplicated = sum(1 for r in report.values() if r["blocks"])
+    print(f"  {len(detector._keys)} fingerprints, {duplicated} files with duplicated blocks")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index_path = Path(tmp) / "bench.clones"
+        timed("save", detector.save, index_path)
+        print(f"  index file: {index_path.stat().st_size / 1e6:.1f} MB")
+
+        rng = random.Random(11)
+        changed = rng.sample(sorted(files), CHANGED)
+        edits = {path: files[path].replace("return", "yield", 1) + "\n\ndef added():\n" + make_block(rng) + "\n"
+                 for path in changed}
+        new_sources = {path: reader.from_bytes(path, text.encode()) for path, text in edits.items()}
+
+        print("\nIncremental rescan")
+        start = time.perf_counter()
+        loaded = timed("load", CloneDetector.load, index_path)
+        affected = timed("affected_by (old versions)", loaded.affected_by, changed)
+        loaded.remove(changed)
+
+        def add_changed():
+            for source in new_sources.values():
+                loaded.add(source)
+        timed("fingerprint the changed files", add_changed)
+        affected |= timed("affected_by (new versions)", loaded.affected_by, changed)
+        timed(f"detect {len(affected | set(changed))} files", loaded.detect, affected | set(changed))
+        timed("save", loaded.save, index_path)
+        total = time.perf_counter() - start
+        print(f"  whole rescan: {total * 1000:.0f} ms")
+
+        # What every rescan paid before the index was persisted sorted: one global sort of all fingerprints
+        fingerprints = [fingerprint(s)[0] for s in sources.values()]
+
+        def global_sort():
+            keys = []
+            for fp in fingerprints:
+                base = len(keys)
+                keys.extend((h << 32) | (base + i) for i, h in enumerate(fp))
+            keys.sort()
+        timed("one global sort of every fingerprint, as each rescan did before", global_sort)
+
+
+if __name__ == "__main__":
+    bench()
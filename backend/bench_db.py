@@ -0,0 +1,109 @@
+"""Benchmark the database backends: in-memory, SQLite and (when configured) MongoDB"""
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, '.')
+
+# Synthetic project: FILES files with SMELLS_PER_FILE smells each
+FILES = int(os.getenv("BENCH_FILES", "5000"))
+SMELLS_PER_FILE = int(os.getenv("BENCH_SMELLS_PER_FILE", "10"))
+# Single-file reads timed per backend
+FILE_READS = 200
+# MongoDB is only benchmarked on a server given for it, in a scratch database
+# dropped afterwards; never on the application's MONGODB_URI
+BENCH_URI = os.getenv("BENCH_MONGODB_URI")
+BENCH_DB = os.getenv("BENCH_DB_NAME", "codesensex_bench")
+
+
+def make_rows(tag: int = 0) -> tuple:
+    metrics = [{"path": f"src/f{i}.py", "loc": (i + tag) % 900, "sloc": 10, "cyclomatic_max": i % 30,
+                "language": "python"} for i in range(FILES)]
+    risks = [{"path": f"src/f{i}.py", "risk_score": (i + tag) % 100, "tier": "High"} for i in range(FILES)]
+    smells = [{"path": f"src/f{i}.py", "type": f"T{j}", "severity": j % 5 + 1, "line": j, "message": "m",
+               "fingerprint": f"{i}-{j}"} for i in range(FILES) for j in range(SMELLS_PER_FILE)]
+    return metrics, risks, smells
+
+
+async def write(db, project_id: str, rows: tuple, keep_except: list = None) -> None:
+    metrics, risks, smells = rows
+    generation = await db.begin_generation(project_id)
+    await db.set_metrics(project_id, metrics, generation)
+    await db.set_risks(project_id, risks, generation)
+    await db.set_smells(project_id, smells, generation)
+    if keep_except is not None:
+        await db.carry_forward(project_id, generation, keep_except)
+    await db.commit_generation(project_id, generation)
+
+
+async def timed(coro) -> float:
+    start = time.perf_counter()
+    await coro
+    return (time.perf_counter() - start) * 1000
+
+
+async def bench(db) -> None:
+    project_id = "bench"
+    rows = make_rows()
+    full = await timed(write(db, project_id, rows))
+
+    # An incremental scan that changed one file
+    changed = "src/f7.py"
+    one = tuple([r for r in table if r["path"] == changed] for table in make_rows(tag=1))
+    incremental = await timed(write(db, project_id, one, keep_except=[changed]))
+
+    read_all = await timed(db.read_rows(project_id, "smells"))
+
+    async def file_reads():
+        for i in range(0, FILES, max(FILES // FILE_READS, 1)):
+            await db.get_risks(project_id, paths=[f"src/f{i}.py"])
+            await db.get_smells(project_id, paths=[f"src/f{i}.py"])
+    files = await timed(file_reads())
+
+    async def aggregates():
+        await db.smell_counts(project_id)
+        await db.risk_summary(project_id)
+        await db.metric_histogram(project_id, "loc", 100)
+        await db.top_smells(project_id, 25)
+    aggregate = await timed(aggregates())
+
+    print(f"{type(db).__name__:12} full write {full:7.0f} ms | one-file rescan {incremental:6.1f} ms | "
+          f"all smells {read_all:6.0f} ms | {FILE_READS} file reads {files:6.0f} ms | aggregates {aggregate:6.0f} ms")
+
+
+async def main() -> None:
+    from services.db import InMemoryDB, MongoDBAtlas
+    from services.sqlite_db import SQLiteDB
+
+    print(f"{FILES} files, {FILES * SMELLS_PER_FILE} smells")
+    await bench(InMemoryDB())
+
+    scratch = tempfile.mkdtemp(prefix="bench_db_")
+    sqlite = SQLiteDB(os.path.join(scratch, "bench.db"))
+    try:
+        await bench(sqlite)
+    finally:
+        await sqlite.close()
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    if not BENCH_URI:
+        print("MongoDB skipped: set BENCH_MONGODB_URI to a server the benchmark may write to")
+        return
+    # Read by MongoDBAtlas.connect; set after services.db has loaded .env
+    os.environ["MONGODB_URI"] = BENCH_URI
+    os.environ["MONGODB_DB_NAME"] = BENCH_DB
+    mongo = MongoDBAtlas()
+    if not await mongo.connect():
+        return
+    try:
+        await bench(mongo)
+    finally:
+        await mongo._client.drop_database(BENCH_DB)
+        await mongo.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,95 @@
+"""Benchmark the JS/TS analyzer: tree-sitter against the regex fallback, for accuracy and speed"""
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, '.')
+
+# Snippets with known answers: (source, max cyclomatic complexity, function count, smell types)
+CASES = {
+    "identifiers.js": (
+        "function notify(modifier, elsewhere) {\n  const verified = modifier ? 1 : 0\n  return verified\n}\n",
+        2, 1, set()),
+    "strings.js": (
+        "function label() {\n  return 'if else while for && || ?'\n}\n",
+        1, 1, set()),
+    "branches.js": (
+        "function f(a, b) {\n  if (a && b) {\n    for (const x of a) {\n      if (x) { return x }\n    }\n"
+        "  } else if (b || a) {\n    return b ?? a\n  }\n  return null\n}\n",
+        8, 1, set()),
+    "jsx_text.jsx": (
+        "export function App() {\n  return <div title=\"Bug report\">Report a Bug</div>\n}\n",
+        1, 1, set()),
+    "typed_secret.ts": (
+        "const apiKey: string = 'sk_live_1234567890abcdef'\nexport default apiKey\n",
+        1, 0, {"Hardcoded Credentials"}),
+    "eval_call.js": (
+        "function run(code) {\n  return eval(code)\n}\n",
+        1, 1, {"XSS Vulnerability"}),
+    "eval_comment.js": (
+        "// eval(x) is never called here\nfunction ok() {\n  return 1\n}\n",
+        1, 1, set()),
+}
+
+EXTENSIONS = ('.js', '.jsx', '.ts', '.tsx')
+
+
+def parser_name(tree: bool) -> str:
+    return "tree-sitter" if tree else "regex"
+
+
+def accuracy(tree: bool) -> None:
+    """Score one parser against the labeled snippets."""
+    from services import js_syntax
+    from services.repo_analyzer import JavaScriptAnalyzer
+    from services.source_reader import SourceReader
+
+    js_syntax.USE_TREE_SITTER = tree
+    reader = SourceReader()
+    correct = 0
+    print(f"\n{parser_name(tree)} accuracy")
+    for name, (source, complexity, functions, smells) in CASES.items():
+        metrics, found, _ = JavaScriptAnalyzer.analyze_source(reader.from_bytes(name, source.encode()))
+        got = (metrics.cyclomatic_max, metrics.fn_count, {s.type for s in found})
+        ok = got == (complexity, functions, smells)
+        correct += ok
+        if not ok:
+            print(f"  wrong on {name}: complexity {got[0]} (want {complexity}), functions {got[1]} (want {functions}), "
+                  f"smells {sorted(got[2])} (want {sorted(smells)})")
+    print(f"  {correct}/{len(CASES)} snippets correct")
+
+
+def speed(tree: bool, files: list, root: Path) -> None:
+    """Time one parser over real sources, already read and decoded."""
+    from services import js_syntax
+    from services.repo_analyzer import JavaScriptAnalyzer
+    from services.source_reader import SourceReader
+
+    js_syntax.USE_TREE_SITTER = tree
+    reader = SourceReader()
+    sources = [reader.open(f, str(f.relative_to(root))) for f in files]
+    for s in sources:
+        s.text, s.lines
+
+    start = time.perf_counter()
+    smells = sum(len(JavaScriptAnalyzer.analyze_source(s)[1]) for s in sources)
+    elapsed = time.perf_counter() - start
+    print(f"  {parser_name(tree)}: {elapsed * 1000 / len(sources):.2f} ms/file, {smells} smells")
+
+
+if __name__ == "__main__":
+    from services import js_syntax
+
+    if not js_syntax.available():
+        print("tree-sitter grammars not installed; only the regex fallback can run")
+        sys.exit(1)
+
+    for tree in (True, False):
+        accuracy(tree)
+
+    # Defaults to the frontend of this repository
+    root = Path(sys.argv[1] if len(sys.argv) > 1 else "../frontend").resolve()
+    files = [p for p in root.rglob('*') if p.suffix in EXTENSIONS and 'node_modules' not in p.parts]
+    print(f"\n{root}: {len(files)} JS/TS files")
+    for tree in (True, False):
+        speed(tree, files, root)
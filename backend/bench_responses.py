@@ -0,0 +1,108 @@
+"""Benchmark response encoding: JSON encoders, compression, and the streamed /smells endpoint"""
+import asyncio
+import gzip
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, '.')
+# The endpoint is timed on a throwaway in-memory database, never the configured one
+os.environ["USE_IN_MEMORY_DB"] = "true"
+os.environ["USE_SQLITE_DB"] = "false"
+
+# Synthetic listing of SMELLS smells over FILES files
+SMELLS = int(os.getenv("BENCH_SMELLS", "100000"))
+FILES = 1000
+TYPES = ("Long Method", "Deep Nesting", "Magic Number", "Duplicated Block")
+
+
+def make_smells(project_id: str) -> list:
+    return [
+        {
+            "project_id": project_id,
+            "path": f"src/pkg{i % 300}/mod{i % FILES}.py",
+            "type": TYPES[i % len(TYPES)],
+            "severity": i % 5 + 1,
+            "line": i % 700,
+            "message": f"Function has {i % 50} statements which exceeds the threshold",
+            "fingerprint": f"{i:016x}"
+        }
+        for i in range(SMELLS)
+    ]
+
+
+def timed(label: str, fn) -> object:
+    start = time.perf_counter()
+    result = fn()
+    print(f"  {label}: {(time.perf_counter() - start) * 1000:.0f} ms")
+    return result
+
+
+def encoders(smells: list) -> bytes:
+    """The whole listing through FastAPI's default encoding, orjson, and the streamed encoder."""
+    from fastapi.encoders import jsonable_encoder
+    from services.http_encoding import dumps, orjson, stream_json_object
+
+    head = {"project_id": "bench", "total": len(smells), "affected_files": FILES, "types": []}
+    content = {**head, "items": smells}
+    print("\nencoding")
+    default = timed("jsonable_encoder + json.dumps", lambda: json.dumps(jsonable_encoder(content)).encode())
+    fast = timed(f"dumps ({'orjson' if orjson else 'json fallback'})", lambda: dumps(content))
+
+    async def batches():
+        for i in range(0, len(smells), 1000):
+            yield smells[i:i + 1000]
+
+    async def collect():
+        return b"".join([chunk async for chunk in stream_json_object(head, "items", batches())])
+    streamed = timed("stream_json_object, 1000-row batches", lambda: asyncio.run(collect()))
+    assert json.loads(streamed) == json.loads(fast) == json.loads(default), "encoders disagree"
+    return fast
+
+
+def compression(body: bytes) -> None:
+    from services.http_encoding import brotli
+
+    print(f"\ncompression of {len(body) / 1e6:.1f} MB")
+    for level in (1, 6):
+        out = timed(f"gzip {level}", lambda: gzip.compress(body, level))
+        print(f"    {len(out) / 1e6:.2f} MB ({len(body) / len(out):.1f}x)")
+    if brotli is None:
+        print("  brotli not installed")
+        return
+    for quality in (4, 11):
+        out = timed(f"brotli {quality}", lambda: brotli.compress(body, quality=quality))
+        print(f"    {len(out) / 1e6:.2f} MB ({len(body) / len(out):.1f}x)")
+
+
+def endpoint(smells: list) -> None:
+    """GET /smells/<project> through the app, middleware included, per Accept-Encoding."""
+    from fastapi.testclient import TestClient
+    import main
+    from services.db import get_database
+
+    async def load(db):
+        generation = await db.begin_generation("bench")
+        await db.set_smells("bench", smells, generation)
+        await db.commit_generation("bench", generation)
+
+    print("\nGET /smells/bench")
+    with TestClient(main.app) as client:
+        client.portal.call(load, get_database())
+        # The test client buffers the body, so this is time to the complete response
+        for encoding in ("identity", "gzip", "br"):
+            start = time.perf_counter()
+            with client.stream("GET", "/smells/bench", headers={"Accept-Encoding": encoding}) as response:
+                size = sum(len(chunk) for chunk in response.iter_raw())
+                used = response.headers.get("content-encoding", "identity")
+            elapsed = time.perf_counter() - start
+            print(f"  Accept-Encoding {encoding:8}: sent {used:8} {size / 1e6:6.2f} MB in {elapsed * 1000:5.0f} ms")
+
+
+if __name__ == "__main__":
+    smells = make_smells("bench")
+    print(f"{len(smells)} smells over {FILES} files")
+    body = encoders(smells)
+    compression(body)
+    endpoint(smells)
@@ -0,0 +1,101 @@
+"""Benchmark MongoDB smell layouts: one document per smell against one bucket per file"""
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, '.')
+
+# Synthetic project: FILES files with SMELLS_PER_FILE smells each
+FILES = int(os.getenv("BENCH_FILES", "2000"))
+SMELLS_PER_FILE = int(os.getenv("BENCH_SMELLS_PER_FILE", "50"))
+# Single-file reads timed per layout
+FILE_READS = 200
+# Server and scratch database to benchmark on, dropped afterwards; never taken
+# from the application's MONGODB_URI so a benchmark cannot land on production
+BENCH_URI = os.getenv("BENCH_MONGODB_URI")
+BENCH_DB = os.getenv("BENCH_DB_NAME", "codesensex_bench")
+
+TYPES = ("Long Method", "Deep Nesting", "Magic Number", "Duplicated Block", "Unused Import")
+
+
+def make_smells(project_id: str) -> list:
+    rng = random.Random(7)
+    return [
+        {
+            "project_id": project_id,
+            "path": f"src/module_{f}.py",
+            "type": rng.choice(TYPES),
+            "severity": rng.randint(1, 5),
+            "line": line,
+            "message": "synthetic smell for the layout benchmark",
+            "suggestion": "nothing to do",
+            "fingerprint": f"{f}:{line}"
+        }
+        for f in range(FILES) for line in range(1, SMELLS_PER_FILE + 1)
+    ]
+
+
+async def timed(label: str, coro) -> object:
+    start = time.perf_counter()
+    result = await coro
+    print(f"  {label}: {(time.perf_counter() - start) * 1000:.0f} ms")
+    return result
+
+
+async def bench_layout(db, layout: str, smells: list) -> None:
+    project_id = f"bench-{layout}"
+    collection = db._smell_collection
+    print(f"\n{layout} layout ({collection})")
+
+    async def write():
+        generation = await db.begin_generation(project_id)
+        await db.set_smells(project_id, [dict(s) for s in smells], generation)
+        await db.commit_generation(project_id, generation)
+    await timed(f"write {len(smells)} smells", write())
+
+    rows = await timed("read the project", db.read_rows(project_id, "smells"))
+    assert len(rows) == len(smells), f"read {len(rows)} of {len(smells)} smells"
+
+    paths = [f"src/module_{f}.py" for f in random.Random(11).sample(range(FILES), min(FILE_READS, FILES))]
+
+    async def file_reads():
+        for path in paths:
+            await db.get_smells(project_id, paths=[path])
+    await timed(f"{len(paths)} single-file reads", file_reads())
+    await timed("smell_counts", db.smell_counts(project_id))
+    await timed("top_smells(25)", db.top_smells(project_id, 25))
+
+    stats = await db._db.command("collStats", collection)
+    print(f"  {stats['count']} documents, {stats['size'] / 1e6:.1f} MB data, "
+          f"{stats.get('storageSize', 0) / 1e6:.1f} MB on disk, {stats['totalIndexSize'] / 1e6:.1f} MB indexes")
+
+
+async def bench() -> int:
+    if not BENCH_URI:
+        print("Set BENCH_MONGODB_URI to a MongoDB the benchmark may write to (it uses the scratch database "
+              f"{BENCH_DB} and drops it afterwards)")
+        return 1
+    from services.db import MongoDBAtlas
+    # Read by MongoDBAtlas.connect; set after services.db has loaded .env
+    os.environ["MONGODB_URI"] = BENCH_URI
+    os.environ["MONGODB_DB_NAME"] = BENCH_DB
+
+    smells = make_smells("bench")
+    print(f"{FILES} files x {SMELLS_PER_FILE} smells = {len(smells)} smells")
+    for layout in ("document", "bucketed"):
+        db = MongoDBAtlas()
+        db._bucketed = layout == "bucketed"
+        if not await db.connect():
+            return 1
+        try:
+            await bench_layout(db, layout, smells)
+        finally:
+            await db._client.drop_database(BENCH_DB)
+            await db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(bench()))
@@ -0,0 +1,12 @@
+from fastapi import APIRouter
+from services.analytics_service import AnalyticsService
+
+router = APIRouter()
+
+@router.get("/{project_id}")
+async def get_top_functions(project_id: str, top: int = 100, min_complexity: int = 1):
+    return await AnalyticsService.fetch_top_functions(project_id, top, min_complexity)
+
+@router.get("/{project_id}/file/{path:path}")
+async def get_file_functions(project_id: str, path: str):
+    return await AnalyticsService.fetch_file_functions(project_id, path)
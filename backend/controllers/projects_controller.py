@@ -0,0 +1,12 @@
+from fastapi import APIRouter, HTTPException
+from services.overview_service import OverviewService
+
+router = APIRouter()
+
+@router.get("/{project_id}/overview")
+async def get_overview(project_id: str, include: str | None = None, limit: int = 50,
+                       sort: str | None = None, top: int = 10, days: int = 30):
+    result = await OverviewService.fetch_overview(project_id, include, limit, sort, top, days)
+    if "error" in result:
+        raise HTTPException(status_code=400, detail=result["error"])
+    return result
@@ -1,8 +1,12 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
 from services.analytics_service import AnalyticsService
+from models.schemas import RisksPage
 
 router = APIRouter()
 
-@router.get("/{project_id}")
-async def get_risks(project_id: str, tier: str | None = None, top: int = 10):
-    return await AnalyticsService.fetch_risks(project_id, tier, top)
+@router.get("/{project_id}", response_model=RisksPage, response_model_exclude_unset=True)
+async def get_risks(project_id: str, tier: str | None = None, top: int = 10, fields: str | None = None):
+    result = await AnalyticsService.fetch_risks(project_id, tier, top, fields)
+    if "error" in result:
+        raise HTTPException(status_code=400, detail=result["error"])
+    return result
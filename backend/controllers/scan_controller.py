@@ -27,5 +27,8 @@ async def scan_project(req: ScanRequest):
         "completed_at": result.get("completed_at"),
         "summary": result.get("summary", {}),
         "files_analyzed": result.get("files_analyzed", 0),
-        "smells_found": result.get("smells_found", 0)
+        "smells_found": result.get("smells_found", 0),
+        "commit_sha": result.get("commit_sha"),
+        "mode": result.get("mode", "full"),
+        "cache": result.get("cache", "miss")
     }
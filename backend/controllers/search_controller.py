@@ -0,0 +1,17 @@
+from fastapi import APIRouter, HTTPException
+from services.search_service import search_issues
+
+router = APIRouter()
+
+@router.get("/{project_id}")
+async def search(project_id: str, q: str = "", path: str | None = None, limit: int = 10):
+    if not q.strip() and not path:
+        raise HTTPException(status_code=400, detail="Pass a query (q) or a file path")
+    items = await search_issues(project_id, q, path, limit)
+    return {
+        "project_id": project_id,
+        "query": q,
+        "path": path,
+        "total": len(items),
+        "items": items
+    }
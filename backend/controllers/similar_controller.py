@@ -0,0 +1,12 @@
+from fastapi import APIRouter, HTTPException
+from services.similarity_service import find_similar
+
+router = APIRouter()
+
+@router.get("/{project_id}/{path:path}")
+async def get_similar(project_id: str, path: str, function: str | None = None,
+                      line: int | None = None, limit: int = 10):
+    result = await find_similar(project_id, path, function, line, limit)
+    if "error" in result:
+        raise HTTPException(status_code=404, detail=result["error"])
+    return result
@@ -1,8 +1,17 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from services.analytics_service import AnalyticsService
+from services.http_encoding import stream_json_object
+from models.schemas import SmellsPage
 
 router = APIRouter()
 
-@router.get("/{project_id}")
-async def get_smells(project_id: str, severity: int | None = None):
-    return await AnalyticsService.fetch_smells(project_id, severity)
+# Streamed, so the model documents the response rather than validating it
+@router.get("/{project_id}", response_model=SmellsPage)
+async def get_smells(project_id: str, severity: int | None = None, fields: str | None = None):
+    # Items are encoded batch by batch as the database yields them, their counts after them
+    listing = AnalyticsService.stream_smells(project_id, severity, fields)
+    if "error" in listing:
+        raise HTTPException(status_code=400, detail=listing["error"])
+    body = stream_json_object(listing["head"], "items", listing["items"], listing["tail"])
+    return StreamingResponse(body, media_type="application/json")
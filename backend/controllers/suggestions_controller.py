@@ -1,8 +1,11 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
 from services.llm_service import LLMService
 
 router = APIRouter()
 
 @router.get("/{project_id}/{file_id}")
 async def get_suggestions(project_id: str, file_id: str, limit: int = 5):
-    return await LLMService.fetch_suggestions(project_id, file_id, limit)
+    result = await LLMService.fetch_suggestions(project_id, file_id, limit)
+    if "error" in result:
+        raise HTTPException(status_code=404, detail=result["error"])
+    return result
@@ -1,6 +1,6 @@
-from fastapi import APIRouter, UploadFile, File
+from fastapi import APIRouter, UploadFile, File, HTTPException
 from pydantic import BaseModel, HttpUrl
-from services.repo_service import RepoService
+from services.repo_service import RepoService, UploadError
 
 router = APIRouter()
 
@@ -16,5 +16,8 @@ async def upload_repo(req: UploadRequest):
 
 @router.post("/repo/file", status_code=202)
 async def upload_zip(file: UploadFile = File(...)):
-    project_id = await RepoService.queue_zip(file)
+    try:
+        project_id = await RepoService.queue_zip(file)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     return {"project_id": project_id, "status": "queued"}
@@ -1,5 +1,6 @@
+import os
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import Optional
@@ -11,10 +12,18 @@ from controllers.risks_controller import router as risks_router
 from controllers.smells_controller import router as smells_router
 from controllers.suggestions_controller import router as suggestions_router
 from controllers.report_controller import router as report_router
+from controllers.functions_controller import router as functions_router
+from controllers.projects_controller import router as projects_router
+from controllers.search_controller import router as search_router
+from controllers.similar_controller import router as similar_router
 from services.db import get_database
 from services.dependency_service import get_dependency_graph
-from services.history_service import get_trend_data, get_comparison_data
-from services.chatbot_service import chat_with_assistant, clear_chat_session
+from services.history_service import get_trend_data, get_file_trend, get_comparison_data
+from services.chatbot_service import chat_with_assistant, clear_chat_session, chat_session_stats
+from services.search_service import search_index_stats
+from services.single_flight import single_flight_stats
+from services.http_cache import conditional_get
+from services.http_encoding import FastJSONResponse, CompressionMiddleware
 
 
 # Pydantic models for new endpoints
@@ -38,7 +47,8 @@ app = FastAPI(
     title="Deep Lynctus Backend",
     version="0.2.0",
     description="AI-Powered Code Quality & Bug Risk Analyzer",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
 )
 
 app.add_middleware(
@@ -49,6 +59,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# ETag / 304 on project reads
+app.middleware("http")(conditional_get)
+
+# br / gzip for larger responses, streamed ones included
+app.add_middleware(CompressionMiddleware, minimum_size=int(os.getenv("COMPRESS_MIN_BYTES", "1024")))
+
 app.include_router(upload_router, prefix="/upload", tags=["upload"])
 app.include_router(scan_router, prefix="/scan", tags=["scan"])
 app.include_router(metrics_router, prefix="/metrics", tags=["metrics"])
@@ -56,6 +72,10 @@ app.include_router(risks_router, prefix="/risks", tags=["risks"])
 app.include_router(smells_router, prefix="/smells", tags=["smells"])
 app.include_router(suggestions_router, prefix="/suggestions", tags=["suggestions"])
 app.include_router(report_router, prefix="/report", tags=["report"])
+app.include_router(functions_router, prefix="/functions", tags=["functions"])
+app.include_router(projects_router, prefix="/projects", tags=["projects"])
+app.include_router(search_router, prefix="/search", tags=["search"])
+app.include_router(similar_router, prefix="/similar", tags=["similar"])
 
 
 # ============== Dependency Graph Endpoints ==============
@@ -73,30 +93,42 @@ async def get_dependencies(project_id: str):
 
 # ============== History & Trends Endpoints ==============
 @app.get("/history/{project_id}", tags=["history"])
-async def get_scan_history(project_id: str, limit: int = 30):
+async def get_scan_history(project_id: str, limit: int = 30, since: Optional[str] = None, until: Optional[str] = None):
     """Get scan history for a project."""
     try:
-        trends = await get_trend_data(project_id, days=30, limit=limit)
-        return {"project_id": project_id, "scans": trends.get("scans", [])}
+        trends = await get_trend_data(project_id, days=30, limit=limit, since=since, until=until)
+        return {"project_id": project_id, "total_scans": trends.get("total_scans", 0), "scans": trends.get("scans", [])}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/history/{project_id}/trends", tags=["history"])
-async def get_project_trends(project_id: str):
+async def get_project_trends(project_id: str, days: int = 30, limit: int = 50,
+                             since: Optional[str] = None, until: Optional[str] = None):
     """Get trend analysis for a project."""
     try:
-        trends = await get_trend_data(project_id)
+        trends = await get_trend_data(project_id, days=days, limit=limit, since=since, until=until)
         return trends
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/history/{project_id}/file/{path:path}", tags=["history"])
+async def get_project_file_trend(project_id: str, path: str, limit: int = 50,
+                                 since: Optional[str] = None, until: Optional[str] = None):
+    """Get the key metrics of one file across scans."""
+    try:
+        return await get_file_trend(project_id, path, limit=limit, since=since, until=until)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.get("/history/{project_id}/compare", tags=["history"])
-async def compare_scans(project_id: str):
-    """Compare current scan with previous."""
+async def compare_scans(project_id: str, from_scan: Optional[str] = Query(None, alias="from"),
+                        to_scan: Optional[str] = Query(None, alias="to"), limit: int = 500):
+    """Compare two scans by id; defaults to the current scan and the one before it."""
     try:
-        comparison = await get_comparison_data(project_id)
+        comparison = await get_comparison_data(project_id, from_scan, to_scan, limit)
         if not comparison:
             raise HTTPException(status_code=404, detail="Scans not found")
         return comparison
@@ -129,6 +161,20 @@ async def clear_chat(project_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/cache/stats", tags=["health"])
+async def get_cache_stats():
+    """Hit rate and size of the database result cache, calls coalesced per kind of work, chat sessions and search indexes."""
+    db = get_database()
+    cache = db.cache_stats() if hasattr(db, "cache_stats") else {"max_entries": 0}
+    return {
+        "enabled": cache["max_entries"] > 0,
+        **cache,
+        "single_flight": single_flight_stats(),
+        "chat_sessions": chat_session_stats(),
+        "search_indexes": search_index_stats()
+    }
+
+
 @app.get("/")
 def root():
     return {"service": "deep-lynctus", "status": "ok"}
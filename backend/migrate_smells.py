@@ -0,0 +1,23 @@
+"""Move stored smells into the layout selected by MONGO_SMELL_LAYOUT"""
+import asyncio
+import sys
+sys.path.insert(0, '.')
+
+async def migrate(project_id=None):
+    from services.db import get_database, SMELL_LAYOUT
+    
+    db = get_database()
+    if not hasattr(db, 'migrate_smell_layout'):
+        print(f"{type(db).__name__} has no smell layouts to migrate")
+        return
+    
+    if not await db.connect():
+        print("Could not connect to MongoDB")
+        return
+    
+    moved = await db.migrate_smell_layout(project_id)
+    print(f"Moved {moved} smells into the {SMELL_LAYOUT} layout")
+    await db.close()
+
+if __name__ == "__main__":
+    asyncio.run(migrate(sys.argv[1] if len(sys.argv) > 1 else None))
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List, Dict
+from typing import Optional, List
 
 class Project(BaseModel):
     id: str = Field(alias="_id")
@@ -9,36 +9,62 @@ class Project(BaseModel):
     languages: List[str] = []
     status: str = "queued"
 
+# Rows as the read endpoints return them. Every field is optional because a
+# request may select a subset (?fields=path,risk_score); unset fields are
+# left out of the response rather than sent as null.
+
 class FileMetric(BaseModel):
-    id: str = Field(alias="_id")
-    project_id: str
-    path: str
-    language: str
-    loc: int
-    avg_fn_len: float
-    cyclomatic_avg: float
-    cyclomatic_max: int
-    nesting_max: int
-    dup_ratio: float
-    comment_ratio: float
-    fn_count: int
+    path: Optional[str] = None
+    language: Optional[str] = None
+    loc: Optional[int] = None
+    sloc: Optional[int] = None
+    cyclomatic_avg: Optional[float] = None
+    cyclomatic_max: Optional[int] = None
+    nesting_max: Optional[int] = None
+    dup_ratio: Optional[float] = None
+    comment_ratio: Optional[float] = None
+    fn_count: Optional[int] = None
+    class_count: Optional[int] = None
 
 class CodeSmell(BaseModel):
-    id: str = Field(alias="_id")
-    project_id: str
-    path: str
-    smell_type: str
-    severity: int
-    message: str
-    start_line: int
-    end_line: int
+    path: Optional[str] = None
+    type: Optional[str] = None
+    severity: Optional[int] = None
+    line: Optional[int] = None
+    message: Optional[str] = None
+    suggestion: Optional[str] = None
+    fingerprint: Optional[str] = None
 
 class RiskScore(BaseModel):
-    id: str = Field(alias="_id")
+    path: Optional[str] = None
+    risk_score: Optional[int] = None
+    tier: Optional[str] = None
+    top_features: Optional[List[str]] = None
+
+class MetricsPage(BaseModel):
+    project_id: str
+    metrics: List[FileMetric]
+    total: int
+    updated_at: str
+
+class RiskTotals(BaseModel):
+    avg_risk: int
+    high: int
+    critical: int
+    total: int
+
+class RisksPage(BaseModel):
+    project_id: str
+    summary: RiskTotals
+    items: List[RiskScore]
+
+class SmellTypeCount(BaseModel):
+    name: str
+    count: int
+
+class SmellsPage(BaseModel):
     project_id: str
-    path: str
-    model_version: str
-    proba: float
-    risk_score: int
-    tier: str
-    top_features: List[Dict]
+    total: int
+    affected_files: int
+    types: List[SmellTypeCount]
+    items: List[CodeSmell]
@@ -1,26 +1,58 @@
-from .db import get_database
+from .db import get_database, function_record, select_fields
+from .summary_service import SummaryService, TIERS
+from .diff_service import KEY_METRICS
+from models.schemas import FileMetric, CodeSmell, RiskScore
 import traceback
 
+# Upper bound for the function leaderboard
+MAX_TOP_FUNCTIONS = 1000
+# Fields a histogram can be requested for, and the table holding them
+HISTOGRAM_FIELDS = {**{field: "metrics" for field in KEY_METRICS}, "risk_score": "risks"}
+
 class AnalyticsService:
     @staticmethod
-    async def fetch_metrics(project_id: str, limit: int, sort: str | None):
+    def parse_fields(fields: str | None, model) -> list[str] | None:
+        """
+        ?fields=path,risk_score as a list of the model's fields; None (or empty)
+        selects them all. Raises ValueError naming any unknown field.
+        """
+        if not fields:
+            return None
+        selected = list(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+        unknown = [f for f in selected if f not in model.model_fields]
+        if unknown:
+            raise ValueError(f"Unknown field(s) {', '.join(unknown)}. Use any of: {', '.join(model.model_fields)}")
+        return selected or None
+
+    @staticmethod
+    async def fetch_metrics(project_id: str, limit: int, sort: str | None, fields: str | None = None):
+        try:
+            selected = AnalyticsService.parse_fields(fields, FileMetric)
+        except ValueError as e:
+            return {"error": str(e)}
         try:
             db = get_database()
             # Ensure connected
             if hasattr(db, '_connected') and not db._connected:
                 await db.connect()
-            metrics = await db.get_metrics(project_id)
             # naive sort parser like "cyclomatic_max:-1"
-            if sort:
+            sort_field, direction = (sort.split(":", 1) + [""])[:2] if sort else (None, "")
+            # Read the sort key too when it was not selected, and drop it after the cut
+            read = selected
+            if selected is not None and sort_field and sort_field not in selected:
+                read = [*selected, sort_field]
+            metrics = await db.get_metrics(project_id, fields=read)
+            if sort_field:
                 try:
-                    field, direction = sort.split(":")
-                    reverse = direction.strip() == "-1"
-                    metrics = sorted(metrics, key=lambda m: m.get(field, 0), reverse=reverse)
+                    metrics = sorted(metrics, key=lambda m: m.get(sort_field, 0), reverse=direction.strip() == "-1")
                 except Exception:
                     pass
+            page = metrics[:limit]
+            if read is not selected:
+                page = [select_fields(m, selected) for m in page]
             return {
                 "project_id": project_id,
-                "metrics": metrics[:limit],
+                "metrics": page,
                 "total": len(metrics),
                 "updated_at": "now"
             }
@@ -30,26 +62,72 @@ class AnalyticsService:
             raise
 
     @staticmethod
-    async def fetch_risks(project_id: str, tier: str | None, top: int):
+    async def fetch_metric_histogram(project_id: str, field: str, bucket_size: float):
+        try:
+            if field not in HISTOGRAM_FIELDS:
+                return {"error": f"Unknown field '{field}'. Use one of: {', '.join(sorted(HISTOGRAM_FIELDS))}"}
+            if bucket_size <= 0:
+                return {"error": "bucket must be positive"}
+            db = get_database()
+            if hasattr(db, '_connected') and not db._connected:
+                await db.connect()
+            histogram = await db.metric_histogram(project_id, field, bucket_size, table=HISTOGRAM_FIELDS[field])
+            buckets = sorted(histogram.items(), key=lambda item: float(item[0]))
+            return {
+                "project_id": project_id,
+                "field": field,
+                "bucket_size": bucket_size,
+                "total": sum(histogram.values()),
+                "buckets": [{"from": float(key), "count": count} for key, count in buckets]
+            }
+        except Exception as e:
+            print(f"Error in fetch_metric_histogram: {e}")
+            traceback.print_exc()
+            raise
+
+    @staticmethod
+    async def fetch_risks(project_id: str, tier: str | None, top: int, fields: str | None = None,
+                          summary: dict | None = None):
+        try:
+            selected = AnalyticsService.parse_fields(fields, RiskScore)
+        except ValueError as e:
+            return {"error": str(e)}
         try:
             db = get_database()
             if hasattr(db, '_connected') and not db._connected:
                 await db.connect()
-            items = await db.get_risks(project_id)
+            if summary is None:
+                summary = await SummaryService.get(project_id) or {}
+            tiers = summary.get("tiers", {})
             if tier:
-                items = [i for i in items if i.get("tier", "").lower() == tier.lower()]
-            avg = round(sum(i.get("risk_score", 0) for i in items) / max(len(items), 1)) if items else 0
-            high_count = sum(1 for i in items if i.get("tier") == "High")
-            critical_count = sum(1 for i in items if i.get("tier") == "Critical")
+                names = [t for t in TIERS if t.lower() == tier.lower()]
+            else:
+                names = list(TIERS)
+            total = sum(tiers.get(t, 0) for t in names)
+            risk_total = sum(summary.get("tier_risk_totals", {}).get(t, 0) for t in names)
+
+            # The summary keeps the riskiest files; deeper or per-tier listings read the rows
+            top_risks = summary.get("top_risks", [])
+            if not tier and (top <= len(top_risks) or len(top_risks) >= total):
+                items = top_risks[:top]
+            else:
+                # Tier and score are needed to filter and rank, whatever was selected
+                read = None if selected is None else list(dict.fromkeys([*selected, "tier", "risk_score"]))
+                items = await db.get_risks(project_id, fields=read)
+                if tier:
+                    items = [i for i in items if i.get("tier", "").lower() == tier.lower()]
+                items = sorted(items, key=lambda x: x.get("risk_score", 0), reverse=True)[:top]
+            if selected is not None:
+                items = [select_fields(i, selected) for i in items]
             return {
                 "project_id": project_id,
                 "summary": {
-                    "avg_risk": avg,
-                    "high": high_count,
-                    "critical": critical_count,
-                    "total": len(items)
+                    "avg_risk": round(risk_total / total) if total else 0,
+                    "high": tiers.get("High", 0) if "High" in names else 0,
+                    "critical": tiers.get("Critical", 0) if "Critical" in names else 0,
+                    "total": total
                 },
-                "items": sorted(items, key=lambda x: x.get("risk_score", 0), reverse=True)[:top]
+                "items": items
             }
         except Exception as e:
             print(f"Error in fetch_risks: {e}")
@@ -57,37 +135,110 @@ class AnalyticsService:
             raise
 
     @staticmethod
-    async def fetch_smells(project_id: str, severity: int | None = None):
+    async def fetch_smells(project_id: str, severity: int | None = None, fields: str | None = None,
+                           summary: dict | None = None):
+        """Smell counts of the project's summary, as the overview shows them; /smells streams its own (stream_smells)."""
+        try:
+            AnalyticsService.parse_fields(fields, CodeSmell)
+        except ValueError as e:
+            return {"error": str(e)}
         try:
             db = get_database()
             if hasattr(db, '_connected') and not db._connected:
                 await db.connect()
-            smells = await db.get_smells(project_id)
-            if severity is not None:
-                smells = [s for s in smells if s.get("severity", 0) >= severity]
-            
-            # Group by type
-            type_counts = {}
-            for s in smells:
-                t = s.get("type", "Unknown")
-                type_counts[t] = type_counts.get(t, 0) + 1
-            
+            if summary is None:
+                summary = await SummaryService.get(project_id) or {}
+            # Histograms are kept per "severity >= N"
+            key = str(max(severity or 1, 1))
+            type_counts = summary.get("smell_types_at_least", {}).get(key, {})
             smell_types = [
                 {"name": name, "count": count}
                 for name, count in type_counts.items()
             ]
-            
-            # Get unique affected files (check both "path" and "file_path" for compatibility)
-            affected_files = len(set(s.get("path", s.get("file_path", "")) for s in smells))
-            
+
             return {
                 "project_id": project_id,
-                "total": len(smells),
-                "affected_files": affected_files,
-                "types": smell_types,
-                "items": smells
+                "total": sum(type_counts.values()),
+                "affected_files": summary.get("affected_files_at_least", {}).get(key, 0),
+                "types": smell_types
             }
         except Exception as e:
             print(f"Error in fetch_smells: {e}")
             traceback.print_exc()
             raise
+
+    @staticmethod
+    def stream_smells(project_id: str, severity: int | None = None, fields: str | None = None):
+        """
+        The smells listing as one read: {"head", "items", "tail"}, items in
+        batches straight from the database cursor. The counts in tail() are
+        tallied from those same rows once they were consumed, so total,
+        affected_files and types always describe exactly the items sent, even
+        when a scan commits while they stream. {"error"} for unknown fields.
+        """
+        try:
+            # The response model is not applied to a stream, so its fields are always projected
+            selected = AnalyticsService.parse_fields(fields, CodeSmell) or list(CodeSmell.model_fields)
+        except ValueError as e:
+            return {"error": str(e)}
+        # Type and path are read for the counts even when not selected, and dropped before encoding
+        extra = [f for f in ("type", "path") if f not in selected]
+        types: dict[str, int] = {}
+        paths: set = set()
+
+        async def items():
+            async for batch in get_database().iter_smells(project_id, severity, fields=selected + extra):
+                for row in batch:
+                    smell_type = row.get("type", "Unknown")
+                    types[smell_type] = types.get(smell_type, 0) + 1
+                    paths.add(row.get("path", ""))
+                yield [select_fields(row, selected) for row in batch] if extra else batch
+
+        def tail():
+            return {
+                "total": sum(types.values()),
+                "affected_files": len(paths),
+                "types": [{"name": name, "count": count}
+                          for name, count in sorted(types.items(), key=lambda t: (-t[1], t[0]))]
+            }
+
+        return {"head": {"project_id": project_id}, "items": items(), "tail": tail}
+
+    @staticmethod
+    async def fetch_top_functions(project_id: str, top: int, min_complexity: int = 1):
+        try:
+            db = get_database()
+            if hasattr(db, '_connected') and not db._connected:
+                await db.connect()
+            top = max(1, min(top, MAX_TOP_FUNCTIONS))
+            items = await db.top_functions(project_id, top, min_complexity)
+            return {
+                "project_id": project_id,
+                "top": top,
+                "min_complexity": min_complexity,
+                "items": items
+            }
+        except Exception as e:
+            print(f"Error in fetch_top_functions: {e}")
+            traceback.print_exc()
+            raise
+
+    @staticmethod
+    async def fetch_file_functions(project_id: str, path: str):
+        try:
+            db = get_database()
+            if hasattr(db, '_connected') and not db._connected:
+                await db.connect()
+            buckets = await db.get_functions(project_id, paths=[path])
+            items = [function_record(b, i) for b in buckets for i in range(b.get("count", 0))]
+            items.sort(key=lambda f: f.get("line", 0))
+            return {
+                "project_id": project_id,
+                "path": path,
+                "total": len(items),
+                "items": items
+            }
+        except Exception as e:
+            print(f"Error in fetch_file_functions: {e}")
+            traceback.print_exc()
+            raise
@@ -0,0 +1,310 @@
+"""
+Read-through cache in front of a DatabaseInterface.
+
+The dashboard asks for the same project's metrics, risks, smells and history
+over and over, and between scans the answers do not change. CachedDatabase
+keeps recent read results per project in a size-bounded LRU with a TTL.
+Whenever something readers can see is written (set_* into the current
+generation, commit_generation, upsert_project, the summary, snapshots and
+diffs) it bumps the project's data version in the database and drops its
+own entries. Entries are keyed on that version. Reads check it against the
+database at most once per version_ttl seconds per project, so a hit costs no
+query and a write by another worker is seen within version_ttl rather than
+after the TTL; this worker's own writes are seen at once. Rows written into a generation that is not committed yet are invisible
+to readers, so they leave the cache alone.
+
+Identical reads that miss at the same time share one backend query (see
+single_flight); with max_entries 0 that is all this layer does. Cached
+results are shared between callers, like InMemoryDB's rows: treat them as
+read-only.
+"""
+
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+
+from .db import DatabaseInterface
+from .single_flight import single_flight
+
+
+def _freeze(value: Any) -> Any:
+    """Hashable form of call arguments (lists of paths, keyword dicts)."""
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+class CachedDatabase(DatabaseInterface):
+    """LRU/TTL cache of query results around another database."""
+
+    def __init__(self, inner: DatabaseInterface, max_entries: int = 1000, ttl: float = 60.0,
+                 version_ttl: float = 1.0):
+        self._inner = inner
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.version_ttl = version_ttl
+        # key -> (expires_at, value), least recently used first
+        self._entries: "OrderedDict[tuple, Tuple[float, Any]]" = OrderedDict()
+        self._keys_by_project: Dict[str, Set[tuple]] = {}
+        # Bumped on every write, so a read that raced one does not cache a stale result
+        self._versions: Dict[str, int] = {}
+        # project_id -> (checked_until, data version last read from the database)
+        self._seen: Dict[str, Tuple[float, int]] = {}
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+        self._flight = single_flight("db_reads")
+
+    def __getattr__(self, name: str) -> Any:
+        # Backend specifics (_connected, _db, migrate_smell_layout, ...) pass through
+        return getattr(self._inner, name)
+
+    def cache_stats(self) -> Dict[str, Any]:
+        lookups = self._hits + self._misses
+        return {
+            "backend": type(self._inner).__name__,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "version_ttl": self.version_ttl,
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+            "evictions": self._evictions,
+            "invalidations": self._invalidations
+        }
+
+    def invalidate(self, project_id: str) -> None:
+        """Drop every cached result of a project."""
+        self._versions[project_id] = self._versions.get(project_id, 0) + 1
+        keys = self._keys_by_project.pop(project_id, ())
+        for key in keys:
+            self._entries.pop(key, None)
+        if keys:
+            self._invalidations += 1
+
+    async def _written(self, project_id: str) -> None:
+        """After a write readers can see: tell the other workers, then drop this one's entries."""
+        try:
+            await self._inner.bump_data_version(project_id)
+        except Exception as e:
+            print(f"⚠️  Data version of {project_id} not bumped, other workers may serve stale reads: {e}")
+        # The version just moved: read it again on the next lookup
+        self._seen.pop(project_id, None)
+        self.invalidate(project_id)
+
+    async def _shared_version(self, project_id: str) -> int:
+        """The project's data version in the database, which moves with the writes of every worker.
+
+        Read from the database at most once per version_ttl; in between the last value is used.
+        """
+        seen = self._seen.get(project_id)
+        if seen is not None and seen[0] > time.monotonic():
+            return seen[1]
+        local = self._versions.get(project_id, 0)
+        # Keyed with the local version, so a lookup after this worker's write never joins one from before it
+        version = await self._flight.do(("data_version", project_id, local), self._inner.data_version, project_id)
+        if self._versions.get(project_id, 0) != local:
+            # This worker wrote meanwhile, so the value may predate the write: use it once, keep nothing
+            return version
+        if seen is not None and seen[1] != version:
+            # Written by another worker: drop the entries of older versions now rather than at eviction
+            self.invalidate(project_id)
+        self._seen[project_id] = (time.monotonic() + self.version_ttl, version)
+        return version
+
+    def _forget(self, key: tuple) -> None:
+        self._entries.pop(key, None)
+        keys = self._keys_by_project.get(key[1])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_project[key[1]]
+
+    async def _read(self, name: str, project_id: str, *args: Any, **kwargs: Any) -> Any:
+        # With nothing kept there is nothing to check; identical reads still coalesce below
+        shared = await self._shared_version(project_id) if self.max_entries > 0 else None
+        key = (name, project_id, _freeze(args), _freeze(kwargs), shared)
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return entry[1]
+            self._forget(key)
+        self._misses += 1
+
+        version = self._versions.get(project_id, 0)
+        # Keyed with the version, so a read started after a write never joins one from before it
+        value = await self._flight.do((key, version), getattr(self._inner, name), project_id, *args, **kwargs)
+        if self.max_entries > 0 and self._versions.get(project_id, 0) == version:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._keys_by_project.setdefault(project_id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._forget(oldest)
+                self._evictions += 1
+        return value
+
+    async def upsert_project(self, project: Dict[str, Any]) -> None:
+        await self._inner.upsert_project(project)
+        await self._written(project["_id"])
+
+    async def get_project(self, project_id: str) -> Optional[Dict[str, Any]]:
+        return await self._read("get_project", project_id)
+
+    async def set_metrics(self, project_id: str, metrics: List[Dict[str, Any]], generation: Optional[str] = None) -> None:
+        await self._inner.set_metrics(project_id, metrics, generation)
+        if generation is None:
+            await self._written(project_id)
+
+    async def get_metrics(self, project_id: str, paths: Optional[List[str]] = None,
+                          fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        return await self._read("get_metrics", project_id, paths, fields)
+
+    async def set_risks(self, project_id: str, risks: List[Dict[str, Any]], generation: Optional[str] = None) -> None:
+        await self._inner.set_risks(project_id, risks, generation)
+        if generation is None:
+            await self._written(project_id)
+
+    async def get_risks(self, project_id: str, paths: Optional[List[str]] = None,
+                        fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        return await self._read("get_risks", project_id, paths, fields)
+
+    async def set_smells(self, project_id: str, smells: List[Dict[str, Any]], generation: Optional[str] = None) -> None:
+        await self._inner.set_smells(project_id, smells, generation)
+        if generation is None:
+            await self._written(project_id)
+
+    async def get_smells(self, project_id: str, paths: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        return await self._read("get_smells", project_id, paths)
+
+    def iter_smells(self, project_id: str, min_severity: Optional[int] = None, batch_size: int = 1000,
+                    fields: Optional[List[str]] = None) -> AsyncIterator[List[Dict[str, Any]]]:
+        # Streamed listings are read through, never held in the cache
+        return self._inner.iter_smells(project_id, min_severity, batch_size, fields)
+
+    def iter_rows(self, project_id: str, table: str, paths: Optional[List[str]] = None,
+                  batch_size: int = 1000) -> AsyncIterator[List[Dict[str, Any]]]:
+        # Whole-project reads for scans, never held in the cache
+        return self._inner.iter_rows(project_id, table, paths, batch_size)
+
+    async def set_functions(self, project_id: str, buckets: List[Dict[str, Any]], generation: Optional[str] = None) -> None:
+        await self._inner.set_functions(project_id, buckets, generation)
+        if generation is None:
+            await self._written(project_id)
+
+    async def get_functions(self, project_id: str, paths: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        return await self._read("get_functions", project_id, paths)
+
+    async def top_functions(self, project_id: str, limit: int, min_complexity: int = 1) -> List[Dict[str, Any]]:
+        return await self._read("top_functions", project_id, limit, min_complexity)
+
+    async def set_suggestions(self, project_id: str, rows: List[Dict[str, Any]], generation: Optional[str] = None) -> None:
+        await self._inner.set_suggestions(project_id, rows, generation)
+        if generation is None:
+            await self._written(project_id)
+
+    async def get_suggestions(self, project_id: str, file_id: str) -> Optional[Dict[str, Any]]:
+        return await self._read("get_suggestions", project_id, file_id)
+
+    async def risk_summary(self, project_id: str) -> Dict[str, Dict[str, float]]:
+        return await self._read("risk_summary", project_id)
+
+    async def smell_counts(self, project_id: str) -> Dict[str, Any]:
+        return await self._read("smell_counts", project_id)
+
+    async def top_smells(self, project_id: str, limit: int) -> List[Dict[str, Any]]:
+        return await self._read("top_smells", project_id, limit)
+
+    async def metric_histogram(self, project_id: str, field: str, bucket_size: float,
+                               table: str = "metrics") -> Dict[str, int]:
+        return await self._read("metric_histogram", project_id, field, bucket_size, table)
+
+    async def begin_generation(self, project_id: str) -> str:
+        return await self._inner.begin_generation(project_id)
+
+    async def current_generation(self, project_id: str) -> Optional[int]:
+        # Compared against to decide what may be reused, so never cached
+        return await self._inner.current_generation(project_id)
+
+    async def carry_forward(self, project_id: str, generation: str, exclude_paths: List[str]) -> None:
+        await self._inner.carry_forward(project_id, generation, exclude_paths)
+
+    async def commit_generation(self, project_id: str, generation: str) -> int:
+        try:
+            return await self._inner.commit_generation(project_id, generation)
+        finally:
+            await self._written(project_id)
+
+    async def drop_generation(self, project_id: str, generation: str) -> None:
+        # Never committed, so nothing cached reads from it
+        await self._inner.drop_generation(project_id, generation)
+
+    async def sweep_generations(self, project_id: str) -> None:
+        # Only rows no reader sees anymore
+        await self._inner.sweep_generations(project_id)
+
+    async def data_version(self, project_id: str) -> int:
+        # The value reads are keyed on: this worker's writes show at once, other workers' within version_ttl
+        return await self._shared_version(project_id)
+
+    async def bump_data_version(self, project_id: str) -> None:
+        await self._written(project_id)
+
+    async def set_summary(self, project_id: str, summary: Dict[str, Any]) -> None:
+        await self._inner.set_summary(project_id, summary)
+        await self._written(project_id)
+
+    async def get_summary(self, project_id: str) -> Optional[Dict[str, Any]]:
+        return await self._read("get_summary", project_id)
+
+    async def append_snapshot(self, snapshot: Dict[str, Any]) -> None:
+        await self._inner.append_snapshot(snapshot)
+        await self._written(snapshot["project_id"])
+
+    async def get_snapshots(self, project_id: str, since: Optional[str] = None, until: Optional[str] = None,
+                            limit: Optional[int] = None, path: Optional[str] = None) -> List[Dict[str, Any]]:
+        return await self._read("get_snapshots", project_id, since, until, limit, path)
+
+    async def get_trend(self, project_id: str, points: int, since: Optional[str] = None,
+                        until: Optional[str] = None) -> Dict[str, Any]:
+        return await self._read("get_trend", project_id, points, since, until)
+
+    async def get_snapshot(self, project_id: str, scan_id: str, files: bool = False) -> Optional[Dict[str, Any]]:
+        return await self._read("get_snapshot", project_id, scan_id, files)
+
+    async def set_scan_diff(self, project_id: str, scan_id: str, entries: List[Dict[str, Any]]) -> None:
+        await self._inner.set_scan_diff(project_id, scan_id, entries)
+        await self._written(project_id)
+
+    async def get_scan_diffs(self, project_id: str, scan_ids: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+        return await self._read("get_scan_diffs", project_id, scan_ids)
+
+    async def record_scan(self, scan: Dict[str, Any]) -> None:
+        await self._inner.record_scan(scan)
+
+    async def find_scan(self, repo_url: str, commit_sha: str) -> Optional[Dict[str, Any]]:
+        return await self._inner.find_scan(repo_url, commit_sha)
+
+    async def get_chat_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        # Rewritten on every message, so never cached
+        return await self._inner.get_chat_session(session_id)
+
+    async def set_chat_session(self, session_id: str, session: Dict[str, Any], ttl: float) -> None:
+        await self._inner.set_chat_session(session_id, session, ttl)
+
+    async def delete_chat_session(self, session_id: str) -> None:
+        await self._inner.delete_chat_session(session_id)
+
+    async def connect(self) -> bool:
+        return await self._inner.connect()
+
+    async def close(self) -> None:
+        self._entries.clear()
+        self._keys_by_project.clear()
+        self._seen.clear()
+        await self._inner.close()
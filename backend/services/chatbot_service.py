@@ -1,9 +1,29 @@
 """
 AI Chatbot Service - Code review assistant.
+
+One chatbot per project, kept in a ChatSessionStore: at most
+CHAT_MAX_SESSIONS of them, each dropped after CHAT_SESSION_TTL seconds
+without a message, with the last CHAT_HISTORY_LIMIT messages of its
+conversation. A chatbot's context is rebuilt when the project has been
+rescanned since it was loaded. With CHAT_SESSIONS_SHARED the conversations
+are kept in the database instead, so every worker continues the same one.
 """
 
+import os
+import time
+from collections import OrderedDict
 from datetime import datetime
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional, Tuple
+
+
+CHAT_MAX_SESSIONS = int(os.getenv("CHAT_MAX_SESSIONS", "500"))
+CHAT_SESSION_TTL = float(os.getenv("CHAT_SESSION_TTL", "1800"))
+# User and assistant messages each count
+CHAT_HISTORY_LIMIT = int(os.getenv("CHAT_HISTORY_LIMIT", "50"))
+CHAT_SESSIONS_SHARED = os.getenv("CHAT_SESSIONS_SHARED", "false").lower() == "true"
+
+# Questions answered with the files most similar to the open (or riskiest) file
+SIMILAR_WORDS = ("similar", "elsewhere", "same pattern", "looks like")
 
 
 class CodeReviewChatbot:
@@ -13,11 +33,24 @@ class CodeReviewChatbot:
         self.project_id = project_id
         self.conversation_history: List[Dict] = []
         self.context: Dict[str, Any] = {}
+        self.context_version: Optional[tuple] = None
+    
+    async def refresh_context(self):
+        """Reload the context if it was never loaded or the project was rescanned since."""
+        from services.summary_service import SummaryService
+        
+        # Served from the database cache between scans
+        summary = await SummaryService.get(self.project_id)
+        version = SummaryService.version(summary)
+        if not self.context or version != self.context_version:
+            await self.load_context(summary)
         
-    async def load_context(self):
+    async def load_context(self, summary: Optional[Dict[str, Any]] = None):
         """Load project context for the chatbot."""
         from services.db import db
+        from services.summary_service import SummaryService
         
+        self.context = {}
         project = await db.get_project(self.project_id)
         if project:
             self.context["project"] = {
@@ -25,43 +58,61 @@ class CodeReviewChatbot:
                 "repo_url": project.get("repo_url", "")
             }
         
-        metrics = await db.get_metrics(self.project_id)
-        if metrics:
-            sorted_metrics = sorted(metrics, key=lambda x: x.get("risk_score", 0), reverse=True)
-            self.context["top_files"] = [
-                {"path": m.get("path", ""), "risk": m.get("risk_score", 0)}
-                for m in sorted_metrics[:5]
-            ]
-            self.context["total_files"] = len(metrics)
+        # Aggregates materialized when the last scan completed
+        if summary is None:
+            summary = await SummaryService.get(self.project_id)
+        self.context_version = SummaryService.version(summary)
+        if not summary:
+            return
+        
+        self.context["top_files"] = [
+            {"path": r.get("path", ""), "risk": r.get("risk_score", 0)}
+            for r in summary.get("top_risks", [])[:5]
+        ]
+        self.context["total_files"] = summary.get("total_files", 0)
         
-        smells = await db.get_smells(self.project_id)
-        if smells:
-            self.context["total_smells"] = len(smells)
+        if summary.get("total_smells"):
+            self.context["total_smells"] = summary["total_smells"]
             self.context["recent_issues"] = [
                 {"type": s.get("type", ""), "path": s.get("path", ""), "message": s.get("message", "")}
-                for s in smells[:10]
+                for s in summary.get("sample_issues", [])[:10]
             ]
             
-            # Count by severity
-            self.context["critical_issues"] = sum(1 for s in smells if s.get("severity") == "critical")
-            self.context["high_issues"] = sum(1 for s in smells if s.get("severity") == "high")
-        
-        # Calculate quality score
-        risks = await db.get_risks(self.project_id)
-        if risks:
-            avg_risk = sum(r.get("risk_score", 0) for r in risks) / len(risks)
-            self.context["quality_score"] = max(0, 100 - avg_risk)
+            levels = summary.get("issue_levels", {})
+            self.context["critical_issues"] = levels.get("critical", 0)
+            self.context["high_issues"] = levels.get("high", 0)
+        
+        self.context["quality_score"] = summary.get("quality_score", 100)
     
     async def chat(self, message: str, file_context: str = None) -> Dict[str, Any]:
         """Process a chat message and return a response."""
-        if not self.context:
-            await self.load_context()
+        from services.search_service import search_issues
+        from services.similarity_service import find_similar
+        
+        await self.refresh_context()
+        
+        # The project's issues that best match the question, from the search index
+        try:
+            relevant = await search_issues(self.project_id, message, path=file_context, limit=5)
+        except Exception as e:
+            print(f"⚠️  Issue search for {self.project_id} failed: {e}")
+            relevant = []
+        
+        similar = None
+        if any(word in message.lower() for word in SIMILAR_WORDS):
+            target = file_context or next((f["path"] for f in self.context.get("top_files", [])), None)
+            if target:
+                try:
+                    similar = await find_similar(self.project_id, target, limit=5)
+                except Exception as e:
+                    print(f"⚠️  Similarity search for {self.project_id} failed: {e}")
         
         # Generate response based on message patterns
-        response = self._generate_response(message)
+        response = self._generate_response(message, relevant, similar)
         
         self.conversation_history.append({"role": "user", "content": message})
         self.conversation_history.append({"role": "assistant", "content": response})
+        del self.conversation_history[:-CHAT_HISTORY_LIMIT]
         
         return {
             "success": True,
@@ -69,10 +120,27 @@ class CodeReviewChatbot:
             "timestamp": datetime.utcnow().isoformat()
         }
     
-    def _generate_response(self, message: str) -> str:
-        """Generate a helpful response based on the message."""
+    def _generate_response(self, message: str, relevant: Optional[List[Dict[str, Any]]] = None,
+                           similar: Optional[Dict[str, Any]] = None) -> str:
+        """Generate a helpful response based on the message, the issues matching it and similar files."""
         message_lower = message.lower()
         
+        if similar is not None:
+            if similar.get("error"):
+                return f"I couldn't compare files: {similar['error']}"
+            if not similar.get("items"):
+                return f"No other file looks like `{similar['path']}`."
+            files_list = "\n".join([
+                f"- `{f['path']}` ({f['similarity'] * 100:.0f}% similar"
+                + (f", Risk: {f['risk_score']:.0f}%)" if "risk_score" in f else ")")
+                for f in similar["items"]
+            ])
+            return f"""🧭 **Files Similar to `{similar['path']}`**
+
+{files_list}
+
+**Why it matters:** Code that shares a structure tends to share its bugs. A fix made in one of these files probably belongs in the others too."""
+        
         if any(word in message_lower for word in ["quality", "score", "health"]):
             score = self.context.get("quality_score", "N/A")
             issues = self.context.get("total_smells", 0)
@@ -101,12 +169,12 @@ These files need the most attention:
             return "No risk data available. Try analyzing a repository first."
         
         if any(word in message_lower for word in ["fix", "solve", "resolve", "how to"]):
-            issues = self.context.get("recent_issues", [])
+            issues = relevant or self.context.get("recent_issues", [])
             if issues:
                 issue = issues[0]
                 return f"""🔧 **Fixing Issues**
 
-Your most recent issue is:
+{"The issue most relevant to your question" if relevant else "Your most recent issue"} is:
 - **Type:** {issue['type']}
 - **File:** `{issue['path']}`
 - **Issue:** {issue['message'][:200]}
@@ -121,12 +189,12 @@ Would you like specific help with any of these issues?"""
             return "No issues found to fix. Your code looks clean!"
         
         if any(word in message_lower for word in ["issue", "problem", "bug", "smell"]):
-            issues = self.context.get("recent_issues", [])[:5]
+            issues = (relevant or self.context.get("recent_issues", []))[:5]
             if issues:
                 issues_list = "\n".join([f"- [{i['type']}] `{i['path']}`: {i['message'][:80]}..." for i in issues])
-                return f"""🐛 **Recent Issues**
+                return f"""🐛 **{"Most Relevant Issues" if relevant else "Recent Issues"}**
 
-Here are the most recent issues found:
+Here are the {"issues that best match your question" if relevant else "most recent issues found"}:
 
 {issues_list}
 
@@ -151,15 +219,21 @@ I'm your code review assistant. I can help you with:
 📈 **Insights**
 - "How has quality changed?"
 - "What patterns do you see?"
+- "Which files are similar to this one?"
 - "Suggest improvements"
 
 Just ask me anything about your codebase!"""
         
         # Default response
+        matches = ""
+        if relevant:
+            matches = "\n🔎 **Related Issues:**\n" + "\n".join(
+                [f"- [{i['type']}] `{i['path']}` line {i.get('line', '?')}: {i['message'][:80]}" for i in relevant[:3]]
+            ) + "\n"
         return f"""I understand you're asking about: *"{message}"*
 
 Based on your project analysis:
-
+{matches}
 📊 **Quick Stats:**
 - Files Analyzed: {self.context.get("total_files", "N/A")}
 - Issues Found: {self.context.get("total_smells", "N/A")}
@@ -176,22 +250,89 @@ I'm here to help you write better code! 🚀"""
         self.conversation_history = []
 
 
-_chatbot_sessions: Dict[str, CodeReviewChatbot] = {}
+class ChatSessionStore:
+    """LRU/TTL store of chatbots, optionally keeping their conversations in the database."""
+    
+    def __init__(self, max_sessions: int = 500, ttl: float = 1800.0, shared: bool = False):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.shared = shared
+        # project_id -> (expires_at, chatbot), least recently used first
+        self._sessions: "OrderedDict[str, Tuple[float, CodeReviewChatbot]]" = OrderedDict()
+        self._evictions = 0
+        self._expirations = 0
+    
+    async def get(self, project_id: str) -> CodeReviewChatbot:
+        now = time.monotonic()
+        entry = self._sessions.pop(project_id, None)
+        if entry is not None and entry[0] <= now:
+            self._expirations += 1
+            entry = None
+        chatbot = entry[1] if entry is not None else CodeReviewChatbot(project_id)
+        self._sessions[project_id] = (now + self.ttl, chatbot)
+        self._evict(now)
+        
+        if self.shared:
+            # Another worker may have continued the conversation
+            from services.db import db
+            stored = await db.get_chat_session(project_id)
+            chatbot.conversation_history = (stored or {}).get("history", [])
+        return chatbot
+    
+    async def save(self, chatbot: CodeReviewChatbot) -> None:
+        if self.shared:
+            from services.db import db
+            await db.set_chat_session(chatbot.project_id, {"history": chatbot.conversation_history}, self.ttl)
+    
+    async def clear(self, project_id: str) -> None:
+        entry = self._sessions.get(project_id)
+        if entry is not None:
+            entry[1].clear_history()
+        if self.shared:
+            from services.db import db
+            await db.delete_chat_session(project_id)
+    
+    def _evict(self, now: float) -> None:
+        # Least recently used first, which is also soonest to expire
+        while self._sessions:
+            oldest = next(iter(self._sessions))
+            if len(self._sessions) > self.max_sessions:
+                self._evictions += 1
+            elif self._sessions[oldest][0] <= now:
+                self._expirations += 1
+            else:
+                break
+            del self._sessions[oldest]
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "ttl": self.ttl,
+            "history_limit": CHAT_HISTORY_LIMIT,
+            "shared": self.shared,
+            "evictions": self._evictions,
+            "expirations": self._expirations
+        }
+
+
+_chatbot_sessions = ChatSessionStore(CHAT_MAX_SESSIONS, CHAT_SESSION_TTL, CHAT_SESSIONS_SHARED)
 
 
 async def get_chatbot(project_id: str) -> CodeReviewChatbot:
-    if project_id not in _chatbot_sessions:
-        chatbot = CodeReviewChatbot(project_id)
-        await chatbot.load_context()
-        _chatbot_sessions[project_id] = chatbot
-    return _chatbot_sessions[project_id]
+    return await _chatbot_sessions.get(project_id)
 
 
 async def chat_with_assistant(project_id: str, message: str, file_context: str = None) -> Dict[str, Any]:
     chatbot = await get_chatbot(project_id)
-    return await chatbot.chat(message, file_context)
+    response = await chatbot.chat(message, file_context)
+    await _chatbot_sessions.save(chatbot)
+    return response
 
 
 async def clear_chat_session(project_id: str):
-    if project_id in _chatbot_sessions:
-        _chatbot_sessions[project_id].clear_history()
+    await _chatbot_sessions.clear(project_id)
+
+
+def chat_session_stats() -> Dict[str, Any]:
+    return _chatbot_sessions.stats()
@@ -0,0 +1,374 @@
+"""
+Clone Detector - Repository-wide duplicate code detection.
+
+Each file is reduced to a normalized token stream (identifiers and literals
+collapsed, comments and whitespace dropped), hashed as rolling k-grams and
+winnowed down to a small set of fingerprints. Fingerprints of all files form
+one repository-wide index; fingerprints shared by two locations are merged
+into duplicated blocks, which give each file its dup_ratio.
+
+The index is kept as one sorted array of fingerprint hashes, into which files
+added since are merged as a sorted run; a file's duplicates are found by
+looking up only its own hashes. The per-file fingerprints and the sorted index
+are persisted next to the repository mirror, as a JSON header followed by the
+raw arrays, so an incremental scan only re-fingerprints the files that changed
+and never sorts the whole repository again.
+"""
+
+import json
+import keyword
+import os
+import re
+import struct
+import sys
+import zlib
+from array import array
+from collections import deque
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from .source_reader import SourceFile
+
+
+# Tokens per k-gram: shorter matches are treated as noise
+KGRAM_TOKENS = 25
+# Winnowing window: every shared run of KGRAM_TOKENS + WINDOW - 1 tokens is guaranteed to be found
+WINDOW = 10
+# Fingerprints shared by more locations than this are boilerplate (imports, getters...) and ignored
+MAX_POSTINGS = 32
+# Smallest duplicated block reported, in lines
+MIN_BLOCK_LINES = 6
+# Blocks reported per file, largest first
+MAX_BLOCKS_PER_FILE = 5
+
+_INDEX_VERSION = 3
+# Length of the JSON header, which the fingerprint arrays follow
+_HEADER = struct.Struct("<Q")
+_MASK = (1 << 64) - 1
+# Index locations pack a file slot and a fingerprint number into one uint64
+_SLOT_SHIFT = np.uint64(32)
+_NUMBER_MASK = np.uint64(0xFFFFFFFF)
+_BASE = 0x100000001B3
+
+_JS_KEYWORDS = {
+    'async', 'await', 'break', 'case', 'catch', 'class', 'const', 'continue', 'default',
+    'delete', 'do', 'else', 'export', 'extends', 'false', 'finally', 'for', 'function',
+    'if', 'import', 'in', 'instanceof', 'let', 'new', 'null', 'of', 'return', 'static',
+    'super', 'switch', 'this', 'throw', 'true', 'try', 'typeof', 'undefined', 'var',
+    'void', 'while', 'yield', 'interface', 'type', 'enum', 'implements'
+}
+_KEYWORDS = set(keyword.kwlist) | _JS_KEYWORDS
+
+_STRING = r'''"""[\s\S]*?"""|\'\'\'[\s\S]*?\'\'\'|"(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*\''''
+_TOKEN_TAIL = r'''
+    |(?P<number>\d[\w.]*)
+    |(?P<name>[A-Za-z_$][\w$]*)
+    |(?P<op>[^\s\w])
+'''
+_PY_TOKENS = re.compile(r'(?P<comment>\#[^\n]*)|(?P<string>' + _STRING + ')' + _TOKEN_TAIL, re.X)
+_JS_TOKENS = re.compile(
+    r'(?P<comment>//[^\n]*|/\*[\s\S]*?\*/)|(?P<string>' + _STRING + r'|`(?:\\.|[^`\\])*`)' + _TOKEN_TAIL, re.X
+)
+
+# Stable token ids, so persisted fingerprints stay comparable across processes
+_token_ids: Dict[str, int] = {}
+
+# One file's fingerprints: k-gram hashes, first and last line of each k-gram, file length
+FileFingerprints = Tuple[array, array, array, int]
+# One duplicated block: (line, end_line, other_path, other_line, other_end_line)
+CloneBlock = Tuple[int, int, str, int, int]
+
+
+def _token_id(token: str) -> int:
+    token_id = _token_ids.get(token)
+    if token_id is None:
+        token_id = _token_ids[token] = zlib.crc32(token.encode())
+    return token_id
+
+
+_LITERAL = _token_id('L')
+_IDENTIFIER = _token_id('I')
+
+
+def tokenize(source: SourceFile) -> Tuple[List[int], List[int]]:
+    """Normalized token ids of a file and the character offset of each token."""
+    pattern = _PY_TOKENS if source.path.endswith('.py') else _JS_TOKENS
+    ids: List[int] = []
+    offsets: List[int] = []
+
+    for m in pattern.finditer(source.text):
+        kind = m.lastgroup
+        if kind == 'comment':
+            continue
+        if kind == 'name':
+            token = m.group()
+            ids.append(_token_id(token) if token in _KEYWORDS else _IDENTIFIER)
+        elif kind == 'op':
+            ids.append(_token_id(m.group()))
+        else:  # string, number
+            ids.append(_LITERAL)
+        offsets.append(m.start())
+
+    return ids, offsets
+
+
+def fingerprint(source: SourceFile) -> FileFingerprints:
+    """Winnowed rolling hashes of a file's k-grams."""
+    ids, offsets = tokenize(source)
+    hashes, starts, ends = array('Q'), array('I'), array('I')
+    if len(ids) < KGRAM_TOKENS:
+        return hashes, starts, ends, source.line_count
+
+    # Rolling hash of every k-gram
+    top = pow(_BASE, KGRAM_TOKENS - 1, 1 << 64)
+    h = 0
+    for token_id in ids[:KGRAM_TOKENS]:
+        h = (h * _BASE + token_id) & _MASK
+    kgrams = [h]
+    for old, new in zip(ids, ids[KGRAM_TOKENS:]):
+        h = ((h - old * top) * _BASE + new) & _MASK
+        kgrams.append(h)
+
+    # Winnowing: keep the rightmost minimum of every window
+    selected: List[int] = []
+    window: deque = deque()
+    for i, h in enumerate(kgrams):
+        while window and kgrams[window[-1]] >= h:
+            window.pop()
+        window.append(i)
+        if window[0] <= i - WINDOW:
+            window.popleft()
+        if i >= WINDOW - 1 and (not selected or selected[-1] != window[0]):
+            selected.append(window[0])
+    if not selected:  # fewer k-grams than one window
+        selected.append(window[0])
+
+    # Line numbers are only needed for the k-grams that were kept
+    line_of = source.line_of
+    for i in selected:
+        hashes.append(kgrams[i])
+        starts.append(line_of(offsets[i]))
+        ends.append(line_of(offsets[i + KGRAM_TOKENS - 1]))
+    return hashes, starts, ends, source.line_count
+
+
+class CloneDetector:
+    """Repository-wide fingerprint index answering duplicated blocks per file."""
+
+    def __init__(self, commit: Optional[str] = None):
+        self._files: Dict[str, FileFingerprints] = {}
+        # Every file gets a new slot each time it is added; removed files leave theirs empty
+        self._slots: Dict[str, int] = {}
+        self._slot_paths: List[Optional[str]] = []
+        # The repository-wide index: every fingerprint hash, sorted, with its location (slot << 32 | number)
+        self._keys = np.zeros(0, dtype=np.uint64)
+        self._refs = np.zeros(0, dtype=np.uint64)
+        # Slots added since the index was last merged
+        self._pending: List[int] = []
+        # Commit the index reflects; an incremental scan may only start from it
+        self.commit = commit
+
+    def add(self, source: SourceFile) -> None:
+        self.remove([source.path])
+        self._files[source.path] = fingerprint(source)
+        self._slots[source.path] = len(self._slot_paths)
+        self._slot_paths.append(source.path)
+        self._pending.append(self._slots[source.path])
+
+    def remove(self, paths: Iterable[str]) -> None:
+        dropped = []
+        for path in paths:
+            if self._files.pop(path, None) is None:
+                continue
+            slot = self._slots.pop(path)
+            self._slot_paths[slot] = None
+            dropped.append(slot)
+        if not dropped:
+            return
+        self._pending = [slot for slot in self._pending if self._slot_paths[slot] is not None]
+        keep = ~np.isin(self._refs >> _SLOT_SHIFT, np.array(dropped, dtype=np.uint64))
+        if not keep.all():
+            self._keys, self._refs = self._keys[keep], self._refs[keep]
+
+    def _index(self) -> Tuple[np.ndarray, np.ndarray]:
+        """The sorted index, with the files added since it was last merged sorted into it."""
+        if self._pending:
+            hashes = [np.frombuffer(self._files[self._slot_paths[slot]][0], dtype=np.uint64)
+                      for slot in self._pending]
+            refs = [(np.uint64(slot) << _SLOT_SHIFT) | np.arange(len(h), dtype=np.uint64)
+                    for slot, h in zip(self._pending, hashes)]
+            hashes, refs = np.concatenate(hashes), np.concatenate(refs)
+            order = np.argsort(hashes, kind='stable')
+            hashes, refs = hashes[order], refs[order]
+            # Inserting a sorted run keeps the index sorted without sorting it again
+            at = np.searchsorted(self._keys, hashes, side='right')
+            self._keys = np.insert(self._keys, at, hashes)
+            self._refs = np.insert(self._refs, at, refs)
+            self._pending = []
+        return self._keys, self._refs
+
+    def _postings(self, path: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Where each fingerprint of an indexed file starts and ends in the sorted index."""
+        keys, _ = self._index()
+        hashes = np.frombuffer(self._files[path][0], dtype=np.uint64)
+        return np.searchsorted(keys, hashes, side='left'), np.searchsorted(keys, hashes, side='right')
+
+    def affected_by(self, paths: Iterable[str]) -> Set[str]:
+        """Files sharing at least one indexed fingerprint with any of the given files."""
+        slices = []
+        for path in paths:
+            if path not in self._files:
+                continue
+            lo, hi = self._postings(path)
+            slices.extend(self._refs[a:b] for a, b in zip(lo.tolist(), hi.tolist()))
+        if not slices:
+            return set()
+        slots = np.unique(np.concatenate(slices) >> _SLOT_SHIFT)
+        return {self._slot_paths[slot] for slot in slots.tolist()}
+
+    def detect(self, paths: Optional[Iterable[str]] = None) -> Dict[str, Dict]:
+        """
+        Duplicated blocks and dup_ratio for the given files (default: all).
+
+        Returns {path: {"dup_ratio": float, "blocks": [CloneBlock, ...]}} for
+        every requested file that is indexed.
+        """
+        wanted = set(self._files) if paths is None else {p for p in paths if p in self._files}
+
+        report = {}
+        for path in wanted:
+            loc = self._files[path][3]
+            blocks = [
+                b for b in self._merge(self._matches(path))
+                if b[1] - b[0] + 1 >= MIN_BLOCK_LINES
+                # A repetitive region matching itself is not a copy
+                and (b[2] != path or b[4] < b[0] or b[3] > b[1])
+            ]
+
+            duplicated: Set[int] = set()
+            for line, end_line, *_ in blocks:
+                duplicated.update(range(line, end_line + 1))
+
+            blocks.sort(key=lambda b: (b[0] - b[1], b[0], b[2], b[3]))
+            report[path] = {
+                "dup_ratio": round(min(len(duplicated) / max(loc, 1), 1.0), 3),
+                "blocks": blocks[:MAX_BLOCKS_PER_FILE]
+            }
+        return report
+
+    def _matches(self, path: str) -> Dict[str, List[Tuple[int, int, int, int]]]:
+        """
+        Fingerprints of one file shared with other locations, grouped by the
+        file they are shared with; only that file's postings are looked up.
+        """
+        _, starts, ends, _ = self._files[path]
+        lo, hi = self._postings(path)
+        counts = hi - lo
+        matches: Dict[str, List[Tuple[int, int, int, int]]] = {}
+        for i in np.flatnonzero((counts >= 2) & (counts <= MAX_POSTINGS)).tolist():
+            a_start, a_end = starts[i], ends[i]
+            for ref in self._refs[lo[i]:hi[i]].tolist():
+                b_path = self._slot_paths[ref >> 32]
+                b = self._files[b_path]
+                j = ref & 0xFFFFFFFF
+                b_start, b_end = b[1][j], b[2][j]
+                # Skip the location itself and overlapping windows of one repetitive region
+                if b_path == path and b_start <= a_end and a_start <= b_end:
+                    continue
+                matches.setdefault(b_path, []).append((a_start, a_end, b_start, b_end))
+        return matches
+
+    @staticmethod
+    def _merge(by_other: Dict[str, List[Tuple[int, int, int, int]]]) -> List[CloneBlock]:
+        """Merge overlapping fingerprint matches into blocks, per file they are shared with."""
+        blocks: List[CloneBlock] = []
+        for other, spans in by_other.items():
+            spans.sort()
+            a0, a1, b0, b1 = spans[0]
+            for a_start, a_end, b_start, b_end in spans[1:]:
+                if a_start <= a1 + 1 and b_start <= b1 + 1 and b_end >= b0 - 1:
+                    a1, b0, b1 = max(a1, a_end), min(b0, b_start), max(b1, b_end)
+                else:
+                    blocks.append((a0, a1, other, b0, b1))
+                    a0, a1, b0, b1 = a_start, a_end, b_start, b_end
+            blocks.append((a0, a1, other, b0, b1))
+        return blocks
+
+    def save(self, index_path: Path) -> None:
+        keys, refs = self._index()
+        paths = list(self._files)
+        # Renumber the slots in file order, dropping those of removed files
+        if len(refs):
+            renumber = np.zeros(len(self._slot_paths), dtype=np.uint64)
+            renumber[[self._slots[p] for p in paths]] = np.arange(len(paths), dtype=np.uint64)
+            refs = (renumber[(refs >> _SLOT_SHIFT).astype(np.intp)] << _SLOT_SHIFT) | (refs & _NUMBER_MASK)
+        header = json.dumps({
+            "version": _INDEX_VERSION,
+            "params": [KGRAM_TOKENS, WINDOW],
+            "byteorder": sys.byteorder,
+            "commit": self.commit,
+            "paths": paths,
+            "counts": [len(self._files[p][0]) for p in paths],
+            "line_counts": [self._files[p][3] for p in paths]
+        }).encode()
+        hashes, starts, ends = array('Q'), array('I'), array('I')
+        for path in paths:
+            fp = self._files[path]
+            hashes.extend(fp[0])
+            starts.extend(fp[1])
+            ends.extend(fp[2])
+
+        tmp_path = index_path.with_name(index_path.name + ".tmp")
+        with open(tmp_path, 'wb') as f:
+            f.write(_HEADER.pack(len(header)))
+            f.write(header)
+            for table in (hashes, starts, ends):
+                f.write(table.tobytes())
+            # The sorted index follows, so loading it needs no sort
+            for table in (keys, refs):
+                f.write(table.tobytes())
+        tmp_path.replace(index_path)
+
+    @classmethod
+    def load(cls, index_path: Path) -> Optional["CloneDetector"]:
+        """The persisted index, or None if it is missing, unreadable or was built with other parameters."""
+        try:
+            with open(index_path, 'rb') as f:
+                (length,) = _HEADER.unpack(f.read(_HEADER.size))
+                if length > os.fstat(f.fileno()).st_size:
+                    return None
+                data = json.loads(f.read(length))
+                if (data.get("version") != _INDEX_VERSION or data.get("params") != [KGRAM_TOKENS, WINDOW]
+                        or data.get("byteorder") != sys.byteorder):
+                    return None
+
+                counts = data["counts"]
+                total = sum(counts)
+                hashes, starts, ends = array('Q'), array('I'), array('I')
+                for table in (hashes, starts, ends):
+                    table.frombytes(f.read(total * table.itemsize))
+                keys = np.frombuffer(f.read(total * 8), dtype=np.uint64)
+                refs = np.frombuffer(f.read(total * 8), dtype=np.uint64)
+                if (len(hashes) != total or len(starts) != total or len(ends) != total
+                        or len(keys) != total or len(refs) != total or f.read(1)):
+                    return None
+                if total and int(refs.max() >> _SLOT_SHIFT) >= len(counts):
+                    return None
+
+            files: Dict[str, FileFingerprints] = {}
+            at = 0
+            for path, count, line_count in zip(data["paths"], counts, data["line_counts"], strict=True):
+                files[path] = (hashes[at:at + count], starts[at:at + count], ends[at:at + count], int(line_count))
+                at += count
+        except Exception:
+            # Truncated, damaged or foreign: a cache miss, the scan fingerprints every file again
+            return None
+
+        detector = cls(data.get("commit"))
+        detector._files = files
+        detector._slot_paths = list(files)
+        detector._slots = {path: slot for slot, path in enumerate(detector._slot_paths)}
+        detector._keys, detector._refs = keys, refs
+        return detector
@@ -1,12 +1,19 @@
 """
 Database Service for CodeSenseX
 
-Supports both in-memory storage (for development) and MongoDB Atlas (for production).
-Set USE_IN_MEMORY_DB=true in .env to use in-memory database.
+Supports in-memory storage (for development), SQLite (for single-node installs,
+see sqlite_db) and MongoDB Atlas (for production). Set USE_IN_MEMORY_DB=true in
+.env to use in-memory database, or USE_SQLITE_DB=true to use SQLite.
 """
 
 import os
-from typing import Dict, Any, List, Optional
+import asyncio
+import heapq
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Any, AsyncIterator, List, Optional
 from abc import ABC, abstractmethod
 
 # Load environment variables
@@ -18,6 +25,108 @@ except ImportError:
 
 # Check if we should use in-memory database
 USE_IN_MEMORY = os.getenv("USE_IN_MEMORY_DB", "true").lower() == "true"
+# SQLite for durable single-node installs; takes precedence over USE_IN_MEMORY_DB
+USE_SQLITE = os.getenv("USE_SQLITE_DB", "false").lower() == "true"
+SQLITE_PATH = os.getenv("SQLITE_DB_PATH", "codesensex.db")
+# Read-through result cache (see cached_db); 0 entries disables caching, identical
+# concurrent reads still share one query
+DB_CACHE_SIZE = int(os.getenv("DB_CACHE_SIZE", "1000"))
+DB_CACHE_TTL = float(os.getenv("DB_CACHE_TTL", "60"))
+# Seconds a project's data version is trusted before the database is asked again, which
+# bounds how long another worker's write can go unseen
+DB_CACHE_VERSION_TTL = float(os.getenv("DB_CACHE_VERSION_TTL", "1"))
+
+# Per-scan result tables, stored by generation
+_RESULT_TABLES = ("metrics", "risks", "smells", "functions", "suggestions")
+# MongoDB smell layout: "document" (one document per smell) or "bucketed" (one per file)
+SMELL_LAYOUT = os.getenv("MONGO_SMELL_LAYOUT", "document").lower()
+# Seconds after which a generation still not committed counts as abandoned
+# by a crashed scan and is swept (see DatabaseInterface.sweep_generations)
+GENERATION_TIMEOUT = float(os.getenv("GENERATION_TIMEOUT", "3600"))
+# Bookkeeping fields of MongoDB result rows (see MongoDBAtlas.commit_generation)
+_GENERATION_FIELDS = ("gen_from", "gen_to", "pending", "pending_at")
+
+
+class FunctionTopK:
+    """
+    Server-side top-K over per-file function buckets.
+    
+    A bucket stores one file's functions column-wise, sorted by complexity
+    (highest first), plus the file's max_complexity. Fed buckets in
+    max_complexity order, it stops as soon as no remaining bucket can beat
+    the current K-th function, so only the buckets that matter are read.
+    """
+    
+    def __init__(self, limit: int, min_complexity: int = 1):
+        self.limit = limit
+        self.min_complexity = min_complexity
+        self._heap: List[tuple] = []
+        self._seq = 0
+    
+    def add(self, bucket: Dict[str, Any]) -> bool:
+        """Offer one bucket; False once it and every later bucket cannot contribute."""
+        heap = self._heap
+        if len(heap) >= self.limit and bucket.get("max_complexity", 0) <= heap[0][0]:
+            return False
+        
+        for i, complexity in enumerate(bucket["columns"]["complexity"]):
+            if complexity < self.min_complexity:
+                break
+            self._seq += 1
+            if len(heap) < self.limit:
+                heapq.heappush(heap, (complexity, -self._seq, bucket, i))
+            elif complexity > heap[0][0]:
+                heapq.heapreplace(heap, (complexity, -self._seq, bucket, i))
+            else:
+                break
+        return True
+    
+    def results(self) -> List[Dict[str, Any]]:
+        ranked = sorted(self._heap, key=lambda item: (-item[0], -item[1]))
+        return [function_record(bucket, i) for _, _, bucket, i in ranked]
+
+
+def function_record(bucket: Dict[str, Any], index: int) -> Dict[str, Any]:
+    """Row-shaped view of the index-th function of a bucket."""
+    record = {name: column[index] for name, column in bucket["columns"].items()}
+    record["path"] = bucket["path"]
+    return record
+
+
+def severity_key(severity: Any) -> str:
+    """Severity as stored in count documents: "1" to "5", missing counts as 1."""
+    return str(min(max(int(severity or 1), 1), 5))
+
+
+def histogram_key(value: Any, bucket_size: float) -> str:
+    bucket = (float(value or 0) // bucket_size) * bucket_size
+    return str(int(bucket)) if bucket == int(bucket) else str(bucket)
+
+
+# Headline numbers of a snapshot (SummaryService.trend_metrics), averaged per trend point
+TREND_METRICS = ("total_files", "total_loc", "total_smells", "quality_score", "avg_risk",
+                 "critical_issues", "high_issues", "medium_issues", "low_issues")
+
+
+def trend_bucket(rank: int, total: int, points: int) -> int:
+    """Bucket of the rank-th (from 1) of total snapshots cut into points runs, as history_service.downsample cuts them."""
+    return (rank * points - 1) // total
+
+
+def trend_point(last: Dict[str, Any], scans: int, averages: Dict[str, float]) -> Dict[str, Any]:
+    """A bucket of scans reported at its latest snapshot, with the numeric metrics averaged over the bucket."""
+    metrics = {
+        key: round(averages[key], 2) if key in averages and isinstance(value, (int, float)) else value
+        for key, value in last.get("metrics", {}).items()
+    }
+    return {**last, "metrics": metrics, "scans": scans}
+
+
+def select_fields(row: Dict[str, Any], fields: Optional[List[str]]) -> Dict[str, Any]:
+    """The row cut down to the given fields; the row itself when fields is None."""
+    if fields is None:
+        return row
+    return {f: row[f] for f in fields if f in row}
 
 
 class DatabaseInterface(ABC):
@@ -32,27 +141,248 @@ class DatabaseInterface(ABC):
         pass
     
     @abstractmethod
-    async def set_metrics(self, project_id: str, metrics: List[Dict[str, Any]]) -> None:
+    async def set_metrics(self, project_id: str, metrics: List[Dict[str, Any]], generation: Optional[str] = None) -> None:
+        pass
+    
+    @abstractmethod
+    async def get_metrics(self, project_id: str, paths: Optional[List[str]] = None,
+                          fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Metric rows of the current generation; with fields, only those fields are read."""
+        pass
+    
+    @abstractmethod
+    async def set_risks(self, project_id: str, risks: List[Dict[str, Any]], generation: Optional[str] = None) -> None:
+        pass
+    
+    @abstractmethod
+    async def get_risks(self, project_id: str, paths: Optional[List[str]] = None,
+                        fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Risk rows, riskiest first; with fields, only those fields are read."""
+        pass
+    
+    @abstractmethod
+    async def set_smells(self, project_id: str, smells: List[Dict[str, Any]], generation: Optional[str] = None) -> None:
+        pass
+    
+    @abstractmethod
+    async def get_smells(self, project_id: str, paths: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Smells of the given files (default: the whole project), uncapped; stream whole-project listings with iter_smells."""
+        pass
+    
+    @abstractmethod
+    def iter_smells(self, project_id: str, min_severity: Optional[int] = None, batch_size: int = 1000,
+                    fields: Optional[List[str]] = None) -> AsyncIterator[List[Dict[str, Any]]]:
+        """The project's smells with severity >= min_severity, in batches read as they are consumed."""
+        pass
+    
+    @abstractmethod
+    def iter_rows(self, project_id: str, table: str, paths: Optional[List[str]] = None,
+                  batch_size: int = 1000) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Every current row of a result table (see _RESULT_TABLES), optionally
+        only of the given paths, in batches. Unlike the get_* listings, which
+        serve pages to clients, never capped: for copies and diffs of a whole project.
+        """
+        pass
+    
+    async def read_rows(self, project_id: str, table: str, paths: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """All of iter_rows in one list."""
+        rows: List[Dict[str, Any]] = []
+        async for batch in self.iter_rows(project_id, table, paths):
+            rows.extend(batch)
+        return rows
+    
+    @abstractmethod
+    async def set_functions(self, project_id: str, buckets: List[Dict[str, Any]], generation: Optional[str] = None) -> None:
+        """Store per-file function buckets (see FunctionTopK), one per path."""
+        pass
+    
+    @abstractmethod
+    async def get_functions(self, project_id: str, paths: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        pass
+    
+    @abstractmethod
+    async def top_functions(self, project_id: str, limit: int, min_complexity: int = 1) -> List[Dict[str, Any]]:
+        """The limit most complex functions of the project, highest first."""
+        pass
+    
+    @abstractmethod
+    async def set_suggestions(self, project_id: str, rows: List[Dict[str, Any]], generation: Optional[str] = None) -> None:
+        """Store per-file refactoring suggestion templates, one row per path, each with its file_id."""
+        pass
+    
+    @abstractmethod
+    async def get_suggestions(self, project_id: str, file_id: str) -> Optional[Dict[str, Any]]:
+        """The current suggestions row of one file, looked up by file_id."""
+        pass
+    
+    @abstractmethod
+    async def risk_summary(self, project_id: str) -> Dict[str, Dict[str, float]]:
+        """Per tier: {"count": files, "risk_total": sum of their risk scores}."""
+        pass
+    
+    @abstractmethod
+    async def smell_counts(self, project_id: str) -> Dict[str, Any]:
+        """
+        Smell counts without the rows: {"by_severity": {severity: {type: count}},
+        "files": {path: {"count": smells, "max_severity": highest severity}}}.
+        """
+        pass
+    
+    @abstractmethod
+    async def top_smells(self, project_id: str, limit: int) -> List[Dict[str, Any]]:
+        """The limit most severe smells of the project, highest first."""
+        pass
+    
+    @abstractmethod
+    async def metric_histogram(self, project_id: str, field: str, bucket_size: float,
+                               table: str = "metrics") -> Dict[str, int]:
+        """Rows of table (metrics or risks) per bucket of field, keyed by the bucket's lower bound."""
+        pass
+    
+    @abstractmethod
+    async def begin_generation(self, project_id: str) -> str:
+        """
+        Open a new generation for a scan to write its results into; returns
+        its token for the set_* methods and commit_generation.
+        
+        Metrics, risks, smells, functions and suggestions are stored per
+        generation: rows are never rewritten, each is valid from the generation
+        that wrote it until the one that replaced it. The set_* methods add rows
+        to the given generation (default: the current one) and every get_*
+        reads the current one, so a scan's rows stay invisible until
+        commit_generation.
+        """
+        pass
+    
+    @abstractmethod
+    async def current_generation(self, project_id: str) -> Optional[int]:
+        """The generation readers currently see; None before the project's first commit."""
+        pass
+    
+    @abstractmethod
+    async def carry_forward(self, project_id: str, generation: str, exclude_paths: List[str]) -> None:
+        """
+        Keep the current rows of every path not in exclude_paths. The commit then
+        retires only the rows of the excluded paths and of the paths the
+        generation wrote; without it, the generation replaces all of the
+        project's rows.
+        """
         pass
     
     @abstractmethod
-    async def get_metrics(self, project_id: str) -> List[Dict[str, Any]]:
+    async def commit_generation(self, project_id: str, generation: str) -> int:
+        """
+        Atomically make generation the current one; returns its number. Only
+        the replaced rows are touched, so an incremental scan costs its changed
+        paths, not the project. Rows it retires stay readable until the next
+        commit, for reads already in flight; sweep_generations deletes them after.
+        """
         pass
     
     @abstractmethod
-    async def set_risks(self, project_id: str, risks: List[Dict[str, Any]]) -> None:
+    async def drop_generation(self, project_id: str, generation: str) -> None:
+        """Discard a generation that will not be committed."""
         pass
     
     @abstractmethod
-    async def get_risks(self, project_id: str) -> List[Dict[str, Any]]:
+    async def sweep_generations(self, project_id: str) -> None:
+        """
+        Delete rows no generation still reads: those retired before the
+        previous generation, and those of generations left uncommitted for
+        longer than GENERATION_TIMEOUT by a scan that failed or crashed.
+        Runs as a background task after each commit (see JobService._swap_results);
+        its cost is a delete per retired row, not one per generation, but no scan waits on it.
+        """
         pass
     
     @abstractmethod
-    async def set_smells(self, project_id: str, smells: List[Dict[str, Any]]) -> None:
+    async def data_version(self, project_id: str) -> int:
+        """
+        A counter that moves whenever what readers see of the project changes;
+        0 until its first bump. Shared by every worker on the same database,
+        so caches key their results on it (see cached_db and http_cache).
+        """
         pass
     
     @abstractmethod
-    async def get_smells(self, project_id: str) -> List[Dict[str, Any]]:
+    async def bump_data_version(self, project_id: str) -> None:
+        """Advance the project's data version, after a write readers can see."""
+        pass
+    
+    @abstractmethod
+    async def set_summary(self, project_id: str, summary: Dict[str, Any]) -> None:
+        """Replace the project's materialized summary (see SummaryService)."""
+        pass
+    
+    @abstractmethod
+    async def get_summary(self, project_id: str) -> Optional[Dict[str, Any]]:
+        pass
+    
+    @abstractmethod
+    async def append_snapshot(self, snapshot: Dict[str, Any]) -> None:
+        """Append a scan snapshot to the project's history; snapshots are immutable, a scan is kept once."""
+        pass
+    
+    @abstractmethod
+    async def get_snapshots(self, project_id: str, since: Optional[str] = None, until: Optional[str] = None,
+                            limit: Optional[int] = None, path: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Snapshots with since <= timestamp <= until, oldest first; with limit,
+        only the latest limit of them. Per-file metrics are left out unless
+        path is given, in which case "files" holds that file's entry only.
+        """
+        pass
+    
+    @abstractmethod
+    async def get_trend(self, project_id: str, points: int, since: Optional[str] = None,
+                        until: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Snapshots with since <= timestamp <= until, without per-file metrics,
+        cut oldest first into at most points runs of consecutive scans. Each
+        run is reported at its latest snapshot with the numeric metrics
+        averaged over the run and "scans" counting it (see trend_point).
+        Returns {"total": snapshots in range, "scans": [...]}; the grouping
+        happens in the database, so only the points leave it.
+        """
+        pass
+    
+    @abstractmethod
+    async def get_snapshot(self, project_id: str, scan_id: str, files: bool = False) -> Optional[Dict[str, Any]]:
+        """One scan's snapshot; per-file metrics are left out unless files is set."""
+        pass
+    
+    @abstractmethod
+    async def set_scan_diff(self, project_id: str, scan_id: str, entries: List[Dict[str, Any]]) -> None:
+        """Store a scan's per-file diff entries against the scan before it (see diff_service)."""
+        pass
+    
+    @abstractmethod
+    async def get_scan_diffs(self, project_id: str, scan_ids: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+        """Diff entries of the given scans, keyed by scan_id."""
+        pass
+    
+    @abstractmethod
+    async def record_scan(self, scan: Dict[str, Any]) -> None:
+        pass
+    
+    @abstractmethod
+    async def find_scan(self, repo_url: str, commit_sha: str) -> Optional[Dict[str, Any]]:
+        """Return the latest completed scan of repo_url at commit_sha, if any."""
+        pass
+    
+    @abstractmethod
+    async def get_chat_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """A stored chat session, unless it has expired."""
+        pass
+    
+    @abstractmethod
+    async def set_chat_session(self, session_id: str, session: Dict[str, Any], ttl: float) -> None:
+        """Store a chat session, replacing the previous one, to expire ttl seconds from now."""
+        pass
+    
+    @abstractmethod
+    async def delete_chat_session(self, session_id: str) -> None:
         pass
     
     @abstractmethod
@@ -69,9 +399,24 @@ class InMemoryDB(DatabaseInterface):
     
     def __init__(self):
         self.projects: Dict[str, Dict[str, Any]] = {}
-        self.file_metrics: Dict[str, Dict[str, Any]] = {}
-        self.risks: Dict[str, Dict[str, Any]] = {}
-        self.smells: Dict[str, Dict[str, Any]] = {}
+        # project_id -> current result tables (see _tables)
+        self.results: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        # project_id -> {file_id: path} of the current suggestions
+        self._suggestion_ids: Dict[str, Dict[str, str]] = {}
+        # token -> tables of a generation not committed yet, with its carry-forward exclusions
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        # project_id -> {"current": generation, "previous": generation}
+        self.generations: Dict[str, Dict[str, Optional[int]]] = {}
+        self.data_versions: Dict[str, int] = {}
+        self.summaries: Dict[str, Dict[str, Any]] = {}
+        # project_id -> snapshots in completion order
+        self.snapshots: Dict[str, List[Dict[str, Any]]] = {}
+        self.scan_diffs: Dict[str, List[Dict[str, Any]]] = {}
+        self.scans: Dict[str, Dict[str, Any]] = {}
+        # (repo_url, commit_sha) -> scan _id of the latest completed scan
+        self._scans_by_commit: Dict[tuple, str] = {}
+        # session_id -> (expires_at, session), soonest to expire first
+        self.chat_sessions: "OrderedDict[str, tuple]" = OrderedDict()
         self._connected = True
     
     async def upsert_project(self, project: Dict[str, Any]) -> None:
@@ -80,33 +425,301 @@ class InMemoryDB(DatabaseInterface):
     async def get_project(self, project_id: str) -> Optional[Dict[str, Any]]:
         return self.projects.get(project_id)
     
-    async def set_metrics(self, project_id: str, metrics: List[Dict[str, Any]]) -> None:
+    def _tables(self, project_id: str) -> Dict[str, Dict[str, Any]]:
+        """The current tables, path -> row (smells: path -> {key: row})."""
+        return self.results.get(project_id) or {t: {} for t in _RESULT_TABLES}
+    
+    def _writable(self, project_id: str, generation: Optional[str]) -> Dict[str, Dict[str, Any]]:
+        """The tables of an open generation, or the current ones."""
+        if generation is not None:
+            return self._pending[generation]["tables"]
+        return self.results.setdefault(project_id, {t: {} for t in _RESULT_TABLES})
+    
+    async def set_metrics(self, project_id: str, metrics: List[Dict[str, Any]], generation: Optional[str] = None) -> None:
+        table = self._writable(project_id, generation)["metrics"]
         for m in metrics:
-            key = f"{project_id}:{m.get('path', '')}"
             m['project_id'] = project_id
-            self.file_metrics[key] = m
+            table[m.get('path', '')] = m
     
-    async def get_metrics(self, project_id: str) -> List[Dict[str, Any]]:
-        return [m for m in self.file_metrics.values() if m.get('project_id') == project_id]
+    async def get_metrics(self, project_id: str, paths: Optional[List[str]] = None,
+                          fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        table = self._tables(project_id)["metrics"]
+        rows = [table[p] for p in paths if p in table] if paths is not None else list(table.values())
+        return rows if fields is None else [select_fields(r, fields) for r in rows]
     
-    async def set_risks(self, project_id: str, risks: List[Dict[str, Any]]) -> None:
+    async def set_risks(self, project_id: str, risks: List[Dict[str, Any]], generation: Optional[str] = None) -> None:
+        table = self._writable(project_id, generation)["risks"]
         for r in risks:
-            key = f"{project_id}:{r.get('path', '')}"
             r['project_id'] = project_id
-            self.risks[key] = r
+            table[r.get('path', '')] = r
     
-    async def get_risks(self, project_id: str) -> List[Dict[str, Any]]:
-        return [r for r in self.risks.values() if r.get('project_id') == project_id]
+    async def get_risks(self, project_id: str, paths: Optional[List[str]] = None,
+                        fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        table = self._tables(project_id)["risks"]
+        rows = [table[p] for p in paths if p in table] if paths is not None else list(table.values())
+        rows.sort(key=lambda r: r.get("risk_score", 0), reverse=True)
+        return rows if fields is None else [select_fields(r, fields) for r in rows]
     
-    async def set_smells(self, project_id: str, smells: List[Dict[str, Any]]) -> None:
+    async def set_smells(self, project_id: str, smells: List[Dict[str, Any]], generation: Optional[str] = None) -> None:
+        table = self._writable(project_id, generation)["smells"]
+        by_path: Dict[str, Dict[str, Any]] = {}
         for s in smells:
             file_path = s.get("path", s.get("file_path", ""))
-            key = f"{project_id}:{file_path}:{s.get('type', '')}:{s.get('line', 0)}"
+            # Copy on write: a dict of smells readers may hold is never changed in place
+            rows = by_path.get(file_path)
+            if rows is None:
+                rows = by_path[file_path] = dict(table.get(file_path, {}))
             s['project_id'] = project_id
-            self.smells[key] = s
+            rows[s.get('fingerprint') or f"{s.get('type', '')}:{s.get('line', 0)}"] = s
+        table.update(by_path)
+    
+    async def get_smells(self, project_id: str, paths: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        table = self._tables(project_id)["smells"]
+        if paths is not None:
+            return [s for p in paths for s in table.get(p, {}).values()]
+        return [s for rows in table.values() for s in rows.values()]
     
-    async def get_smells(self, project_id: str) -> List[Dict[str, Any]]:
-        return [s for s in self.smells.values() if s.get('project_id') == project_id]
+    async def iter_smells(self, project_id: str, min_severity: Optional[int] = None, batch_size: int = 1000,
+                          fields: Optional[List[str]] = None) -> AsyncIterator[List[Dict[str, Any]]]:
+        batch = []
+        for rows in list(self._tables(project_id)["smells"].values()):
+            for s in rows.values():
+                if min_severity is None or s.get("severity", 0) >= min_severity:
+                    batch.append(select_fields(s, fields))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    
+    async def iter_rows(self, project_id: str, table: str, paths: Optional[List[str]] = None,
+                        batch_size: int = 1000) -> AsyncIterator[List[Dict[str, Any]]]:
+        rows = list(self._tables(project_id)[table].values())
+        if table == "smells":
+            rows = [s for by_key in rows for s in by_key.values()]
+        if paths is not None:
+            wanted = set(paths)
+            rows = [r for r in rows if r.get("path", "") in wanted]
+        for start in range(0, len(rows), batch_size):
+            yield rows[start:start + batch_size]
+    
+    async def set_functions(self, project_id: str, buckets: List[Dict[str, Any]], generation: Optional[str] = None) -> None:
+        table = self._writable(project_id, generation)["functions"]
+        for b in buckets:
+            b['project_id'] = project_id
+            table[b.get('path', '')] = b
+    
+    async def get_functions(self, project_id: str, paths: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        table = self._tables(project_id)["functions"]
+        if paths is not None:
+            return [table[p] for p in paths if p in table]
+        return list(table.values())
+    
+    async def set_suggestions(self, project_id: str, rows: List[Dict[str, Any]], generation: Optional[str] = None) -> None:
+        table = self._writable(project_id, generation)["suggestions"]
+        for row in rows:
+            row['project_id'] = project_id
+            table[row.get('path', '')] = row
+            if generation is None:
+                self._suggestion_ids.setdefault(project_id, {})[row["file_id"]] = row.get('path', '')
+    
+    async def get_suggestions(self, project_id: str, file_id: str) -> Optional[Dict[str, Any]]:
+        file_path = self._suggestion_ids.get(project_id, {}).get(file_id)
+        return self._tables(project_id)["suggestions"].get(file_path) if file_path is not None else None
+    
+    async def top_functions(self, project_id: str, limit: int, min_complexity: int = 1) -> List[Dict[str, Any]]:
+        buckets = sorted(
+            (b for b in self._tables(project_id)["functions"].values()
+             if b.get('max_complexity', 0) >= min_complexity),
+            key=lambda b: b.get('max_complexity', 0),
+            reverse=True
+        )
+        top = FunctionTopK(limit, min_complexity)
+        for bucket in buckets:
+            if not top.add(bucket):
+                break
+        return top.results()
+    
+    async def risk_summary(self, project_id: str) -> Dict[str, Dict[str, float]]:
+        tiers: Dict[str, Dict[str, float]] = {}
+        for r in self._tables(project_id)["risks"].values():
+            tier = tiers.setdefault(r.get("tier", "Low"), {"count": 0, "risk_total": 0})
+            tier["count"] += 1
+            tier["risk_total"] += r.get("risk_score", 0)
+        return tiers
+    
+    async def smell_counts(self, project_id: str) -> Dict[str, Any]:
+        by_severity: Dict[str, Dict[str, int]] = {}
+        files: Dict[str, Dict[str, int]] = {}
+        # The smell table is already keyed by path
+        for file_path, rows in self._tables(project_id)["smells"].items():
+            if not rows:
+                continue
+            max_severity = 1
+            for s in rows.values():
+                key = severity_key(s.get("severity"))
+                types = by_severity.setdefault(key, {})
+                types[s.get("type", "Unknown")] = types.get(s.get("type", "Unknown"), 0) + 1
+                max_severity = max(max_severity, int(key))
+            files[file_path] = {"count": len(rows), "max_severity": max_severity}
+        return {"by_severity": by_severity, "files": files}
+    
+    async def top_smells(self, project_id: str, limit: int) -> List[Dict[str, Any]]:
+        smells = (s for rows in self._tables(project_id)["smells"].values() for s in rows.values())
+        return heapq.nlargest(max(limit, 0), smells, key=lambda s: s.get("severity", 0) or 0)
+    
+    async def metric_histogram(self, project_id: str, field: str, bucket_size: float,
+                               table: str = "metrics") -> Dict[str, int]:
+        histogram: Dict[str, int] = {}
+        for row in self._tables(project_id)[table].values():
+            key = histogram_key(row.get(field, 0), bucket_size)
+            histogram[key] = histogram.get(key, 0) + 1
+        return histogram
+    
+    async def begin_generation(self, project_id: str) -> str:
+        generation = uuid.uuid4().hex
+        self._pending[generation] = {
+            "project_id": project_id,
+            "tables": {t: {} for t in _RESULT_TABLES},
+            "exclude": None,
+            "opened": time.monotonic()
+        }
+        return generation
+    
+    async def current_generation(self, project_id: str) -> Optional[int]:
+        return self.generations.get(project_id, {}).get("current")
+    
+    async def carry_forward(self, project_id: str, generation: str, exclude_paths: List[str]) -> None:
+        pending = self._pending[generation]
+        pending["exclude"] = set(pending["exclude"] or ()) | set(exclude_paths)
+    
+    async def commit_generation(self, project_id: str, generation: str) -> int:
+        pending = self._pending.pop(generation)
+        tables = pending["tables"]
+        if pending["exclude"] is None:
+            self.results[project_id] = tables
+            self._suggestion_ids[project_id] = {row["file_id"]: path for path, row in tables["suggestions"].items()}
+        else:
+            # Tables are updated in place, path by path: only the replaced paths are touched
+            live = self._writable(project_id, None)
+            ids = self._suggestion_ids.setdefault(project_id, {})
+            replaced = pending["exclude"].union(*tables.values())
+            for name in _RESULT_TABLES:
+                table = live[name]
+                for path in replaced:
+                    row = table.pop(path, None)
+                    if name == "suggestions" and row is not None:
+                        ids.pop(row["file_id"], None)
+                table.update(tables[name])
+            ids.update((row["file_id"], path) for path, row in tables["suggestions"].items())
+        
+        previous = self.generations.get(project_id, {}).get("current")
+        current = (previous or 0) + 1
+        self.generations[project_id] = {"current": current, "previous": previous}
+        return current
+    
+    async def drop_generation(self, project_id: str, generation: str) -> None:
+        self._pending.pop(generation, None)
+    
+    async def sweep_generations(self, project_id: str) -> None:
+        # Retired rows went with the commit that replaced them; only abandoned scans are left
+        cutoff = time.monotonic() - GENERATION_TIMEOUT
+        for generation, pending in list(self._pending.items()):
+            if pending["project_id"] == project_id and pending["opened"] < cutoff:
+                del self._pending[generation]
+    
+    async def data_version(self, project_id: str) -> int:
+        return self.data_versions.get(project_id, 0)
+    
+    async def bump_data_version(self, project_id: str) -> None:
+        self.data_versions[project_id] = self.data_versions.get(project_id, 0) + 1
+    
+    async def set_summary(self, project_id: str, summary: Dict[str, Any]) -> None:
+        self.summaries[project_id] = summary
+    
+    async def get_summary(self, project_id: str) -> Optional[Dict[str, Any]]:
+        return self.summaries.get(project_id)
+    
+    async def append_snapshot(self, snapshot: Dict[str, Any]) -> None:
+        history = self.snapshots.setdefault(snapshot["project_id"], [])
+        if any(s["scan_id"] == snapshot["scan_id"] for s in history):
+            return
+        history.append(snapshot)
+        history.sort(key=lambda s: s["timestamp"])
+    
+    async def get_snapshots(self, project_id: str, since: Optional[str] = None, until: Optional[str] = None,
+                            limit: Optional[int] = None, path: Optional[str] = None) -> List[Dict[str, Any]]:
+        history = [
+            s for s in self.snapshots.get(project_id, [])
+            if (since is None or s["timestamp"] >= since) and (until is None or s["timestamp"] <= until)
+        ]
+        if limit is not None:
+            history = history[-limit:] if limit > 0 else []
+        
+        results = []
+        for s in history:
+            row = {k: v for k, v in s.items() if k != "files"}
+            if path is not None:
+                row["files"] = [f for f in s.get("files", []) if f.get("path") == path]
+            results.append(row)
+        return results
+    
+    async def get_trend(self, project_id: str, points: int, since: Optional[str] = None,
+                        until: Optional[str] = None) -> Dict[str, Any]:
+        history = await self.get_snapshots(project_id, since, until)
+        total = len(history)
+        if total <= points:
+            return {"total": total, "scans": [{**s, "scans": 1} for s in history]}
+        
+        buckets: Dict[int, List[Dict[str, Any]]] = {}
+        for rank, s in enumerate(history, 1):
+            buckets.setdefault(trend_bucket(rank, total, points), []).append(s)
+        scans = []
+        for bucket in buckets.values():
+            averages = {key: sum(s["metrics"].get(key, 0) for s in bucket) / len(bucket) for key in TREND_METRICS}
+            scans.append(trend_point(bucket[-1], len(bucket), averages))
+        return {"total": total, "scans": scans}
+    
+    async def get_snapshot(self, project_id: str, scan_id: str, files: bool = False) -> Optional[Dict[str, Any]]:
+        for s in self.snapshots.get(project_id, []):
+            if s["scan_id"] == scan_id:
+                return {k: v for k, v in s.items() if files or k != "files"}
+        return None
+    
+    async def set_scan_diff(self, project_id: str, scan_id: str, entries: List[Dict[str, Any]]) -> None:
+        self.scan_diffs[f"{project_id}:{scan_id}"] = entries
+    
+    async def get_scan_diffs(self, project_id: str, scan_ids: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+        return {sid: self.scan_diffs[f"{project_id}:{sid}"] for sid in scan_ids if f"{project_id}:{sid}" in self.scan_diffs}
+    
+    async def record_scan(self, scan: Dict[str, Any]) -> None:
+        self.scans[scan["_id"]] = scan
+        if scan.get("status") == "completed" and scan.get("commit_sha"):
+            self._scans_by_commit[(scan.get("repo_url"), scan["commit_sha"])] = scan["_id"]
+    
+    async def find_scan(self, repo_url: str, commit_sha: str) -> Optional[Dict[str, Any]]:
+        scan_id = self._scans_by_commit.get((repo_url, commit_sha))
+        return self.scans.get(scan_id) if scan_id else None
+    
+    async def get_chat_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        entry = self.chat_sessions.get(session_id)
+        if entry is None or entry[0] <= time.monotonic():
+            return None
+        return entry[1]
+    
+    async def set_chat_session(self, session_id: str, session: Dict[str, Any], ttl: float) -> None:
+        now = time.monotonic()
+        self.chat_sessions.pop(session_id, None)
+        self.chat_sessions[session_id] = (now + ttl, session)
+        # Sessions share one ttl, so the expired ones are at the front
+        while self.chat_sessions:
+            oldest = next(iter(self.chat_sessions))
+            if self.chat_sessions[oldest][0] > now:
+                break
+            del self.chat_sessions[oldest]
+    
+    async def delete_chat_session(self, session_id: str) -> None:
+        self.chat_sessions.pop(session_id, None)
     
     async def connect(self) -> bool:
         print("✅ Using in-memory database")
@@ -114,9 +727,17 @@ class InMemoryDB(DatabaseInterface):
     
     async def close(self) -> None:
         self.projects.clear()
-        self.file_metrics.clear()
-        self.risks.clear()
-        self.smells.clear()
+        self.results.clear()
+        self._suggestion_ids.clear()
+        self._pending.clear()
+        self.generations.clear()
+        self.data_versions.clear()
+        self.summaries.clear()
+        self.snapshots.clear()
+        self.scan_diffs.clear()
+        self.scans.clear()
+        self._scans_by_commit.clear()
+        self.chat_sessions.clear()
         print("🔌 In-memory database cleared")
 
 
@@ -127,6 +748,17 @@ class MongoDBAtlas(DatabaseInterface):
         self._client = None
         self._db = None
         self._connected = False
+        self._bucketed = SMELL_LAYOUT == "bucketed"
+        # token -> carry-forward exclusions and paths written of each generation this worker opened
+        self._open: Dict[str, Dict[str, Any]] = {}
+    
+    @property
+    def _smell_collection(self) -> str:
+        return "smell_buckets" if self._bucketed else "smells"
+    
+    @property
+    def _result_collections(self) -> tuple:
+        return ("file_metrics", "risks", self._smell_collection, "functions", "suggestions")
     
     async def connect(self) -> bool:
         """Connect to MongoDB Atlas."""
@@ -171,18 +803,37 @@ class MongoDBAtlas(DatabaseInterface):
         if self._db is None:
             return
         
-        indexes = {
-            "projects": [("name", 1)],
-            "file_metrics": [("project_id", 1), ("path", 1)],
-            "risks": [("project_id", 1), ("risk_score", -1)],
-            "smells": [("project_id", 1), ("type", 1)]
-        }
+        indexes = [
+            ("projects", [("name", 1)]),
+            ("file_metrics", [("project_id", 1), ("gen_to", 1), ("path", 1)]),
+            ("risks", [("project_id", 1), ("gen_to", 1), ("risk_score", -1)]),
+            ("risks", [("project_id", 1), ("gen_to", 1), ("path", 1)]),
+            ("smells", [("project_id", 1), ("gen_to", 1), ("type", 1)]),
+            ("smells", [("project_id", 1), ("gen_to", 1), ("path", 1)]),
+            ("smell_buckets", [("project_id", 1), ("gen_to", 1), ("path", 1)]),
+            ("functions", [("project_id", 1), ("gen_to", 1), ("path", 1)]),
+            ("functions", [("project_id", 1), ("gen_to", 1), ("max_complexity", -1)]),
+            ("suggestions", [("project_id", 1), ("gen_to", 1), ("file_id", 1)]),
+            ("suggestions", [("project_id", 1), ("gen_to", 1), ("path", 1)]),
+            ("scans", [("repo_url", 1), ("commit_sha", 1), ("completed_at", -1)]),
+            ("scan_history", [("project_id", 1), ("timestamp", 1)]),
+            ("scan_diffs", [("project_id", 1), ("scan_id", 1)])
+        ]
+        
+        # Rows of uncommitted generations, for their commit and for sweeping
+        indexes += [(c, [("project_id", 1), ("pending", 1)]) for c in self._result_collections]
         
-        for collection, keys in indexes.items():
+        for collection, keys in indexes:
             try:
                 await self._db[collection].create_index(keys)
             except Exception as e:
                 print(f"Warning: Could not create index on {collection}: {e}")
+        
+        try:
+            # MongoDB deletes chat sessions once expires_at has passed
+            await self._db.chat_sessions.create_index("expires_at", expireAfterSeconds=0)
+        except Exception as e:
+            print(f"Warning: Could not create index on chat_sessions: {e}")
     
     async def close(self) -> None:
         """Close MongoDB connection."""
@@ -207,75 +858,664 @@ class MongoDBAtlas(DatabaseInterface):
             await self.connect()
         return await self._db.projects.find_one({"_id": project_id})
     
-    async def set_metrics(self, project_id: str, metrics: List[Dict[str, Any]]) -> None:
+    async def _current_generation(self, project_id: str) -> int:
+        state = await self._db.generations.find_one({"_id": project_id})
+        return (state or {}).get("current") or 0
+    
+    @staticmethod
+    def _generation_query(project_id: str, generation: int) -> Dict[str, Any]:
+        """
+        Rows valid at generation: committed by then (gen_from) and not retired
+        by then (gen_to). Rows written before generations existed have neither
+        bound and are valid until their first replacement.
+        """
+        return {
+            "project_id": project_id,
+            "pending": None,
+            "gen_from": {"$not": {"$gt": generation}},
+            "gen_to": {"$not": {"$lte": generation}}
+        }
+    
+    async def _project_filter(self, project_id: str, paths: Optional[List[str]]) -> Dict[str, Any]:
+        """Rows of the current generation, optionally only for the given paths."""
+        query = self._generation_query(project_id, await self._current_generation(project_id))
+        if paths is not None:
+            query["path"] = {"$in": list(paths)}
+        return query
+    
+    @staticmethod
+    def _projection(fields: Optional[List[str]], prefix: str = "") -> Dict[str, Any]:
+        """Only the requested fields, or the whole row without bookkeeping; never the ObjectId."""
+        if fields is None:
+            return {"_id": 0, **{f: 0 for f in _GENERATION_FIELDS}}
+        return {"_id": 0, **{prefix + f: 1 for f in fields}}
+    
+    async def _stamp(self, project_id: str, generation: Optional[str], paths: List[str]) -> Dict[str, Any]:
+        """Bookkeeping fields of new rows: pending in an open generation, else valid from the current one."""
+        if generation is None:
+            return {"gen_from": await self._current_generation(project_id)}
+        self._open.setdefault(generation, {"exclude": None, "paths": set()})["paths"].update(paths)
+        return {"pending": generation, "pending_at": datetime.utcnow()}
+    
+    async def _insert_rows(self, collection: str, project_id: str, rows: List[Dict[str, Any]],
+                           generation: Optional[str]) -> None:
+        if not rows:
+            return
+        for row in rows:
+            row['project_id'] = project_id
+        stamp = await self._stamp(project_id, generation, [row.get("path", row.get("file_path", "")) for row in rows])
+        await self._db[collection].insert_many([{**row, **stamp} for row in rows], ordered=False)
+    
+    async def set_metrics(self, project_id: str, metrics: List[Dict[str, Any]], generation: Optional[str] = None) -> None:
         if not self._connected:
             await self.connect()
-        
-        for m in metrics:
-            m['project_id'] = project_id
-            await self._db.file_metrics.update_one(
-                {"project_id": project_id, "path": m.get("path", "")},
-                {"$set": m},
-                upsert=True
-            )
+        await self._insert_rows("file_metrics", project_id, metrics, generation)
     
-    async def get_metrics(self, project_id: str) -> List[Dict[str, Any]]:
+    async def get_metrics(self, project_id: str, paths: Optional[List[str]] = None,
+                          fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
         if not self._connected:
             await self.connect()
-        cursor = self._db.file_metrics.find({"project_id": project_id})
-        results = await cursor.to_list(length=1000)
-        # Convert ObjectId to string for JSON serialization
-        for r in results:
-            if '_id' in r:
-                r['_id'] = str(r['_id'])
-        return results
+        cursor = self._db.file_metrics.find(await self._project_filter(project_id, paths), self._projection(fields))
+        # Uncapped, as the other backends are: totals and projected reads need every row
+        return await cursor.to_list(length=None)
     
-    async def set_risks(self, project_id: str, risks: List[Dict[str, Any]]) -> None:
+    async def set_risks(self, project_id: str, risks: List[Dict[str, Any]], generation: Optional[str] = None) -> None:
         if not self._connected:
             await self.connect()
-        
-        for r in risks:
-            r['project_id'] = project_id
-            await self._db.risks.update_one(
-                {"project_id": project_id, "path": r.get("path", "")},
-                {"$set": r},
-                upsert=True
-            )
+        await self._insert_rows("risks", project_id, risks, generation)
     
-    async def get_risks(self, project_id: str) -> List[Dict[str, Any]]:
+    async def get_risks(self, project_id: str, paths: Optional[List[str]] = None,
+                        fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
         if not self._connected:
             await self.connect()
-        cursor = self._db.risks.find({"project_id": project_id}).sort("risk_score", -1)
-        results = await cursor.to_list(length=1000)
-        # Convert ObjectId to string for JSON serialization
-        for r in results:
-            if '_id' in r:
-                r['_id'] = str(r['_id'])
-        return results
+        cursor = self._db.risks.find(
+            await self._project_filter(project_id, paths), self._projection(fields)
+        ).sort("risk_score", -1)
+        return await cursor.to_list(length=None)
     
-    async def set_smells(self, project_id: str, smells: List[Dict[str, Any]]) -> None:
+    async def set_smells(self, project_id: str, smells: List[Dict[str, Any]], generation: Optional[str] = None) -> None:
         if not self._connected:
             await self.connect()
+        if not self._bucketed:
+            await self._insert_rows("smells", project_id, smells, generation)
+            return
         
         for s in smells:
             s['project_id'] = project_id
+        buckets = self._smell_buckets(project_id, smells)
+        if buckets:
+            stamp = await self._stamp(project_id, generation, [b["path"] for b in buckets])
+            await self._db.smell_buckets.insert_many([{**b, **stamp} for b in buckets], ordered=False)
+    
+    async def get_smells(self, project_id: str, paths: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        if not self._connected:
+            await self.connect()
+        query = await self._project_filter(project_id, paths)
+        if self._bucketed:
+            # One indexed fetch of the project's (or the paths') buckets
+            cursor = self._db.smell_buckets.find(query, {"_id": 0, "path": 1, "smells": 1})
+            return [
+                {**s, "path": bucket["path"], "project_id": project_id}
+                async for bucket in cursor for s in bucket["smells"]
+            ]
+        
+        # Uncapped, as the bucketed layout and the other backends are
+        cursor = self._db.smells.find(query, self._projection(None))
+        return await cursor.to_list(length=None)
+    
+    async def iter_smells(self, project_id: str, min_severity: Optional[int] = None, batch_size: int = 1000,
+                          fields: Optional[List[str]] = None) -> AsyncIterator[List[Dict[str, Any]]]:
+        if not self._connected:
+            await self.connect()
+        query = await self._project_filter(project_id, None)
+        if self._bucketed:
+            if min_severity is not None:
+                query["smells.severity"] = {"$gte": min_severity}
+            if fields is None:
+                projection = {"_id": 0, "path": 1, "smells": 1}
+            else:
+                # Severity stays readable for the per-smell filter below
+                projection = {**self._projection([*fields, "severity"], "smells."), "path": 1}
+            cursor = self._db.smell_buckets.find(query, projection).batch_size(max(batch_size // 10, 1))
+            batch = []
+            async for bucket in cursor:
+                batch.extend(
+                    select_fields({**s, "path": bucket["path"], "project_id": project_id}, fields)
+                    for s in bucket["smells"]
+                    if min_severity is None or s.get("severity", 0) >= min_severity
+                )
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+            return
+        
+        if min_severity is not None:
+            query["severity"] = {"$gte": min_severity}
+        # Unlike get_smells, not capped: the rows stream straight from the cursor
+        cursor = self._db.smells.find(query, self._projection(fields)).batch_size(batch_size)
+        batch = []
+        async for row in cursor:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    
+    async def iter_rows(self, project_id: str, table: str, paths: Optional[List[str]] = None,
+                        batch_size: int = 1000) -> AsyncIterator[List[Dict[str, Any]]]:
+        if not self._connected:
+            await self.connect()
+        collection = {"metrics": "file_metrics", "smells": self._smell_collection}.get(table, table)
+        query = await self._project_filter(project_id, paths)
+        cursor = self._db[collection].find(query, self._projection(None)).batch_size(batch_size)
+        batch = []
+        async for row in cursor:
+            if collection == "smell_buckets":
+                batch.extend({**s, "path": row["path"], "project_id": project_id} for s in row["smells"])
+            else:
+                batch.append(row)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    
+    @staticmethod
+    def _smell_buckets(project_id: str, smells: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """One document per file: its smells without the repeated fields, plus per-file counts."""
+        by_path: Dict[str, List[Dict[str, Any]]] = {}
+        for s in smells:
             file_path = s.get("path", s.get("file_path", ""))
-            await self._db.smells.update_one(
-                {"project_id": project_id, "path": file_path, "type": s.get("type", ""), "line": s.get("line", 0)},
-                {"$set": s},
-                upsert=True
+            by_path.setdefault(file_path, []).append(
+                {k: v for k, v in s.items() if k not in ("_id", "project_id", "path", *_GENERATION_FIELDS)}
             )
+        
+        buckets = []
+        for file_path, rows in by_path.items():
+            severity: Dict[str, int] = {}
+            types: Dict[str, int] = {}
+            for row in rows:
+                key = str(row.get("severity", 1))
+                severity[key] = severity.get(key, 0) + 1
+                types[row.get("type", "")] = types.get(row.get("type", ""), 0) + 1
+            buckets.append({
+                "project_id": project_id,
+                "path": file_path,
+                "count": len(rows),
+                "severity_counts": severity,
+                "type_counts": types,
+                "smells": rows
+            })
+        return buckets
     
-    async def get_smells(self, project_id: str) -> List[Dict[str, Any]]:
+    async def migrate_smell_layout(self, project_id: Optional[str] = None) -> int:
+        """
+        Move stored smells into the configured layout (MONGO_SMELL_LAYOUT),
+        from whichever layout holds them now; returns the number of smells moved.
+        
+        Generation bounds are kept, so current and retained generations read
+        the same after the move. Run it right after switching the layout, before
+        serving traffic: until a project is moved its smells read as empty.
+        """
         if not self._connected:
             await self.connect()
-        cursor = self._db.smells.find({"project_id": project_id})
-        results = await cursor.to_list(length=1000)
-        # Convert ObjectId to string for JSON serialization
-        for r in results:
-            if '_id' in r:
-                r['_id'] = str(r['_id'])
-        return results
+        source = "smells" if self._bucketed else "smell_buckets"
+        query = {"project_id": project_id} if project_id else {}
+        project_ids = [project_id] if project_id else await self._db[source].distinct("project_id")
+        
+        moved = 0
+        for pid in project_ids:
+            docs = await self._db[source].find({**query, "project_id": pid}).to_list(length=None)
+            if not docs:
+                continue
+            # Rows sharing a file and the same generation bounds move together
+            groups: Dict[tuple, List[Dict[str, Any]]] = {}
+            for doc in docs:
+                bounds = tuple((f, doc[f]) for f in _GENERATION_FIELDS if doc.get(f) is not None)
+                groups.setdefault((doc.get("path", ""), bounds), []).append(doc)
+            
+            new_docs = []
+            for (file_path, bounds), group in groups.items():
+                if self._bucketed:
+                    targets = self._smell_buckets(pid, group)
+                else:
+                    targets = [
+                        {**s, "path": bucket["path"], "project_id": pid}
+                        for bucket in group for s in bucket["smells"]
+                    ]
+                for target in targets:
+                    target.update(bounds)
+                new_docs.extend(targets)
+            
+            if new_docs:
+                await self._db[self._smell_collection].insert_many(new_docs, ordered=False)
+            await self._db[source].delete_many({"_id": {"$in": [d["_id"] for d in docs]}})
+            moved += len(docs) if self._bucketed else len(new_docs)
+            print(f"  Moved smells of {pid} into {self._smell_collection}", flush=True)
+        return moved
+    
+    async def begin_generation(self, project_id: str) -> str:
+        generation = uuid.uuid4().hex
+        self._open[generation] = {"exclude": None, "paths": set()}
+        return generation
+    
+    async def current_generation(self, project_id: str) -> Optional[int]:
+        if not self._connected:
+            await self.connect()
+        state = await self._db.generations.find_one({"_id": project_id})
+        return (state or {}).get("current")
+    
+    async def carry_forward(self, project_id: str, generation: str, exclude_paths: List[str]) -> None:
+        scan = self._open.setdefault(generation, {"exclude": None, "paths": set()})
+        scan["exclude"] = set(scan["exclude"] or ()) | set(exclude_paths)
+    
+    async def _claim_commit(self, project_id: str, generation: str) -> int:
+        """
+        Take the project's commit lock on its generations document, so workers
+        commit one at a time; returns the current generation. A lock held past
+        GENERATION_TIMEOUT belongs to a crashed commit, undone before retrying.
+        """
+        from pymongo.errors import DuplicateKeyError
+        
+        while True:
+            state = await self._db.generations.find_one({"_id": project_id}) or {}
+            held = state.get("committing")
+            if held is not None:
+                if held["at"] > datetime.utcnow() - timedelta(seconds=GENERATION_TIMEOUT):
+                    await asyncio.sleep(0.5)
+                else:
+                    await self._roll_back(project_id, held)
+                continue
+            
+            current = state.get("current") or 0
+            try:
+                # Matches only if no other commit got in since the read; otherwise the
+                # upsert collides with the existing document
+                await self._db.generations.update_one(
+                    {"_id": project_id, "committing": None, "current": state.get("current")},
+                    {"$set": {"committing": {"generation": generation, "number": current + 1, "at": datetime.utcnow()}}},
+                    upsert=True
+                )
+                return current
+            except DuplicateKeyError:
+                continue
+    
+    async def _roll_back(self, project_id: str, held: Dict[str, Any]) -> None:
+        """Undo a commit that never made its generation current, and release its lock."""
+        state = await self._db.generations.find_one({"_id": project_id}) or {}
+        number = held["number"]
+        if (state.get("current") or 0) < number:
+            for collection in self._result_collections:
+                await self._db[collection].delete_many({"project_id": project_id, "gen_from": number})
+                await self._db[collection].delete_many({"project_id": project_id, "pending": held["generation"]})
+                await self._db[collection].update_many(
+                    {"project_id": project_id, "gen_to": number}, {"$unset": {"gen_to": ""}}
+                )
+        await self._db.generations.update_one(
+            {"_id": project_id, "committing.generation": held["generation"]}, {"$unset": {"committing": ""}}
+        )
+    
+    async def commit_generation(self, project_id: str, generation: str) -> int:
+        if not self._connected:
+            await self.connect()
+        scan = self._open.pop(generation, {"exclude": None, "paths": set()})
+        current = await self._claim_commit(project_id, generation)
+        committed = current + 1
+        
+        try:
+            # Rows are bounded, never copied or rewritten: an incremental scan
+            # retires the rows of its replaced paths only
+            retire: Dict[str, Any] = {"project_id": project_id, "pending": None, "gen_to": None}
+            if scan["exclude"] is not None:
+                retire["path"] = {"$in": list(scan["exclude"] | scan["paths"])}
+            for collection in self._result_collections:
+                await self._db[collection].update_many(retire, {"$set": {"gen_to": committed}})
+                await self._db[collection].update_many(
+                    {"project_id": project_id, "pending": generation},
+                    {"$set": {"gen_from": committed}, "$unset": {"pending": "", "pending_at": ""}}
+                )
+            
+            # Single-document update: readers see either the old or the new generation
+            flipped = await self._db.generations.update_one(
+                {"_id": project_id, "committing.generation": generation},
+                {"$set": {"current": committed, "previous": current}, "$unset": {"committing": ""}}
+            )
+        except Exception:
+            try:
+                await self._roll_back(project_id, {"generation": generation, "number": committed})
+            except Exception as e:
+                # Undone by the next commit or sweep once the lock times out
+                print(f"⚠️  Could not roll back generation {committed} of {project_id}: {e}", flush=True)
+            raise
+        if not flipped.matched_count:
+            raise RuntimeError(f"Commit of generation {committed} of {project_id} outlived GENERATION_TIMEOUT")
+        return committed
+    
+    async def drop_generation(self, project_id: str, generation: str) -> None:
+        if not self._connected:
+            await self.connect()
+        self._open.pop(generation, None)
+        for collection in self._result_collections:
+            await self._db[collection].delete_many({"project_id": project_id, "pending": generation})
+    
+    async def sweep_generations(self, project_id: str) -> None:
+        if not self._connected:
+            await self.connect()
+        cutoff = datetime.utcnow() - timedelta(seconds=GENERATION_TIMEOUT)
+        state = await self._db.generations.find_one({"_id": project_id}) or {}
+        held = state.get("committing")
+        if held is not None and held["at"] <= cutoff:
+            await self._roll_back(project_id, held)
+        
+        for collection in self._result_collections:
+            if state.get("previous"):
+                # Readers in flight see the previous generation at the oldest
+                await self._db[collection].delete_many({"project_id": project_id, "gen_to": {"$lte": state["previous"]}})
+            await self._db[collection].delete_many({"project_id": project_id, "pending_at": {"$lt": cutoff}})
+    
+    async def data_version(self, project_id: str) -> int:
+        if not self._connected:
+            await self.connect()
+        state = await self._db.data_versions.find_one({"_id": project_id})
+        return (state or {}).get("version", 0)
+    
+    async def bump_data_version(self, project_id: str) -> None:
+        if not self._connected:
+            await self.connect()
+        await self._db.data_versions.update_one({"_id": project_id}, {"$inc": {"version": 1}}, upsert=True)
+    
+    async def set_summary(self, project_id: str, summary: Dict[str, Any]) -> None:
+        if not self._connected:
+            await self.connect()
+        await self._db.summaries.replace_one(
+            {"_id": project_id},
+            {**summary, "_id": project_id},
+            upsert=True
+        )
+    
+    async def get_summary(self, project_id: str) -> Optional[Dict[str, Any]]:
+        if not self._connected:
+            await self.connect()
+        return await self._db.summaries.find_one({"_id": project_id})
+    
+    async def append_snapshot(self, snapshot: Dict[str, Any]) -> None:
+        if not self._connected:
+            await self.connect()
+        # Insert-only: replaying a scan never rewrites its snapshot
+        await self._db.scan_history.update_one(
+            {"_id": f"{snapshot['project_id']}:{snapshot['scan_id']}"},
+            {"$setOnInsert": snapshot},
+            upsert=True
+        )
+    
+    async def get_snapshots(self, project_id: str, since: Optional[str] = None, until: Optional[str] = None,
+                            limit: Optional[int] = None, path: Optional[str] = None) -> List[Dict[str, Any]]:
+        if not self._connected:
+            await self.connect()
+        if limit is not None and limit <= 0:
+            return []
+        
+        query: Dict[str, Any] = {"project_id": project_id}
+        if since is not None or until is not None:
+            query["timestamp"] = {}
+            if since is not None:
+                query["timestamp"]["$gte"] = since
+            if until is not None:
+                query["timestamp"]["$lte"] = until
+        
+        if path is None:
+            projection: Dict[str, Any] = {"_id": 0, "files": 0}
+        else:
+            # $elemMatch projects by inclusion, so the snapshot fields are listed
+            projection = {"_id": 0, "project_id": 1, "scan_id": 1, "commit_sha": 1, "timestamp": 1,
+                          "metrics": 1, "files": {"$elemMatch": {"path": path}}}
+        
+        if limit is None:
+            cursor = self._db.scan_history.find(query, projection).sort("timestamp", 1)
+            return await cursor.to_list(length=None)
+        # Latest limit snapshots straight off the index, returned oldest first
+        cursor = self._db.scan_history.find(query, projection).sort("timestamp", -1).limit(limit)
+        snapshots = await cursor.to_list(length=limit)
+        snapshots.reverse()
+        return snapshots
+    
+    async def get_trend(self, project_id: str, points: int, since: Optional[str] = None,
+                        until: Optional[str] = None) -> Dict[str, Any]:
+        if not self._connected:
+            await self.connect()
+        query: Dict[str, Any] = {"project_id": project_id}
+        if since is not None or until is not None:
+            query["timestamp"] = {}
+            if since is not None:
+                query["timestamp"]["$gte"] = since
+            if until is not None:
+                query["timestamp"]["$lte"] = until
+        
+        # Timestamps only, covered by the (project_id, timestamp) index, to place the runs
+        cursor = self._db.scan_history.find(query, {"_id": 0, "timestamp": 1}).sort("timestamp", 1)
+        stamps = [doc["timestamp"] async for doc in cursor]
+        total = len(stamps)
+        if total <= points:
+            snapshots = await self.get_snapshots(project_id, since, until)
+            return {"total": total, "scans": [{**s, "scans": 1} for s in snapshots]}
+        
+        # Each run starts at its first scan's timestamp; scans sharing a timestamp stay in one run
+        starts = sorted({stamps[i * total // points] for i in range(points)})
+        output: Dict[str, Any] = {"scans": {"$sum": 1}, "last": {"$last": "$$ROOT"}}
+        for key in TREND_METRICS:
+            output[key] = {"$avg": {"$ifNull": [f"$metrics.{key}", 0]}}
+        pipeline = [
+            {"$match": query},
+            {"$sort": {"timestamp": 1}},
+            {"$project": {"_id": 0, "files": 0}},
+            {"$bucket": {"groupBy": "$timestamp", "boundaries": starts + [stamps[-1] + "\uffff"], "output": output}}
+        ]
+        scans = []
+        async for bucket in self._db.scan_history.aggregate(pipeline):
+            averages = {key: bucket[key] for key in TREND_METRICS if bucket.get(key) is not None}
+            scans.append(trend_point(bucket["last"], bucket["scans"], averages))
+        return {"total": total, "scans": scans}
+    
+    async def get_snapshot(self, project_id: str, scan_id: str, files: bool = False) -> Optional[Dict[str, Any]]:
+        if not self._connected:
+            await self.connect()
+        projection = {"_id": 0} if files else {"_id": 0, "files": 0}
+        return await self._db.scan_history.find_one({"_id": f"{project_id}:{scan_id}"}, projection)
+    
+    async def set_scan_diff(self, project_id: str, scan_id: str, entries: List[Dict[str, Any]]) -> None:
+        if not self._connected:
+            await self.connect()
+        # One document per changed file keeps large diffs under the document size limit
+        await self._db.scan_diffs.delete_many({"project_id": project_id, "scan_id": scan_id})
+        if entries:
+            await self._db.scan_diffs.insert_many([
+                {**e, "project_id": project_id, "scan_id": scan_id, "seq": i} for i, e in enumerate(entries)
+            ])
+    
+    async def get_scan_diffs(self, project_id: str, scan_ids: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+        if not self._connected:
+            await self.connect()
+        cursor = self._db.scan_diffs.find(
+            {"project_id": project_id, "scan_id": {"$in": list(scan_ids)}},
+            {"_id": 0, "project_id": 0}
+        ).sort([("scan_id", 1), ("seq", 1)])
+        
+        diffs: Dict[str, List[Dict[str, Any]]] = {}
+        async for entry in cursor:
+            entry.pop("seq", None)
+            diffs.setdefault(entry.pop("scan_id"), []).append(entry)
+        return diffs
+    
+    async def set_functions(self, project_id: str, buckets: List[Dict[str, Any]], generation: Optional[str] = None) -> None:
+        if not self._connected:
+            await self.connect()
+        await self._insert_rows("functions", project_id, buckets, generation)
+    
+    async def get_functions(self, project_id: str, paths: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        if not self._connected:
+            await self.connect()
+        cursor = self._db.functions.find(await self._project_filter(project_id, paths), self._projection(None))
+        return await cursor.to_list(length=None)
+    
+    async def set_suggestions(self, project_id: str, rows: List[Dict[str, Any]], generation: Optional[str] = None) -> None:
+        if not self._connected:
+            await self.connect()
+        await self._insert_rows("suggestions", project_id, rows, generation)
+    
+    async def get_suggestions(self, project_id: str, file_id: str) -> Optional[Dict[str, Any]]:
+        if not self._connected:
+            await self.connect()
+        # Exact match on the (project_id, gen_to, file_id) index
+        return await self._db.suggestions.find_one(
+            {**await self._project_filter(project_id, None), "file_id": file_id},
+            self._projection(None)
+        )
+    
+    async def top_functions(self, project_id: str, limit: int, min_complexity: int = 1) -> List[Dict[str, Any]]:
+        if not self._connected:
+            await self.connect()
+        # Walks the (project_id, max_complexity) index and stops early
+        cursor = self._db.functions.find(
+            {**await self._project_filter(project_id, None), "max_complexity": {"$gte": min_complexity}},
+            self._projection(None)
+        ).sort("max_complexity", -1).batch_size(max(limit, 20))
+        
+        top = FunctionTopK(limit, min_complexity)
+        async for bucket in cursor:
+            if not top.add(bucket):
+                break
+        await cursor.close()
+        return top.results()
+    
+    async def risk_summary(self, project_id: str) -> Dict[str, Dict[str, float]]:
+        if not self._connected:
+            await self.connect()
+        cursor = self._db.risks.aggregate([
+            {"$match": await self._project_filter(project_id, None)},
+            {"$group": {"_id": {"$ifNull": ["$tier", "Low"]}, "count": {"$sum": 1}, "risk_total": {"$sum": "$risk_score"}}}
+        ])
+        return {g["_id"]: {"count": g["count"], "risk_total": g["risk_total"]} async for g in cursor}
+    
+    async def smell_counts(self, project_id: str) -> Dict[str, Any]:
+        if not self._connected:
+            await self.connect()
+        if self._bucketed:
+            # Buckets carry their count; only the type/severity pairs need the array unwound
+            facets = {
+                "types": [
+                    {"$unwind": "$smells"},
+                    {"$group": {"_id": {"severity": "$smells.severity", "type": "$smells.type"}, "count": {"$sum": 1}}}
+                ],
+                "files": [
+                    {"$project": {"_id": "$path", "count": 1, "max_severity": {"$max": "$smells.severity"}}}
+                ]
+            }
+        else:
+            facets = {
+                "types": [
+                    {"$group": {"_id": {"severity": "$severity", "type": "$type"}, "count": {"$sum": 1}}}
+                ],
+                "files": [
+                    {"$group": {"_id": "$path", "count": {"$sum": 1}, "max_severity": {"$max": "$severity"}}}
+                ]
+            }
+        cursor = self._db[self._smell_collection].aggregate([
+            {"$match": await self._project_filter(project_id, None)},
+            {"$facet": facets}
+        ])
+        result = (await cursor.to_list(length=1))[0]
+        
+        # Severities are normalized here so the counts match InMemoryDB's
+        by_severity: Dict[str, Dict[str, int]] = {}
+        for g in result["types"]:
+            types = by_severity.setdefault(severity_key(g["_id"].get("severity")), {})
+            name = g["_id"].get("type") or "Unknown"
+            types[name] = types.get(name, 0) + g["count"]
+        files: Dict[str, Dict[str, int]] = {}
+        for g in result["files"]:
+            entry = files.setdefault(g["_id"], {"count": 0, "max_severity": 1})
+            entry["count"] += g["count"]
+            entry["max_severity"] = max(entry["max_severity"], int(severity_key(g["max_severity"])))
+        return {"by_severity": by_severity, "files": files}
+    
+    async def top_smells(self, project_id: str, limit: int) -> List[Dict[str, Any]]:
+        if not self._connected:
+            await self.connect()
+        if limit <= 0:
+            return []
+        query = await self._project_filter(project_id, None)
+        if self._bucketed:
+            cursor = self._db.smell_buckets.aggregate([
+                {"$match": query},
+                {"$unwind": "$smells"},
+                {"$sort": {"smells.severity": -1}},
+                {"$limit": limit},
+                {"$replaceRoot": {"newRoot": {"$mergeObjects": [
+                    "$smells", {"path": "$path", "project_id": "$project_id"}
+                ]}}}
+            ])
+        else:
+            cursor = self._db.smells.find(query, self._projection(None)).sort("severity", -1).limit(limit)
+        return await cursor.to_list(length=limit)
+    
+    async def metric_histogram(self, project_id: str, field: str, bucket_size: float,
+                               table: str = "metrics") -> Dict[str, int]:
+        if not self._connected:
+            await self.connect()
+        collection = {"metrics": "file_metrics", "risks": "risks"}[table]
+        cursor = self._db[collection].aggregate([
+            {"$match": await self._project_filter(project_id, None)},
+            {"$group": {
+                "_id": {"$multiply": [
+                    {"$floor": {"$divide": [{"$ifNull": [f"${field}", 0]}, bucket_size]}}, bucket_size
+                ]},
+                "count": {"$sum": 1}
+            }}
+        ])
+        return {histogram_key(g["_id"], bucket_size): g["count"] async for g in cursor}
+    
+    async def record_scan(self, scan: Dict[str, Any]) -> None:
+        if not self._connected:
+            await self.connect()
+        await self._db.scans.update_one(
+            {"_id": scan["_id"]},
+            {"$set": scan},
+            upsert=True
+        )
+    
+    async def find_scan(self, repo_url: str, commit_sha: str) -> Optional[Dict[str, Any]]:
+        if not self._connected:
+            await self.connect()
+        return await self._db.scans.find_one(
+            {"repo_url": repo_url, "commit_sha": commit_sha, "status": "completed"},
+            sort=[("completed_at", -1)]
+        )
+    
+    async def get_chat_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        if not self._connected:
+            await self.connect()
+        # The TTL monitor runs about once a minute, so expiry is checked here too
+        return await self._db.chat_sessions.find_one(
+            {"_id": session_id, "expires_at": {"$gt": datetime.utcnow()}},
+            {"_id": 0, "expires_at": 0}
+        )
+    
+    async def set_chat_session(self, session_id: str, session: Dict[str, Any], ttl: float) -> None:
+        if not self._connected:
+            await self.connect()
+        await self._db.chat_sessions.replace_one(
+            {"_id": session_id},
+            {**session, "_id": session_id, "expires_at": datetime.utcnow() + timedelta(seconds=ttl)},
+            upsert=True
+        )
+    
+    async def delete_chat_session(self, session_id: str) -> None:
+        if not self._connected:
+            await self.connect()
+        await self._db.chat_sessions.delete_one({"_id": session_id})
 
 
 # Singleton database instance
@@ -285,10 +1525,15 @@ def get_database() -> DatabaseInterface:
     """Factory function to get the appropriate database instance (singleton)."""
     global _db_instance
     if _db_instance is None:
-        if USE_IN_MEMORY:
+        if USE_SQLITE:
+            from .sqlite_db import SQLiteDB
+            _db_instance = SQLiteDB(SQLITE_PATH)
+        elif USE_IN_MEMORY:
             _db_instance = InMemoryDB()
         else:
             _db_instance = MongoDBAtlas()
+        from .cached_db import CachedDatabase
+        _db_instance = CachedDatabase(_db_instance, DB_CACHE_SIZE, DB_CACHE_TTL, DB_CACHE_VERSION_TTL)
     return _db_instance
 
 
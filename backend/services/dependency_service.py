@@ -2,39 +2,65 @@
 Dependency Graph Service - Analyzes file imports and generates dependency graph data.
 """
 
-import os
+import asyncio
 import ast
 import re
+import posixpath
 from pathlib import Path
-from typing import Dict, List, Any
+from typing import Dict, Iterable, List, Any, Optional, Tuple
 from collections import defaultdict
 
+from .source_reader import SourceReader, SourceFile
+
 
 class DependencyAnalyzer:
     """Analyzes code dependencies and generates graph data for visualization."""
     
-    def __init__(self, repo_path: str):
-        self.repo_path = Path(repo_path)
+    EXTENSIONS = ['.py', '.js', '.jsx', '.ts', '.tsx']
+    
+    def __init__(self, repo_path: Optional[str] = None, reader: Optional[SourceReader] = None):
+        self.repo_path = Path(repo_path) if repo_path else None
+        self.reader = reader or SourceReader()
         self.nodes: List[Dict[str, Any]] = []
         self.links: List[Dict[str, Any]] = []
+        # Imports are resolved once every file is known: (node id, raw imports)
+        self._paths: List[str] = []
+        self._imports: List[Tuple[str, List[str]]] = []
         
     def analyze(self) -> Dict[str, Any]:
-        """Analyze all files and return dependency graph data."""
-        python_files = list(self.repo_path.rglob("*.py"))
-        js_files = list(self.repo_path.rglob("*.js"))
-        jsx_files = list(self.repo_path.rglob("*.jsx"))
-        ts_files = list(self.repo_path.rglob("*.ts"))
-        tsx_files = list(self.repo_path.rglob("*.tsx"))
-        
-        all_files = python_files + js_files + jsx_files + ts_files + tsx_files
-        
+        """Analyze all files under repo_path and return dependency graph data."""
         ignore_dirs = {'node_modules', 'venv', '.venv', '__pycache__', '.git', 'dist', 'build'}
-        all_files = [f for f in all_files if not any(d in f.parts for d in ignore_dirs)]
-        
-        file_index = self._build_file_index(all_files)
-        
-        for file_path in all_files:
-            self._analyze_file(file_path, file_index)
+        sources = []
+        for ext in self.EXTENSIONS:
+            for f in self.repo_path.rglob(f"*{ext}"):
+                rel = f.relative_to(self.repo_path)
+                if any(d in rel.parts for d in ignore_dirs):
+                    continue
+                source = self.reader.open(f, rel.as_posix())
+                if source is not None:
+                    sources.append(source)
+        return self.analyze_sources(sources)
+    
+    def analyze_sources(self, sources: Iterable[SourceFile]) -> Dict[str, Any]:
+        """Build the graph from sources already read by the scan's SourceReader."""
+        for source in sources:
+            self.add_source(source)
+        return self.graph()
+    
+    def add_source(self, source: SourceFile) -> None:
+        """Record a file's node and imports; the source is not needed afterwards."""
+        self._paths.append(source.path)
+        self._analyze_file(source)
+    
+    def graph(self) -> Dict[str, Any]:
+        """Resolve the recorded imports against every added file and return the graph."""
+        file_index = self._build_file_index(self._paths)
+        for node_id, imports in self._imports:
+            for imp in imports:
+                resolved = self._resolve_import(imp, node_id, file_index)
+                if resolved:
+                    self.links.append({"source": node_id, "target": resolved, "type": "import"})
+        self._imports = []
         
         self._calculate_node_metrics()
         
@@ -48,70 +74,49 @@ class DependencyAnalyzer:
             }
         }
     
-    def _build_file_index(self, files: List[Path]) -> Dict[str, Path]:
+    def _build_file_index(self, paths: List[str]) -> Dict[str, str]:
         index = {}
-        for f in files:
-            name = f.stem
-            index[name] = f
-            try:
-                rel = f.relative_to(self.repo_path)
-                index[str(rel)] = f
-                module_path = str(rel).replace(os.sep, '.').replace('/', '.')
-                if module_path.endswith('.py'):
-                    module_path = module_path[:-3]
-                index[module_path] = f
-            except ValueError:
-                pass
+        for rel in paths:
+            rel = rel.replace('\\', '/')
+            name = posixpath.splitext(posixpath.basename(rel))[0]
+            index[name] = rel
+            index[rel] = rel
+            module_path = rel.replace('/', '.')
+            if module_path.endswith('.py'):
+                module_path = module_path[:-3]
+            index[module_path] = rel
         return index
     
-    def _analyze_file(self, file_path: Path, file_index: Dict[str, Path]):
-        try:
-            rel_path = str(file_path.relative_to(self.repo_path))
-        except ValueError:
-            rel_path = str(file_path)
+    def _analyze_file(self, source: SourceFile):
+        rel_path = source.path.replace('\\', '/')
         
-        ext = file_path.suffix.lower()
+        ext = posixpath.splitext(rel_path)[1].lower()
         if ext == '.py':
             file_type = 'python'
-            imports = self._get_python_imports(file_path)
+            imports = self._get_python_imports(source)
         elif ext in ['.js', '.jsx']:
             file_type = 'javascript'
-            imports = self._get_js_imports(file_path)
+            imports = self._get_js_imports(source)
         elif ext in ['.ts', '.tsx']:
             file_type = 'typescript'
-            imports = self._get_js_imports(file_path)
+            imports = self._get_js_imports(source)
         else:
             return
         
-        try:
-            content = file_path.read_text(encoding='utf-8', errors='ignore')
-            loc = len(content.splitlines())
-        except:
-            loc = 0
-        
-        node_id = rel_path.replace('\\', '/')
+        node_id = rel_path
         self.nodes.append({
             "id": node_id,
-            "name": file_path.name,
+            "name": posixpath.basename(rel_path),
             "type": file_type,
-            "metrics": {"lines": loc, "complexity": 0},
+            "metrics": {"lines": source.line_count, "complexity": 0},
             "risk": 0
         })
-        
-        for imp in imports:
-            resolved = self._resolve_import(imp, file_path, file_index)
-            if resolved:
-                try:
-                    target_rel = str(resolved.relative_to(self.repo_path)).replace('\\', '/')
-                except ValueError:
-                    target_rel = str(resolved).replace('\\', '/')
-                self.links.append({"source": node_id, "target": target_rel, "type": "import"})
-    
-    def _get_python_imports(self, file_path: Path) -> List[str]:
+        self._imports.append((node_id, imports))
+    
+    def _get_python_imports(self, source: SourceFile) -> List[str]:
         imports = []
         try:
-            content = file_path.read_text(encoding='utf-8', errors='ignore')
-            tree = ast.parse(content)
+            tree = ast.parse(source.text)
             for node in ast.walk(tree):
                 if isinstance(node, ast.Import):
                     for alias in node.names:
@@ -123,18 +128,15 @@ class DependencyAnalyzer:
             pass
         return imports
     
-    def _get_js_imports(self, file_path: Path) -> List[str]:
+    def _get_js_imports(self, source: SourceFile) -> List[str]:
         imports = []
-        try:
-            content = file_path.read_text(encoding='utf-8', errors='ignore')
-            imports.extend(re.findall(r'import\s+.*?\s+from\s+[\'"]([^\'"]+)[\'"]', content))
-            imports.extend(re.findall(r'import\s+[\'"]([^\'"]+)[\'"]', content))
-            imports.extend(re.findall(r'require\s*\(\s*[\'"]([^\'"]+)[\'"]\s*\)', content))
-        except:
-            pass
+        content = source.text
+        imports.extend(re.findall(r'import\s+.*?\s+from\s+[\'"]([^\'"]+)[\'"]', content))
+        imports.extend(re.findall(r'import\s+[\'"]([^\'"]+)[\'"]', content))
+        imports.extend(re.findall(r'require\s*\(\s*[\'"]([^\'"]+)[\'"]\s*\)', content))
         return imports
     
-    def _resolve_import(self, import_name: str, source_file: Path, file_index: Dict[str, Path]) -> Path:
+    def _resolve_import(self, import_name: str, source_path: str, file_index: Dict[str, str]) -> Optional[str]:
         external = ('react', 'vue', 'angular', 'express', 'lodash', 'axios', 'moment',
                     'numpy', 'pandas', 'django', 'flask', 'fastapi', 'sqlalchemy',
                     'requests', '@', 'framer', 'recharts', 'tailwind', 'vite')
@@ -143,12 +145,10 @@ class DependencyAnalyzer:
         if import_name in file_index:
             return file_index[import_name]
         if import_name.startswith('.'):
-            source_dir = source_file.parent
-            rel_path = import_name.lstrip('./').replace('/', os.sep)
-            for ext in ['.py', '.js', '.jsx', '.ts', '.tsx']:
-                candidate = source_dir / (rel_path + ext)
-                if candidate.exists():
-                    return candidate
+            base = posixpath.normpath(posixpath.join(posixpath.dirname(source_path), import_name))
+            for ext in self.EXTENSIONS:
+                if base + ext in file_index:
+                    return file_index[base + ext]
         parts = import_name.split('.')
         for part in parts:
             if part in file_index:
@@ -175,9 +175,18 @@ class DependencyAnalyzer:
 _dependency_cache: Dict[str, Dict] = {}
 
 
+def cache_dependency_graph(project_id: str, graph: Optional[Dict[str, Any]]) -> None:
+    """Store the graph built during a scan, or drop a stale one when graph is None."""
+    if graph is None:
+        _dependency_cache.pop(project_id, None)
+    else:
+        _dependency_cache[project_id] = graph
+
+
 async def get_dependency_graph(project_id: str) -> Dict[str, Any]:
     """Get dependency graph for a project."""
     from services.db import db
+    from services.repo_analyzer import repo_analyzer
     
     if project_id in _dependency_cache:
         return _dependency_cache[project_id]
@@ -186,13 +195,22 @@ async def get_dependency_graph(project_id: str) -> Dict[str, Any]:
     if not project:
         return {"nodes": [], "links": [], "error": "Project not found"}
     
-    repo_path = project.get("local_path")
-    if not repo_path or not os.path.exists(repo_path):
-        return {"nodes": [], "links": [], "message": "Repository not available locally."}
+    def build() -> Optional[Dict[str, Any]]:
+        reader = SourceReader()
+        analyzer = DependencyAnalyzer(reader=reader)
+        try:
+            for source in repo_analyzer.read_project_sources(project, reader):
+                analyzer.add_source(source)
+                reader.release(source)
+        finally:
+            reader.close()
+        return analyzer.graph() if analyzer.nodes else None
     
     try:
-        analyzer = DependencyAnalyzer(repo_path)
-        result = analyzer.analyze()
+        # Reading a whole revision (git cat-file, blob prefetch) blocks
+        result = await asyncio.to_thread(build)
+        if result is None:
+            return {"nodes": [], "links": [], "message": "Repository not available locally."}
         _dependency_cache[project_id] = result
         return result
     except Exception as e:
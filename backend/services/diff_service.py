@@ -0,0 +1,141 @@
+"""
+Scan Diff Service - What changed between two scans, file by file.
+
+When a scan completes, the stored rows of every file it replaced are compared
+with the new ones: smells are matched by fingerprint (see smell_fingerprint)
+into new and fixed, and key metrics are kept before and after. Only files with
+a change get a diff entry, so storing a scan's diff costs what changed, not the
+size of the project. Diffs between any two scans are composed from the
+per-scan diffs in between.
+"""
+
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .smell_fingerprint import row_fingerprint
+
+
+# Metrics tracked per file across scans
+KEY_METRICS = ("loc", "sloc", "cyclomatic_max", "fn_count", "nesting_max", "dup_ratio", "comment_ratio")
+
+
+def _path(row: Dict[str, Any]) -> str:
+    return row.get("path", row.get("file_path", ""))
+
+
+def _by_path(rows: Iterable[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    grouped: Dict[str, List[Dict[str, Any]]] = {}
+    for row in rows:
+        grouped.setdefault(_path(row), []).append(row)
+    return grouped
+
+
+def _file_state(metric: Optional[Dict[str, Any]], risk: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    if metric is None:
+        return None
+    state = {k: metric.get(k, 0) for k in KEY_METRICS}
+    state["risk_score"] = (risk or {}).get("risk_score", 0)
+    return state
+
+
+def _compact_smell(row: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "fingerprint": row_fingerprint(row),
+        "path": _path(row),
+        "type": row.get("type", ""),
+        "severity": row.get("severity", 1),
+        "line": row.get("line", 0),
+        "message": row.get("message", "")
+    }
+
+
+def diff_files(old_metrics: List[Dict[str, Any]], old_risks: List[Dict[str, Any]], old_smells: List[Dict[str, Any]],
+               new_metrics: List[Dict[str, Any]], new_risks: List[Dict[str, Any]],
+               new_smells: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Diff entries for the files whose rows were replaced: old rows are what was
+    stored for them before the scan, new rows what the scan stored instead.
+
+    Each entry is {"path", "status", "before", "after", "new", "fixed"} where
+    status is added, removed or modified and before/after hold the key metrics
+    (None for a file that did not exist). Unchanged files are left out.
+    """
+    old_m = {_path(r): r for r in old_metrics}
+    new_m = {_path(r): r for r in new_metrics}
+    old_r = {_path(r): r for r in old_risks}
+    new_r = {_path(r): r for r in new_risks}
+    old_s = _by_path(old_smells)
+    new_s = _by_path(new_smells)
+
+    entries = []
+    for path in sorted(set(old_m) | set(new_m) | set(old_s) | set(new_s)):
+        before = _file_state(old_m.get(path), old_r.get(path))
+        after = _file_state(new_m.get(path), new_r.get(path))
+
+        was = {row_fingerprint(r): r for r in old_s.get(path, [])}
+        now = {row_fingerprint(r): r for r in new_s.get(path, [])}
+        new = [_compact_smell(now[f]) for f in now.keys() - was.keys()]
+        fixed = [_compact_smell(was[f]) for f in was.keys() - now.keys()]
+
+        if before == after and not new and not fixed:
+            continue
+        entries.append({
+            "path": path,
+            "status": "added" if before is None else "removed" if after is None else "modified",
+            "before": before,
+            "after": after,
+            "new": sorted(new, key=lambda s: s["line"]),
+            "fixed": sorted(fixed, key=lambda s: s["line"])
+        })
+    return entries
+
+
+def diff_header(from_scan_id: str, entries: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Counts of a scan's diff, kept with its history snapshot."""
+    return {
+        "from_scan_id": from_scan_id,
+        "files_changed": len(entries),
+        "new": sum(len(e["new"]) for e in entries),
+        "fixed": sum(len(e["fixed"]) for e in entries)
+    }
+
+
+def compose(steps: List[List[Dict[str, Any]]]) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, Dict], Dict[str, Dict]]:
+    """
+    Net effect of consecutive per-scan diffs, oldest first.
+
+    Returns (files, new, fixed): files maps path to its composed entry, new and
+    fixed map fingerprint to smell. A smell that appears and is fixed again in
+    between cancels out, as does one fixed and then reintroduced.
+    """
+    files: Dict[str, Dict[str, Any]] = {}
+    new: Dict[str, Dict] = {}
+    fixed: Dict[str, Dict] = {}
+
+    for entries in steps:
+        for entry in entries:
+            composed = files.get(entry["path"])
+            if composed is None:
+                files[entry["path"]] = {"path": entry["path"], "before": entry["before"], "after": entry["after"]}
+            else:
+                composed["after"] = entry["after"]
+
+            for smell in entry["fixed"]:
+                if new.pop(smell["fingerprint"], None) is None:
+                    fixed[smell["fingerprint"]] = smell
+            for smell in entry["new"]:
+                if fixed.pop(smell["fingerprint"], None) is None:
+                    new[smell["fingerprint"]] = smell
+
+    # Files that ended up as they started
+    touched = {s["path"] for s in new.values()} | {s["path"] for s in fixed.values()}
+    for path in [p for p, e in files.items() if e["before"] == e["after"] and p not in touched]:
+        del files[path]
+
+    for entry in files.values():
+        before, after = entry["before"], entry["after"]
+        entry["status"] = "added" if before is None else "removed" if after is None else "modified"
+        if before is not None and after is not None:
+            entry["deltas"] = {k: round(after[k] - before.get(k, 0), 3) for k in after if after[k] != before.get(k, 0)}
+        else:
+            entry["deltas"] = {}
+    return files, new, fixed
@@ -0,0 +1,145 @@
+"""
+Git Object Store - Reads source files straight from a repository's object database.
+
+Used by the "objects" ingestion mode: the tree is listed with `git ls-tree -r`
+and only the blobs we analyze are streamed through one long-lived
+`git cat-file --batch` process, so no working tree is ever written to disk.
+In blobless partial clones the needed blobs are fetched in a single batch first.
+"""
+
+import subprocess
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+
+# Max paths passed to a single `git ls-tree` invocation
+_LS_TREE_CHUNK = 500
+
+
+class CatFileBatch:
+    """A long-lived `git cat-file --batch` process answering one object at a time."""
+
+    def __init__(self, repo_dir: Path):
+        self._proc = subprocess.Popen(
+            ['git', 'cat-file', '--batch'],
+            cwd=str(repo_dir),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL
+        )
+        self.bytes_read = 0
+
+    def read(self, oid: str) -> Optional[bytes]:
+        """Return the object's content, or None if it is missing."""
+        self._proc.stdin.write(f"{oid}\n".encode())
+        self._proc.stdin.flush()
+
+        header = self._proc.stdout.readline().decode().split()
+        if len(header) != 3:  # "<oid> missing"
+            return None
+
+        size = int(header[2])
+        data = self._proc.stdout.read(size)
+        self._proc.stdout.read(1)  # trailing LF
+        self.bytes_read += size
+        return data
+
+    def close(self) -> None:
+        if self._proc.poll() is None:
+            self._proc.stdin.close()
+            try:
+                self._proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self._proc.kill()
+
+    def __enter__(self) -> "CatFileBatch":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class GitObjectStore:
+    """Lists and reads blobs of a (possibly bare, possibly blobless) repository."""
+
+    def __init__(self, repo_dir: Path):
+        self.repo_dir = repo_dir
+
+    def list_tree(self, rev: str, paths: Optional[List[str]] = None) -> List[Tuple[str, str]]:
+        """Return (path, blob oid) for every regular file in rev, optionally limited to paths."""
+        if paths is None:
+            return self._ls_tree(rev, [])
+
+        entries = []
+        for i in range(0, len(paths), _LS_TREE_CHUNK):
+            entries.extend(self._ls_tree(rev, paths[i:i + _LS_TREE_CHUNK]))
+        return entries
+
+    def _ls_tree(self, rev: str, paths: List[str]) -> List[Tuple[str, str]]:
+        cmd = ['git', 'ls-tree', '-r', '-z', '--full-tree', rev]
+        if paths:
+            cmd += ['--', *paths]
+        result = subprocess.run(cmd, cwd=str(self.repo_dir), capture_output=True, timeout=120)
+        if result.returncode != 0:
+            print(f"  git ls-tree failed: {result.stderr.decode(errors='ignore').strip()}", flush=True)
+            return []
+
+        entries = []
+        for record in result.stdout.decode('utf-8', errors='surrogateescape').split('\0'):
+            if not record:
+                continue
+            meta, path = record.split('\t', 1)
+            mode, obj_type, oid = meta.split()
+            # Skip submodules (commit) and symlinks (120000)
+            if obj_type == 'blob' and mode != '120000':
+                entries.append((path, oid))
+        return entries
+
+    def prefetch(self, oids: Iterable[str]) -> bool:
+        """
+        Fetch missing blobs of a partial clone in one round-trip.
+
+        Mirrors what git does for lazy fetches, but batched instead of one
+        request per object. A no-op for repositories that are not partial clones.
+        """
+        if not self._is_partial_clone():
+            return True
+
+        oid_list = "\n".join(oids)
+        if not oid_list:
+            return True
+
+        result = subprocess.run(
+            ['git', '-c', 'fetch.negotiationAlgorithm=noop', 'fetch', 'origin',
+             '--no-tags', '--no-write-fetch-head', '--recurse-submodules=no',
+             '--filter=blob:none', '--stdin'],
+            cwd=str(self.repo_dir),
+            input=oid_list + "\n",
+            capture_output=True,
+            text=True,
+            timeout=600
+        )
+        if result.returncode != 0:
+            print(f"  Blob prefetch failed: {result.stderr.strip()}", flush=True)
+        return result.returncode == 0
+
+    def _is_partial_clone(self) -> bool:
+        result = subprocess.run(
+            ['git', 'config', '--get', 'remote.origin.promisor'],
+            cwd=str(self.repo_dir),
+            capture_output=True,
+            text=True
+        )
+        return result.stdout.strip() == 'true'
+
+    def read_blobs(self, entries: List[Tuple[str, str]]) -> Iterator[Tuple[str, bytes]]:
+        """Yield (path, raw content) for the given (path, oid) entries."""
+        self.prefetch(oid for _, oid in entries)
+
+        with CatFileBatch(self.repo_dir) as batch:
+            for path, oid in entries:
+                data = batch.read(oid)
+                if data is None:
+                    print(f"  Blob {oid[:12]} for {path} is missing, skipping", flush=True)
+                    continue
+                yield path, data
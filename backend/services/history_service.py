@@ -1,25 +1,69 @@
 """
-Historical Trends Service - Simple trend tracking using existing DB data.
+Historical Trends Service - Trend tracking over persisted scan snapshots.
+
+Every completed scan appends an immutable snapshot (headline numbers and key
+metrics per file) to the project's history, see SummaryService.materialize.
+Long ranges are downsampled so responses stay bounded: project trends by the
+database (DatabaseInterface.get_trend), single-file trends here.
 """
 
-from datetime import datetime
-from typing import Dict, List, Any
+from datetime import datetime, timedelta
+from typing import Dict, List, Any, Optional
+
+
+# Upper bound on points returned for one trend series
+MAX_TREND_POINTS = 500
+
+
+def downsample(snapshots: List[Dict], points: int) -> List[Dict]:
+    """
+    Reduce snapshots to at most points entries.
 
+    Consecutive snapshots are grouped into equal-sized buckets; each bucket is
+    reported at its latest scan, with numeric metrics averaged over the bucket
+    and "scans" counting the snapshots it stands for.
+    """
+    points = max(1, min(points, MAX_TREND_POINTS))
+    if len(snapshots) <= points:
+        return [{**s, "scans": 1} for s in snapshots]
 
-# In-memory cache for trends (simulates historical data)
-_trends_cache: Dict[str, List[Dict]] = {}
+    reduced = []
+    n = len(snapshots)
+    for i in range(points):
+        bucket = snapshots[i * n // points:(i + 1) * n // points]
+        last = bucket[-1]
+        metrics = {}
+        for key, value in last["metrics"].items():
+            if isinstance(value, (int, float)):
+                metrics[key] = round(sum(s["metrics"].get(key, 0) for s in bucket) / len(bucket), 2)
+            else:
+                metrics[key] = value
+        reduced.append({**last, "metrics": metrics, "scans": len(bucket)})
+    return reduced
 
 
-async def get_trend_data(project_id: str, days: int = 30, limit: int = 50) -> Dict[str, Any]:
-    """Get historical trend data for a project."""
+def _percent_change(current: float, previous: float) -> float:
+    return ((current - previous) / previous) * 100 if previous > 0 else 0
+
+
+async def get_trend_data(project_id: str, days: int = 30, limit: int = 50,
+                         since: Optional[str] = None, until: Optional[str] = None,
+                         summary: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Get historical trend data for a project.
+
+    Covers the last days days unless since/until (ISO timestamps) are given,
+    downsampled to at most limit points. Callers that already hold the
+    project's summary pass it in.
+    """
     from services.db import db
-    
-    # Get current metrics and smells
-    metrics = await db.get_metrics(project_id)
-    smells = await db.get_smells(project_id)
-    risks = await db.get_risks(project_id)
-    
-    if not metrics:
+    from services.summary_service import SummaryService
+
+    # Current summary, materialized when the last scan completed
+    if summary is None:
+        summary = await SummaryService.get(project_id)
+
+    if not summary:
         return {
             "project_id": project_id,
             "has_data": False,
@@ -28,86 +72,111 @@ async def get_trend_data(project_id: str, days: int = 30, limit: int = 50) -> Di
             "changes": None,
             "scans": []
         }
-    
-    # Calculate current summary
-    total_files = len(metrics)
-    total_smells = len(smells)
-    
-    # Calculate average risk
-    avg_risk = 0
-    if risks:
-        avg_risk = sum(r.get("risk_score", 0) for r in risks) / len(risks)
-    
-    # Count issues by severity
-    critical = sum(1 for s in smells if s.get("severity") == "critical")
-    high = sum(1 for s in smells if s.get("severity") == "high")
-    medium = sum(1 for s in smells if s.get("severity") == "medium")
-    low = sum(1 for s in smells if s.get("severity") == "low" or not s.get("severity"))
-    
-    quality_score = max(0, 100 - avg_risk)
-    
-    current = {
-        "total_files": total_files,
-        "total_smells": total_smells,
-        "quality_score": quality_score,
-        "avg_risk": avg_risk,
-        "critical_issues": critical,
-        "high_issues": high,
-        "medium_issues": medium,
-        "low_issues": low
-    }
-    
-    # Store in cache for history tracking
-    if project_id not in _trends_cache:
-        _trends_cache[project_id] = []
-    
-    # Add current snapshot to history
-    snapshot = {
-        "scan_id": f"scan_{len(_trends_cache[project_id]) + 1}",
-        "timestamp": datetime.utcnow().isoformat(),
-        "metrics": current
-    }
-    
-    # Only add if different from last snapshot
-    if not _trends_cache[project_id] or _trends_cache[project_id][-1]["metrics"] != current:
-        _trends_cache[project_id].append(snapshot)
-    
-    # Calculate changes (simulated for now)
+
+    current = SummaryService.trend_metrics(summary)
+
+    # Change since the scan before the latest one
     changes = {
         "quality_score": 0,
         "total_smells": 0,
         "avg_risk": 0
     }
-    
-    if len(_trends_cache[project_id]) >= 2:
-        prev = _trends_cache[project_id][-2]["metrics"]
-        if prev["quality_score"] > 0:
-            changes["quality_score"] = ((current["quality_score"] - prev["quality_score"]) / prev["quality_score"]) * 100
-        if prev["total_smells"] > 0:
-            changes["total_smells"] = ((current["total_smells"] - prev["total_smells"]) / prev["total_smells"]) * 100
-        if prev["avg_risk"] > 0:
-            changes["avg_risk"] = ((current["avg_risk"] - prev["avg_risk"]) / prev["avg_risk"]) * 100
-    
+
+    latest = await db.get_snapshots(project_id, limit=2)
+    if len(latest) >= 2:
+        prev = latest[-2]["metrics"]
+        for key in changes:
+            changes[key] = _percent_change(current[key], prev.get(key, 0))
+
+    if since is None and until is None:
+        since = (datetime.utcnow() - timedelta(days=days)).isoformat()
+    # Downsampled by the database, so a long history never leaves it whole
+    trend = await db.get_trend(project_id, max(1, min(limit, MAX_TREND_POINTS)), since=since, until=until)
+
     return {
         "project_id": project_id,
         "has_data": True,
         "current": current,
         "changes": changes,
-        "scans": _trends_cache[project_id][-limit:]
+        "total_scans": trend["total"],
+        "scans": trend["scans"]
     }
 
 
-async def get_comparison_data(project_id: str) -> Dict[str, Any]:
-    """Compare current state with previous scan."""
-    if project_id not in _trends_cache or len(_trends_cache[project_id]) < 2:
-        return {
-            "has_comparison": False,
-            "message": "Not enough scans for comparison. Run more analyses."
+async def get_file_trend(project_id: str, path: str, limit: int = 50,
+                         since: Optional[str] = None, until: Optional[str] = None) -> Dict[str, Any]:
+    """Key metrics of one file across scans, downsampled to at most limit points."""
+    from services.db import db
+
+    snapshots = await db.get_snapshots(project_id, since=since, until=until, path=path)
+    points = [
+        {
+            "scan_id": s["scan_id"],
+            "commit_sha": s.get("commit_sha"),
+            "timestamp": s["timestamp"],
+            "metrics": {k: v for k, v in s["files"][0].items() if k != "path"}
         }
-    
-    current = _trends_cache[project_id][-1]
-    previous = _trends_cache[project_id][-2]
-    
+        for s in snapshots if s.get("files")
+    ]
+
+    return {
+        "project_id": project_id,
+        "path": path,
+        "total_scans": len(points),
+        "scans": downsample(points, limit)
+    }
+
+
+async def get_comparison_data(project_id: str, from_scan: Optional[str] = None, to_scan: Optional[str] = None,
+                              limit: int = 500) -> Dict[str, Any]:
+    """
+    Compare two scans (default: the latest with the one before it).
+
+    New and fixed smells and per-file metric changes are composed from the
+    diffs stored for every scan after from_scan up to to_scan; at most limit
+    smells and files are listed, the counts cover all of them.
+    """
+    from services.db import db
+    from services.diff_service import compose
+
+    if to_scan is None:
+        latest = await db.get_snapshots(project_id, limit=2)
+        if len(latest) < 2:
+            return {
+                "has_comparison": False,
+                "message": "Not enough scans for comparison. Run more analyses."
+            }
+        current = latest[-1]
+        previous = latest[0] if from_scan is None else await db.get_snapshot(project_id, from_scan)
+    else:
+        current = await db.get_snapshot(project_id, to_scan)
+        previous = await db.get_snapshot(project_id, from_scan) if from_scan else None
+        if current is not None and from_scan is None:
+            earlier = await db.get_snapshots(project_id, until=current["timestamp"], limit=2)
+            previous = earlier[0] if len(earlier) == 2 else None
+
+    if current is None or previous is None:
+        return {"has_comparison": False, "message": "Scan not found in history."}
+
+    # Diffs are stored forward in time; an older "to" is the reverse comparison
+    reverse = previous["timestamp"] > current["timestamp"]
+    older, newer = (current, previous) if reverse else (previous, current)
+
+    chain = await db.get_snapshots(project_id, since=older["timestamp"], until=newer["timestamp"])
+    steps = [s for s in chain if s["scan_id"] != older["scan_id"]]
+    if any("diff" not in s for s in steps):
+        return {"has_comparison": False, "message": "No diff was recorded for some scans in this range."}
+
+    stored = await db.get_scan_diffs(project_id, [s["scan_id"] for s in steps])
+    files, new, fixed = compose([stored.get(s["scan_id"], []) for s in steps])
+    if reverse:
+        new, fixed = fixed, new
+        for entry in files.values():
+            entry["before"], entry["after"] = entry["after"], entry["before"]
+            entry["status"] = {"added": "removed", "removed": "added"}.get(entry["status"], entry["status"])
+            entry["deltas"] = {k: -v for k, v in entry["deltas"].items()}
+
+    limit = max(0, limit)
     return {
         "has_comparison": True,
         "current": current,
@@ -116,5 +185,14 @@ async def get_comparison_data(project_id: str) -> Dict[str, Any]:
             "quality_score": current["metrics"]["quality_score"] - previous["metrics"]["quality_score"],
             "total_smells": current["metrics"]["total_smells"] - previous["metrics"]["total_smells"],
             "files": current["metrics"]["total_files"] - previous["metrics"]["total_files"]
-        }
+        },
+        "smells": {
+            "new_count": len(new),
+            "fixed_count": len(fixed),
+            "persisting": current["metrics"]["total_smells"] - len(new),
+            "new": sorted(new.values(), key=lambda s: (-s["severity"], s["path"], s["line"]))[:limit],
+            "fixed": sorted(fixed.values(), key=lambda s: (-s["severity"], s["path"], s["line"]))[:limit]
+        },
+        "files_changed": len(files),
+        "files": sorted(files.values(), key=lambda e: e["path"])[:limit]
     }
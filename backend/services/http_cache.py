@@ -0,0 +1,77 @@
+"""
+Conditional GET for the project read endpoints.
+
+Everything served under /metrics, /risks, /smells, /functions, /history,
+/dependencies, /projects, /search, /similar and /suggestions for a project
+only changes when the project is written to, and every such write bumps its
+data version in the database (see DatabaseInterface.data_version), whichever
+worker made it. So that version, plus the request's path and query, makes an
+ETag: a poll that sends it back in If-None-Match gets a 304 without the
+endpoint running. The version comes from the read cache (see cached_db), which
+asks the database again only once the value it holds is DB_CACHE_VERSION_TTL
+seconds old, so most polls make no query at all.
+"""
+
+import hashlib
+import os
+import re
+from datetime import datetime
+from typing import Awaitable, Callable, Optional
+
+from fastapi import Request, Response
+
+from .db import get_database
+
+
+# GET /<prefix>/<project_id>[/...] endpoints whose data changes with scans only
+_PROJECT_READ = re.compile(r"^/(metrics|risks|smells|functions|history|dependencies|projects|search|similar|suggestions)/([^/]+)")
+
+# Clients may reuse a response for this many seconds before revalidating (0: always revalidate)
+HTTP_CACHE_MAX_AGE = int(os.getenv("HTTP_CACHE_MAX_AGE", "0"))
+
+
+def _cache_control() -> str:
+    if HTTP_CACHE_MAX_AGE > 0:
+        return f"private, max-age={HTTP_CACHE_MAX_AGE}"
+    return "private, no-cache"
+
+
+async def project_etag(project_id: str, request: Request) -> str:
+    version = await get_database().data_version(project_id)
+    query = "&".join(sorted(f"{k}={v}" for k, v in request.query_params.multi_items()))
+    key = f"{version}|{request.url.path}|{query}"
+    if request.url.path.startswith(("/history/", "/projects/")):
+        # Trend windows default to the last N days, so they also move with the date
+        key += f"|{datetime.utcnow().date()}"
+    # Weak: the same data may be sent with different encodings
+    return f'W/"{hashlib.blake2b(key.encode(), digest_size=8).hexdigest()}"'
+
+
+def _matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    # Weak comparison, as RFC 9110 prescribes for If-None-Match
+    return "*" in tags or any(t.removeprefix("W/") == etag.removeprefix("W/") for t in tags)
+
+
+async def conditional_get(request: Request, call_next: Callable[[Request], Awaitable[Response]]) -> Response:
+    """HTTP middleware: ETag and Cache-Control on project reads, 304 when the client is current."""
+    match = _PROJECT_READ.match(request.url.path)
+    if request.method != "GET" or match is None:
+        return await call_next(request)
+
+    try:
+        etag = await project_etag(match.group(2), request)
+    except Exception as e:
+        print(f"⚠️  ETag unavailable for {request.url.path}: {e}")
+        return await call_next(request)
+
+    headers = {"ETag": etag, "Cache-Control": _cache_control()}
+    if _matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    response = await call_next(request)
+    if response.status_code == 200:
+        response.headers.update(headers)
+    return response
@@ -0,0 +1,181 @@
+"""
+Response encoding: fast JSON, compression and streamed JSON arrays.
+
+FastJSONResponse renders with orjson when it is installed. Large listings
+(/smells) are streamed: the array is written batch by batch as the database
+cursor yields it, never built in memory whole. CompressionMiddleware
+negotiates brotli (when installed) or gzip for responses over a size
+threshold, compressing streamed bodies chunk by chunk.
+"""
+
+import json
+import zlib
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=str, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=str, separators=(',', ':')).encode('utf-8')
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson when available."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+async def stream_json_object(head: Dict[str, Any], key: str, batches: AsyncIterator[List[Dict[str, Any]]],
+                             tail: Optional[Callable[[], Dict[str, Any]]] = None) -> AsyncIterator[bytes]:
+    """
+    Encode head plus key -> the concatenated batches as one JSON object,
+    yielding a chunk per batch. The fields tail() returns once the batches
+    are exhausted close the object, for values computed from the batches.
+    """
+    opening = dumps(head)[:-1]
+    yield opening + (b',' if head else b'') + dumps(key) + b':['
+    first = True
+    async for batch in batches:
+        if not batch:
+            continue
+        # One array per batch, stripped of its brackets
+        chunk = dumps(batch)[1:-1]
+        yield chunk if first else b',' + chunk
+        first = False
+    closing = dumps(tail())[1:-1] if tail is not None else b''
+    yield b']' + (b',' + closing if closing else b'') + b'}'
+
+
+# Content types worth compressing
+_COMPRESSIBLE = ("application/json", "text/", "application/javascript", "image/svg+xml")
+
+
+def _accepted(accept_encoding: str) -> Dict[str, float]:
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            accepted[name.strip().lower()] = q
+    return accepted
+
+
+class _Compressor:
+    def __init__(self, encoding: str, level: int):
+        self.encoding = encoding
+        if encoding == "br":
+            self._br = brotli.Compressor(quality=level)
+        else:
+            self._gz = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        if self.encoding == "br":
+            out = self._br.process(data)
+            return out + (self._br.finish() if final else self._br.flush())
+        out = self._gz.compress(data)
+        return out + self._gz.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class CompressionMiddleware:
+    """ASGI middleware: br or gzip by Accept-Encoding, for bodies of at least minimum_size bytes."""
+
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def _choose(self, accept_encoding: str) -> Optional[str]:
+        accepted = _accepted(accept_encoding)
+        if brotli is not None and accepted.get("br", 0) > 0:
+            return "br"
+        if accepted.get("gzip", 0) > 0:
+            return "gzip"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers", [])}
+        encoding = self._choose(headers.get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Dict[str, Any] = {}
+        compressor: Optional[_Compressor] = None
+        passthrough = False
+        # Body held back until it reaches minimum_size or ends, so small streamed bodies stay plain
+        pending = b""
+
+        async def send_compressed(message):
+            nonlocal compressor, passthrough, pending
+            if message["type"] == "http.response.start":
+                start.update(message)
+                response_headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in message.get("headers", [])}
+                content_type = response_headers.get("content-type", "")
+                passthrough = (
+                    "content-encoding" in response_headers
+                    or message["status"] in (204, 206, 304)
+                    or not content_type.startswith(_COMPRESSIBLE)
+                )
+                if passthrough:
+                    await send(message)
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            more_body = message.get("more_body", False)
+            if compressor is not None:
+                await send({"type": "http.response.body", "body": compressor.compress(message.get("body", b""), final=not more_body),
+                            "more_body": more_body})
+                return
+
+            pending += message.get("body", b"")
+            if more_body and len(pending) < self.minimum_size:
+                return
+            body, pending = pending, b""
+            if not more_body and len(body) < self.minimum_size:
+                # Small and complete: not worth compressing
+                passthrough = True
+                plain = [(k, v) for k, v in start.get("headers", []) if k.decode("latin-1").lower() != "content-length"]
+                plain.append((b"content-length", str(len(body)).encode()))
+                await send({**start, "headers": plain})
+                await send({"type": "http.response.body", "body": body, "more_body": False})
+                return
+
+            compressor = _Compressor(encoding, self.brotli_quality if encoding == "br" else self.gzip_level)
+            new_headers = [
+                (k, v) for k, v in start.get("headers", [])
+                if k.decode("latin-1").lower() not in ("content-length", "vary")
+            ]
+            vary = [v.decode("latin-1") for k, v in start.get("headers", []) if k.decode("latin-1").lower() == "vary"]
+            new_headers.append((b"content-encoding", encoding.encode()))
+            new_headers.append((b"vary", ", ".join([*vary, "Accept-Encoding"]).encode("latin-1")))
+            data = compressor.compress(body, final=not more_body)
+            if not more_body:
+                new_headers.append((b"content-length", str(len(data)).encode()))
+            await send({**start, "headers": new_headers})
+            await send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
@@ -1,7 +1,61 @@
+import asyncio
 from datetime import datetime
-import sys
+import uuid
 from .db import get_database
-from .repo_analyzer import repo_analyzer
+from .repo_analyzer import repo_analyzer, RepoAnalyzer
+from .dependency_service import cache_dependency_graph
+from .summary_service import SummaryService
+from .diff_service import diff_files, diff_header
+from .single_flight import single_flight
+from .search_service import update_search_index
+from .llm_service import LLMService
+
+
+# Fields that belong to the stored row rather than the analysis result
+_ROW_FIELDS = ("_id", "project_id")
+
+
+def _strip_row_fields(rows: list) -> list:
+    return [{k: v for k, v in row.items() if k not in _ROW_FIELDS} for row in rows]
+
+
+# Scans in progress, keyed by project, commit and options
+_scans = single_flight("scans")
+
+
+# Sweeps of old generations in progress, referenced until they finish
+_sweeps: set = set()
+
+
+def _sweep_in_background(project_id: str) -> None:
+    """Delete the rows the last commit retired without holding up the scan."""
+    task = asyncio.create_task(_sweep(project_id))
+    _sweeps.add(task)
+    task.add_done_callback(_sweeps.discard)
+
+
+async def _sweep(project_id: str) -> None:
+    try:
+        await get_database().sweep_generations(project_id)
+    except Exception as e:
+        # Left for the sweep after the next commit
+        print(f"⚠️  Could not sweep old generations of {project_id}: {e}", flush=True)
+
+
+def _options_key(options: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in options.items()))
+
+
+def _scan_summary(summary: dict) -> dict:
+    """The totals a scan record keeps, in the shape RepoAnalyzer.summarize gives them."""
+    languages = summary.get("languages", {})
+    return {
+        "total_files": summary.get("total_files", 0),
+        "total_loc": summary.get("total_loc", 0),
+        "total_smells": summary.get("total_smells", 0),
+        "languages": list(languages),
+        "files_by_language": {lang: totals.get("files", 0) for lang, totals in languages.items()}
+    }
 
 
 class JobService:
@@ -9,51 +63,376 @@ class JobService:
     async def start_scan(project_id: str, options: dict) -> dict:
         """
         Start a scan for the given project.
-        
-        1. Get the project's GitHub URL from the database
-        2. Clone the repository
-        3. Run static analysis (AST parsing, complexity, etc.)
-        4. Detect code smells
-        5. Calculate risk scores
-        6. Store all results in the database
-        
+
+        1. Get the project's GitHub URL (or uploaded ZIP archive) from the database
+        2. Resolve the remote HEAD commit and reuse a completed scan of it if one exists
+        3. Clone the repository mirror, or fetch into it and diff against the
+           last scanned commit to re-analyze only the changed files
+        4. Run static analysis (AST parsing, complexity, etc.)
+        5. Detect code smells
+        6. Calculate risk scores
+        7. Store all results in the database
+
+        Pass options={"force": True} to skip the commit cache,
+        options={"incremental": False} to re-analyze every file and
+        options={"ingest": "worktree" | "sparse" | "objects"} to pick how
+        sources are read from git (see RepoAnalyzer.INGEST_MODES).
+
+        A request made while an identical scan of the project is running
+        shares that scan's result instead of starting another.
+
         Returns scan results summary.
         """
         db = get_database()
-        
+        started_at = datetime.utcnow().isoformat()
+
         # Get project info
         project = await db.get_project(project_id)
         if not project:
-            return {"error": "Project not found", "started_at": datetime.utcnow().isoformat()}
-        
+            return {"error": "Project not found", "started_at": started_at}
+
+        # A scan of the same project at the same commit that is already running is joined, not repeated
+        if project.get("source_type") == "zip":
+            key = (project_id, project.get("archive_sha256"), _options_key(options))
+            return await _scans.do(key, JobService._scan_archive, project, options, started_at)
+
         github_url = project.get("source_ref", "")
         if not github_url:
-            return {"error": "No GitHub URL found for project", "started_at": datetime.utcnow().isoformat()}
-        
+            return {"error": "No GitHub URL found for project", "started_at": started_at}
+
+        repo_url = RepoAnalyzer.normalize_repo_url(github_url)
+        # git ls-remote waits on the network; keep it off the event loop
+        head_sha = await asyncio.to_thread(RepoAnalyzer.resolve_remote_head, github_url)
+        key = (project_id, head_sha, _options_key(options))
+        return await _scans.do(key, JobService._scan_repo, project, github_url, repo_url, head_sha, options, started_at)
+
+    @staticmethod
+    async def _scan_repo(project: dict, github_url: str, repo_url: str, head_sha: str | None,
+                         options: dict, started_at: str) -> dict:
+        """Scan a git repository whose remote HEAD is head_sha (None if it could not be resolved)."""
+        db = get_database()
+
+        # Same repo at the same commit produces the same results
+        if head_sha and not options.get("force"):
+            cached = await db.find_scan(repo_url, head_sha)
+            if cached:
+                reused = await JobService._reuse_scan(project, cached, started_at)
+                if reused is not None:
+                    return reused
+
+        ingest_mode = options.get("ingest") or project.get("ingest_mode")
+
+        # Only the files touched since the last scanned commit need re-analysis
+        if options.get("incremental", True) and project.get("last_commit"):
+            results = await repo_analyzer.analyze_incremental(github_url, project["last_commit"], ingest_mode,
+                                                              project["_id"])
+            if results is not None:
+                return await JobService._store_incremental(project, repo_url, results, started_at)
+
         # Analyze the repository
         print(f"🔍 Starting analysis of {github_url}...", flush=True)
-        results = await repo_analyzer.analyze_github_repo(github_url)
-        
+        results = await repo_analyzer.analyze_github_repo(github_url, ingest_mode, project["_id"])
+
+        if "error" in results and results.get("error"):
+            return {"error": results["error"], "started_at": started_at}
+
+        return await JobService._store_full(project, repo_url, results.get("commit_sha") or head_sha, results, started_at)
+
+    @staticmethod
+    async def _scan_archive(project: dict, options: dict, started_at: str) -> dict:
+        """Scan an uploaded ZIP; the archive digest plays the role of the commit SHA."""
+        db = get_database()
+        archive_path = project.get("archive_path")
+        archive_sha = project.get("archive_sha256")
+        if not archive_path:
+            return {"error": "No uploaded archive found for project", "started_at": started_at}
+
+        repo_url = f"zip:{archive_sha}"
+        if archive_sha and not options.get("force"):
+            cached = await db.find_scan(repo_url, archive_sha)
+            if cached:
+                reused = await JobService._reuse_scan(project, cached, started_at)
+                if reused is not None:
+                    return reused
+
+        print(f"🔍 Starting analysis of uploaded archive {project.get('source_ref')}...", flush=True)
+        results = await repo_analyzer.analyze_zip_archive(archive_path, archive_sha, project.get("source_ref"))
+
         if "error" in results and results.get("error"):
-            return {"error": results["error"], "started_at": datetime.utcnow().isoformat()}
-        
+            return {"error": results["error"], "started_at": started_at}
+
+        return await JobService._store_full(project, repo_url, archive_sha, results, started_at)
+
+    @staticmethod
+    async def _store_full(project: dict, repo_url: str, commit_sha: str, results: dict, started_at: str) -> dict:
+        """Store the results of a full scan and record it for commit-keyed reuse."""
+        db = get_database()
+        project_id = project["_id"]
+
         # Store results in database
         metrics = results.get("metrics", [])
         risks = results.get("risks", [])
         smells = results.get("smells", [])
-        
-        db = get_database()
-        await db.set_metrics(project_id, metrics)
-        await db.set_risks(project_id, risks)
-        await db.set_smells(project_id, smells)
-        
+
+        # A full scan replaces every stored row; the old ones are diffed against it,
+        # read uncapped so files past the first page don't show up as added
+        old_metrics = await db.read_rows(project_id, "metrics")
+        old_risks = await db.read_rows(project_id, "risks")
+        old_smells = await db.read_rows(project_id, "smells")
+
+        generation = await JobService._swap_results(project_id, metrics, risks, smells, results.get("functions", []))
+        cache_dependency_graph(project_id, results.get("dependencies"))
+
         print(f"✅ Analysis complete: {len(metrics)} files, {len(smells)} smells, {len(risks)} risk scores", flush=True)
-        
-        return {
-            "started_at": datetime.utcnow().isoformat(),
-            "completed_at": datetime.utcnow().isoformat(),
+
+        completed_at = datetime.utcnow().isoformat()
+        scan = {
+            "_id": str(uuid.uuid4()),
+            "project_id": project_id,
+            "repo_url": repo_url,
+            "commit_sha": commit_sha,
+            "status": "completed",
+            "started_at": started_at,
+            "completed_at": completed_at,
             "summary": results.get("summary", {}),
             "files_analyzed": len(metrics),
             "smells_found": len(smells),
-            "status": "completed"
+            "generation": generation,
+            "local_path": results.get("local_path"),
+            "ingest_mode": results.get("ingest_mode")
+        }
+        await db.record_scan(scan)
+        diff = await JobService._record_diff(project, scan, (old_metrics, old_risks, old_smells), (metrics, risks, smells))
+        await SummaryService.materialize(project_id, scan, diff=diff)
+        await db.upsert_project({
+            **project,
+            "status": "completed",
+            "last_commit": commit_sha,
+            "last_scan_id": scan["_id"],
+            "local_path": results.get("local_path"),
+            "ingest_mode": results.get("ingest_mode")
+        })
+
+        return {
+            "started_at": started_at,
+            "completed_at": completed_at,
+            "commit_sha": commit_sha,
+            "summary": scan["summary"],
+            "files_analyzed": scan["files_analyzed"],
+            "smells_found": scan["smells_found"],
+            "status": "completed",
+            "mode": "full",
+            "cache": "miss"
+        }
+
+    @staticmethod
+    async def _store_incremental(project: dict, repo_url: str, results: dict, started_at: str) -> dict:
+        """Replace the stored results of the changed files and update the summary by delta."""
+        db = get_database()
+        project_id = project["_id"]
+        stale = list(results["stale"])
+        metrics = list(results["metrics"])
+        risks = list(results["risks"])
+        smells = list(results["smells"])
+
+        # Unchanged files that gained or lost a duplicate of a changed file
+        partners = results.get("clones") or {}
+        refreshed = {"paths": []}
+        if partners:
+            refreshed = repo_analyzer.refresh_clone_results(
+                _strip_row_fields(await db.read_rows(project_id, "metrics", paths=list(partners))),
+                _strip_row_fields(await db.read_rows(project_id, "smells", paths=list(partners))),
+                partners
+            )
+            stale += refreshed["paths"]
+            metrics += refreshed["metrics"]
+            risks += refreshed["risks"]
+            smells += refreshed["smells"]
+
+        # Results being replaced, needed to adjust the previous summary
+        old_metrics = await db.read_rows(project_id, "metrics", paths=stale) if stale else []
+        old_risks = await db.read_rows(project_id, "risks", paths=stale) if stale else []
+        old_smells = await db.read_rows(project_id, "smells", paths=stale) if stale else []
+
+        generation = await JobService._swap_results(project_id, metrics, risks, smells, results.get("functions", []),
+                                                    keep_except=stale)
+        # Rebuilt from the mirror on next request
+        cache_dependency_graph(project_id, None)
+
+        print(f"✅ Incremental analysis complete: {len(results['changed'])} files re-analyzed, "
+              f"{len(results['stale']) - len(results['changed'])} dropped, "
+              f"{len(refreshed['paths'])} updated for duplicates", flush=True)
+
+        completed_at = datetime.utcnow().isoformat()
+        commit_sha = results["commit_sha"]
+        scan = {
+            "_id": str(uuid.uuid4()),
+            "project_id": project_id,
+            "repo_url": repo_url,
+            "commit_sha": commit_sha,
+            "base_sha": results["base_sha"],
+            "status": "completed",
+            "started_at": started_at,
+            "completed_at": completed_at,
+            "generation": generation,
+            "local_path": results.get("local_path"),
+            "ingest_mode": results.get("ingest_mode")
+        }
+        old, new = (old_metrics, old_risks, old_smells), (metrics, risks, smells)
+        diff = await JobService._record_diff(project, scan, old, new)
+        # The previous summary and snapshot updated with what changed; rebuilt when there are none
+        summary = await SummaryService.apply_delta(project_id, project.get("last_scan_id"), scan, old, new, diff) \
+            or await SummaryService.materialize(project_id, scan, diff=diff)
+        scan["summary"] = _scan_summary(summary)
+        scan["files_analyzed"] = summary.get("total_files", 0)
+        scan["smells_found"] = summary.get("total_smells", 0)
+        await db.record_scan(scan)
+        await db.upsert_project({
+            **project,
+            "status": "completed",
+            "last_commit": commit_sha,
+            "last_scan_id": scan["_id"],
+            "local_path": results.get("local_path"),
+            "ingest_mode": results.get("ingest_mode")
+        })
+
+        return {
+            "started_at": started_at,
+            "completed_at": completed_at,
+            "commit_sha": commit_sha,
+            "summary": scan["summary"],
+            "files_analyzed": scan["files_analyzed"],
+            "smells_found": scan["smells_found"],
+            "files_changed": len(results["stale"]),
+            "status": "completed",
+            "mode": "incremental",
+            "cache": "miss"
+        }
+
+    @staticmethod
+    async def _swap_results(project_id: str, metrics: list, risks: list, smells: list, functions: list,
+                            keep_except: list | None = None) -> int:
+        """
+        Write a scan's rows under a new generation and make it current in one step,
+        so readers never see a mix of two scans. With keep_except (incremental
+        scans) the current rows of every other path are kept; otherwise the new
+        rows replace the project's results. Rows no reader sees anymore, and those
+        of scans that crashed before committing, are swept in the background after
+        the commit, so the scan never waits on the deletes. The project's
+        search index is updated with the new smells. Refactoring suggestions are
+        generated for every file written and stored with its rows. Returns the
+        committed generation.
+        """
+        db = get_database()
+        generation = await db.begin_generation(project_id)
+        try:
+            await db.set_metrics(project_id, metrics, generation)
+            await db.set_risks(project_id, risks, generation)
+            await db.set_smells(project_id, smells, generation)
+            await db.set_functions(project_id, functions, generation)
+            await db.set_suggestions(project_id, LLMService.build_suggestions(metrics, smells), generation)
+            if keep_except is not None:
+                await db.carry_forward(project_id, generation, keep_except)
+            committed = await db.commit_generation(project_id, generation)
+        except Exception:
+            await db.drop_generation(project_id, generation)
+            raise
+        _sweep_in_background(project_id)
+
+        try:
+            await update_search_index(project_id, smells, functions, keep_except)
+        except Exception as e:
+            # Rebuilt from the stored rows on next search
+            print(f"⚠️  Could not update the search index of {project_id}: {e}", flush=True)
+        return committed
+
+    @staticmethod
+    async def _record_diff(project: dict, scan: dict, old: tuple, new: tuple) -> dict | None:
+        """
+        Store the per-file diff of a scan against the project's previous scan,
+        given the (metrics, risks, smells) rows it replaced and wrote.
+        Returns the diff counts, or None for a project's first scan.
+        """
+        previous_scan_id = project.get("last_scan_id")
+        if not previous_scan_id:
+            return None
+        entries = diff_files(*old, *new)
+        await get_database().set_scan_diff(project["_id"], scan["_id"], entries)
+        return diff_header(previous_scan_id, entries)
+
+    @staticmethod
+    async def _reuse_scan(project: dict, cached: dict, started_at: str) -> dict | None:
+        """
+        Serve a scan from an earlier completed scan of the same commit, as long
+        as the project that ran it still holds that scan's results: the one it
+        last completed, at the generation it committed. Returns None when it
+        moved on since (a later scan, or one since pushed over), for the caller
+        to scan again.
+        """
+        db = get_database()
+        project_id = project["_id"]
+        source_id = cached.get("project_id")
+        source = project if source_id == project_id else (await db.get_project(source_id) if source_id else None)
+        if not source or source.get("last_scan_id") != cached["_id"] or not cached.get("generation") \
+                or await db.current_generation(source_id) != cached["generation"]:
+            return None
+
+        # Another project was created for the same URL: copy its stored results
+        # under a scan of this project's own, diffed against what it held before
+        scan_id = cached["_id"]
+        if source_id != project_id:
+            rows = [
+                _strip_row_fields(await db.read_rows(source_id, table))
+                for table in ("metrics", "risks", "smells", "functions")
+            ]
+            if await db.current_generation(source_id) != cached["generation"]:
+                # Rescanned while being copied
+                return None
+            old = tuple([await db.read_rows(project_id, table) for table in ("metrics", "risks", "smells")])
+            generation = await JobService._swap_results(project_id, *rows)
+            cache_dependency_graph(project_id, None)
+
+            scan = {
+                "_id": str(uuid.uuid4()),
+                "project_id": project_id,
+                "repo_url": cached.get("repo_url"),
+                "commit_sha": cached["commit_sha"],
+                "reused_from": cached["_id"],
+                "status": "completed",
+                "started_at": started_at,
+                "completed_at": datetime.utcnow().isoformat(),
+                "summary": cached.get("summary", {}),
+                "files_analyzed": cached.get("files_analyzed", 0),
+                "smells_found": cached.get("smells_found", 0),
+                "generation": generation,
+                "local_path": cached.get("local_path"),
+                "ingest_mode": cached.get("ingest_mode")
+            }
+            diff = await JobService._record_diff(project, scan, old, tuple(rows[:3]))
+            await SummaryService.materialize(project_id, scan, diff=diff)
+            await db.record_scan(scan)
+            scan_id = scan["_id"]
+
+        if project.get("last_scan_id") != scan_id:
+            await db.upsert_project({
+                **project,
+                "status": "completed",
+                "last_commit": cached["commit_sha"],
+                "last_scan_id": scan_id,
+                "local_path": cached.get("local_path") or project.get("local_path"),
+                "ingest_mode": cached.get("ingest_mode") or project.get("ingest_mode")
+            })
+
+        print(f"♻️  Reusing scan {cached['_id']} for commit {cached['commit_sha'][:12]}", flush=True)
+
+        return {
+            "started_at": started_at,
+            "completed_at": datetime.utcnow().isoformat(),
+            "commit_sha": cached["commit_sha"],
+            "summary": cached.get("summary", {}),
+            "files_analyzed": cached.get("files_analyzed", 0),
+            "smells_found": cached.get("smells_found", 0),
+            "status": "completed",
+            "mode": "reuse",
+            "cache": "hit"
         }
@@ -0,0 +1,490 @@
+"""
+JS Syntax - Tree-sitter parsing for JavaScript/TypeScript analysis.
+
+Each JS/JSX/TS/TSX file is parsed once and walked once; the walk collects
+everything the metrics and smell detectors need (per-function complexity,
+nesting, callbacks, risky calls, JSX props...) into a JsFacts record.
+
+Tree-sitter is optional: without the `tree_sitter` package and its grammars
+parse() returns None and JavaScriptAnalyzer falls back to its regex detectors.
+Set JS_PARSER=regex to force the fallback.
+"""
+
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from .source_reader import SourceFile
+
+try:
+    from tree_sitter import Language, Parser
+    import tree_sitter_javascript
+    import tree_sitter_typescript
+
+    _JS = Language(tree_sitter_javascript.language())
+    _TS = Language(tree_sitter_typescript.language_typescript())
+    _TSX = Language(tree_sitter_typescript.language_tsx())
+    # Grammars tried in order; the TSX grammar also accepts JSX the JavaScript one rejects (`<feMergeNode in=...>`)
+    _LANGUAGES = {
+        '.js': (_JS, _TSX),
+        '.jsx': (_JS, _TSX),
+        '.ts': (_TS,),
+        '.tsx': (_TSX,),
+    }
+except (ImportError, ValueError):  # not installed, or grammar built for another tree-sitter ABI
+    _LANGUAGES = {}
+
+USE_TREE_SITTER = os.getenv("JS_PARSER", "auto").lower() != "regex"
+
+_parsers: Dict[Any, Any] = {}
+
+
+def available() -> bool:
+    return USE_TREE_SITTER and bool(_LANGUAGES)
+
+
+def parse(source: SourceFile):
+    """
+    Syntax tree of a JS/TS source, or None when tree-sitter is unavailable or
+    cannot parse the file cleanly (error recovery can swallow whole functions,
+    so such files are left to the regex detectors).
+    """
+    if not available():
+        return None
+    languages = _LANGUAGES.get(os.path.splitext(source.path)[1].lower(), ())
+
+    data = source.text.encode('utf-8', errors='surrogatepass')
+    for language in languages:
+        parser = _parsers.get(language)
+        if parser is None:
+            parser = _parsers[language] = Parser(language)
+        tree = parser.parse(data)
+        if not tree.root_node.has_error:
+            return tree
+    return None
+
+
+FUNCTION_NODES = {
+    'function_declaration', 'generator_function_declaration', 'function_expression',
+    'function', 'generator_function', 'arrow_function', 'method_definition'
+}
+CLASS_NODES = {'class_declaration', 'abstract_class_declaration', 'class'}
+LOOP_NODES = {'for_statement', 'for_in_statement', 'while_statement', 'do_statement'}
+# Same block kinds NestingVisitor counts for Python
+NESTING_NODES = LOOP_NODES | {'if_statement', 'switch_statement', 'try_statement'} | FUNCTION_NODES
+DECISION_NODES = LOOP_NODES | {'if_statement', 'switch_case', 'catch_clause', 'ternary_expression'}
+DECISION_OPERATORS = {'&&', '||', '??'}
+
+SYNC_IO_CALLS = {
+    'readFileSync': "Synchronous file I/O blocks event loop",
+    'writeFileSync': "Synchronous file I/O blocks event loop",
+    'appendFileSync': "Synchronous file I/O blocks event loop",
+    'execSync': "Synchronous exec blocks event loop",
+    'spawnSync': "Synchronous spawn blocks event loop",
+}
+FETCH_CALLS = {'fetch', 'axios', 'get', 'post', 'query', 'findOne', 'find'}
+SQL_CALLS = {'query': "SQL query with template literal interpolation",
+             'execute': "SQL execute with string concatenation",
+             'raw': "Raw SQL query with interpolation"}
+ITERATION_METHODS = {'forEach', 'map'}
+CONSOLE_METHODS = {'log', 'warn', 'error', 'debug', 'info'}
+
+_SECRET_NAMES = [
+    (re.compile(r'api[_-]?key|apikey', re.I), re.compile(r'^[a-zA-Z0-9_\-]{20,}$'), "Hardcoded API key"),
+    (re.compile(r'password|passwd|pwd', re.I), re.compile(r'.'), "Hardcoded password"),
+    (re.compile(r'secret|token', re.I), re.compile(r'^[a-zA-Z0-9_\-]{15,}$'), "Hardcoded secret/token"),
+    (re.compile(r'aws_access_key_id|aws_secret', re.I), re.compile(r''), "Hardcoded AWS credentials"),
+]
+_SECRET_VALUES = [
+    (re.compile(r'Bearer\s+[a-zA-Z0-9_\-\.]+'), "Hardcoded Bearer token"),
+    (re.compile(r'-----BEGIN\s+(?:RSA\s+)?PRIVATE\s+KEY-----', re.I), "Private key in code"),
+]
+_INSECURE_HTTP = re.compile(r'^http://(?!localhost|127\.0\.0\.1)')
+_TODO = re.compile(r'TODO|FIXME|HACK|XXX|BUG', re.I)
+_STATE_REF = re.compile(r'\b(?:props\.|state\.|\w+(?:State|Props))\b')
+_SETTER_CALL = re.compile(r'\bset[A-Z]\w*\s*\(')
+
+
+@dataclass
+class FunctionInfo:
+    name: Optional[str]
+    line: int
+    end_line: int
+    complexity: int = 1
+    nesting: int = 0
+    params: int = 0
+    is_async: bool = False
+    unprotected_await: bool = False
+
+
+@dataclass
+class JsFacts:
+    """What one walk over a JS/TS syntax tree found."""
+    functions: List[FunctionInfo] = field(default_factory=list)
+    module_complexity: int = 1
+    class_count: int = 0
+    nesting_max: int = 0
+    callback_depth_max: int = 0
+    xss: List[Tuple[int, str]] = field(default_factory=list)
+    sql: List[Tuple[int, str]] = field(default_factory=list)
+    secrets: List[Tuple[int, str]] = field(default_factory=list)
+    insecure_http: int = 0
+    sync_io: List[Tuple[int, str]] = field(default_factory=list)
+    fetch_in_loop: Optional[int] = None
+    push_in_unbounded_loop: Optional[int] = None
+    set_interval: int = 0
+    clear_interval: int = 0
+    add_listener: int = 0
+    remove_listener: int = 0
+    large_imports: List[Tuple[int, str]] = field(default_factory=list)
+    effect_missing_deps: Optional[int] = None
+    effect_without_cleanup: Optional[int] = None
+    inline_object_props: int = 0
+    anonymous_handlers: int = 0
+    catch_calls: int = 0
+    await_in_loop: Optional[int] = None
+    promise_all: bool = False
+    empty_catches: int = 0
+    any_types: int = 0
+    console_calls: int = 0
+    todos: int = 0
+    comment_lines: int = 0
+
+
+@dataclass
+class _Frame:
+    """Function being walked; loop and try depths are local to it."""
+    info: Optional[FunctionInfo]
+    # Nesting depth of the function node itself
+    base: int = 0
+    is_callback: bool = False
+    iteration_callback: bool = False
+    interval_callback: bool = False
+    loops: int = 0
+    infinite_loops: int = 0
+    tries: int = 0
+
+    @property
+    def unbounded(self) -> bool:
+        return self.interval_callback or self.infinite_loops > 0
+
+
+class JsSyntaxVisitor:
+    """Single iterative pass over a tree-sitter tree, filling a JsFacts."""
+
+    def __init__(self, source: SourceFile, tree):
+        self.source = source
+        self.tree = tree
+        self.facts = JsFacts()
+        self._frames = [_Frame(info=None)]
+        self._nesting = 0
+        self._callbacks = 0
+
+    def walk(self) -> JsFacts:
+        stack = [(self.tree.root_node, False)]
+        while stack:
+            node, leaving = stack.pop()
+            if leaving:
+                self._leave(node)
+                continue
+            if self._enter(node):
+                stack.append((node, True))
+            stack.extend((child, False) for child in reversed(node.named_children))
+        return self.facts
+
+    # ---- scope tracking ----------------------------------------------------
+
+    def _enter(self, node) -> bool:
+        """Visit node on the way down; True if it needs a _leave on the way up."""
+        kind = node.type
+        facts = self.facts
+        frame = self._frames[-1]
+        scoped = False
+
+        if kind in NESTING_NODES:
+            self._nesting += 1
+            facts.nesting_max = max(facts.nesting_max, self._nesting)
+            for outer in self._frames[1:]:
+                outer.info.nesting = max(outer.info.nesting, self._nesting - outer.base)
+            scoped = True
+
+        if kind in DECISION_NODES:
+            self._add_complexity(1)
+        elif kind == 'binary_expression':
+            operator = node.child_by_field_name('operator')
+            if operator is not None and operator.type in DECISION_OPERATORS:
+                self._add_complexity(1)
+
+        if kind in FUNCTION_NODES:
+            self._enter_function(node)
+        elif kind in LOOP_NODES:
+            frame.loops += 1
+            if _is_infinite_loop(node):
+                frame.infinite_loops += 1
+            scoped = True
+        elif kind == 'try_statement':
+            frame.tries += 1
+            scoped = True
+        elif kind in CLASS_NODES:
+            facts.class_count += 1
+        elif kind == 'await_expression':
+            self._visit_await(frame)
+        elif kind == 'call_expression':
+            self._visit_call(node, frame)
+        elif kind == 'new_expression':
+            if _text(node.child_by_field_name('constructor')) == 'Function':
+                facts.xss.append((_line(node), "new Function() - similar risks to eval()"))
+        elif kind == 'assignment_expression':
+            self._visit_assignment(node)
+        elif kind == 'variable_declarator' or kind == 'public_field_definition':
+            self._check_secret(node.child_by_field_name('name'), node.child_by_field_name('value'))
+        elif kind == 'pair':
+            self._check_secret(node.child_by_field_name('key'), node.child_by_field_name('value'))
+        elif kind == 'catch_clause':
+            body = node.child_by_field_name('body')
+            if body is not None and body.named_child_count == 0:
+                facts.empty_catches += 1
+        elif kind == 'string' or kind == 'template_string':
+            self._visit_string(node)
+        elif kind == 'import_statement':
+            self._visit_import(node)
+        elif kind == 'jsx_attribute':
+            self._visit_jsx_attribute(node)
+        elif kind == 'predefined_type':
+            if node.text == b'any':
+                facts.any_types += 1
+        elif kind == 'comment':
+            text = _text(node)
+            facts.todos += len(_TODO.findall(text))
+            facts.comment_lines += text.count('\n') + 1
+
+        return scoped
+
+    def _leave(self, node) -> None:
+        kind = node.type
+        if kind in NESTING_NODES:
+            self._nesting -= 1
+
+        if kind in FUNCTION_NODES:
+            if self._frames.pop().is_callback:
+                self._callbacks -= 1
+        elif kind in LOOP_NODES:
+            frame = self._frames[-1]
+            frame.loops -= 1
+            if _is_infinite_loop(node):
+                frame.infinite_loops -= 1
+        elif kind == 'try_statement':
+            self._frames[-1].tries -= 1
+
+    def _enter_function(self, node) -> None:
+        parent = node.parent
+        parameters = node.child_by_field_name('parameters')
+        info = FunctionInfo(
+            name=self._function_name(node),
+            line=_line(node),
+            end_line=node.end_point[0] + 1,
+            params=parameters.named_child_count if parameters is not None
+            else int(node.child_by_field_name('parameter') is not None),
+            is_async=node.child_count > 0 and node.children[0].type == 'async'
+        )
+        self.facts.functions.append(info)
+
+        frame = _Frame(info=info, base=self._nesting)
+        if parent is not None and parent.type == 'arguments':
+            self._callbacks += 1
+            self.facts.callback_depth_max = max(self.facts.callback_depth_max, self._callbacks)
+            callee = _callee_name(parent.parent)
+            frame.is_callback = True
+            frame.iteration_callback = callee in ITERATION_METHODS
+            frame.interval_callback = callee == 'setInterval'
+        self._frames.append(frame)
+
+    @staticmethod
+    def _function_name(node) -> Optional[str]:
+        name = node.child_by_field_name('name')
+        if name is None and node.parent is not None and node.parent.type in ('variable_declarator', 'public_field_definition'):
+            name = node.parent.child_by_field_name('name')
+        return _text(name) if name is not None else None
+
+    def _add_complexity(self, amount: int) -> None:
+        info = self._frames[-1].info
+        if info is None:
+            self.facts.module_complexity += amount
+        else:
+            info.complexity += amount
+
+    # ---- detectors ---------------------------------------------------------
+
+    def _visit_await(self, frame: _Frame) -> None:
+        if frame.loops and self.facts.await_in_loop is None:
+            self.facts.await_in_loop = frame.info.line if frame.info is not None else 1
+        if frame.info is not None and frame.tries == 0:
+            frame.info.unprotected_await = True
+
+    def _visit_call(self, node, frame: _Frame) -> None:
+        facts = self.facts
+        function = node.child_by_field_name('function')
+        name = _callee_name(node)
+        line = _line(node)
+        receiver = _text(function.child_by_field_name('object')) if function is not None \
+            and function.type == 'member_expression' else None
+
+        if name == 'eval' and receiver is None:
+            facts.xss.append((line, "eval() usage - code injection vulnerability"))
+        elif name == 'write' and receiver == 'document':
+            facts.xss.append((line, "document.write usage - XSS and performance issues"))
+        elif name in SYNC_IO_CALLS:
+            facts.sync_io.append((line, SYNC_IO_CALLS[name]))
+        elif name == 'setInterval':
+            facts.set_interval += 1
+        elif name == 'clearInterval':
+            facts.clear_interval += 1
+        elif name == 'addEventListener':
+            facts.add_listener += 1
+        elif name == 'removeEventListener':
+            facts.remove_listener += 1
+        elif name == 'catch' and receiver is not None:
+            facts.catch_calls += 1
+        elif name == 'all' and receiver == 'Promise':
+            facts.promise_all = True
+        elif name in CONSOLE_METHODS and receiver == 'console':
+            facts.console_calls += 1
+        elif name == 'push' and frame.unbounded and facts.push_in_unbounded_loop is None:
+            facts.push_in_unbounded_loop = line
+        elif name == 'useEffect':
+            self._visit_effect(node)
+
+        if name in FETCH_CALLS and (frame.loops or frame.iteration_callback) and facts.fetch_in_loop is None:
+            facts.fetch_in_loop = line
+        if name in SQL_CALLS and receiver is not None:
+            self._check_sql(node, name)
+
+    def _check_sql(self, node, name: str) -> None:
+        args = node.child_by_field_name('arguments')
+        first = args.named_children[0] if args is not None and args.named_child_count else None
+        if first is None:
+            return
+        interpolated = first.type == 'template_string' and any(
+            c.type == 'template_substitution' for c in first.named_children)
+        concatenated = first.type == 'binary_expression' and _text(first.child_by_field_name('operator')) == '+' \
+            and any(c.type in ('string', 'template_string') for c in first.named_children)
+        if (interpolated and name in ('query', 'raw')) or (concatenated and name == 'execute'):
+            self.facts.sql.append((_line(node), SQL_CALLS[name]))
+
+    def _visit_effect(self, node) -> None:
+        args = node.child_by_field_name('arguments')
+        if args is None or args.named_child_count < 1:
+            return
+        callback = args.named_children[0]
+        if callback.type != 'arrow_function':
+            return
+        body = _text(callback.child_by_field_name('body'))
+        deps = args.named_children[1] if args.named_child_count > 1 else None
+
+        if deps is not None and deps.type == 'array' and deps.named_child_count == 0 \
+                and _STATE_REF.search(body) and self.facts.effect_missing_deps is None:
+            self.facts.effect_missing_deps = _line(node)
+        if _SETTER_CALL.search(body) and not self._returns_cleanup(callback) \
+                and self.facts.effect_without_cleanup is None:
+            self.facts.effect_without_cleanup = _line(node)
+
+    @staticmethod
+    def _returns_cleanup(callback) -> bool:
+        body = callback.child_by_field_name('body')
+        if body is None or body.type != 'statement_block':
+            return False
+        for statement in body.named_children:
+            if statement.type == 'return_statement' and statement.named_child_count \
+                    and statement.named_children[0].type in FUNCTION_NODES | {'identifier'}:
+                return True
+        return False
+
+    def _visit_assignment(self, node) -> None:
+        left = node.child_by_field_name('left')
+        if left is not None and left.type == 'member_expression':
+            prop = _text(left.child_by_field_name('property'))
+            if prop == 'innerHTML':
+                self.facts.xss.append((_line(node), "Direct innerHTML assignment - XSS vulnerability"))
+            self._check_secret(left.child_by_field_name('property'), node.child_by_field_name('right'))
+        else:
+            self._check_secret(left, node.child_by_field_name('right'))
+
+    def _check_secret(self, name_node, value_node) -> None:
+        if name_node is None or value_node is None or value_node.type != 'string':
+            return
+        name = _text(name_node)
+        value = _string_value(value_node)
+        for name_pattern, value_pattern, message in _SECRET_NAMES:
+            if name_pattern.search(name) and value_pattern.search(value):
+                self.facts.secrets.append((_line(value_node), message))
+                return
+
+    def _visit_string(self, node) -> None:
+        value = _string_value(node)
+        if _INSECURE_HTTP.match(value):
+            self.facts.insecure_http += 1
+        for pattern, message in _SECRET_VALUES:
+            if pattern.search(value):
+                self.facts.secrets.append((_line(node), message))
+
+    def _visit_import(self, node) -> None:
+        source = _string_value(node.child_by_field_name('source'))
+        clause = next((c for c in node.named_children if c.type == 'import_clause'), None)
+        if clause is None:
+            return
+        kinds = {c.type for c in clause.named_children}
+        line = _line(node)
+        if 'identifier' in kinds and source == 'lodash':
+            self.facts.large_imports.append((line, "Full lodash import (~70KB)"))
+        elif 'identifier' in kinds and source == 'moment':
+            self.facts.large_imports.append((line, "moment.js import (~290KB) - use date-fns or dayjs"))
+        elif 'namespace_import' in kinds:
+            self.facts.large_imports.append((line, "Namespace import prevents tree-shaking"))
+
+    def _visit_jsx_attribute(self, node) -> None:
+        if node.named_child_count < 2:
+            return
+        name = _text(node.named_children[0])
+        value = node.named_children[1]
+        if value.type != 'jsx_expression' or not value.named_child_count:
+            return
+        expression = value.named_children[0]
+        if name == 'dangerouslySetInnerHTML':
+            self.facts.xss.append((_line(node), "dangerouslySetInnerHTML usage - XSS risk"))
+        elif name in ('style', 'className', 'options') and expression.type in ('object', 'array'):
+            self.facts.inline_object_props += 1
+        elif name.startswith('on') and expression.type in FUNCTION_NODES:
+            self.facts.anonymous_handlers += 1
+
+
+def _text(node) -> str:
+    return node.text.decode('utf-8', errors='ignore') if node is not None else ''
+
+
+def _line(node) -> int:
+    return node.start_point[0] + 1
+
+
+def _is_infinite_loop(node) -> bool:
+    return node.type == 'while_statement' and _text(node.child_by_field_name('condition')) in ('(true)', '(1)')
+
+
+def _string_value(node) -> str:
+    if node is None:
+        return ''
+    return ''.join(_text(c) for c in node.named_children if c.type == 'string_fragment')
+
+
+def _callee_name(call) -> Optional[str]:
+    """Called function or method name of a call_expression (`fs.readFileSync(...)` -> readFileSync)."""
+    if call is None or call.type != 'call_expression':
+        return None
+    function = call.child_by_field_name('function')
+    if function is None:
+        return None
+    if function.type == 'member_expression':
+        return _text(function.child_by_field_name('property'))
+    if function.type == 'identifier':
+        return _text(function)
+    return None
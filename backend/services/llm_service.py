@@ -1,3 +1,7 @@
+import base64
+import binascii
+from typing import Any, Dict, List, Optional
+
 from .db import get_database
 
 
@@ -528,6 +532,26 @@ if (status === STATUS.PENDING) { }""",
             "priority": "Medium",
             "est_hours": 1
         },
+        "Duplicated Block": {
+            "title": "Extract Shared Code",
+            "rationale": "Copy-pasted blocks drift apart - a bug fixed in one copy stays in the other.",
+            "snippet": """# Before: Same block in two places
+def export_csv(rows):
+    cleaned = [r for r in rows if r.get("active")]
+    cleaned.sort(key=lambda r: r["name"])
+    ...
+
+def export_json(rows):
+    cleaned = [r for r in rows if r.get("active")]
+    cleaned.sort(key=lambda r: r["name"])
+    ...
+
+# After: One helper used by both
+def active_rows_sorted(rows):
+    return sorted((r for r in rows if r.get("active")), key=lambda r: r["name"])""",
+            "priority": "Medium",
+            "est_hours": 2
+        },
         "Too Many Parameters": {
             "title": "Use Options Object",
             "rationale": "Many parameters are hard to remember and error-prone.",
@@ -764,77 +788,132 @@ if elapsed > CACHE_TTL_SECONDS:
         }
     }
     
+    # Offered when none of a file's smells has a template
+    GENERAL_SUGGESTIONS = [
+        {
+            "title": "Add Unit Tests",
+            "rationale": "Improve code coverage and catch regressions early",
+            "snippet": "def test_function_name():\n    result = function_name(input)\n    assert result == expected",
+            "priority": "Medium",
+            "est_hours": 2
+        },
+        {
+            "title": "Add Type Hints",
+            "rationale": "Type hints improve code readability and IDE support",
+            "snippet": "def process(data: dict[str, Any]) -> Result:\n    ...",
+            "priority": "Low",
+            "est_hours": 1
+        }
+    ]
+    
+    PRIORITY_ORDER = {"Critical": 0, "High": 1, "Medium": 2, "Low": 3}
+    
     @staticmethod
-    async def fetch_suggestions(project_id: str, file_id: str, limit: int):
+    def file_id(path: str) -> str:
+        """Stable, URL-safe id of a file path: its UTF-8 bytes in unpadded base64url."""
+        return base64.urlsafe_b64encode(path.encode("utf-8")).decode("ascii").rstrip("=")
+    
+    @staticmethod
+    def file_path(file_id: str) -> Optional[str]:
+        """The path a file_id was made from, or None if it is not one."""
+        try:
+            return base64.urlsafe_b64decode(file_id + "=" * (-len(file_id) % 4)).decode("utf-8")
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            return None
+    
+    @staticmethod
+    def suggestion_templates(smells: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """
-        Generate refactoring suggestions based on detected smells for a file.
-        Only fetches smells from the current project to avoid stale data.
+        The templates that apply to one file's smells, one per smell type, most
+        urgent first: the template key (smell type) and the smell it quotes.
+        Empty when none of the smells has a template.
         """
-        db = get_database()
-        file_path = file_id.replace('_', '/')  # Reverse the path encoding
-        
-        # Try to find smells for this file IN THIS PROJECT ONLY
-        smells = []
-        try:
-            if hasattr(db, '_db') and db._db is not None:
-                # Search for smells matching this file path AND project
-                cursor = db._db.smells.find({
-                    "project_id": project_id,
-                    "$or": [
-                        {"path": {"$regex": file_path.replace('/', '.'), "$options": "i"}},
-                        {"path": {"$regex": file_id, "$options": "i"}}
-                    ]
-                })
-                smells = await cursor.to_list(length=100)
-        except Exception as e:
-            print(f"Error fetching smells for suggestions: {e}")
-            smells = []
-        
-        suggestions = []
+        templates = []
         seen_types = set()
         
         for smell in smells:
             smell_type = smell.get('type', '')
-            if smell_type in seen_types:
+            if smell_type in seen_types or smell_type not in LLMService.SUGGESTION_TEMPLATES:
                 continue
             seen_types.add(smell_type)
-            
-            template = LLMService.SUGGESTION_TEMPLATES.get(smell_type)
-            if template:
-                suggestion = {
-                    "title": template["title"],
-                    "rationale": f"{template['rationale']} (Line {smell.get('line', 'N/A')}: {smell.get('message', '')})",
-                    "snippet": template["snippet"],
-                    "priority": template["priority"],
-                    "est_hours": template["est_hours"]
-                }
-                suggestions.append(suggestion)
+            templates.append({"type": smell_type, "line": smell.get('line'), "message": smell.get('message', '')})
+        
+        templates.sort(key=lambda x: LLMService.PRIORITY_ORDER.get(
+            LLMService.SUGGESTION_TEMPLATES[x["type"]]["priority"], 3))
+        return templates
+    
+    @staticmethod
+    def expand_suggestions(templates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Full suggestions of a file from its templates (see suggestion_templates)."""
+        suggestions = []
+        for quoted in templates:
+            template = LLMService.SUGGESTION_TEMPLATES.get(quoted["type"])
+            if template is None:
+                continue
+            line = quoted.get("line")
+            suggestions.append({
+                "title": template["title"],
+                "rationale": f"{template['rationale']} (Line {'N/A' if line is None else line}: {quoted.get('message', '')})",
+                "snippet": template["snippet"],
+                "priority": template["priority"],
+                "est_hours": template["est_hours"]
+            })
         
         # If no specific suggestions, provide general ones
         if not suggestions:
-            suggestions = [
-                {
-                    "title": "Add Unit Tests",
-                    "rationale": "Improve code coverage and catch regressions early",
-                    "snippet": "def test_function_name():\n    result = function_name(input)\n    assert result == expected",
-                    "priority": "Medium",
-                    "est_hours": 2
-                },
-                {
-                    "title": "Add Type Hints",
-                    "rationale": "Type hints improve code readability and IDE support",
-                    "snippet": "def process(data: dict[str, Any]) -> Result:\n    ...",
-                    "priority": "Low",
-                    "est_hours": 1
-                }
-            ]
+            suggestions = [dict(s) for s in LLMService.GENERAL_SUGGESTIONS]
+        return suggestions
+    
+    @staticmethod
+    def suggest(smells: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Refactoring suggestions for one file's smells, one per smell type, most urgent first."""
+        return LLMService.expand_suggestions(LLMService.suggestion_templates(smells))
+    
+    @staticmethod
+    def build_suggestions(metrics: List[Dict[str, Any]], smells: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        One suggestions row per analyzed file, keyed by file_id, for
+        DatabaseInterface.set_suggestions. Rows keep only the template keys and
+        the smells they quote; the template text is filled in when read.
+        """
+        by_path: Dict[str, List[Dict[str, Any]]] = {}
+        for smell in smells:
+            by_path.setdefault(smell.get("path", ""), []).append(smell)
+        for rows in by_path.values():
+            # The first smell of each type is the one quoted
+            rows.sort(key=lambda x: (-x.get("severity", 0), x.get("line", 0)))
+        
+        return [
+            {
+                "path": m["path"],
+                "file_id": LLMService.file_id(m["path"]),
+                "templates": LLMService.suggestion_templates(by_path.get(m["path"], []))
+            }
+            for m in metrics if m.get("path")
+        ]
+    
+    @staticmethod
+    async def fetch_suggestions(project_id: str, file_id: str, limit: int):
+        """
+        Refactoring suggestions for a file (see file_id), as stored when the
+        project's last scan completed.
+        """
+        db = get_database()
+        file_path = LLMService.file_path(file_id)
+        if file_path is None:
+            return {"error": f"Invalid file id '{file_id}'"}
         
-        # Sort by priority
-        priority_order = {"High": 0, "Medium": 1, "Low": 2}
-        suggestions.sort(key=lambda x: priority_order.get(x.get("priority", "Low"), 2))
+        row = await db.get_suggestions(project_id, file_id)
+        if row is None or "templates" not in row:
+            # Scanned before template keys were stored: derive them from the file's smells
+            if not await db.get_metrics(project_id, paths=[file_path], fields=["path"]):
+                return {"error": f"File {file_path} not found in project"}
+            smells = sorted(await db.get_smells(project_id, paths=[file_path]),
+                            key=lambda x: (-x.get("severity", 0), x.get("line", 0)))
+            row = {"templates": LLMService.suggestion_templates(smells)}
         
         return {
             "file_id": file_id,
             "path": file_path,
-            "suggestions": suggestions[:limit]
+            "suggestions": LLMService.expand_suggestions(row["templates"])[:limit]
         }
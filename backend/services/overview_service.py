@@ -0,0 +1,85 @@
+"""
+Project Overview Service - Every dashboard view of a project in one response.
+
+The dashboard's first paint used to take five requests (metrics, risks,
+smells, trends, dependencies), each reading the project's summary again.
+The overview fetches the summary once, hands it to every section and
+resolves the sections concurrently; only the metrics table and the trend
+history read anything beyond it. A section that fails carries an "error"
+key instead of failing the whole response.
+"""
+
+import asyncio
+from typing import Any, Dict, List, Optional
+
+from .analytics_service import AnalyticsService
+from .dependency_service import get_dependency_graph
+from .history_service import get_trend_data
+from .summary_service import SummaryService
+from models.schemas import FileMetric, RiskScore
+
+
+# Sections in response order; all of them unless ?include= narrows it
+SECTIONS = ("summary", "metrics", "risks", "smells", "trends", "dependencies")
+
+# Summary fields sent as the "summary" section; the lists in it are served by their own sections
+SUMMARY_FIELDS = (
+    "scan_id", "commit_sha", "computed_at", "total_files", "total_loc", "total_smells",
+    "affected_files", "avg_risk", "quality_score", "tiers", "risk_histogram",
+    "smell_severity", "issue_levels", "languages"
+)
+
+# Rows carry the fields their typed endpoints send (see models.schemas)
+METRIC_FIELDS = ",".join(FileMetric.model_fields)
+RISK_FIELDS = ",".join(RiskScore.model_fields)
+
+
+class OverviewService:
+    @staticmethod
+    def parse_include(include: Optional[str]) -> List[str]:
+        """?include=risks,trends as section names in response order. Raises ValueError on unknown ones."""
+        if not include:
+            return list(SECTIONS)
+        requested = {s.strip().lower() for s in include.split(",") if s.strip()}
+        unknown = sorted(requested - set(SECTIONS))
+        if unknown:
+            raise ValueError(f"Unknown section(s) {', '.join(unknown)}. Use any of: {', '.join(SECTIONS)}")
+        return [s for s in SECTIONS if s in requested] or list(SECTIONS)
+
+    @staticmethod
+    async def fetch_overview(project_id: str, include: Optional[str] = None, limit: int = 50,
+                             sort: Optional[str] = None, top: int = 10, days: int = 30) -> Dict[str, Any]:
+        try:
+            sections = OverviewService.parse_include(include)
+        except ValueError as e:
+            return {"error": str(e)}
+
+        # Read once, shared by every section built from it
+        summary = await SummaryService.get(project_id) or {}
+
+        async def smells() -> Dict[str, Any]:
+            head = await AnalyticsService.fetch_smells(project_id, summary=summary)
+            # The most severe issues; the full listing streams from /smells
+            return {**head, "items": summary.get("sample_issues", [])}
+
+        resolvers = {
+            "summary": lambda: OverviewService._summary(summary),
+            "metrics": lambda: AnalyticsService.fetch_metrics(project_id, limit, sort, METRIC_FIELDS),
+            "risks": lambda: AnalyticsService.fetch_risks(project_id, None, top, RISK_FIELDS, summary=summary),
+            "smells": smells,
+            "trends": lambda: get_trend_data(project_id, days=days, summary=summary),
+            "dependencies": lambda: get_dependency_graph(project_id)
+        }
+        results = await asyncio.gather(*(resolvers[s]() for s in sections), return_exceptions=True)
+
+        overview: Dict[str, Any] = {"project_id": project_id, "has_data": bool(summary)}
+        for section, result in zip(sections, results):
+            if isinstance(result, Exception):
+                print(f"⚠️  Overview section {section} of {project_id} failed: {result}")
+                result = {"error": str(result)}
+            overview[section] = result
+        return overview
+
+    @staticmethod
+    async def _summary(summary: Dict[str, Any]) -> Dict[str, Any]:
+        return {k: summary[k] for k in SUMMARY_FIELDS if k in summary}
@@ -3,17 +3,35 @@ Repository Analyzer - Clones and analyzes GitHub repositories for code quality m
 Enterprise-grade detection for real-world issues that cause production incidents.
 """
 
+import asyncio
 import os
 import ast
+import hashlib
 import tempfile
 import shutil
 import subprocess
+import zipfile
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Iterable, Iterator, AsyncIterator
 from dataclasses import dataclass, asdict
 import re
 from collections import Counter
 
+try:
+    import fcntl
+except ImportError:  # Windows: a single worker process, the asyncio lock is enough
+    fcntl = None
+
+from .clone_detector import CloneDetector, CloneBlock
+from .similarity_index import SimilarityIndex
+from .git_object_store import GitObjectStore
+from . import js_syntax
+from .js_syntax import JsFacts, JsSyntaxVisitor
+from .source_reader import SourceReader, SourceFile
+from .dependency_service import DependencyAnalyzer
+from .smell_fingerprint import fingerprint_smells
+
 
 # ============================================================================
 # ENTERPRISE SECURITY PATTERNS - Real vulnerabilities found in production
@@ -90,6 +108,22 @@ class CodeSmell:
     line: int
     message: str
     suggestion: str
+    fingerprint: str = ""  # stable across scans, see smell_fingerprint
+
+
+@dataclass
+class FunctionMetrics:
+    name: str
+    line: int
+    end_line: int
+    complexity: int
+    nesting: int
+    params: int
+    length: int
+
+
+# What a language analyzer returns for one file
+AnalysisResult = tuple[Optional[FileMetrics], List[CodeSmell], List[FunctionMetrics]]
 
 
 @dataclass
@@ -198,11 +232,20 @@ class PythonAnalyzer:
     """Analyze Python files for metrics and code smells."""
     
     @staticmethod
-    def analyze_file(file_path: Path, relative_path: str) -> tuple[Optional[FileMetrics], List[CodeSmell]]:
+    def analyze_file(file_path: Path, relative_path: str) -> AnalysisResult:
         """Analyze a single Python file."""
+        source = SourceReader().open(file_path, relative_path)
+        if source is None:
+            return None, [], []
+        return PythonAnalyzer.analyze_source(source)
+    
+    @staticmethod
+    def analyze_source(source: SourceFile) -> AnalysisResult:
+        """Analyze a single Python file from its shared, already-read source."""
+        relative_path = source.path
         try:
-            content = file_path.read_text(encoding='utf-8', errors='ignore')
-            lines = content.split('\n')
+            content = source.text
+            lines = source.lines
             
             # Basic line counts
             loc = len(lines)
@@ -227,7 +270,7 @@ class PythonAnalyzer:
                     dup_ratio=0.0,
                     comment_ratio=comment_ratio,
                     language="python"
-                ), []
+                ), [], []
             
             # Count functions and classes
             functions = [node for node in ast.walk(tree) 
@@ -243,6 +286,7 @@ class PythonAnalyzer:
             
             cyclomatic_max = max(complexities) if complexities else 1
             cyclomatic_avg = sum(complexities) / len(complexities) if complexities else 1.0
+            function_metrics = PythonAnalyzer._function_metrics(functions, classes, complexities)
             
             # Calculate nesting depth
             nesting_visitor = NestingVisitor()
@@ -250,7 +294,7 @@ class PythonAnalyzer:
             nesting_max = nesting_visitor.max_depth
             
             # Detect code smells
-            smells = PythonAnalyzer._detect_smells(tree, lines, relative_path, functions, classes)
+            smells = PythonAnalyzer._detect_smells(tree, source, functions, classes)
             
             metrics = FileMetrics(
                 path=relative_path,
@@ -261,26 +305,57 @@ class PythonAnalyzer:
                 fn_count=len(functions),
                 class_count=len(classes),
                 nesting_max=nesting_max,
-                dup_ratio=0.0,  # Would need more sophisticated analysis
+                dup_ratio=0.0,  # Filled in by the repository-wide clone detector
                 comment_ratio=round(comment_ratio, 3),
                 language="python"
             )
             
-            return metrics, smells
+            return metrics, smells, function_metrics
             
         except Exception as e:
             print(f"Error analyzing {relative_path}: {e}")
-            return None, []
+            return None, [], []
     
     @staticmethod
-    def _detect_smells(tree: ast.AST, lines: List[str], path: str, 
+    def _function_metrics(functions: List[ast.AST], classes: List[ast.AST],
+                          complexities: List[int]) -> List[FunctionMetrics]:
+        """Per-function records; methods are named Class.method."""
+        owners = {}
+        for cls in classes:
+            for item in cls.body:
+                if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                    owners[item] = cls.name
+        
+        records = []
+        for func, complexity in zip(functions, complexities):
+            nesting_visitor = NestingVisitor()
+            nesting_visitor.visit(func)
+            args = func.args
+            end_line = getattr(func, 'end_lineno', None) or func.lineno
+            records.append(FunctionMetrics(
+                name=f"{owners[func]}.{func.name}" if func in owners else func.name,
+                line=func.lineno,
+                end_line=end_line,
+                complexity=complexity,
+                nesting=max(nesting_visitor.max_depth - 1, 0),  # the def itself counts as one level
+                params=len(args.posonlyargs) + len(args.args) + len(args.kwonlyargs)
+                       + (args.vararg is not None) + (args.kwarg is not None),
+                length=end_line - func.lineno + 1
+            ))
+        return records
+    
+    @staticmethod
+    def _detect_smells(tree: ast.AST, source: SourceFile,
                        functions: List[ast.AST], classes: List[ast.AST]) -> List[CodeSmell]:
         """
         Enterprise-grade code smell detection for Python.
         Focuses on issues that cause real production incidents.
         """
         smells = []
-        content = '\n'.join(lines)
+        path = source.path
+        content = source.text
+        lines = source.lines
+        line_of = source.line_of
         loc = len(lines)
         
         # ============================================================
@@ -291,7 +366,7 @@ class PythonAnalyzer:
         for pattern in SECURITY_PATTERNS['sql_injection']:
             matches = list(re.finditer(pattern, content, re.IGNORECASE | re.MULTILINE))
             for match in matches:
-                line_num = content[:match.start()].count('\n') + 1
+                line_num = line_of(match.start())
                 smells.append(CodeSmell(
                     path=path,
                     type="SQL Injection Risk",
@@ -306,7 +381,7 @@ class PythonAnalyzer:
         for pattern in SECURITY_PATTERNS['hardcoded_secrets']:
             matches = list(re.finditer(pattern, content, re.IGNORECASE))
             for match in matches:
-                line_num = content[:match.start()].count('\n') + 1
+                line_num = line_of(match.start())
                 # Get a preview without exposing the secret
                 line_content = lines[line_num - 1] if line_num <= len(lines) else ''
                 key_match = re.search(r'(password|secret|key|token|api)', line_content, re.IGNORECASE)
@@ -325,7 +400,7 @@ class PythonAnalyzer:
         for pattern in SECURITY_PATTERNS['command_injection']:
             matches = list(re.finditer(pattern, content))
             for match in matches:
-                line_num = content[:match.start()].count('\n') + 1
+                line_num = line_of(match.start())
                 matched_text = match.group(0)[:20]
                 smells.append(CodeSmell(
                     path=path,
@@ -344,7 +419,7 @@ class PythonAnalyzer:
         # N+1 Query Problem (common in ORMs)
         n_plus_one_pattern = r'for\s+(\w+)\s+in\s+(\w+).*:\s*\n\s*.*\.\s*(?:objects|query|filter|get|find)'
         for match in re.finditer(n_plus_one_pattern, content, re.MULTILINE):
-            line_num = content[:match.start()].count('\n') + 1
+            line_num = line_of(match.start())
             smells.append(CodeSmell(
                 path=path,
                 type="N+1 Query Problem",
@@ -357,7 +432,7 @@ class PythonAnalyzer:
         # Synchronous I/O in Async Context
         async_sync_pattern = r'async\s+def\s+\w+[^:]+:\s*\n(?:.*\n)*?.*(?:requests\.|urllib\.|time\.sleep|open\()'
         for match in re.finditer(async_sync_pattern, content, re.MULTILINE):
-            line_num = content[:match.start()].count('\n') + 1
+            line_num = line_of(match.start())
             smells.append(CodeSmell(
                 path=path,
                 type="Blocking Call in Async",
@@ -533,14 +608,41 @@ class PythonAnalyzer:
 
 
 class JavaScriptAnalyzer:
-    """Basic analyzer for JavaScript/TypeScript files."""
+    """
+    Analyzer for JavaScript/TypeScript files.
+    
+    Uses one tree-sitter parse per file when the grammars are installed
+    (see js_syntax), and regex heuristics otherwise.
+    """
     
     @staticmethod
-    def analyze_file(file_path: Path, relative_path: str) -> tuple[Optional[FileMetrics], List[CodeSmell]]:
+    def analyze_file(file_path: Path, relative_path: str) -> AnalysisResult:
         """Analyze a JavaScript/TypeScript file."""
+        source = SourceReader().open(file_path, relative_path)
+        if source is None:
+            return None, [], []
+        return JavaScriptAnalyzer.analyze_source(source)
+    
+    # Extensions labeled "javascript"; every other one the analyzer takes is TypeScript
+    JAVASCRIPT_EXTENSIONS = ('.js', '.jsx')
+    
+    @staticmethod
+    def language(relative_path: str) -> str:
+        """Language label of a file, the same whichever parser path analyzed it."""
+        suffix = Path(relative_path).suffix.lower()
+        return "javascript" if suffix in JavaScriptAnalyzer.JAVASCRIPT_EXTENSIONS else "typescript"
+    
+    @staticmethod
+    def analyze_source(source: SourceFile) -> AnalysisResult:
+        """Analyze a JavaScript/TypeScript file from its shared, already-read source."""
+        relative_path = source.path
         try:
-            content = file_path.read_text(encoding='utf-8', errors='ignore')
-            lines = content.split('\n')
+            tree = js_syntax.parse(source)
+            if tree is not None:
+                return JavaScriptAnalyzer._analyze_tree(source, JsSyntaxVisitor(source, tree).walk())
+            
+            content = source.text
+            lines = source.lines
             
             loc = len(lines)
             sloc = sum(1 for line in lines if line.strip() and not line.strip().startswith('//'))
@@ -573,7 +675,7 @@ class JavaScriptAnalyzer:
                 elif char == '}':
                     current_depth = max(0, current_depth - 1)
             
-            smells = JavaScriptAnalyzer._detect_smells(content, lines, relative_path)
+            smells = JavaScriptAnalyzer._detect_smells(source)
             
             metrics = FileMetrics(
                 path=relative_path,
@@ -586,19 +688,185 @@ class JavaScriptAnalyzer:
                 nesting_max=max_depth,
                 dup_ratio=0.0,
                 comment_ratio=round(comment_ratio, 3),
-                language="javascript" if relative_path.endswith('.js') else "typescript"
+                language=JavaScriptAnalyzer.language(relative_path)
             )
             
-            return metrics, smells
+            # Function boundaries are only known from the syntax tree
+            return metrics, smells, []
             
         except Exception as e:
             print(f"Error analyzing {relative_path}: {e}")
-            return None, []
+            return None, [], []
     
     @staticmethod
-    def _detect_smells(content: str, lines: List[str], path: str) -> List[CodeSmell]:
+    def _analyze_tree(source: SourceFile, facts: JsFacts) -> AnalysisResult:
+        """Metrics and smells from the facts of one syntax tree walk."""
+        relative_path = source.path
+        lines = source.lines
+        loc = len(lines)
+        sloc = sum(1 for line in lines if line.strip() and not line.strip().startswith('//'))
+        
+        # Anonymous callbacks are not counted as functions of the file
+        named = [f for f in facts.functions if f.name]
+        complexities = [f.complexity for f in facts.functions]
+        
+        metrics = FileMetrics(
+            path=relative_path,
+            loc=loc,
+            sloc=sloc,
+            cyclomatic_max=max(complexities + [facts.module_complexity]),
+            cyclomatic_avg=round(sum(complexities) / len(complexities), 2) if complexities else float(facts.module_complexity),
+            fn_count=len(named),
+            class_count=facts.class_count,
+            nesting_max=facts.nesting_max,
+            dup_ratio=0.0,  # Filled in by the repository-wide clone detector
+            comment_ratio=round(min(facts.comment_lines / max(loc, 1), 1.0), 3),
+            language=JavaScriptAnalyzer.language(relative_path)
+        )
+        functions = [
+            FunctionMetrics(
+                name=f.name or "<anonymous>",
+                line=f.line,
+                end_line=f.end_line,
+                complexity=f.complexity,
+                nesting=f.nesting,
+                params=f.params,
+                length=f.end_line - f.line + 1
+            )
+            for f in facts.functions
+        ]
+        return metrics, JavaScriptAnalyzer._detect_tree_smells(source, facts, named), functions
+    
+    @staticmethod
+    def _detect_tree_smells(source: SourceFile, facts: JsFacts, named: list) -> List[CodeSmell]:
+        """Same smells as _detect_smells, read from syntax tree facts instead of regexes."""
+        smells = []
+        path = source.path
+        loc = source.line_count
+        
+        def smell(type_: str, severity: int, line: int, message: str, suggestion: str):
+            smells.append(CodeSmell(path=path, type=type_, severity=severity, line=line,
+                                    message=message, suggestion=suggestion))
+        
+        # ===== SECURITY VULNERABILITIES =====
+        reported = Counter()
+        for line, msg in facts.xss:
+            reported[msg] += 1
+            if reported[msg] <= 2:  # Report up to 2 instances
+                smell("XSS Vulnerability", 5, line, msg,
+                      "Use textContent instead of innerHTML, or sanitize HTML with DOMPurify")
+        for line, msg in JavaScriptAnalyzer._first_per_message(facts.sql):
+            smell("SQL Injection Risk", 5, line, msg, "Use parameterized queries or prepared statements")
+        for line, msg in JavaScriptAnalyzer._first_per_message(facts.secrets):
+            smell("Hardcoded Credentials", 5, line, msg,
+                  "Use environment variables, secrets manager, or .env files (gitignored)")
+        if facts.insecure_http:
+            smell("Insecure HTTP", 4, 1, f"Found {facts.insecure_http} insecure HTTP URLs (non-localhost)",
+                  "Use HTTPS for all external URLs")
+        
+        # ===== PERFORMANCE ISSUES =====
+        for line, msg in JavaScriptAnalyzer._first_per_message(facts.sync_io):
+            smell("Blocking I/O", 4, line, msg, "Use async versions: readFile, writeFile, exec, spawn")
+        if facts.fetch_in_loop is not None:
+            smell("N+1 Query Pattern", 5, facts.fetch_in_loop,
+                  "Database/API call inside loop - N+1 performance problem",
+                  "Batch queries using Promise.all(), or fetch all data before the loop")
+        if facts.push_in_unbounded_loop is not None:
+            smell("Memory Leak Risk", 5, facts.push_in_unbounded_loop,
+                  "Unbounded array growth in infinite loop/interval",
+                  "Limit array size or use circular buffer pattern")
+        if facts.set_interval > facts.clear_interval + 1:
+            smell("Interval Leak", 4, 1,
+                  f"Found {facts.set_interval} setInterval but only {facts.clear_interval} clearInterval",
+                  "Store interval ID and clear in cleanup (useEffect return, componentWillUnmount)")
+        if facts.add_listener > facts.remove_listener + 2:
+            smell("Event Listener Leak", 4, 1,
+                  f"Found {facts.add_listener} addEventListener but only {facts.remove_listener} removeEventListener",
+                  "Clean up listeners in useEffect cleanup or componentWillUnmount")
+        for line, msg in JavaScriptAnalyzer._first_per_message(facts.large_imports):
+            smell("Large Bundle Import", 3, line, msg, "Use named imports: import { specific } from 'library'")
+        
+        # ===== REACT-SPECIFIC ISSUES =====
+        if facts.effect_missing_deps is not None:
+            smell("Missing Dependencies", 4, facts.effect_missing_deps,
+                  "useEffect with empty deps array uses external variables",
+                  "Add used variables to dependency array or use useCallback")
+        if facts.effect_without_cleanup is not None:
+            smell("State Update Without Cleanup", 4, facts.effect_without_cleanup,
+                  "useEffect sets state but has no cleanup - may cause memory leak",
+                  "Return cleanup function: return () => { /* cleanup */ }")
+        if facts.inline_object_props > 5:
+            smell("Inline Object Props", 3, 1,
+                  f"Found {facts.inline_object_props} inline object/array props - causes re-renders",
+                  "Move objects outside component or use useMemo")
+        if facts.anonymous_handlers > 5:
+            smell("Anonymous Handlers", 3, 1,
+                  f"Found {facts.anonymous_handlers} anonymous functions in event handlers",
+                  "Use useCallback for event handlers to prevent unnecessary re-renders")
+        
+        # ===== ASYNC/AWAIT ISSUES =====
+        unprotected = [f for f in facts.functions if f.is_async and f.unprotected_await]
+        if len(unprotected) > facts.catch_calls:
+            smell("Unhandled Promise Rejection", 4, unprotected[0].line,
+                  "Async functions without proper error handling",
+                  "Wrap await calls in try-catch or add .catch() handlers")
+        if facts.await_in_loop is not None and not facts.promise_all:
+            smell("Sequential Await", 4, facts.await_in_loop,
+                  "Await inside loop executes sequentially instead of in parallel",
+                  "Use Promise.all() with map to parallelize: await Promise.all(items.map(async i => ...))")
+        
+        # ===== CODE QUALITY ISSUES =====
+        if facts.callback_depth_max >= 4:
+            smell("Callback Hell", 4, 1, f"Deep callback nesting (depth: {facts.callback_depth_max})",
+                  "Refactor using async/await or Promises to flatten structure")
+        
+        # Only flag extremely long functions; React components and pages are naturally longer
+        is_test_file = any(x in path.lower() for x in ['test', 'spec', 'mock', '__test__'])
+        is_page_or_component = any(x in path.lower() for x in ['page', 'component', 'view', 'screen'])
+        threshold = 500 if is_page_or_component else 300
+        for f in named:
+            func_lines = f.end_line - f.line
+            if func_lines > threshold and not is_test_file:
+                smell("Long Function", 2, f.line, f"Function '{f.name}' has ~{func_lines} lines - quite large",
+                      "Optional: Consider breaking into smaller functions if it improves readability")
+        
+        if facts.empty_catches:
+            smell("Empty Catch Block", 4, 1, f"Found {facts.empty_catches} empty catch blocks",
+                  "Log errors or handle them appropriately")
+        if facts.any_types > 5:
+            smell("Excessive Any Types", 4, 1,
+                  f"Found {facts.any_types} uses of 'any' type - defeats TypeScript benefits",
+                  "Define proper interfaces/types or use 'unknown' for truly unknown types")
+        
+        # ===== MAINTENANCE ISSUES =====
+        if facts.console_calls > 5:
+            smell("Debug Statements", 2, 1, f"Found {facts.console_calls} console statements",
+                  "Remove debug statements or use proper logging library")
+        if facts.todos:
+            smell("Unresolved TODOs", 2, 1, f"Found {facts.todos} TODO/FIXME comments",
+                  "Address or create tickets for tracking")
+        if loc > 500:
+            smell("Long File", 3 if loc > 800 else 2, 1, f"File has {loc} lines",
+                  "Split into multiple modules by responsibility")
+        
+        return smells
+    
+    @staticmethod
+    def _first_per_message(findings: List[tuple]) -> List[tuple]:
+        """First (line, message) of each distinct message, like one re.search per pattern."""
+        seen = {}
+        for line, msg in findings:
+            seen.setdefault(msg, line)
+        return [(line, msg) for msg, line in seen.items()]
+    
+    @staticmethod
+    def _detect_smells(source: SourceFile) -> List[CodeSmell]:
         """Detect enterprise-grade code smells in JavaScript/TypeScript."""
         smells = []
+        path = source.path
+        content = source.text
+        lines = source.lines
+        line_of = source.line_of
         loc = len(lines)
         
         # ===== CRITICAL SECURITY VULNERABILITIES (Severity 5) =====
@@ -616,7 +884,7 @@ class JavaScriptAnalyzer:
             matches = list(re.finditer(pattern, content))
             if matches:
                 for match in matches[:2]:  # Report up to 2 instances
-                    line_num = content[:match.start()].count('\n') + 1
+                    line_num = line_of(match.start())
                     smells.append(CodeSmell(
                         path=path,
                         type="XSS Vulnerability",
@@ -636,7 +904,7 @@ class JavaScriptAnalyzer:
         for pattern, msg in sql_patterns:
             matches = list(re.finditer(pattern, content, re.IGNORECASE | re.DOTALL))
             if matches:
-                line_num = content[:matches[0].start()].count('\n') + 1
+                line_num = line_of(matches[0].start())
                 smells.append(CodeSmell(
                     path=path,
                     type="SQL Injection Risk",
@@ -659,7 +927,7 @@ class JavaScriptAnalyzer:
         for pattern, msg in secret_patterns:
             matches = list(re.finditer(pattern, content, re.IGNORECASE))
             if matches:
-                line_num = content[:matches[0].start()].count('\n') + 1
+                line_num = line_of(matches[0].start())
                 smells.append(CodeSmell(
                     path=path,
                     type="Hardcoded Credentials",
@@ -693,7 +961,7 @@ class JavaScriptAnalyzer:
         for pattern, msg in sync_patterns:
             matches = list(re.finditer(pattern, content))
             if matches:
-                line_num = content[:matches[0].start()].count('\n') + 1
+                line_num = line_of(matches[0].start())
                 smells.append(CodeSmell(
                     path=path,
                     type="Blocking I/O",
@@ -763,7 +1031,7 @@ class JavaScriptAnalyzer:
         for pattern, msg in large_imports:
             matches = list(re.finditer(pattern, content))
             if matches:
-                line_num = content[:matches[0].start()].count('\n') + 1
+                line_num = line_of(matches[0].start())
                 smells.append(CodeSmell(
                     path=path,
                     type="Large Bundle Import",
@@ -901,8 +1169,8 @@ class JavaScriptAnalyzer:
                         end_pos = i
                         break
             
-            func_lines = content[start_pos:end_pos].count('\n')
-            line_num = content[:match.start()].count('\n') + 1
+            func_lines = line_of(end_pos) - line_of(start_pos)
+            line_num = line_of(match.start())
             
             # Only flag extremely long functions (300+ lines for JS/React components)
             # React components and pages are naturally longer
@@ -985,6 +1253,17 @@ class JavaScriptAnalyzer:
         return smells
 
 
+# Folder GitHub wraps archives in: "<repo>-<branch>", "<repo>-<tag>" or "<repo>-<sha>"
+_GITHUB_ARCHIVE_ROOT = re.compile(r"^.+-(main|master|develop|trunk|v?\d+(\.\d+)*|[0-9a-f]{7,40})$")
+_COMMIT_SHA = re.compile(r"^[0-9a-f]{40}$")
+
+# One lock per mirror directory. Scans of the same URL by two projects, or with
+# other options, are not joined by the scan single-flight but share the mirror
+_mirror_locks: Dict[str, asyncio.Lock] = {}
+# How often a scan waiting on another worker process's hold of a mirror retries
+_MIRROR_LOCK_POLL = 0.1
+
+
 class RepoAnalyzer:
     """Main repository analyzer that clones and analyzes GitHub repositories."""
     
@@ -1002,86 +1281,661 @@ class RepoAnalyzer:
         '.pytest_cache', '.mypy_cache', 'eggs', '*.egg-info'
     }
     
-    def __init__(self):
-        self.temp_dir: Optional[Path] = None
+    # Persistent clones, one per repository URL, kept between scans for incremental fetches
+    MIRROR_ROOT = Path(os.getenv("REPO_MIRROR_DIR", str(Path(tempfile.gettempdir()) / "codesensex_mirrors")))
+    
+    # How sources get from the remote into the analyzers:
+    #   worktree - shallow clone with a full checkout
+    #   sparse   - blobless clone, checkout limited to supported extensions
+    #   objects  - bare blobless clone, blobs streamed through `git cat-file --batch`
+    INGEST_MODES = ("worktree", "sparse", "objects")
+    DEFAULT_INGEST_MODE = os.getenv("REPO_INGEST_MODE", "worktree")
+    
+    async def analyze_github_repo(self, github_url: str, ingest_mode: Optional[str] = None,
+                                  project_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Clone (or refresh) the repository mirror and analyze every supported file;
+        with project_id, the similarity vectors are saved for that project.
+        """
+        mode = self._ingest_mode(ingest_mode)
+        repo_dir = self.mirror_path(github_url, mode)
+        # Held until the clone index is saved: another scan of the URL would move the checkout under us
+        async with self._mirror_lock(repo_dir):
+            return await self._analyze_mirror(github_url, repo_dir, mode, project_id)
+    
+    async def _analyze_mirror(self, github_url: str, repo_dir: Path, mode: str,
+                              project_id: Optional[str] = None) -> Dict[str, Any]:
+        """The full scan of analyze_github_repo, with the mirror lock held."""
+        print(f"🔍 Syncing {github_url} into {repo_dir} ({mode})...", flush=True)
+        
+        if not await self._sync_mirror(github_url, repo_dir, mode):
+            print(f"❌ Failed to clone {github_url}", flush=True)
+            return {"error": "Failed to clone repository", "metrics": [], "risks": [], "smells": []}
+        
+        print(f"✅ Clone successful, analyzing files...", flush=True)
+        commit_sha = await asyncio.to_thread(self._head_commit, repo_dir)
+        
+        reader = SourceReader()
+        # Reading (cat-file, blob prefetch) and analysis block: the generator is consumed in the worker thread
+        results = await asyncio.to_thread(
+            self._analyze_full, reader, self._read_sources(reader, repo_dir, mode, commit_sha),
+            clone_index=self._clone_index_path(repo_dir),
+            vector_index=self._vector_index_path(repo_dir, project_id) if project_id else None,
+            commit_sha=commit_sha
+        )
+        return {
+            "commit_sha": commit_sha,
+            "ingest_mode": mode,
+            "local_path": str(repo_dir),
+            **results
+        }
+    
+    async def analyze_zip_archive(self, archive_path: str, archive_sha: Optional[str] = None,
+                                  archive_name: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Analyze supported members of an uploaded ZIP by streaming them out of
+        the archive; archive_name is the name it was uploaded under.
+        """
+        # Decompressing and analyzing every member blocks: keep it off the event loop
+        return await asyncio.to_thread(self._analyze_zip, archive_path, archive_sha, archive_name)
+    
+    def _analyze_zip(self, archive_path: str, archive_sha: Optional[str] = None,
+                     archive_name: Optional[str] = None) -> Dict[str, Any]:
+        try:
+            with zipfile.ZipFile(archive_path) as zf:
+                reader = SourceReader()
+                return self._analyze_full(reader, self._read_zip_sources(reader, zf, archive_name),
+                                          vector_index=Path(archive_path).with_suffix(".vectors"),
+                                          commit_sha=archive_sha)
+        except (OSError, zipfile.BadZipFile) as e:
+            print(f"❌ Failed to read archive {archive_path}: {e}", flush=True)
+            return {"error": "Failed to read uploaded archive", "metrics": [], "risks": [], "smells": []}
+    
+    def _analyze_full(self, reader: SourceReader, sources: Iterator[SourceFile],
+                      clone_index: Optional[Path] = None, vector_index: Optional[Path] = None,
+                      commit_sha: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Analyze every file of a scan once; metrics, smells, clones, similarity
+        vectors and dependency graph share one read. The clone fingerprints are
+        saved to clone_index when given, as of commit_sha, for later incremental
+        scans, and the vectors to vector_index for /similar, also as of commit_sha.
+        """
+        detector = CloneDetector(commit_sha)
+        vectors = SimilarityIndex(commit_sha) if vector_index is not None else None
+        dependency_graph = DependencyAnalyzer()
+        try:
+            all_metrics, all_smells, functions = self._analyze_sources(
+                reader, sources, vectors, detector, dependency_graph
+            )
+        finally:
+            reader.close()
+        dependencies = dependency_graph.graph()
+        
+        all_smells.extend(self._apply_clones(all_metrics, detector.detect()))
+        if clone_index is not None:
+            detector.save(clone_index)
+        if vectors is not None:
+            vectors.save(vector_index)
+        
+        # Calculate risk scores
+        risks = self._calculate_risks(all_metrics, all_smells)
+        
+        io_stats = reader.stats()
+        print(f"  Read {io_stats['bytes_read']} bytes from {io_stats['files_opened']} files "
+              f"({io_stats['files_mmapped']} mmapped, {io_stats['binary_skipped']} binary skipped)", flush=True)
+        summary = self.summarize(all_metrics, len(all_smells))
+        summary["io"] = io_stats
+        
+        return {
+            "metrics": [asdict(m) for m in all_metrics],
+            "risks": [asdict(r) for r in risks],
+            "smells": [asdict(s) for s in all_smells],
+            "functions": functions,
+            "dependencies": dependencies,
+            "summary": summary
+        }
+    
+    def _read_zip_sources(self, reader: SourceReader, zf: zipfile.ZipFile,
+                          archive_name: Optional[str] = None) -> Iterator[SourceFile]:
+        """Yield supported archive members as shared sources, without extracting."""
+        members = [i for i in zf.infolist() if not i.is_dir()]
+        prefix = self._archive_wrapper(zf, members, archive_name)
+        
+        for info in members:
+            relative_path = info.filename[len(prefix):]
+            if not self._is_supported(relative_path):
+                continue
+            with zf.open(info) as member:
+                source = reader.from_stream(relative_path, member, info.file_size)
+            if source is not None:
+                yield source
+    
+    @staticmethod
+    def _archive_wrapper(zf: zipfile.ZipFile, members: List[zipfile.ZipInfo],
+                         archive_name: Optional[str] = None) -> str:
+        """
+        The "<repo>-<ref>/" folder GitHub wraps its archives in, to strip from
+        member paths; "" for any other layout, whose paths are kept as they
+        are (a single "pkg/" or "tool-2/" folder is part of the project's paths).
+
+        Only stripped when the archive says it comes from GitHub (or git
+        archive), by the commit it records as its comment, or when the folder
+        is named after the upload itself, as in "<repo>-<ref>.zip".
+        """
+        roots = {m.filename.split('/', 1)[0] for m in members}
+        if len(roots) != 1 or not all('/' in m.filename for m in members):
+            return ""
+        root = roots.pop()
+        commit = zf.comment.decode('ascii', errors='replace').strip()
+        if _COMMIT_SHA.match(commit):
+            return f"{root}/"
+        stem = Path(archive_name or "").name
+        if stem.lower().endswith(".zip"):
+            stem = stem[:-len(".zip")]
+        if root == stem and _GITHUB_ARCHIVE_ROOT.match(root):
+            return f"{root}/"
+        return ""
+    
+    def read_project_sources(self, project: Dict[str, Any], reader: SourceReader) -> Iterator[SourceFile]:
+        """
+        Stream the supported sources of a project's last scanned revision,
+        however it was ingested; nothing when they are not available locally.
+        """
+        if project.get("source_type") == "zip":
+            archive_path = project.get("archive_path")
+            if not archive_path or not os.path.exists(archive_path):
+                return
+            with zipfile.ZipFile(archive_path) as zf:
+                yield from self._read_zip_sources(reader, zf, project.get("source_ref"))
+            return
+        
+        repo_dir = project.get("local_path")
+        mode = self._ingest_mode(project.get("ingest_mode"))
+        commit_sha = project.get("last_commit")
+        if not repo_dir or not commit_sha or not self._mirror_exists(Path(repo_dir), mode):
+            return
+        # Read from git objects whatever the mode: the checkout is shared by every project of
+        # the URL and may hold another's newer commit, or a fetch of a scan that then failed
+        yield from self._read_sources(reader, Path(repo_dir), "objects", commit_sha)
+    
+    async def analyze_incremental(self, github_url: str, base_sha: str, ingest_mode: Optional[str] = None,
+                                  project_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Fetch new history into the mirror and analyze only what changed since base_sha;
+        with project_id, that project's similarity vectors are updated too.
         
-    async def analyze_github_repo(self, github_url: str) -> Dict[str, Any]:
-        """Clone and analyze a GitHub repository."""
+        Returns None when an incremental scan is not possible (no mirror, or the
+        base commit is unknown to it) so the caller can fall back to a full scan.
+        """
+        mode = self._ingest_mode(ingest_mode)
+        repo_dir = self.mirror_path(github_url, mode)
+        async with self._mirror_lock(repo_dir):
+            return await self._analyze_mirror_changes(github_url, repo_dir, mode, base_sha, project_id)
+    
+    async def _analyze_mirror_changes(self, github_url: str, repo_dir: Path, mode: str, base_sha: str,
+                                      project_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """The incremental scan of analyze_incremental, with the mirror lock held."""
+        if not self._mirror_exists(repo_dir, mode):
+            return None
+        if (await self._git_async(repo_dir, 'cat-file', '-e', f'{base_sha}^{{commit}}')).returncode != 0:
+            return None
+        # Duplicates are found against the whole repository, not just the diff
+        clone_index = self._clone_index_path(repo_dir)
+        detector = await asyncio.to_thread(CloneDetector.load, clone_index)
+        if detector is None:
+            return None
+        if detector.commit != base_sha:
+            # The mirror is shared by every project of the URL; another one's scan moved the index on
+            print(f"  Clone index is at {(detector.commit or 'an unknown commit')[:12]}, not {base_sha[:12]}: "
+                  "scanning in full", flush=True)
+            return None
+        
+        print(f"🔍 Fetching new history for {github_url}...", flush=True)
+        if not await self._sync_mirror(github_url, repo_dir, mode):
+            return None
+        commit_sha = await asyncio.to_thread(self._head_commit, repo_dir)
+        
+        diff = await self._git_async(repo_dir, 'diff', '--name-status', '-z', '-M', base_sha, commit_sha)
+        if diff.returncode != 0:
+            print(f"  git diff failed: {diff.stderr.strip()}", flush=True)
+            return None
+        
+        changed, removed = self._parse_name_status(diff.stdout)
+        changed = [p for p in changed if self._is_supported(p)]
+        removed = [p for p in removed if self._is_supported(p)]
+        
+        print(f"  {len(changed)} files to re-analyze, {len(removed)} removed ({base_sha[:12]}..{(commit_sha or '')[:12]})", flush=True)
+        
+        results = await asyncio.to_thread(self._analyze_changes, detector, clone_index, repo_dir, mode,
+                                          commit_sha, changed, removed, project_id)
+        return {
+            "commit_sha": commit_sha,
+            "base_sha": base_sha,
+            "ingest_mode": mode,
+            "local_path": str(repo_dir),
+            **results
+        }
+    
+    def _analyze_changes(self, detector: CloneDetector, clone_index: Path, repo_dir: Path, mode: str,
+                         commit_sha: Optional[str], changed: List[str], removed: List[str],
+                         project_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        The blocking part of an incremental scan: read and analyze the changed
+        files, and move the clone index (and the project's vectors) on to commit_sha.
+        """
+        base_sha = detector.commit
+        stale = sorted(set(changed) | set(removed))
+        # Files that shared code with the old versions...
+        affected = detector.affected_by(stale)
+        detector.remove(stale)
+        # Without saved vectors of base_sha the index is rebuilt from the mirror when first queried
+        vector_index = self._vector_index_path(repo_dir, project_id) if project_id else None
+        vectors = SimilarityIndex.load(vector_index) if vector_index is not None else None
+        if vectors is not None and vectors.commit != base_sha:
+            vectors = None
+        if vectors is not None:
+            vectors.remove(stale)
+            vectors.commit = commit_sha
+        
+        reader = SourceReader()
         try:
-            # Create temp directory path (but don't create it - git clone will do that)
-            temp_base = Path(tempfile.gettempdir())
-            self.temp_dir = temp_base / f"codesensex_{os.urandom(8).hex()}"
-            
-            print(f"🔍 Cloning {github_url} to {self.temp_dir}...", flush=True)
-            
-            # Clone repository
-            clone_success = await self._clone_repo(github_url)
-            if not clone_success:
-                print(f"❌ Failed to clone {github_url}", flush=True)
-                return {"error": "Failed to clone repository", "metrics": [], "risks": [], "smells": []}
-            
-            print(f"✅ Clone successful, analyzing files...", flush=True)
-            
-            # Find all analyzable files
-            all_metrics: List[FileMetrics] = []
-            all_smells: List[CodeSmell] = []
-            
-            for file_path in self._find_files():
-                ext = file_path.suffix.lower()
-                if ext in self.SUPPORTED_EXTENSIONS:
-                    analyzer = self.SUPPORTED_EXTENSIONS[ext]
-                    relative_path = str(file_path.relative_to(self.temp_dir))
-                    
-                    metrics, smells = analyzer.analyze_file(file_path, relative_path)
-                    if metrics:
-                        all_metrics.append(metrics)
-                    all_smells.extend(smells)
-            
-            # Calculate risk scores
-            risks = self._calculate_risks(all_metrics, all_smells)
-            
-            return {
-                "metrics": [asdict(m) for m in all_metrics],
-                "risks": [asdict(r) for r in risks],
-                "smells": [asdict(s) for s in all_smells],
-                "summary": {
-                    "total_files": len(all_metrics),
-                    "total_loc": sum(m.loc for m in all_metrics),
-                    "total_smells": len(all_smells),
-                    "languages": list(set(m.language for m in all_metrics))
-                }
-            }
-            
+            all_metrics, all_smells, functions = self._analyze_sources(
+                reader, self._read_sources(reader, repo_dir, mode, commit_sha, changed), vectors, detector
+            )
         finally:
-            # Cleanup
-            if self.temp_dir and self.temp_dir.exists():
-                shutil.rmtree(self.temp_dir, ignore_errors=True)
+            reader.close()
+        
+        # ...or share code with the new ones
+        affected |= detector.affected_by(changed)
+        clones = detector.detect(affected | set(changed))
+        all_smells.extend(self._apply_clones(all_metrics, clones))
+        detector.commit = commit_sha
+        detector.save(clone_index)
+        if vectors is not None:
+            vectors.save(vector_index)
+        risks = self._calculate_risks(all_metrics, all_smells)
+        
+        return {
+            "changed": changed,
+            # Every path whose stored results are now stale
+            "stale": stale,
+            "metrics": [asdict(m) for m in all_metrics],
+            "risks": [asdict(r) for r in risks],
+            "smells": [asdict(s) for s in all_smells],
+            "functions": functions,
+            # Unchanged files whose duplicates may have appeared or disappeared
+            "clones": {p: clones[p] for p in affected - set(stale) if p in clones},
+            "io": reader.stats()
+        }
+    
+    def _analyze_sources(self, reader: SourceReader, sources: Iterable[SourceFile],
+                         vectors: Optional[SimilarityIndex] = None, detector: Optional[CloneDetector] = None,
+                         dependencies: Optional[DependencyAnalyzer] = None
+                         ) -> tuple[List[FileMetrics], List[CodeSmell], List[Dict[str, Any]]]:
+        """
+        Run the language analyzers over sources as they stream past; functions
+        come back as per-file buckets. The cross-file passes (vectors, clone
+        fingerprints, import edges) take what they need from each file when
+        given, and the file is released before the next one is read.
+        """
+        all_metrics: List[FileMetrics] = []
+        all_smells: List[CodeSmell] = []
+        function_buckets: List[Dict[str, Any]] = []
+        
+        for source in sources:
+            try:
+                if detector is not None:
+                    detector.add(source)
+                if dependencies is not None:
+                    dependencies.add_source(source)
+                
+                analyzer = self.SUPPORTED_EXTENSIONS.get(Path(source.path).suffix.lower())
+                if analyzer is None:
+                    continue
+                
+                metrics, smells, functions = analyzer.analyze_source(source)
+                fingerprint_smells(smells, source.lines, functions)
+                if metrics:
+                    all_metrics.append(metrics)
+                all_smells.extend(smells)
+                if functions:
+                    function_buckets.append(self.function_bucket(source.path, functions))
+                if vectors is not None:
+                    vectors.add(source, [(f.name, f.line, f.end_line) for f in functions])
+            finally:
+                reader.release(source)
+        
+        return all_metrics, all_smells, function_buckets
+    
+    @staticmethod
+    def function_bucket(path: str, functions: List[FunctionMetrics]) -> Dict[str, Any]:
+        """
+        One file's functions stored column-wise, most complex first, so a
+        top-K reader can stop inside a file as soon as it is out of range.
+        """
+        ordered = sorted(functions, key=lambda f: (-f.complexity, f.line))
+        return {
+            "path": path,
+            "count": len(ordered),
+            "max_complexity": ordered[0].complexity,
+            "columns": {name: [getattr(f, name) for f in ordered] for name in FunctionMetrics.__dataclass_fields__}
+        }
+    
+    def _read_sources(self, reader: SourceReader, repo_dir: Path, mode: str, commit_sha: Optional[str],
+                      relative_paths: Optional[List[str]] = None) -> Iterator[SourceFile]:
+        """Yield supported files as shared sources, from the checkout or the object store."""
+        if mode == "objects":
+            store = GitObjectStore(repo_dir)
+            entries = [(p, oid) for p, oid in store.list_tree(commit_sha or 'HEAD', relative_paths)
+                       if self._is_supported(p)]
+            for relative_path, data in store.read_blobs(entries):
+                source = reader.from_bytes(relative_path, data)
+                if source is not None:
+                    yield source
+            return
+        
+        if relative_paths is None:
+            relative_paths = [f.relative_to(repo_dir).as_posix() for f in self._find_files(repo_dir)]
+        
+        for relative_path in relative_paths:
+            file_path = repo_dir / relative_path
+            if not file_path.is_file():
+                continue
+            source = reader.open(file_path, relative_path)
+            if source is not None:
+                yield source
+    
+    def _apply_clones(self, metrics: List[FileMetrics], clones: Dict[str, Dict]) -> List[CodeSmell]:
+        """Set dup_ratio from clone detection results and return the Duplicated Block smells."""
+        smells = []
+        for m in metrics:
+            clone = clones.get(m.path)
+            if clone is None:
+                continue
+            m.dup_ratio = clone["dup_ratio"]
+            smells.extend(self._clone_smells(m.path, clone["blocks"]))
+        return smells
+    
+    @staticmethod
+    def _clone_smells(path: str, blocks: List[CloneBlock]) -> List[CodeSmell]:
+        smells = []
+        for line, end_line, other_path, other_line, other_end_line in blocks:
+            if other_path == path:
+                where = f"lines {other_line}-{other_end_line} of this file"
+            else:
+                where = f"{other_path}:{other_line}-{other_end_line}"
+            smells.append(CodeSmell(
+                path=path,
+                type="Duplicated Block",
+                severity=3 if end_line - line + 1 >= 30 else 2,
+                line=line,
+                message=f"Lines {line}-{end_line} duplicate {where}",
+                suggestion="Extract the shared code into one function or module and call it from both places"
+            ))
+        fingerprint_smells(smells)
+        return smells
+    
+    def refresh_clone_results(self, metric_rows: List[Dict[str, Any]], smell_rows: List[Dict[str, Any]],
+                              clones: Dict[str, Dict]) -> Dict[str, Any]:
+        """
+        Re-apply clone results to the stored rows of files that did not change
+        themselves, recomputing their risk. Only files whose duplicates actually
+        changed are returned.
+        """
+        smells_by_path: Dict[str, List[CodeSmell]] = {}
+        for row in smell_rows:
+            smell = CodeSmell(**{k: row[k] for k in CodeSmell.__dataclass_fields__ if k in row})
+            smells_by_path.setdefault(smell.path, []).append(smell)
+        
+        paths, metrics, smells = [], [], []
+        for row in metric_rows:
+            m = FileMetrics(**{k: row[k] for k in FileMetrics.__dataclass_fields__})
+            clone = clones.get(m.path)
+            if clone is None:
+                continue
+            file_smells = smells_by_path.get(m.path, [])
+            old_clones = [s for s in file_smells if s.type == "Duplicated Block"]
+            new_clones = self._clone_smells(m.path, clone["blocks"])
+            if m.dup_ratio == clone["dup_ratio"] and old_clones == new_clones:
+                continue
+            
+            m.dup_ratio = clone["dup_ratio"]
+            paths.append(m.path)
+            metrics.append(m)
+            smells.extend(s for s in file_smells if s.type != "Duplicated Block")
+            smells.extend(new_clones)
+        
+        risks = self._calculate_risks(metrics, smells)
+        return {
+            "paths": paths,
+            "metrics": [asdict(m) for m in metrics],
+            "risks": [asdict(r) for r in risks],
+            "smells": [asdict(s) for s in smells]
+        }
+    
+    @staticmethod
+    def summarize(metrics: List[FileMetrics], smell_count: int) -> Dict[str, Any]:
+        files_by_language = Counter(m.language for m in metrics)
+        return {
+            "total_files": len(metrics),
+            "total_loc": sum(m.loc for m in metrics),
+            "total_smells": smell_count,
+            "languages": list(files_by_language),
+            "files_by_language": dict(files_by_language)
+        }
+    
+    @staticmethod
+    def _parse_name_status(output: str) -> tuple[List[str], List[str]]:
+        """Split `git diff --name-status -z` output into (to re-analyze, to drop)."""
+        changed, removed = [], []
+        fields = output.split('\0')
+        i = 0
+        while i < len(fields) and fields[i]:
+            status = fields[i][0]
+            if status in ('R', 'C'):
+                old_path, new_path = fields[i + 1], fields[i + 2]
+                if status == 'R':
+                    removed.append(old_path)
+                changed.append(new_path)
+                i += 3
+            else:
+                path = fields[i + 1]
+                if status == 'D':
+                    removed.append(path)
+                else:  # A, M, T
+                    changed.append(path)
+                i += 2
+        return changed, removed
+    
+    def _is_supported(self, relative_path: str) -> bool:
+        path = Path(relative_path)
+        if any(ignored in path.parts for ignored in self.IGNORED_DIRS):
+            return False
+        return path.suffix.lower() in self.SUPPORTED_EXTENSIONS
+    
+    @staticmethod
+    def normalize_repo_url(github_url: str) -> str:
+        """Canonical form of a repository URL, used to match scans of the same repo."""
+        url = github_url.strip().rstrip('/')
+        if url.endswith('.git'):
+            url = url[:-4]
+        return url.lower()
     
-    async def _clone_repo(self, github_url: str) -> bool:
+    def mirror_path(self, github_url: str, mode: Optional[str] = None) -> Path:
+        key = hashlib.sha1(self.normalize_repo_url(github_url).encode()).hexdigest()[:16]
+        mode = self._ingest_mode(mode)
+        if mode == "objects":
+            return self.MIRROR_ROOT / f"{key}.git"
+        if mode == "sparse":
+            return self.MIRROR_ROOT / f"{key}-sparse"
+        return self.MIRROR_ROOT / key
+    
+    @staticmethod
+    def _clone_index_path(repo_dir: Path) -> Path:
+        return repo_dir.with_name(f"{repo_dir.name}.clones")
+    
+    @staticmethod
+    def _vector_index_path(repo_dir: Path, project_id: str) -> Path:
+        # One per project: the mirror is shared by every project of the URL, each at its own commit
+        return repo_dir.with_name(f"{repo_dir.name}.{project_id}.vectors")
+    
+    def vector_index_path(self, project: Dict[str, Any]) -> Optional[Path]:
+        """Where the similarity vectors of a project's last scan are saved (see SimilarityIndex)."""
+        if project.get("source_type") == "zip":
+            archive_path = project.get("archive_path")
+            return Path(archive_path).with_suffix(".vectors") if archive_path else None
+        repo_dir = project.get("local_path")
+        return self._vector_index_path(Path(repo_dir), project["_id"]) if repo_dir else None
+    
+    def _ingest_mode(self, mode: Optional[str]) -> str:
+        mode = mode or self.DEFAULT_INGEST_MODE
+        return mode if mode in self.INGEST_MODES else "worktree"
+    
+    @staticmethod
+    def _mirror_exists(repo_dir: Path, mode: str) -> bool:
+        if mode == "objects":
+            return (repo_dir / 'HEAD').exists()
+        return (repo_dir / '.git').exists()
+    
+    def _sparse_patterns(self) -> List[str]:
+        """Non-cone sparse-checkout patterns selecting supported sources outside ignored dirs."""
+        patterns = [f"*{ext}" for ext in self.SUPPORTED_EXTENSIONS]
+        patterns += [f"!**/{d}/**" for d in sorted(self.IGNORED_DIRS)]
+        return patterns
+    
+    @staticmethod
+    def _clone_url(github_url: str) -> str:
+        url = github_url.strip()
+        if not url.endswith('.git'):
+            url = url.rstrip('/') + '.git'
+        return url
+    
+    @staticmethod
+    def _git(repo_dir: Path, *args: str, timeout: int = 120) -> subprocess.CompletedProcess:
+        return subprocess.run(
+            ['git', *args],
+            cwd=str(repo_dir),
+            capture_output=True,
+            text=True,
+            timeout=timeout
+        )
+    
+    @staticmethod
+    async def _git_async(repo_dir: Path, *args: str, timeout: int = 120) -> subprocess.CompletedProcess:
+        """_git in a worker thread, for async callers: the event loop keeps serving while git runs."""
+        return await asyncio.to_thread(RepoAnalyzer._git, repo_dir, *args, timeout=timeout)
+    
+    @staticmethod
+    def resolve_remote_head(github_url: str) -> Optional[str]:
+        """Resolve the commit SHA of the remote HEAD without cloning."""
+        try:
+            result = subprocess.run(
+                ['git', 'ls-remote', RepoAnalyzer._clone_url(github_url), 'HEAD'],
+                capture_output=True,
+                text=True,
+                timeout=30
+            )
+            if result.returncode != 0 or not result.stdout.strip():
+                print(f"  git ls-remote failed: {result.stderr.strip()}", flush=True)
+                return None
+            return result.stdout.split()[0]
+        except (subprocess.TimeoutExpired, FileNotFoundError) as e:
+            print(f"  Could not resolve remote HEAD: {e}", flush=True)
+            return None
+    
+    def _head_commit(self, repo_dir: Path) -> Optional[str]:
+        """Commit SHA checked out in the mirror."""
+        try:
+            result = self._git(repo_dir, 'rev-parse', 'HEAD', timeout=10)
+            return result.stdout.strip() if result.returncode == 0 else None
+        except Exception:
+            return None
+    
+    @staticmethod
+    @asynccontextmanager
+    async def _mirror_lock(repo_dir: Path) -> AsyncIterator[None]:
+        """
+        Hold a mirror for one scan at a time: its sync, source read and clone
+        index save. An asyncio lock orders the scans of this process and a
+        flock on "<mirror>.lock" those of other worker processes.
+        """
+        lock = _mirror_locks.setdefault(str(repo_dir), asyncio.Lock())
+        async with lock:
+            repo_dir.parent.mkdir(parents=True, exist_ok=True)
+            with open(repo_dir.with_name(f"{repo_dir.name}.lock"), "a") as handle:
+                while fcntl is not None:
+                    # Polled rather than blocking in a thread, so a cancelled scan never leaves it held
+                    try:
+                        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        break
+                    except BlockingIOError:
+                        await asyncio.sleep(_MIRROR_LOCK_POLL)
+                # Closing the file releases the flock
+                yield
+    
+    async def _sync_mirror(self, github_url: str, repo_dir: Path, mode: str = "worktree") -> bool:
+        """Clone the mirror on first use, afterwards fetch only the new HEAD commit."""
+        if not self._mirror_exists(repo_dir, mode):
+            return await self._clone_repo(github_url, repo_dir, mode)
+        
+        try:
+            # Partial clones remember their filter, so this fetches commits and trees only
+            fetch = await self._git_async(repo_dir, 'fetch', '--depth', '1', 'origin', 'HEAD')
+            if fetch.returncode != 0:
+                print(f"  Git stderr: {fetch.stderr}", flush=True)
+                return False
+            if mode == "objects":
+                update = await self._git_async(repo_dir, 'update-ref', '--no-deref', 'HEAD', 'FETCH_HEAD')
+            else:
+                update = await self._git_async(repo_dir, 'checkout', '--force', '--detach', 'FETCH_HEAD')
+            if update.returncode != 0:
+                print(f"  Git stderr: {update.stderr}", flush=True)
+            return update.returncode == 0
+        except subprocess.TimeoutExpired:
+            print("  Fetch timed out after 120 seconds", flush=True)
+            return False
+        except Exception as e:
+            print(f"  Fetch error: {e}", flush=True)
+            return False
+    
+    async def _clone_repo(self, github_url: str, repo_dir: Path, mode: str = "worktree") -> bool:
         """Clone a GitHub repository."""
         try:
-            # Clean URL
-            url = github_url.strip()
-            if not url.endswith('.git'):
-                url = url.rstrip('/') + '.git'
+            url = self._clone_url(github_url)
+            await asyncio.to_thread(shutil.rmtree, repo_dir, ignore_errors=True)
+            repo_dir.parent.mkdir(parents=True, exist_ok=True)
             
-            print(f"  Running: git clone --depth 1 {url} {self.temp_dir}", flush=True)
+            # Clone with depth=1 for speed; skip blobs we will never analyze
+            cmd = ['git', 'clone', '--depth', '1']
+            if mode == "objects":
+                cmd += ['--bare', '--filter=blob:none']
+            elif mode == "sparse":
+                cmd += ['--filter=blob:none', '--sparse']
+            cmd += [url, str(repo_dir)]
             
-            # Clone with depth=1 for speed
-            result = subprocess.run(
-                ['git', 'clone', '--depth', '1', url, str(self.temp_dir)],
+            print(f"  Running: {' '.join(cmd)}", flush=True)
+            
+            result = await asyncio.to_thread(
+                subprocess.run,
+                cmd,
                 capture_output=True,
                 text=True,
                 timeout=120
             )
             
+            if result.returncode == 0 and mode == "sparse":
+                # Switching the patterns checks out the matching blobs in one batch fetch
+                result = await self._git_async(repo_dir, 'sparse-checkout', 'set', '--no-cone', *self._sparse_patterns())
+            
             if result.returncode != 0:
                 print(f"  Git stderr: {result.stderr}", flush=True)
+                await asyncio.to_thread(shutil.rmtree, repo_dir, ignore_errors=True)
             
             return result.returncode == 0
             
         except subprocess.TimeoutExpired:
             print("  Clone timed out after 120 seconds", flush=True)
+            await asyncio.to_thread(shutil.rmtree, repo_dir, ignore_errors=True)
             return False
         except FileNotFoundError:
             print("  Error: git command not found. Make sure git is installed.", flush=True)
@@ -1090,16 +1944,16 @@ class RepoAnalyzer:
             print(f"  Clone error: {e}", flush=True)
             return False
     
-    def _find_files(self) -> List[Path]:
+    def _find_files(self, repo_dir: Path) -> List[Path]:
         """Find all analyzable files in the repository."""
         files = []
         
-        for file_path in self.temp_dir.rglob('*'):
+        for file_path in repo_dir.rglob('*'):
             if not file_path.is_file():
                 continue
                 
             # Skip ignored directories
-            if any(ignored in file_path.parts for ignored in self.IGNORED_DIRS):
+            if any(ignored in file_path.relative_to(repo_dir).parts for ignored in self.IGNORED_DIRS):
                 continue
                 
             # Only include supported extensions
@@ -1179,6 +2033,14 @@ class RepoAnalyzer:
             elif m.fn_count > 20:
                 score += 5
             
+            # Duplicated code - every fix has to be repeated (0-10 points)
+            if m.dup_ratio >= 0.3:
+                score += 10
+                top_features.append("high_duplication")
+            elif m.dup_ratio >= 0.1:
+                score += 5
+                top_features.append("duplicated_code")
+            
             # Low comment ratio (potential documentation debt) (0-5 points)
             if m.sloc > 100 and m.comment_ratio < 0.02:
                 score += 5
@@ -1,9 +1,36 @@
+import asyncio
+import os
 import uuid
+import hashlib
+import tempfile
+import zipfile
+from pathlib import Path
 from typing import Any
 from fastapi import UploadFile
 from .db import get_database
 
 
+# Where uploaded archives are kept until they are scanned
+UPLOAD_DIR = Path(os.getenv("UPLOAD_DIR", str(Path(tempfile.gettempdir()) / "codesensex_uploads")))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Upload and zip-bomb limits
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", "200")) * 1024 * 1024
+MAX_ZIP_ENTRIES = int(os.getenv("MAX_ZIP_ENTRIES", "50000"))
+MAX_ZIP_UNCOMPRESSED_BYTES = int(os.getenv("MAX_ZIP_UNCOMPRESSED_MB", "2048")) * 1024 * 1024
+MAX_ZIP_RATIO = int(os.getenv("MAX_ZIP_RATIO", "100"))
+# Small text files legitimately compress very well; only large entries are ratio-checked
+_RATIO_CHECK_MIN_BYTES = 1024 * 1024
+
+
+class UploadError(Exception):
+    """An upload was rejected; status_code is the HTTP status to answer with."""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
 class RepoService:
     @staticmethod
     async def queue_project(req: Any) -> str:
@@ -21,14 +48,82 @@ class RepoService:
 
     @staticmethod
     async def queue_zip(file: UploadFile) -> str:
+        """Spool the uploaded archive to disk, check it for zip bombs and queue it for scanning."""
         db = get_database()
         project_id = str(uuid.uuid4())
+
+        archive_path, sha256 = await RepoService._spool_upload(file, project_id)
+        try:
+            await asyncio.to_thread(RepoService._validate_archive, archive_path)
+        except UploadError:
+            archive_path.unlink(missing_ok=True)
+            raise
+
         await db.upsert_project({
             "_id": project_id,
             "name": file.filename,
             "source_type": "zip",
             "source_ref": file.filename,
+            "archive_path": str(archive_path),
+            "archive_sha256": sha256,
             "languages": [],
             "status": "queued"
         })
         return project_id
+
+    @staticmethod
+    async def _spool_upload(file: UploadFile, project_id: str) -> tuple[Path, str]:
+        """
+        Copy the upload to disk chunk by chunk, enforcing MAX_UPLOAD_BYTES.
+        Hashing and disk writes run in a worker thread, off the event loop.
+        """
+        await asyncio.to_thread(UPLOAD_DIR.mkdir, parents=True, exist_ok=True)
+        archive_path = UPLOAD_DIR / f"{project_id}.zip"
+        digest = hashlib.sha256()
+        size = 0
+
+        def write(chunk: bytes) -> None:
+            digest.update(chunk)
+            out.write(chunk)
+
+        out = await asyncio.to_thread(open, archive_path, "wb")
+        try:
+            try:
+                while True:
+                    chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > MAX_UPLOAD_BYTES:
+                        raise UploadError(
+                            f"Upload exceeds the {MAX_UPLOAD_BYTES // (1024 * 1024)} MB limit",
+                            status_code=413
+                        )
+                    await asyncio.to_thread(write, chunk)
+            finally:
+                await asyncio.to_thread(out.close)
+        except BaseException:
+            archive_path.unlink(missing_ok=True)
+            raise
+
+        return archive_path, digest.hexdigest()
+
+    @staticmethod
+    def _validate_archive(archive_path: Path) -> None:
+        """Reject archives that are not ZIPs or whose central directory looks like a zip bomb."""
+        if not zipfile.is_zipfile(archive_path):
+            raise UploadError("Uploaded file is not a valid ZIP archive")
+
+        with zipfile.ZipFile(archive_path) as zf:
+            entries = zf.infolist()
+            if len(entries) > MAX_ZIP_ENTRIES:
+                raise UploadError(f"Archive has {len(entries)} entries (limit {MAX_ZIP_ENTRIES})", status_code=413)
+
+            total = 0
+            for info in entries:
+                total += info.file_size
+                if (info.file_size > _RATIO_CHECK_MIN_BYTES
+                        and info.file_size > info.compress_size * MAX_ZIP_RATIO):
+                    raise UploadError(f"Suspicious compression ratio for {info.filename}", status_code=413)
+            if total > MAX_ZIP_UNCOMPRESSED_BYTES:
+                raise UploadError("Archive expands beyond the allowed uncompressed size", status_code=413)
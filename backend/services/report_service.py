@@ -1,28 +1,39 @@
 from services.db import get_database
+from services.summary_service import SummaryService
+from services.single_flight import single_flight
 from datetime import datetime
 
+# Reports being rendered, keyed by project, sections and scan
+_reports = single_flight("reports")
+
 class ReportService:
     @staticmethod
     async def generate_pdf(project_id: str, sections: list[str]) -> bytes:
         """
         Generate a PDF report for the given project.
         Uses ReportLab if available, otherwise returns a formatted text file.
+        Concurrent requests for the same report of the same scan share one rendering.
         """
+        summary = await SummaryService.get(project_id) or {}
+        key = (project_id, tuple(sorted(sections)), summary.get("scan_id"), summary.get("computed_at"))
+        return await _reports.do(key, ReportService._render_pdf, project_id, sections, summary)
+
+    @staticmethod
+    async def _render_pdf(project_id: str, sections: list[str], summary: dict) -> bytes:
         # Get database instance
         db = get_database()
         
         # Gather data using async methods
         project = await db.get_project(project_id) or {}
-        metrics_list = await db.get_metrics(project_id)
-        risks_list = await db.get_risks(project_id)
-        smells_list = await db.get_smells(project_id)
         
-        # Calculate summary stats
-        total_files = len(metrics_list)
-        avg_risk = sum(r.get('risk_score', 0) for r in risks_list) / max(len(risks_list), 1)
-        critical_count = sum(1 for r in risks_list if r.get('risk_score', 0) >= 80)
-        high_count = sum(1 for r in risks_list if 60 <= r.get('risk_score', 0) < 80)
-        total_smells = len(smells_list)
+        # Summary stats, materialized when the scan completed
+        histogram = summary.get('risk_histogram', {})
+        total_files = summary.get('total_files', 0)
+        avg_risk = summary.get('avg_risk', 0)
+        critical_count = histogram.get('80', 0) + histogram.get('90', 0)
+        high_count = histogram.get('60', 0) + histogram.get('70', 0)
+        total_smells = summary.get('total_smells', 0)
+        sorted_risks = summary.get('top_risks', [])[:10]
         
         try:
             from reportlab.lib.pagesizes import letter
@@ -58,7 +69,6 @@ class ReportService:
             c.drawString(72, y - 110, "Top Risk Files")
             
             c.setFont("Helvetica", 10)
-            sorted_risks = sorted(risks_list, key=lambda x: x.get('risk_score', 0), reverse=True)[:10]
             y_pos = y - 135
             for r in sorted_risks:
                 c.drawString(72, y_pos, f"• {r.get('path', 'Unknown')} - Score: {r.get('risk_score', 0)}")
@@ -93,7 +103,6 @@ class ReportService:
             report.append("TOP RISK FILES")
             report.append("-" * 60)
             
-            sorted_risks = sorted(risks_list, key=lambda x: x.get('risk_score', 0), reverse=True)[:10]
             for r in sorted_risks:
                 report.append(f"  • {r.get('path', 'Unknown')} - Score: {r.get('risk_score', 0)}")
             
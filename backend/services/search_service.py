@@ -0,0 +1,480 @@
+"""
+Search Service - BM25 retrieval over a project's smells.
+
+Every smell is a document made of its type, message and path, plus the name
+of the function it sits in. The inverted index keeps postings as parallel
+arrays of document ids and term frequencies, so a project with 100k smells
+costs a few megabytes rather than a dict per posting. Hits are resolved to
+full smell rows with one query for their files.
+
+A completed scan updates the index of its project in place: the documents
+of the files it re-analyzed are dropped and the new ones appended (see
+JobService._swap_results). Indexes are otherwise loaded or built on first
+search and again once the project's summary shows a scan they have not
+seen, which is how workers that did not run the scan catch up. A built index
+is saved under SEARCH_INDEX_DIR with the summary version it reflects, so
+other workers and restarts load its arrays instead of re-tokenizing every
+smell. At most SEARCH_INDEX_MAX_PROJECTS indexes are held, least recently
+searched first out.
+"""
+
+import asyncio
+import hashlib
+import heapq
+import json
+import math
+import os
+import re
+import struct
+import sys
+import tempfile
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .db import get_database
+from .single_flight import single_flight
+from .summary_service import SummaryService
+from models.schemas import CodeSmell
+
+
+SEARCH_INDEX_MAX_PROJECTS = int(os.getenv("SEARCH_INDEX_MAX_PROJECTS", "20"))
+# Built indexes are saved here, one file per project, for other workers and restarts
+SEARCH_INDEX_DIR = Path(os.getenv("SEARCH_INDEX_DIR", str(Path(tempfile.gettempdir()) / "codesensex_search")))
+# Upper bound on hits per search
+MAX_SEARCH_RESULTS = 100
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+# Terms below this idf (in nearly every smell, like a shared path prefix) are not scored
+MIN_IDF = 0.01
+
+_INDEX_VERSION = 1
+# Length of the JSON header, which the document and posting arrays follow
+_HEADER = struct.Struct("<Q")
+
+_CAMEL = re.compile(r"([a-z0-9])([A-Z])")
+_TOKEN = re.compile(r"[a-z0-9]+")
+_STOP_WORDS = frozenset(
+    "a an and are as at be by can do does for from has have how i in is it its me my of on or "
+    "should the this to what where which why with you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase words of text; identifiers split at underscores, dots and camelCase humps."""
+    return [t for t in _TOKEN.findall(_CAMEL.sub(r"\1 \2", text or "").lower())
+            if len(t) > 1 and t not in _STOP_WORDS]
+
+
+def smell_key(smell: Dict[str, Any]) -> str:
+    """Identifies a smell within its file, as the databases key them."""
+    return smell.get("fingerprint") or f"{smell.get('type', '')}:{smell.get('line', 0)}"
+
+
+# One smell as indexed: its key, its token count and the count of each of its terms
+Document = Tuple[str, int, Dict[str, int]]
+
+
+def _enclosing_functions(bucket: Optional[Dict[str, Any]]) -> List[Tuple[int, int, str]]:
+    """(line, end_line, name) of a file's functions, innermost last for any line."""
+    if not bucket:
+        return []
+    columns = bucket.get("columns", {})
+    spans = zip(columns.get("line", []), columns.get("end_line", []), columns.get("name", []))
+    return sorted(spans)
+
+
+class SearchIndex:
+    """Inverted index of one project's smells, scored with BM25."""
+
+    def __init__(self):
+        self.paths: List[str] = []
+        self._path_ids: Dict[str, int] = {}
+        self._docs_by_path: Dict[int, List[int]] = {}
+        # Per document: path id, smell key, token count, and whether it is still live
+        self._doc_path = array("I")
+        self._doc_key: List[str] = []
+        self._doc_len = array("H")
+        self._alive = bytearray()
+        # term -> (document ids, term frequencies), ids ascending
+        self._postings: Dict[str, Tuple[array, array]] = {}
+        self.live = 0
+        self._total_len = 0
+        # K1 * length normalization per document, recomputed after the index changes
+        self._norms: Optional[List[float]] = None
+        # Summary version (see SummaryService.version) the index reflects; None right after a scan updated it
+        self.version: Optional[tuple] = None
+
+    def add_file(self, path: str, smells: Iterable[Dict[str, Any]], functions: Optional[Dict[str, Any]] = None) -> None:
+        self.add_documents(path, documents(path, smells, functions))
+
+    def add_documents(self, path: str, docs: Iterable[Document]) -> None:
+        """Append a file's tokenized smells (see documents)."""
+        path_id = self._path_ids.get(path)
+        if path_id is None:
+            path_id = self._path_ids[path] = len(self.paths)
+            self.paths.append(path)
+        doc_ids = self._docs_by_path.setdefault(path_id, [])
+
+        for key, length, counts in docs:
+            doc = len(self._doc_key)
+            self._doc_path.append(path_id)
+            self._doc_key.append(key)
+            self._doc_len.append(min(length, 0xFFFF))
+            self._alive.append(1)
+            doc_ids.append(doc)
+            self._norms = None
+            self.live += 1
+            self._total_len += length
+
+            for token, tf in counts.items():
+                posting = self._postings.get(token)
+                if posting is None:
+                    posting = self._postings[token] = (array("I"), array("H"))
+                posting[0].append(doc)
+                posting[1].append(min(tf, 0xFFFF))
+
+    def remove_paths(self, paths: Iterable[str]) -> None:
+        """Drop the documents of these files; their postings are reclaimed by compacted."""
+        for path in paths:
+            path_id = self._path_ids.get(path)
+            if path_id is None:
+                continue
+            for doc in self._docs_by_path.pop(path_id, []):
+                if self._alive[doc]:
+                    self._norms = None
+                    self._alive[doc] = 0
+                    self.live -= 1
+                    self._total_len -= self._doc_len[doc]
+
+    @property
+    def needs_compaction(self) -> bool:
+        return len(self._doc_key) > 2 * self.live + 1000
+
+    def compacted(self) -> "SearchIndex":
+        """
+        A copy with the live documents renumbered and the postings rewritten
+        without the dropped ones; this index is left as it is, so searches
+        can go on reading it while the copy is built.
+        """
+        remap = array("i", [-1]) * len(self._doc_key)
+        index = SearchIndex()
+        for doc, alive in enumerate(self._alive):
+            if alive:
+                remap[doc] = len(index._doc_key)
+                index._doc_path.append(self._doc_path[doc])
+                index._doc_key.append(self._doc_key[doc])
+                index._doc_len.append(self._doc_len[doc])
+
+        for term, (docs, tfs) in self._postings.items():
+            new_docs, new_tfs = array("I"), array("H")
+            for doc, tf in zip(docs, tfs):
+                if remap[doc] >= 0:
+                    new_docs.append(remap[doc])
+                    new_tfs.append(tf)
+            if new_docs:
+                index._postings[term] = (new_docs, new_tfs)
+
+        index._docs_by_path = {
+            path_id: [remap[d] for d in docs if remap[d] >= 0]
+            for path_id, docs in self._docs_by_path.items()
+        }
+        index.paths = list(self.paths)
+        index._path_ids = dict(self._path_ids)
+        index._alive = bytearray(b"\x01") * len(index._doc_key)
+        index.live = self.live
+        index._total_len = self._total_len
+        index.version = self.version
+        return index
+
+    def _doc_norms(self) -> List[float]:
+        if self._norms is None:
+            avg_len = self._total_len / max(self.live, 1) or 1.0
+            self._norms = [K1 * (1 - B + B * length / avg_len) for length in self._doc_len]
+        return self._norms
+
+    def search(self, query: str, path: Optional[str] = None, limit: int = 10) -> List[Tuple[str, str, float]]:
+        """
+        The limit best (path, smell key, score) matches of query, optionally
+        within one file. With a path and no query terms, all of that file's
+        smells are returned unscored.
+        """
+        candidates = None
+        if path is not None:
+            path_id = self._path_ids.get(path)
+            if path_id is None:
+                return []
+            candidates = set(self._docs_by_path.get(path_id, ()))
+
+        terms = set(tokenize(query))
+        if not terms:
+            if candidates is None:
+                return []
+            return [(path, self._doc_key[d], 0.0) for d in sorted(candidates)]
+
+        n = max(self.live, 1)
+        alive = self._alive
+        norms = self._doc_norms()
+        scores: Dict[int, float] = {}
+        get = scores.get
+        for term in terms:
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            docs, tfs = posting
+            # Document frequency counts dropped documents until the next compaction
+            idf = math.log(1 + max(n - len(docs) + 0.5, 0) / (len(docs) + 0.5))
+            if idf < MIN_IDF:
+                continue
+            weight = idf * (K1 + 1)
+            if candidates is not None:
+                for doc, tf in zip(docs, tfs):
+                    if doc in candidates:
+                        scores[doc] = get(doc, 0.0) + weight * tf / (tf + norms[doc])
+                continue
+            for doc, tf in zip(docs, tfs):
+                if alive[doc]:
+                    scores[doc] = get(doc, 0.0) + weight * tf / (tf + norms[doc])
+
+        best = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        return [(self.paths[self._doc_path[doc]], self._doc_key[doc], score) for doc, score in best]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "documents": self.live,
+            "dropped": len(self._doc_key) - self.live,
+            "terms": len(self._postings),
+            "postings": sum(len(docs) for docs, _ in self._postings.values())
+        }
+
+    def save(self, index_path: Path) -> None:
+        """Write the index, as a JSON header followed by the raw document and posting arrays."""
+        terms = list(self._postings)
+        header = json.dumps({
+            "version": _INDEX_VERSION,
+            "byteorder": sys.byteorder,
+            "summary": _version_key(self.version),
+            "paths": self.paths,
+            "keys": self._doc_key,
+            "terms": terms,
+            "counts": [len(self._postings[t][0]) for t in terms]
+        }).encode()
+        posting_docs, posting_tfs = array("I"), array("H")
+        for term in terms:
+            docs, tfs = self._postings[term]
+            posting_docs.extend(docs)
+            posting_tfs.extend(tfs)
+
+        index_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = index_path.with_name(index_path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(_HEADER.pack(len(header)))
+            f.write(header)
+            for table in (self._doc_path, self._doc_len, self._alive, posting_docs, posting_tfs):
+                f.write(table if isinstance(table, bytearray) else table.tobytes())
+        tmp_path.replace(index_path)
+
+    @classmethod
+    def load(cls, index_path: Path, version: Optional[tuple]) -> Optional["SearchIndex"]:
+        """The saved index if it reflects the summary version given, else None."""
+        if version is None:
+            return None
+        try:
+            with open(index_path, "rb") as f:
+                (length,) = _HEADER.unpack(f.read(_HEADER.size))
+                if length > os.fstat(f.fileno()).st_size:
+                    return None
+                data = json.loads(f.read(length))
+                if (data.get("version") != _INDEX_VERSION or data.get("byteorder") != sys.byteorder
+                        or data.get("summary") != _version_key(version)):
+                    return None
+
+                n_docs, counts = len(data["keys"]), data["counts"]
+                doc_path, doc_len = array("I"), array("H")
+                doc_path.frombytes(f.read(n_docs * doc_path.itemsize))
+                doc_len.frombytes(f.read(n_docs * doc_len.itemsize))
+                alive = bytearray(f.read(n_docs))
+                posting_docs, posting_tfs = array("I"), array("H")
+                posting_docs.frombytes(f.read(sum(counts) * posting_docs.itemsize))
+                posting_tfs.frombytes(f.read(sum(counts) * posting_tfs.itemsize))
+                if (len(doc_path) != n_docs or len(doc_len) != n_docs or len(alive) != n_docs
+                        or len(posting_docs) != sum(counts) or len(posting_tfs) != sum(counts) or f.read(1)):
+                    return None
+        except Exception:
+            # Missing, damaged or foreign: rebuilt from the database
+            return None
+
+        index = cls()
+        index.paths = data["paths"]
+        index._path_ids = {path: i for i, path in enumerate(index.paths)}
+        index._doc_path, index._doc_key, index._doc_len, index._alive = doc_path, data["keys"], doc_len, alive
+        for doc, path_id in enumerate(doc_path):
+            if alive[doc]:
+                index._docs_by_path.setdefault(path_id, []).append(doc)
+                index.live += 1
+                index._total_len += doc_len[doc]
+        at = 0
+        for term, count in zip(data["terms"], counts, strict=True):
+            index._postings[term] = (posting_docs[at:at + count], posting_tfs[at:at + count])
+            at += count
+        index.version = version
+        return index
+
+
+def documents(path: str, smells: Iterable[Dict[str, Any]], functions: Optional[Dict[str, Any]] = None) -> List[Document]:
+    """Tokenize a file's smells for SearchIndex.add_documents; needs no index, so it can run in a worker thread."""
+    spans = _enclosing_functions(functions)
+    docs = []
+    for smell in smells:
+        line = smell.get("line", 0) or 0
+        function = ""
+        for start, end, name in spans:
+            if start > line:
+                break
+            if line <= end:
+                function = name
+        tokens = tokenize(f"{smell.get('type', '')} {smell.get('message', '')} {path} {function}")
+
+        counts: Dict[str, int] = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        docs.append((smell_key(smell), len(tokens), counts))
+    return docs
+
+
+def _version_key(version: Optional[tuple]) -> Optional[List[str]]:
+    """A summary version as stored in a saved index."""
+    return None if version is None else [str(part) for part in version]
+
+
+def _index_path(project_id: str) -> Path:
+    return SEARCH_INDEX_DIR / f"{hashlib.sha1(project_id.encode()).hexdigest()[:16]}.search"
+
+
+# project_id -> index, least recently used first
+_indexes: "OrderedDict[str, SearchIndex]" = OrderedDict()
+_builds = single_flight("search_index")
+
+
+def _remember(project_id: str, index: SearchIndex) -> None:
+    _indexes[project_id] = index
+    _indexes.move_to_end(project_id)
+    while len(_indexes) > SEARCH_INDEX_MAX_PROJECTS:
+        _indexes.popitem(last=False)
+
+
+def _file_documents(smells: Iterable[Dict[str, Any]], functions: List[Dict[str, Any]]
+                    ) -> List[Tuple[str, List[Document]]]:
+    """A scan's smells tokenized per file; the costly part of indexing, run in a worker thread."""
+    by_path: Dict[str, List[Dict[str, Any]]] = {}
+    for smell in smells:
+        by_path.setdefault(smell.get("path", smell.get("file_path", "")), []).append(smell)
+    buckets = {b.get("path", ""): b for b in functions}
+    return [(path, documents(path, rows, buckets.get(path))) for path, rows in by_path.items()]
+
+
+def _new_index(smells: Iterable[Dict[str, Any]], functions: List[Dict[str, Any]]) -> SearchIndex:
+    index = SearchIndex()
+    for path, docs in _file_documents(smells, functions):
+        index.add_documents(path, docs)
+    return index
+
+
+async def _build(project_id: str, version: Optional[tuple]) -> SearchIndex:
+    index_path = _index_path(project_id)
+    index = await asyncio.to_thread(SearchIndex.load, index_path, version)
+    if index is not None:
+        return index
+
+    db = get_database()
+    fields = ["path", "type", "message", "line", "fingerprint"]
+    smells = [s async for batch in db.iter_smells(project_id, batch_size=5000, fields=fields) for s in batch]
+    functions = await db.get_functions(project_id)
+    # Not shared with any reader yet: built and saved in a worker thread
+    index = await asyncio.to_thread(_new_index, smells, functions)
+    index.version = version
+    if version is not None:
+        try:
+            await asyncio.to_thread(index.save, index_path)
+        except OSError as e:
+            print(f"⚠️  Could not save the search index of {project_id}: {e}", flush=True)
+    print(f"🔎 Search index of {project_id} built: {index.live} smells, {len(index._postings)} terms", flush=True)
+    return index
+
+
+async def get_search_index(project_id: str) -> SearchIndex:
+    """The project's index, loaded or built if it is missing or behind the last scan."""
+    version = SummaryService.version(await SummaryService.get(project_id))
+    index = _indexes.get(project_id)
+    if index is not None:
+        if index.version is None:
+            # Updated by a scan in this process; the summary written after it is the one it reflects
+            index.version = version
+        if index.version == version:
+            _indexes.move_to_end(project_id)
+            return index
+    index = await _builds.do((project_id, version), _build, project_id, version)
+    _remember(project_id, index)
+    return index
+
+
+async def update_search_index(project_id: str, smells: List[Dict[str, Any]], functions: List[Dict[str, Any]],
+                              replaced_paths: Optional[List[str]] = None) -> None:
+    """
+    Apply a scan's rows to the project's index. Without replaced_paths the
+    rows are the whole project; with them, only those files changed. Called
+    before the scan's summary is written. Tokenizing runs in a worker thread;
+    the index searches are reading is only changed on the event loop.
+    """
+    if replaced_paths is None:
+        _remember(project_id, await asyncio.to_thread(_new_index, smells, functions))
+        return
+
+    index = _indexes.get(project_id)
+    if index is None:
+        return
+    # The summary still describes the scan before this one; an index behind even that is rebuilt later
+    if index.version is not None and index.version != SummaryService.version(await SummaryService.get(project_id)):
+        _indexes.pop(project_id, None)
+        return
+    file_docs = await asyncio.to_thread(_file_documents, smells, functions)
+    index.remove_paths(replaced_paths)
+    if index.needs_compaction:
+        index = await asyncio.to_thread(index.compacted)
+    for path, docs in file_docs:
+        index.add_documents(path, docs)
+    index.version = None
+    _remember(project_id, index)
+
+
+async def search_issues(project_id: str, query: str, path: Optional[str] = None,
+                        limit: int = 10) -> List[Dict[str, Any]]:
+    """The smells best matching query (or, with only a path, that file's smells), with their scores."""
+    limit = max(1, min(limit, MAX_SEARCH_RESULTS))
+    index = await get_search_index(project_id)
+    hits = index.search(query, path, limit)
+    if not hits:
+        return []
+
+    rows = await get_database().get_smells(project_id, paths=list(dict.fromkeys(p for p, _, _ in hits)))
+    by_key = {(r.get("path", ""), smell_key(r)): r for r in rows}
+    results = []
+    for hit_path, key, score in hits:
+        row = by_key.get((hit_path, key))
+        if row is not None:
+            results.append({**{f: row[f] for f in CodeSmell.model_fields if f in row}, "score": round(score, 4)})
+    if not tokenize(query):
+        # A file's smells, most severe first
+        results.sort(key=lambda r: (-r.get("severity", 0), r.get("line", 0)))
+    return results[:limit]
+
+
+def search_index_stats() -> Dict[str, Any]:
+    return {
+        "projects": len(_indexes),
+        "max_projects": SEARCH_INDEX_MAX_PROJECTS,
+        "documents": sum(index.live for index in _indexes.values())
+    }
@@ -0,0 +1,297 @@
+"""
+Similarity Index - Vectors of files and functions for nearest-neighbour search.
+
+Each file, and each function of at least MIN_FUNCTION_LINES lines, becomes
+a DIMENSIONS-wide float32 vector made of two hashed feature sets: n-grams of
+the clone detector's normalized token stream, which capture structure
+whatever the names, and the words of the identifiers and comments, which
+capture what the code is about. Counts are damped with log1p and both halves
+are L2-normalized, so a dot product is a cosine similarity.
+
+The vectors of a project are saved next to its repository's mirror (or its
+uploaded archive) as one file: a JSON header, recording the commit the
+vectors describe, then the raw float32 file and function matrices. Queries memory-map
+the matrices and score every row, which takes a few milliseconds per 100k
+rows. An incremental scan loads the index, drops the changed files and adds
+their new vectors.
+"""
+
+import json
+import keyword
+import os
+import re
+import struct
+import sys
+import zlib
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .clone_detector import tokenize
+from .source_reader import SourceFile
+
+
+DIMENSIONS = 128
+# Tokens per structural n-gram
+NGRAM_TOKENS = 3
+# Shorter functions are too small to compare and are only indexed as part of their file
+MIN_FUNCTION_LINES = 5
+
+_INDEX_VERSION = 2
+_HEADER = struct.Struct("<Q")
+# Matrices start on a 64-byte boundary
+_ALIGN = 64
+
+_NEWLINE = re.compile(r"\n")
+_WORD = re.compile(r"[A-Za-z][A-Za-z0-9]*")
+_HUMP = re.compile(r"[a-z0-9]+|[A-Z][a-z0-9]*")
+_SKIP_WORDS = frozenset(keyword.kwlist) | {
+    "const", "let", "var", "function", "this", "self", "return", "the", "and", "for", "new", "null",
+    "true", "false", "undefined", "import", "export", "from", "def", "class"
+}
+
+# Odd 64-bit constants for combining and mixing token ids
+_PRIME = np.uint64(0x100000001B3)
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+_WORD_SALT = np.uint64(0x5BD1E995)
+
+# One function: (name, line, end_line)
+FunctionSpan = Tuple[str, int, int]
+# One file: its vector, its indexed functions and their vectors (one row each)
+FileVectors = Tuple[np.ndarray, List[FunctionSpan], np.ndarray]
+
+
+def _words(text: str) -> Tuple[List[int], List[int]]:
+    """Ids of the lowercased words of identifiers and comments, split at humps, with their offsets."""
+    ids: List[int] = []
+    offsets: List[int] = []
+    for m in _WORD.finditer(text):
+        for part in _HUMP.findall(m.group()):
+            word = part.lower()
+            if len(word) > 2 and word not in _SKIP_WORDS:
+                # Stable across processes, so saved vectors stay comparable
+                ids.append(zlib.crc32(word.encode()))
+                offsets.append(m.start())
+    return ids, offsets
+
+
+def _hashed(ids: np.ndarray, n: int, salt: np.uint64) -> np.ndarray:
+    """Signed counts of the hashed n-grams of ids, log-damped and L2-normalized."""
+    if len(ids) < n:
+        return np.zeros(DIMENSIONS, dtype=np.float64)
+    count = len(ids) - n + 1
+    h = ids[:count] ^ salt
+    for k in range(1, n):
+        h = h * _PRIME + ids[k:k + count]
+    h = (h ^ (h >> np.uint64(29))) * _MIX
+    buckets = (h >> np.uint64(32)) % np.uint64(DIMENSIONS)
+    signs = np.where((h >> np.uint64(31)) & np.uint64(1), -1.0, 1.0)
+    counts = np.bincount(buckets.astype(np.intp), weights=signs, minlength=DIMENSIONS)
+    counts = np.sign(counts) * np.log1p(np.abs(counts))
+    norm = np.linalg.norm(counts)
+    return counts / norm if norm else counts
+
+
+def _vector(tokens: np.ndarray, words: np.ndarray) -> np.ndarray:
+    v = _hashed(tokens, NGRAM_TOKENS, np.uint64(0)) + _hashed(words, 1, _WORD_SALT)
+    norm = np.linalg.norm(v)
+    return (v / norm if norm else v).astype(np.float32)
+
+
+def embed(source: SourceFile, functions: Iterable[FunctionSpan] = ()) -> FileVectors:
+    """The vector of a file and of each of its functions long enough to index."""
+    token_ids, token_offsets = tokenize(source)
+    word_ids, word_offsets = _words(source.text)
+    tokens = np.array(token_ids, dtype=np.uint64)
+    words = np.array(word_ids, dtype=np.uint64)
+
+    spans = sorted((f for f in functions if f[2] - f[1] + 1 >= MIN_FUNCTION_LINES), key=lambda f: f[1])
+    rows = np.zeros((len(spans), DIMENSIONS), dtype=np.float32)
+    if spans:
+        # Offsets to 1-based lines, as SourceFile.line_of
+        newlines = np.array([m.start() for m in _NEWLINE.finditer(source.text)], dtype=np.int64)
+        token_lines = np.searchsorted(newlines, np.array(token_offsets, dtype=np.int64)) + 1
+        word_lines = np.searchsorted(newlines, np.array(word_offsets, dtype=np.int64)) + 1
+        for row, (_, line, end_line) in enumerate(spans):
+            t0, t1 = np.searchsorted(token_lines, [line, end_line + 1])
+            w0, w1 = np.searchsorted(word_lines, [line, end_line + 1])
+            rows[row] = _vector(tokens[t0:t1], words[w0:w1])
+    return _vector(tokens, words), spans, rows
+
+
+def _top(scores: np.ndarray, limit: int) -> np.ndarray:
+    """Row indexes of the limit highest scores, best first."""
+    limit = min(limit, len(scores))
+    if limit <= 0:
+        return np.zeros(0, dtype=np.intp)
+    best = np.argpartition(-scores, limit - 1)[:limit]
+    return best[np.argsort(-scores[best])]
+
+
+class SimilarityIndex:
+    """Repository-wide file and function vectors answering nearest neighbours."""
+
+    def __init__(self, commit: Optional[str] = None):
+        # Commit (or archive digest) of the sources the vectors were computed from
+        self.commit = commit
+        self._files: Dict[str, FileVectors] = {}
+        # Stacked matrices and row labels, built from _files or mapped from disk
+        self._table: Optional[dict] = None
+
+    def add(self, source: SourceFile, functions: Iterable[FunctionSpan] = ()) -> None:
+        self._entries()[source.path] = embed(source, functions)
+        self._table = None
+
+    def remove(self, paths: Iterable[str]) -> None:
+        files = self._entries()
+        for path in paths:
+            files.pop(path, None)
+        self._table = None
+
+    def __len__(self) -> int:
+        return len(self._tables()["paths"])
+
+    def _entries(self) -> Dict[str, FileVectors]:
+        """Per-file vectors; rows of a loaded index are still read from the mapped file."""
+        if self._table is not None and not self._files:
+            table = self._tables()
+            for i, path in enumerate(table["paths"]):
+                start, end = table["function_starts"][i], table["function_starts"][i + 1]
+                spans = list(zip(table["function_names"][start:end],
+                                 table["function_lines"][start:end].tolist(),
+                                 table["function_end_lines"][start:end].tolist()))
+                self._files[path] = (table["files"][i], spans, table["functions"][start:end])
+        return self._files
+
+    def _tables(self) -> dict:
+        if self._table is None:
+            paths = sorted(self._files)
+            spans = [self._files[p][1] for p in paths]
+            counts = [len(s) for s in spans]
+            self._table = {
+                "paths": paths,
+                "rows": {p: i for i, p in enumerate(paths)},
+                "files": np.vstack([self._files[p][0] for p in paths]) if paths
+                         else np.zeros((0, DIMENSIONS), dtype=np.float32),
+                "functions": np.vstack([self._files[p][2] for p in paths]) if sum(counts)
+                             else np.zeros((0, DIMENSIONS), dtype=np.float32),
+                "function_starts": np.concatenate([[0], np.cumsum(counts, dtype=np.int64)]),
+                "function_paths": np.repeat(np.arange(len(paths)), counts),
+                "function_names": [name for s in spans for name, _, _ in s],
+                "function_lines": np.array([line for s in spans for _, line, _ in s], dtype=np.int64),
+                "function_end_lines": np.array([end for s in spans for _, _, end in s], dtype=np.int64)
+            }
+        return self._table
+
+    def similar_files(self, path: str, limit: int = 10) -> Optional[List[Tuple[str, float]]]:
+        """The limit files most similar to path with their cosine similarity, or None if it is not indexed."""
+        table = self._tables()
+        row = table["rows"].get(path)
+        if row is None:
+            return None
+        scores = table["files"] @ table["files"][row]
+        scores[row] = -np.inf
+        return [(table["paths"][i], float(scores[i])) for i in _top(scores, limit) if scores[i] > -np.inf]
+
+    def similar_functions(self, path: str, name: str, line: Optional[int] = None,
+                          limit: int = 10) -> Optional[List[Tuple[str, str, int, int, float]]]:
+        """
+        The limit functions most similar to the function name of path (the one
+        starting at line, if several share the name), as (path, name, line,
+        end_line, similarity). None if no such function is indexed.
+        """
+        table = self._tables()
+        file_row = table["rows"].get(path)
+        if file_row is None:
+            return None
+        start, end = table["function_starts"][file_row], table["function_starts"][file_row + 1]
+        candidates = [i for i in range(start, end) if table["function_names"][i] == name]
+        if line is not None:
+            candidates = [i for i in candidates if table["function_lines"][i] == line]
+        if not candidates:
+            return None
+        row = candidates[0]
+        scores = table["functions"] @ table["functions"][row]
+        scores[row] = -np.inf
+        return [
+            (table["paths"][table["function_paths"][i]], table["function_names"][i],
+             int(table["function_lines"][i]), int(table["function_end_lines"][i]), float(scores[i]))
+            for i in _top(scores, limit) if scores[i] > -np.inf
+        ]
+
+    def save(self, index_path: Path) -> None:
+        table = self._tables()
+        header = json.dumps({
+            "version": _INDEX_VERSION,
+            "params": [DIMENSIONS, NGRAM_TOKENS, MIN_FUNCTION_LINES],
+            "byteorder": sys.byteorder,
+            "commit": self.commit,
+            "paths": table["paths"],
+            "function_counts": np.diff(table["function_starts"]).tolist(),
+            "function_names": table["function_names"],
+            "function_lines": table["function_lines"].tolist(),
+            "function_end_lines": table["function_end_lines"].tolist()
+        }).encode()
+        offset = -(-(_HEADER.size + len(header)) // _ALIGN) * _ALIGN
+
+        tmp_path = index_path.with_name(index_path.name + ".tmp")
+        with open(tmp_path, 'wb') as f:
+            f.write(_HEADER.pack(len(header)))
+            f.write(header)
+            f.write(b"\0" * (offset - _HEADER.size - len(header)))
+            f.write(np.ascontiguousarray(table["files"], dtype=np.float32).tobytes())
+            f.write(np.ascontiguousarray(table["functions"], dtype=np.float32).tobytes())
+        tmp_path.replace(index_path)
+
+    @classmethod
+    def load(cls, index_path: Path) -> Optional["SimilarityIndex"]:
+        """
+        The persisted index with its matrices memory-mapped, or None if it is
+        missing, unreadable or was built with other parameters.
+        """
+        try:
+            with open(index_path, 'rb') as f:
+                (length,) = _HEADER.unpack(f.read(_HEADER.size))
+                size = os.fstat(f.fileno()).st_size
+                if length > size:
+                    return None
+                data = json.loads(f.read(length))
+            if (data.get("version") != _INDEX_VERSION
+                    or data.get("params") != [DIMENSIONS, NGRAM_TOKENS, MIN_FUNCTION_LINES]
+                    or data.get("byteorder") != sys.byteorder):
+                return None
+
+            paths = data["paths"]
+            counts = data["function_counts"]
+            functions = sum(counts)
+            offset = -(-(_HEADER.size + length) // _ALIGN) * _ALIGN
+            row_bytes = DIMENSIONS * 4
+            if (len(counts) != len(paths) or size != offset + (len(paths) + functions) * row_bytes
+                    or not len(data["function_names"]) == len(data["function_lines"])
+                    == len(data["function_end_lines"]) == functions):
+                return None
+
+            def matrix(rows: int, at: int) -> np.ndarray:
+                if not rows:
+                    return np.zeros((0, DIMENSIONS), dtype=np.float32)
+                return np.memmap(index_path, dtype=np.float32, mode='r', offset=at, shape=(rows, DIMENSIONS))
+
+            table = {
+                "paths": paths,
+                "rows": {p: i for i, p in enumerate(paths)},
+                "files": matrix(len(paths), offset),
+                "functions": matrix(functions, offset + len(paths) * row_bytes),
+                "function_starts": np.concatenate([[0], np.cumsum(counts, dtype=np.int64)]),
+                "function_paths": np.repeat(np.arange(len(paths)), counts),
+                "function_names": data["function_names"],
+                "function_lines": np.array(data["function_lines"], dtype=np.int64),
+                "function_end_lines": np.array(data["function_end_lines"], dtype=np.int64)
+            }
+        except Exception:
+            # Truncated, damaged or foreign: a cache miss, the vectors are built again
+            return None
+
+        index = cls(data.get("commit"))
+        index._table = table
+        return index
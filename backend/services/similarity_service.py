@@ -0,0 +1,126 @@
+"""
+Similarity Service - Files and functions that look like a given one.
+
+Scans save the vectors of a project next to its mirror (see SimilarityIndex).
+Loaded indexes are kept per file and reloaded when a scan rewrites it, so
+a query is a dot product over the memory-mapped rows. An index is only used
+at the commit the project was last scanned at: a project scanned before
+vectors existed, whose incremental scan had none to update, or that reused
+another project's scan, gets its index built from its sources on first query.
+"""
+
+import asyncio
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from .db import get_database, select_fields
+from .repo_analyzer import repo_analyzer
+from .similarity_index import SimilarityIndex, MIN_FUNCTION_LINES
+from .single_flight import single_flight
+from .source_reader import SourceReader
+
+
+# Loaded indexes kept, least recently queried first out
+MAX_LOADED_INDEXES = 20
+# Upper bound on neighbours per query
+MAX_SIMILAR_RESULTS = 100
+
+# index path -> (file mtime, index)
+_indexes: "OrderedDict[str, Tuple[int, SimilarityIndex]]" = OrderedDict()
+_builds = single_flight("similarity_index")
+
+
+def _build(project: Dict[str, Any], functions: List[Dict[str, Any]], index_path: Path) -> Optional[SimilarityIndex]:
+    """Vectors of a project's sources as last scanned, saved to index_path; None if they are not available."""
+    spans = {
+        bucket.get("path", ""): list(zip(*(bucket.get("columns", {}).get(c, []) for c in ("name", "line", "end_line"))))
+        for bucket in functions
+    }
+    reader = SourceReader()
+    index = SimilarityIndex(project.get("last_commit"))
+    try:
+        for source in repo_analyzer.read_project_sources(project, reader):
+            index.add(source, spans.get(source.path, []))
+            reader.release(source)
+    finally:
+        reader.close()
+    if not len(index):
+        return None
+    index.save(index_path)
+    print(f"🧭 Similarity index of {project['_id']} built: {len(index)} files", flush=True)
+    return index
+
+
+async def get_similarity_index(project: Dict[str, Any]) -> Optional[SimilarityIndex]:
+    """The project's index, loaded (or built) once per scan; None if its sources are not available."""
+    index_path = repo_analyzer.vector_index_path(project)
+    if index_path is None:
+        return None
+    key = str(index_path)
+    commit = project.get("last_commit")
+    try:
+        mtime = index_path.stat().st_mtime_ns
+    except OSError:
+        mtime = None
+
+    cached = _indexes.get(key)
+    if cached is not None and mtime is not None and cached[0] == mtime and cached[1].commit == commit:
+        _indexes.move_to_end(key)
+        return cached[1]
+
+    index = SimilarityIndex.load(index_path) if mtime is not None else None
+    if index is None or index.commit != commit:
+        functions = await get_database().get_functions(project["_id"])
+        index = await _builds.do((key, commit), asyncio.to_thread, _build, project, functions, index_path)
+        if index is None:
+            return None
+        mtime = index_path.stat().st_mtime_ns
+
+    _indexes[key] = (mtime, index)
+    _indexes.move_to_end(key)
+    while len(_indexes) > MAX_LOADED_INDEXES:
+        _indexes.popitem(last=False)
+    return index
+
+
+async def find_similar(project_id: str, path: str, function: Optional[str] = None,
+                       line: Optional[int] = None, limit: int = 10) -> Dict[str, Any]:
+    """
+    The files most similar to path, with their risk, or with function the
+    functions most similar to that one of path (the one starting at line if
+    the name is not unique in the file).
+    """
+    db = get_database()
+    project = await db.get_project(project_id)
+    if not project:
+        return {"error": "Project not found"}
+    index = await get_similarity_index(project)
+    if index is None:
+        return {"error": "No similarity index for this project. Scan it first."}
+    limit = max(1, min(limit, MAX_SIMILAR_RESULTS))
+
+    if function:
+        hits = index.similar_functions(path, function, line, limit)
+        if hits is None:
+            return {"error": f"Function '{function}' of {path} is not indexed "
+                             f"(functions under {MIN_FUNCTION_LINES} lines are not)"}
+        items = [
+            {"path": p, "function": name, "line": start, "end_line": end, "similarity": round(score, 4)}
+            for p, name, start, end, score in hits
+        ]
+    else:
+        hits = index.similar_files(path, limit)
+        if hits is None:
+            return {"error": f"{path} is not indexed"}
+        risks = await db.get_risks(project_id, paths=[p for p, _ in hits], fields=["path", "risk_score", "tier"])
+        by_path = {r.get("path"): select_fields(r, ["risk_score", "tier"]) for r in risks}
+        items = [{"path": p, "similarity": round(score, 4), **by_path.get(p, {})} for p, score in hits]
+
+    return {
+        "project_id": project_id,
+        "path": path,
+        "function": function,
+        "total": len(items),
+        "items": items
+    }
@@ -0,0 +1,60 @@
+"""
+Single-flight request coalescing.
+
+When identical work is requested again while it is still running (a team
+opening the same dashboard, a double click on "scan"), the later callers
+await the call already in flight instead of starting their own. Nothing is
+kept once the call finishes; that is what CachedDatabase is for.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """Shares one in-flight call among concurrent callers with the same key."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[..., Awaitable[Any]], *args: Any, **kwargs: Any) -> Any:
+        """Await fn(*args, **kwargs), or the call already running under key."""
+        self.calls += 1
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(fn(*args, **kwargs))
+            self._inflight[key] = future
+            future.add_done_callback(lambda f: self._finished(key, f))
+        else:
+            self.coalesced += 1
+        # A caller that gives up must not cancel the call for the others
+        return await asyncio.shield(future)
+
+    def _finished(self, key: Hashable, future: asyncio.Future) -> None:
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._inflight)
+        }
+
+
+_groups: Dict[str, SingleFlight] = {}
+
+
+def single_flight(name: str) -> SingleFlight:
+    """The process-wide group for one kind of work (db reads, reports, scans)."""
+    group = _groups.get(name)
+    if group is None:
+        group = _groups[name] = SingleFlight(name)
+    return group
+
+
+def single_flight_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: group.stats() for name, group in _groups.items()}
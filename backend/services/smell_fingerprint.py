@@ -0,0 +1,68 @@
+"""
+Smell Fingerprints - Stable identities for code smells across scans.
+
+A smell is identified by its rule, file, enclosing function and a hash of the
+normalized source line it points at, not by its line number, so it keeps its
+identity when code above it moves. Identical smells within one function are
+told apart by their order of appearance.
+"""
+
+import hashlib
+import re
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence
+
+
+MODULE_SYMBOL = "<module>"
+
+_WHITESPACE = re.compile(r'\s+')
+_DIGITS = re.compile(r'\d+')
+
+
+def normalize_snippet(text: str) -> str:
+    """Whitespace-insensitive form of a source line or message."""
+    return _WHITESPACE.sub(' ', text.strip())
+
+
+def enclosing_symbol(line: int, functions: Sequence[Any]) -> str:
+    """Name of the innermost function (anything with name, line, end_line) spanning line."""
+    best = None
+    for f in functions:
+        if f.line <= line <= f.end_line and (best is None or f.line > best.line):
+            best = f
+    return best.name if best is not None else MODULE_SYMBOL
+
+
+def fingerprint(rule: str, path: str, symbol: str, snippet: str, occurrence: int = 0) -> str:
+    key = f"{rule}\0{path}\0{symbol}\0{snippet}\0{occurrence}"
+    return hashlib.blake2b(key.encode('utf-8', errors='ignore'), digest_size=8).hexdigest()
+
+
+def fingerprint_smells(smells: List[Any], lines: Optional[List[str]] = None,
+                       functions: Sequence[Any] = ()) -> None:
+    """
+    Set the fingerprint of every smell of one file.
+
+    Without the file's lines (or for a line out of range) the message, with
+    numbers masked, stands in for the snippet.
+    """
+    seen: Counter = Counter()
+    for smell in sorted(smells, key=lambda s: s.line):
+        if lines and 1 <= smell.line <= len(lines):
+            snippet = normalize_snippet(lines[smell.line - 1])
+        else:
+            snippet = _DIGITS.sub('#', normalize_snippet(smell.message))
+        symbol = enclosing_symbol(smell.line, functions)
+
+        base = (smell.type, symbol, snippet)
+        smell.fingerprint = fingerprint(smell.type, smell.path, symbol, snippet, seen[base])
+        seen[base] += 1
+
+
+def row_fingerprint(row: Dict[str, Any]) -> str:
+    """Fingerprint of a stored smell row; rows stored before fingerprints existed get the message-based one."""
+    if row.get("fingerprint"):
+        return row["fingerprint"]
+    path = row.get("path", row.get("file_path", ""))
+    snippet = _DIGITS.sub('#', normalize_snippet(row.get("message", "")))
+    return fingerprint(row.get("type", ""), path, MODULE_SYMBOL, snippet)
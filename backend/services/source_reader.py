@@ -0,0 +1,215 @@
+"""
+Source Reader - Scan-scoped, read-once access to source files.
+
+Every analyzer in a scan (metrics, smells, dependency graph) asks the same
+SourceReader for a file, so each file is opened and decoded at most once.
+Large files are memory-mapped, binary or non-UTF-8 content is detected from a
+small prefix before anything is decoded, and the decoded text and line index
+are built lazily and shared.
+"""
+
+import bisect
+import codecs
+import mmap
+import re
+import tempfile
+from pathlib import Path
+from typing import BinaryIO, Dict, List, Optional, Union
+
+
+# Files at least this large are memory-mapped instead of read into a bytes object
+MMAP_THRESHOLD = 256 * 1024
+# How much of a file is inspected to decide whether it is text
+SNIFF_BYTES = 8192
+# Read size when spooling a stream to disk
+STREAM_CHUNK = 1024 * 1024
+
+_NEWLINE = re.compile('\n')
+
+
+class SourceFile:
+    """One source file: raw bytes (or an mmap) plus lazily decoded text and line index."""
+
+    def __init__(self, path: str, data: Union[bytes, mmap.mmap], reader: "SourceReader"):
+        self.path = path
+        self.size = len(data)
+        self._data = data
+        self._reader = reader
+        self._text: Optional[str] = None
+        self._lines: Optional[List[str]] = None
+        self._line_starts: Optional[List[int]] = None
+        self.encoding = self._sniff()
+
+    def _sniff(self) -> Optional[str]:
+        """Classify the file from its prefix: 'utf-8', 'latin-1', or None for binary."""
+        prefix = bytes(self._data[:SNIFF_BYTES])
+        if b'\0' in prefix:
+            return None
+        try:
+            # A multi-byte character may be cut at the end of the prefix
+            codecs.getincrementaldecoder('utf-8')().decode(prefix, final=len(prefix) == self.size)
+            return 'utf-8'
+        except UnicodeDecodeError:
+            return 'latin-1'
+
+    @property
+    def is_binary(self) -> bool:
+        return self.encoding is None
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = str(self._data, self.encoding or 'utf-8', errors='ignore')
+            self._reader.bytes_decoded += self.size
+            self._release()
+        return self._text
+
+    @property
+    def lines(self) -> List[str]:
+        if self._lines is None:
+            self._lines = self.text.split('\n')
+        return self._lines
+
+    @property
+    def line_count(self) -> int:
+        return len(self.lines)
+
+    def line_of(self, offset: int) -> int:
+        """1-based line number of a character offset into text."""
+        if self._line_starts is None:
+            self._line_starts = [0] + [m.end() for m in _NEWLINE.finditer(self.text)]
+        return bisect.bisect_right(self._line_starts, offset)
+
+    def _release(self) -> None:
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._data = b''
+
+
+class SourceReader:
+    """Opens each file of a scan once and keeps I/O counters for the scan."""
+
+    def __init__(self):
+        self._files: Dict[str, SourceFile] = {}
+        self.bytes_read = 0
+        self.bytes_decoded = 0
+        self.files_opened = 0
+        self.files_mmapped = 0
+        self.binary_skipped = 0
+
+    def open(self, file_path: Path, relative_path: str) -> Optional[SourceFile]:
+        """Return the shared SourceFile for a file on disk, or None if it is binary or unreadable."""
+        key = relative_path.replace('\\', '/')
+        if key in self._files:
+            return self._files[key]
+
+        try:
+            with open(file_path, 'rb') as f:
+                size = f.seek(0, 2)
+                f.seek(0)
+                if size >= MMAP_THRESHOLD:
+                    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    self.files_mmapped += 1
+                else:
+                    data = f.read()
+                    self.bytes_read += len(data)
+        except (OSError, ValueError) as e:
+            print(f"Error reading {relative_path}: {e}")
+            return None
+
+        self.files_opened += 1
+        source = SourceFile(relative_path, data, self)
+        if isinstance(data, mmap.mmap):
+            # Only the pages touched so far were read from disk
+            self.bytes_read += min(size, SNIFF_BYTES) if source.is_binary else size
+        return self._register(key, source)
+
+    def from_bytes(self, relative_path: str, data: bytes) -> Optional[SourceFile]:
+        """Wrap content that was already read elsewhere (git object store, ZIP member)."""
+        key = relative_path.replace('\\', '/')
+        if key in self._files:
+            return self._files[key]
+
+        self.files_opened += 1
+        self.bytes_read += len(data)
+        return self._register(key, SourceFile(relative_path, data, self))
+
+    def from_stream(self, relative_path: str, stream: BinaryIO, size: int) -> Optional[SourceFile]:
+        """
+        Read content of a declared size from a stream (a ZIP member). Small
+        files are read into memory; large ones are spooled to a temporary file
+        and memory-mapped like large files on disk, so they are never held
+        whole in memory. None if the content is binary, or runs past size.
+        """
+        key = relative_path.replace('\\', '/')
+        if key in self._files:
+            return self._files[key]
+
+        # Never trust the declared size: stop reading one byte past it
+        if size < MMAP_THRESHOLD:
+            data = stream.read(size + 1)
+            if len(data) > size:
+                print(f"  Skipping {relative_path}: expands beyond its declared size", flush=True)
+                return None
+            return self.from_bytes(relative_path, data)
+
+        first = stream.read(STREAM_CHUNK)
+        if b'\0' in first[:SNIFF_BYTES]:
+            self.files_opened += 1
+            self.binary_skipped += 1
+            self.bytes_read += len(first)
+            return None
+        with tempfile.TemporaryFile() as spool:
+            copied = 0
+            chunk = first
+            while chunk:
+                copied += len(chunk)
+                if copied > size:
+                    print(f"  Skipping {relative_path}: expands beyond its declared size", flush=True)
+                    return None
+                spool.write(chunk)
+                chunk = stream.read(STREAM_CHUNK)
+            if not copied:
+                return self.from_bytes(relative_path, b'')
+            spool.flush()
+            # The mapping outlives the (already unlinked) file
+            data = mmap.mmap(spool.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self.files_opened += 1
+        self.files_mmapped += 1
+        self.bytes_read += copied
+        return self._register(key, SourceFile(relative_path, data, self))
+
+    def get(self, relative_path: str) -> Optional[SourceFile]:
+        return self._files.get(relative_path.replace('\\', '/'))
+
+    def release(self, source: SourceFile) -> None:
+        """
+        Forget a file every analyzer is done with, dropping its content and
+        decoded text, so a scan streaming its files holds one at a time.
+        """
+        self._files.pop(source.path.replace('\\', '/'), None)
+        source._release()
+        source._text = source._lines = source._line_starts = None
+
+    def _register(self, key: str, source: SourceFile) -> Optional[SourceFile]:
+        if source.is_binary:
+            self.binary_skipped += 1
+            source._release()
+            return None
+        self._files[key] = source
+        return source
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "files_opened": self.files_opened,
+            "files_mmapped": self.files_mmapped,
+            "binary_skipped": self.binary_skipped,
+            "bytes_read": self.bytes_read,
+            "bytes_decoded": self.bytes_decoded
+        }
+
+    def close(self) -> None:
+        for source in self._files.values():
+            source._release()
+        self._files.clear()
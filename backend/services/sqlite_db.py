@@ -0,0 +1,615 @@
+"""
+SQLite database for single-node installs.
+
+A durable alternative to InMemoryDB that needs no server: one database file
+in WAL mode, so a crash or restart keeps every project. sqlite3 calls block,
+so all statements run on one dedicated thread that owns the connection,
+never on the event loop.
+
+Result rows are stored as JSON next to the columns the queries filter and
+sort on, each valid from the generation that wrote it (gen_from) until the
+one that replaced it (gen_to). The rows of a new generation are held back
+until commit_generation, which retires the rows they replace, writes them
+with executemany and makes the generation current in one transaction per
+scan; rows of unchanged files are left alone.
+"""
+
+import asyncio
+import json
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from .db import (GENERATION_TIMEOUT, TREND_METRICS, DatabaseInterface, FunctionTopK, histogram_key, severity_key,
+                 trend_point)
+
+
+# Result table -> columns kept next to the JSON row, besides project_id, gen_from, gen_to and path
+_COLUMNS = {
+    "metrics": (),
+    "risks": ("tier", "risk_score"),
+    "smells": ("key", "type", "severity"),
+    "functions": ("max_complexity",),
+    "suggestions": ("file_id",),
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS projects (id TEXT PRIMARY KEY, doc TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS metrics (
+    project_id TEXT NOT NULL, gen_from INTEGER NOT NULL, gen_to INTEGER, path TEXT NOT NULL, doc TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS risks (
+    project_id TEXT NOT NULL, gen_from INTEGER NOT NULL, gen_to INTEGER, path TEXT NOT NULL,
+    tier TEXT, risk_score REAL, doc TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS smells (
+    project_id TEXT NOT NULL, gen_from INTEGER NOT NULL, gen_to INTEGER, path TEXT NOT NULL,
+    key TEXT NOT NULL, type TEXT, severity INTEGER, doc TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS functions (
+    project_id TEXT NOT NULL, gen_from INTEGER NOT NULL, gen_to INTEGER, path TEXT NOT NULL,
+    max_complexity INTEGER, doc TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS suggestions (
+    project_id TEXT NOT NULL, gen_from INTEGER NOT NULL, gen_to INTEGER, path TEXT NOT NULL,
+    file_id TEXT NOT NULL, doc TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS generations (project_id TEXT PRIMARY KEY, current INTEGER NOT NULL, previous INTEGER);
+CREATE TABLE IF NOT EXISTS data_versions (project_id TEXT PRIMARY KEY, version INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS summaries (project_id TEXT PRIMARY KEY, doc TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS scan_history (
+    project_id TEXT NOT NULL, scan_id TEXT NOT NULL, timestamp TEXT NOT NULL,
+    doc TEXT NOT NULL, files TEXT NOT NULL, PRIMARY KEY (project_id, scan_id)
+);
+CREATE TABLE IF NOT EXISTS scan_diffs (
+    project_id TEXT NOT NULL, scan_id TEXT NOT NULL, seq INTEGER NOT NULL,
+    doc TEXT NOT NULL, PRIMARY KEY (project_id, scan_id, seq)
+);
+CREATE TABLE IF NOT EXISTS scans (
+    id TEXT PRIMARY KEY, repo_url TEXT, commit_sha TEXT, status TEXT, completed_at TEXT, doc TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chat_sessions (id TEXT PRIMARY KEY, expires_at REAL NOT NULL, doc TEXT NOT NULL);
+
+CREATE UNIQUE INDEX IF NOT EXISTS metrics_path ON metrics (project_id, path) WHERE gen_to IS NULL;
+CREATE UNIQUE INDEX IF NOT EXISTS risks_path ON risks (project_id, path) WHERE gen_to IS NULL;
+CREATE INDEX IF NOT EXISTS risks_score ON risks (project_id, risk_score DESC) WHERE gen_to IS NULL;
+CREATE UNIQUE INDEX IF NOT EXISTS smells_path ON smells (project_id, path, key) WHERE gen_to IS NULL;
+CREATE INDEX IF NOT EXISTS smells_severity ON smells (project_id, severity DESC, type) WHERE gen_to IS NULL;
+CREATE UNIQUE INDEX IF NOT EXISTS functions_path ON functions (project_id, path) WHERE gen_to IS NULL;
+CREATE INDEX IF NOT EXISTS functions_complexity ON functions (project_id, max_complexity DESC) WHERE gen_to IS NULL;
+CREATE UNIQUE INDEX IF NOT EXISTS suggestions_path ON suggestions (project_id, path) WHERE gen_to IS NULL;
+CREATE INDEX IF NOT EXISTS suggestions_file ON suggestions (project_id, file_id) WHERE gen_to IS NULL;
+CREATE INDEX IF NOT EXISTS metrics_rows ON metrics (project_id);
+CREATE INDEX IF NOT EXISTS risks_rows ON risks (project_id);
+CREATE INDEX IF NOT EXISTS smells_rows ON smells (project_id);
+CREATE INDEX IF NOT EXISTS functions_rows ON functions (project_id);
+CREATE INDEX IF NOT EXISTS suggestions_rows ON suggestions (project_id);
+CREATE INDEX IF NOT EXISTS metrics_retired ON metrics (project_id, gen_to) WHERE gen_to IS NOT NULL;
+CREATE INDEX IF NOT EXISTS risks_retired ON risks (project_id, gen_to) WHERE gen_to IS NOT NULL;
+CREATE INDEX IF NOT EXISTS smells_retired ON smells (project_id, gen_to) WHERE gen_to IS NOT NULL;
+CREATE INDEX IF NOT EXISTS functions_retired ON functions (project_id, gen_to) WHERE gen_to IS NOT NULL;
+CREATE INDEX IF NOT EXISTS suggestions_retired ON suggestions (project_id, gen_to) WHERE gen_to IS NOT NULL;
+CREATE INDEX IF NOT EXISTS scan_history_time ON scan_history (project_id, timestamp);
+CREATE INDEX IF NOT EXISTS scans_commit ON scans (repo_url, commit_sha, completed_at DESC);
+CREATE INDEX IF NOT EXISTS chat_sessions_expiry ON chat_sessions (expires_at);
+"""
+
+# Rows of the current generation: a commit retires the rows it replaces and
+# writes their replacements in one transaction, so those are the unretired ones
+_LIVE = "gen_to IS NULL"
+# Rows valid at generation :gen, for reads spanning several statements; those
+# page by rowid along the <table>_rows indexes, which keep a project in rowid order
+_AT = "gen_from <= :gen AND (gen_to IS NULL OR gen_to > :gen)"
+# The project's current generation; 0 until its first commit
+_CURRENT = "COALESCE((SELECT current FROM generations WHERE project_id = :pid), 0)"
+
+
+def _dumps(doc: Dict[str, Any]) -> str:
+    return json.dumps(doc, default=str, separators=(',', ':'))
+
+
+def _path(row: Dict[str, Any]) -> str:
+    return row.get("path", row.get("file_path", ""))
+
+
+def _result_row(table: str, project_id: str, generation: int, row: Dict[str, Any]) -> tuple:
+    if table == "risks":
+        extra = (row.get("tier"), row.get("risk_score", 0))
+    elif table == "smells":
+        key = row.get("fingerprint") or f"{row.get('type', '')}:{row.get('line', 0)}"
+        extra = (key, row.get("type"), row.get("severity"))
+    elif table == "functions":
+        extra = (row.get("max_complexity", 0),)
+    elif table == "suggestions":
+        extra = (row.get("file_id", ""),)
+    else:
+        extra = ()
+    return (project_id, generation, _path(row), *extra, _dumps(row))
+
+
+def _insert_sql(table: str) -> str:
+    columns = ("project_id", "gen_from", "path", *_COLUMNS[table], "doc")
+    return f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+
+
+class SQLiteDB(DatabaseInterface):
+    """SQLite database for durable single-node installs."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._connected = False
+        # One thread owns the connection; statements never run on the event loop
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+        # token -> rows and carry-forward exclusions of a generation waiting for commit_generation
+        self._pending: Dict[str, Dict[str, Any]] = {}
+
+    async def _run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        if not self._connected:
+            await self.connect()
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _open(self) -> None:
+        conn = sqlite3.connect(self.path, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        self._conn = conn
+
+    async def connect(self) -> bool:
+        if self._connected:
+            return True
+        try:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._open)
+            self._connected = True
+            print(f"✅ Using SQLite database: {self.path}")
+            return True
+        except sqlite3.Error as e:
+            print(f"⚠️  SQLite database could not be opened: {e}")
+            return False
+
+    async def close(self) -> None:
+        if self._conn is not None:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._conn.close)
+            self._conn = None
+            self._connected = False
+            print("🔌 SQLite database closed")
+
+    def _write(self, statements: List[tuple]) -> None:
+        """Run (sql, params, many) statements in one transaction."""
+        conn = self._conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for sql, params, many in statements:
+                if many:
+                    conn.executemany(sql, params)
+                else:
+                    conn.execute(sql, params)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _query(self, sql: str, params: Any = ()) -> List[tuple]:
+        return self._conn.execute(sql, params).fetchall()
+
+    async def upsert_project(self, project: Dict[str, Any]) -> None:
+        def upsert() -> None:
+            row = self._conn.execute("SELECT doc FROM projects WHERE id = ?", (project["_id"],)).fetchone()
+            # Merged like MongoDB's $set
+            doc = {**json.loads(row[0]), **project} if row else project
+            self._write([("INSERT OR REPLACE INTO projects (id, doc) VALUES (?, ?)", (project["_id"], _dumps(doc)), False)])
+        await self._run(upsert)
+
+    async def get_project(self, project_id: str) -> Optional[Dict[str, Any]]:
+        rows = await self._run(self._query, "SELECT doc FROM projects WHERE id = ?", (project_id,))
+        return json.loads(rows[0][0]) if rows else None
+
+    async def _set_rows(self, table: str, project_id: str, rows: List[Dict[str, Any]], generation: Optional[str]) -> None:
+        for row in rows:
+            row['project_id'] = project_id
+        if generation is not None:
+            # Written by commit_generation, together with the rest of the scan
+            self._pending[generation]["rows"][table].extend(rows)
+            return
+
+        def write() -> None:
+            # Into the current generation, replacing the rows of the same paths
+            gen = self._query(f"SELECT {_CURRENT}", {"pid": project_id})[0][0]
+            self._write([(_insert_sql(table), [_result_row(table, project_id, gen, r) for r in rows], True)])
+        if rows:
+            await self._run(write)
+
+    @staticmethod
+    def _doc_column(fields: Optional[List[str]], params: Dict[str, Any]) -> str:
+        """The doc, or a JSON array of just the requested fields extracted by SQLite."""
+        if fields is None:
+            return "doc"
+        paths = []
+        for i, field in enumerate(fields):
+            params[f"f{i}"] = f"$.{field}"
+            paths.append(f"json_extract(doc, :f{i})")
+        return f"json_array({', '.join(paths)})"
+
+    @staticmethod
+    def _load_doc(doc: str, fields: Optional[List[str]]) -> Dict[str, Any]:
+        if fields is None:
+            return json.loads(doc)
+        # Fields a row lacks come back as null; leave them out like the other backends do
+        return {f: v for f, v in zip(fields, json.loads(doc)) if v is not None}
+
+    async def _get_rows(self, table: str, project_id: str, paths: Optional[List[str]], order: str = "rowid",
+                        fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        params: Dict[str, Any] = {"pid": project_id}
+        sql = f"SELECT {self._doc_column(fields, params)} FROM {table} WHERE project_id = :pid AND {_LIVE}"
+        if paths is not None:
+            sql += " AND path IN (SELECT value FROM json_each(:paths))"
+            params["paths"] = json.dumps(list(paths))
+            # Sort the few rows found through the path index rather than walk
+            # the whole project along an index already in the requested order
+            order = f"+{order}"
+        rows = await self._run(self._query, f"{sql} ORDER BY {order}", params)
+        return [self._load_doc(doc, fields) for (doc,) in rows]
+
+    async def set_metrics(self, project_id: str, metrics: List[Dict[str, Any]], generation: Optional[str] = None) -> None:
+        await self._set_rows("metrics", project_id, metrics, generation)
+
+    async def get_metrics(self, project_id: str, paths: Optional[List[str]] = None,
+                          fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        return await self._get_rows("metrics", project_id, paths, fields=fields)
+
+    async def set_risks(self, project_id: str, risks: List[Dict[str, Any]], generation: Optional[str] = None) -> None:
+        await self._set_rows("risks", project_id, risks, generation)
+
+    async def get_risks(self, project_id: str, paths: Optional[List[str]] = None,
+                        fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        return await self._get_rows("risks", project_id, paths, order="risk_score DESC", fields=fields)
+
+    async def set_smells(self, project_id: str, smells: List[Dict[str, Any]], generation: Optional[str] = None) -> None:
+        await self._set_rows("smells", project_id, smells, generation)
+
+    async def get_smells(self, project_id: str, paths: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        return await self._get_rows("smells", project_id, paths)
+
+    async def iter_smells(self, project_id: str, min_severity: Optional[int] = None, batch_size: int = 1000,
+                          fields: Optional[List[str]] = None) -> AsyncIterator[List[Dict[str, Any]]]:
+        params: Dict[str, Any] = {"pid": project_id, "min": min_severity, "after": 0, "limit": batch_size,
+                                  "gen": await self._generation(project_id)}
+        sql = (f"SELECT rowid, {self._doc_column(fields, params)} FROM smells "
+               f"WHERE project_id = :pid AND {_AT} AND rowid > :after")
+        if min_severity is not None:
+            sql += " AND severity >= :min"
+        # Keyset pages: each batch is its own short query, nothing is held open between
+        # them; all read the generation current at the first, whatever commits meanwhile
+        while True:
+            rows = await self._run(self._query, f"{sql} ORDER BY rowid LIMIT :limit", dict(params))
+            if not rows:
+                return
+            yield [self._load_doc(doc, fields) for _, doc in rows]
+            params["after"] = rows[-1][0]
+
+    async def iter_rows(self, project_id: str, table: str, paths: Optional[List[str]] = None,
+                        batch_size: int = 1000) -> AsyncIterator[List[Dict[str, Any]]]:
+        params: Dict[str, Any] = {"pid": project_id, "after": 0, "limit": batch_size,
+                                  "gen": await self._generation(project_id)}
+        sql = f"SELECT rowid, doc FROM {table} WHERE project_id = :pid AND {_AT} AND rowid > :after"
+        if paths is not None:
+            sql += " AND path IN (SELECT value FROM json_each(:paths))"
+            params["paths"] = json.dumps(list(paths))
+        while True:
+            rows = await self._run(self._query, f"{sql} ORDER BY rowid LIMIT :limit", dict(params))
+            if not rows:
+                return
+            yield [json.loads(doc) for _, doc in rows]
+            params["after"] = rows[-1][0]
+
+    async def set_functions(self, project_id: str, buckets: List[Dict[str, Any]], generation: Optional[str] = None) -> None:
+        await self._set_rows("functions", project_id, buckets, generation)
+
+    async def get_functions(self, project_id: str, paths: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        return await self._get_rows("functions", project_id, paths)
+
+    async def set_suggestions(self, project_id: str, rows: List[Dict[str, Any]], generation: Optional[str] = None) -> None:
+        await self._set_rows("suggestions", project_id, rows, generation)
+
+    async def get_suggestions(self, project_id: str, file_id: str) -> Optional[Dict[str, Any]]:
+        rows = await self._run(
+            self._query,
+            f"SELECT doc FROM suggestions WHERE project_id = :pid AND {_LIVE} AND file_id = :fid",
+            {"pid": project_id, "fid": file_id}
+        )
+        return json.loads(rows[0][0]) if rows else None
+
+    async def top_functions(self, project_id: str, limit: int, min_complexity: int = 1) -> List[Dict[str, Any]]:
+        def top() -> List[Dict[str, Any]]:
+            # Walks the (project_id, max_complexity) index of live rows and stops early
+            cursor = self._conn.execute(
+                f"SELECT doc FROM functions WHERE project_id = :pid AND {_LIVE} "
+                "AND max_complexity >= :min ORDER BY max_complexity DESC",
+                {"pid": project_id, "min": min_complexity}
+            )
+            top = FunctionTopK(limit, min_complexity)
+            for (doc,) in cursor:
+                if not top.add(json.loads(doc)):
+                    break
+            cursor.close()
+            return top.results()
+        return await self._run(top)
+
+    async def risk_summary(self, project_id: str) -> Dict[str, Dict[str, float]]:
+        rows = await self._run(
+            self._query,
+            f"SELECT COALESCE(tier, 'Low'), COUNT(*), TOTAL(risk_score) FROM risks "
+            f"WHERE project_id = :pid AND {_LIVE} GROUP BY 1",
+            {"pid": project_id}
+        )
+        return {tier: {"count": count, "risk_total": total} for tier, count, total in rows}
+
+    async def smell_counts(self, project_id: str) -> Dict[str, Any]:
+        def counts() -> Dict[str, Any]:
+            where = f"WHERE project_id = :pid AND {_LIVE}"
+            by_severity: Dict[str, Dict[str, int]] = {}
+            for severity, name, count in self._query(
+                f"SELECT severity, type, COUNT(*) FROM smells {where} GROUP BY severity, type", {"pid": project_id}
+            ):
+                types = by_severity.setdefault(severity_key(severity), {})
+                types[name or "Unknown"] = types.get(name or "Unknown", 0) + count
+            files = {
+                path: {"count": count, "max_severity": int(severity_key(max_severity))}
+                for path, count, max_severity in self._query(
+                    f"SELECT path, COUNT(*), MAX(severity) FROM smells {where} GROUP BY path", {"pid": project_id}
+                )
+            }
+            return {"by_severity": by_severity, "files": files}
+        return await self._run(counts)
+
+    async def top_smells(self, project_id: str, limit: int) -> List[Dict[str, Any]]:
+        rows = await self._run(
+            self._query,
+            f"SELECT doc FROM smells WHERE project_id = :pid AND {_LIVE} "
+            "ORDER BY severity DESC, rowid LIMIT :limit",
+            {"pid": project_id, "limit": max(limit, 0)}
+        )
+        return [json.loads(doc) for (doc,) in rows]
+
+    async def metric_histogram(self, project_id: str, field: str, bucket_size: float,
+                               table: str = "metrics") -> Dict[str, int]:
+        value = "risk_score" if table == "risks" and field == "risk_score" else "json_extract(doc, :field)"
+        # Metrics are non-negative, so truncating is flooring
+        rows = await self._run(
+            self._query,
+            f"SELECT CAST(COALESCE({value}, 0) / :size AS INTEGER) AS bucket, COUNT(*) FROM {table} "
+            f"WHERE project_id = :pid AND {_LIVE} GROUP BY bucket",
+            {"pid": project_id, "field": f"$.{field}", "size": float(bucket_size)}
+        )
+        return {histogram_key(bucket * bucket_size, bucket_size): count for bucket, count in rows}
+
+    async def begin_generation(self, project_id: str) -> str:
+        generation = uuid.uuid4().hex
+        self._pending[generation] = {
+            "project_id": project_id,
+            "rows": {t: [] for t in _COLUMNS},
+            "exclude": None,
+            "opened": time.monotonic()
+        }
+        return generation
+
+    async def _generation(self, project_id: str) -> int:
+        return (await self._run(self._query, f"SELECT {_CURRENT}", {"pid": project_id}))[0][0]
+
+    async def current_generation(self, project_id: str) -> Optional[int]:
+        rows = await self._run(self._query, "SELECT current FROM generations WHERE project_id = ?", (project_id,))
+        return rows[0][0] if rows else None
+
+    async def carry_forward(self, project_id: str, generation: str, exclude_paths: List[str]) -> None:
+        pending = self._pending[generation]
+        pending["exclude"] = set(pending["exclude"] or ()) | set(exclude_paths)
+
+    async def commit_generation(self, project_id: str, generation: str) -> int:
+        pending = self._pending.pop(generation)
+
+        def commit() -> int:
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                state = conn.execute("SELECT current FROM generations WHERE project_id = ?", (project_id,)).fetchone()
+                previous = state[0] if state else None
+                committed = (previous or 0) + 1
+
+                # Rows are bounded, never copied: an incremental scan retires the rows of its replaced paths only
+                retire = "WHERE project_id = :pid AND gen_to IS NULL"
+                params: Dict[str, Any] = {"pid": project_id, "gen": committed}
+                if pending["exclude"] is not None:
+                    written = (_path(r) for rows in pending["rows"].values() for r in rows)
+                    retire += " AND path IN (SELECT value FROM json_each(:paths))"
+                    params["paths"] = json.dumps(sorted(pending["exclude"].union(written)))
+                for table, rows in pending["rows"].items():
+                    conn.execute(f"UPDATE {table} SET gen_to = :gen {retire}", params)
+                    if rows:
+                        conn.executemany(_insert_sql(table), [_result_row(table, project_id, committed, r) for r in rows])
+                conn.execute(
+                    "INSERT OR REPLACE INTO generations (project_id, current, previous) VALUES (?, ?, ?)",
+                    (project_id, committed, previous)
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            return committed
+        return await self._run(commit)
+
+    async def drop_generation(self, project_id: str, generation: str) -> None:
+        # Never written
+        self._pending.pop(generation, None)
+
+    async def sweep_generations(self, project_id: str) -> None:
+        # Uncommitted rows never reach the file, so a crash leaves none behind; a
+        # scan that failed without dropping its generation only holds memory
+        cutoff = time.monotonic() - GENERATION_TIMEOUT
+        for generation, pending in list(self._pending.items()):
+            if pending["project_id"] == project_id and pending["opened"] < cutoff:
+                del self._pending[generation]
+        # Readers in flight see the previous generation at the oldest
+        await self._run(self._write, [
+            (f"DELETE FROM {table} WHERE project_id = :pid "
+             "AND gen_to <= (SELECT previous FROM generations WHERE project_id = :pid)", {"pid": project_id}, False)
+            for table in _COLUMNS
+        ])
+
+    async def data_version(self, project_id: str) -> int:
+        rows = await self._run(self._query, "SELECT version FROM data_versions WHERE project_id = ?", (project_id,))
+        return rows[0][0] if rows else 0
+
+    async def bump_data_version(self, project_id: str) -> None:
+        await self._run(self._write, [(
+            "INSERT INTO data_versions (project_id, version) VALUES (?, 1) "
+            "ON CONFLICT (project_id) DO UPDATE SET version = version + 1", (project_id,), False
+        )])
+
+    async def set_summary(self, project_id: str, summary: Dict[str, Any]) -> None:
+        await self._run(self._write, [
+            ("INSERT OR REPLACE INTO summaries (project_id, doc) VALUES (?, ?)", (project_id, _dumps(summary)), False)
+        ])
+
+    async def get_summary(self, project_id: str) -> Optional[Dict[str, Any]]:
+        rows = await self._run(self._query, "SELECT doc FROM summaries WHERE project_id = ?", (project_id,))
+        return json.loads(rows[0][0]) if rows else None
+
+    async def append_snapshot(self, snapshot: Dict[str, Any]) -> None:
+        doc = {k: v for k, v in snapshot.items() if k != "files"}
+        # Insert-only: replaying a scan never rewrites its snapshot
+        await self._run(self._write, [(
+            "INSERT OR IGNORE INTO scan_history (project_id, scan_id, timestamp, doc, files) VALUES (?, ?, ?, ?, ?)",
+            (snapshot["project_id"], snapshot["scan_id"], snapshot["timestamp"], _dumps(doc),
+             _dumps(snapshot.get("files", []))),
+            False
+        )])
+
+    async def get_snapshots(self, project_id: str, since: Optional[str] = None, until: Optional[str] = None,
+                            limit: Optional[int] = None, path: Optional[str] = None) -> List[Dict[str, Any]]:
+        if limit is not None and limit <= 0:
+            return []
+
+        # With a path, only that file's entry leaves SQLite
+        files = ("(SELECT json_group_array(json(value)) FROM json_each(files) "
+                 "WHERE json_extract(value, '$.path') = :path)") if path is not None else "NULL"
+        sql = f"SELECT doc, {files} FROM scan_history WHERE project_id = :pid"
+        params: Dict[str, Any] = {"pid": project_id, "path": path}
+        if since is not None:
+            sql += " AND timestamp >= :since"
+            params["since"] = since
+        if until is not None:
+            sql += " AND timestamp <= :until"
+            params["until"] = until
+        if limit is None:
+            rows = await self._run(self._query, f"{sql} ORDER BY timestamp", params)
+        else:
+            params["limit"] = limit
+            rows = await self._run(self._query, f"{sql} ORDER BY timestamp DESC LIMIT :limit", params)
+            rows.reverse()
+
+        snapshots = []
+        for doc, file_entries in rows:
+            snapshot = json.loads(doc)
+            if path is not None:
+                snapshot["files"] = json.loads(file_entries)
+            snapshots.append(snapshot)
+        return snapshots
+
+    async def get_trend(self, project_id: str, points: int, since: Optional[str] = None,
+                        until: Optional[str] = None) -> Dict[str, Any]:
+        where = "project_id = :pid"
+        params: Dict[str, Any] = {"pid": project_id, "points": points}
+        if since is not None:
+            where += " AND timestamp >= :since"
+            params["since"] = since
+        if until is not None:
+            where += " AND timestamp <= :until"
+            params["until"] = until
+        rows = await self._run(self._query, f"SELECT COUNT(*) FROM scan_history WHERE {where}", params)
+        total = rows[0][0]
+        if total <= points:
+            snapshots = await self.get_snapshots(project_id, since, until)
+            return {"total": len(snapshots), "scans": [{**s, "scans": 1} for s in snapshots]}
+
+        # Runs as in trend_bucket; with MAX() the bare doc column is the run's latest row
+        params["total"] = total
+        averages = ", ".join(f"AVG(COALESCE(json_extract(doc, '$.metrics.{key}'), 0))" for key in TREND_METRICS)
+        sql = (f"WITH ranked AS (SELECT doc, ROW_NUMBER() OVER (ORDER BY timestamp) AS rank "
+               f"FROM scan_history WHERE {where}) "
+               f"SELECT MAX(rank), doc, COUNT(*), {averages} FROM ranked "
+               f"GROUP BY (rank * :points - 1) / :total ORDER BY MAX(rank)")
+        rows = await self._run(self._query, sql, params)
+        scans = [
+            trend_point(json.loads(doc), count, dict(zip(TREND_METRICS, values)))
+            for _, doc, count, *values in rows
+        ]
+        return {"total": total, "scans": scans}
+
+    async def get_snapshot(self, project_id: str, scan_id: str, files: bool = False) -> Optional[Dict[str, Any]]:
+        column = "files" if files else "NULL"
+        rows = await self._run(
+            self._query, f"SELECT doc, {column} FROM scan_history WHERE project_id = ? AND scan_id = ?",
+            (project_id, scan_id)
+        )
+        if not rows:
+            return None
+        snapshot = json.loads(rows[0][0])
+        if files:
+            snapshot["files"] = json.loads(rows[0][1])
+        return snapshot
+
+    async def set_scan_diff(self, project_id: str, scan_id: str, entries: List[Dict[str, Any]]) -> None:
+        await self._run(self._write, [
+            ("DELETE FROM scan_diffs WHERE project_id = ? AND scan_id = ?", (project_id, scan_id), False),
+            ("INSERT INTO scan_diffs (project_id, scan_id, seq, doc) VALUES (?, ?, ?, ?)",
+             [(project_id, scan_id, i, _dumps(e)) for i, e in enumerate(entries)], True)
+        ])
+
+    async def get_scan_diffs(self, project_id: str, scan_ids: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+        rows = await self._run(
+            self._query,
+            "SELECT scan_id, doc FROM scan_diffs WHERE project_id = ? "
+            "AND scan_id IN (SELECT value FROM json_each(?)) ORDER BY scan_id, seq",
+            (project_id, json.dumps(list(scan_ids)))
+        )
+        diffs: Dict[str, List[Dict[str, Any]]] = {}
+        for scan_id, doc in rows:
+            diffs.setdefault(scan_id, []).append(json.loads(doc))
+        return diffs
+
+    async def record_scan(self, scan: Dict[str, Any]) -> None:
+        await self._run(self._write, [(
+            "INSERT OR REPLACE INTO scans (id, repo_url, commit_sha, status, completed_at, doc) VALUES (?, ?, ?, ?, ?, ?)",
+            (scan["_id"], scan.get("repo_url"), scan.get("commit_sha"), scan.get("status"),
+             scan.get("completed_at"), _dumps(scan)),
+            False
+        )])
+
+    async def find_scan(self, repo_url: str, commit_sha: str) -> Optional[Dict[str, Any]]:
+        rows = await self._run(
+            self._query,
+            "SELECT doc FROM scans WHERE repo_url IS ? AND commit_sha = ? AND status = 'completed' "
+            "ORDER BY completed_at DESC LIMIT 1",
+            (repo_url, commit_sha)
+        )
+        return json.loads(rows[0][0]) if rows else None
+
+    async def get_chat_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        rows = await self._run(self._query, "SELECT doc FROM chat_sessions WHERE id = ? AND expires_at > ?",
+                               (session_id, time.time()))
+        return json.loads(rows[0][0]) if rows else None
+
+    async def set_chat_session(self, session_id: str, session: Dict[str, Any], ttl: float) -> None:
+        now = time.time()
+        await self._run(self._write, [
+            ("INSERT OR REPLACE INTO chat_sessions (id, expires_at, doc) VALUES (?, ?, ?)",
+             (session_id, now + ttl, _dumps(session)), False),
+            # Expired sessions go with the next write, off the expiry index
+            ("DELETE FROM chat_sessions WHERE expires_at <= ?", (now,), False)
+        ])
+
+    async def delete_chat_session(self, session_id: str) -> None:
+        await self._run(self._write, [("DELETE FROM chat_sessions WHERE id = ?", (session_id,), False)])
@@ -0,0 +1,320 @@
+"""
+Project Summary Service - Aggregates materialized once per scan.
+
+Dashboards, reports, trends and the chatbot all need the same numbers
+(tier counts, smell histograms, riskiest files, quality score). They are
+computed when a scan completes and stored as one summary document per
+project, so readers fetch a single small document instead of every row.
+Each completed scan also appends a snapshot of them to the project's
+history, which the trend charts read. A full scan builds both from the
+stored rows; an incremental one updates the previous ones with the rows it
+replaced, so a small push costs its diff rather than the whole project.
+"""
+
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from .db import get_database, severity_key
+
+
+# Riskiest files and sample issues kept in the summary
+SUMMARY_TOP_N = 25
+SEVERITIES = (1, 2, 3, 4, 5)
+TIERS = ("Critical", "High", "Medium", "Low")
+
+
+def _path(row: Dict[str, Any]) -> str:
+    return row.get("path", row.get("file_path", ""))
+
+
+def _public(row: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in row.items() if k not in ("_id", "project_id")}
+
+
+def _risk_bucket(score: Any) -> str:
+    """Histogram bucket of a risk score, in steps of ten: "0" holds 0-9, "90" holds 90-100."""
+    return str(min(int(float(score or 0) // 10 * 10), 90))
+
+
+def _smell_files(smells: List[Dict[str, Any]]) -> Dict[str, Dict[str, int]]:
+    """Per path {"count", "max_severity"}, as smell_counts reports them."""
+    files: Dict[str, Dict[str, int]] = {}
+    for s in smells:
+        entry = files.setdefault(_path(s), {"count": 0, "max_severity": 1})
+        entry["count"] += 1
+        entry["max_severity"] = max(entry["max_severity"], int(severity_key(s.get("severity"))))
+    return files
+
+
+def _file_entries(metrics: List[Dict[str, Any]], risks: List[Dict[str, Any]],
+                  smell_files: Dict[str, Dict[str, int]]) -> List[Dict[str, Any]]:
+    """Key metrics per file, as kept in snapshots."""
+    risk_by_path = {_path(r): r for r in risks}
+    files = []
+    for m in metrics:
+        path = _path(m)
+        risk = risk_by_path.get(path, {})
+        files.append({
+            "path": path,
+            "loc": m.get("loc", 0),
+            "cyclomatic_max": m.get("cyclomatic_max", 0),
+            "dup_ratio": m.get("dup_ratio", 0),
+            "risk_score": risk.get("risk_score", 0),
+            "tier": risk.get("tier", "Low"),
+            "smells": smell_files.get(path, {}).get("count", 0)
+        })
+    return files
+
+
+class SummaryService:
+    @staticmethod
+    def build(project_id: str, metrics: List[Dict[str, Any]], risks: List[Dict[str, Any]],
+              risk_tiers: Dict[str, Dict[str, float]], risk_histogram: Dict[str, int],
+              smell_counts: Dict[str, Any], sample_issues: List[Dict[str, Any]],
+              scan: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Compute the summary document. Counts come from the database's
+        aggregations (risk_summary, metric_histogram, smell_counts); the rows
+        are only needed for the per-file lists.
+        """
+        score_buckets = Counter()
+        for bucket, count in risk_histogram.items():
+            score_buckets[_risk_bucket(bucket)] += count
+        top_risks = sorted(risks, key=lambda r: r.get("risk_score", 0), reverse=True)[:SUMMARY_TOP_N]
+
+        by_severity = {str(s): Counter(smell_counts["by_severity"].get(str(s), {})) for s in SEVERITIES}
+        max_severity = Counter(f["max_severity"] for f in smell_counts["files"].values())
+
+        languages: Dict[str, Dict[str, int]] = {}
+        for m in metrics:
+            lang = languages.setdefault(m.get("language", "unknown"), {"files": 0, "loc": 0})
+            lang["files"] += 1
+            lang["loc"] += m.get("loc", 0)
+
+        return SummaryService._assemble(project_id, scan, languages, risk_tiers, score_buckets,
+                                        [_public(r) for r in top_risks], by_severity, max_severity, sample_issues)
+
+    @staticmethod
+    def _assemble(project_id: str, scan: Optional[Dict[str, Any]], languages: Dict[str, Dict[str, int]],
+                  risk_tiers: Dict[str, Dict[str, float]], score_buckets: Counter, top_risks: List[Dict[str, Any]],
+                  by_severity: Dict[str, Counter], max_severity: Counter,
+                  sample_issues: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        The summary document from per-language totals, risk tiers and buckets,
+        smell counts per severity and type, and files per highest severity.
+        """
+        # Risks
+        risk_files = sum(t["count"] for t in risk_tiers.values())
+        avg_risk = sum(t["risk_total"] for t in risk_tiers.values()) / risk_files if risk_files else 0
+
+        # "at least severity N" rollups, as the smells endpoint filters; severity
+        # keys are strings so the document stores as-is in MongoDB
+        types_at_least: Dict[str, Dict[str, int]] = {}
+        affected_at_least: Dict[str, int] = {}
+        running_types: Counter = Counter()
+        running_files = 0
+        for severity in reversed(SEVERITIES):
+            key = str(severity)
+            running_types.update(by_severity[key])
+            running_files += max_severity.get(severity, 0)
+            types_at_least[key] = dict(running_types)
+            affected_at_least[key] = running_files
+
+        return {
+            "_id": project_id,
+            "project_id": project_id,
+            "scan_id": (scan or {}).get("_id"),
+            "commit_sha": (scan or {}).get("commit_sha"),
+            "computed_at": datetime.utcnow().isoformat(),
+            "total_files": sum(lang["files"] for lang in languages.values()),
+            "total_loc": sum(lang["loc"] for lang in languages.values()),
+            "total_smells": sum(sum(counter.values()) for counter in by_severity.values()),
+            "affected_files": affected_at_least["1"],
+            "avg_risk": avg_risk,
+            "quality_score": max(0, 100 - avg_risk),
+            "tiers": {tier: risk_tiers.get(tier, {}).get("count", 0) for tier in TIERS},
+            "tier_risk_totals": {tier: risk_tiers.get(tier, {}).get("risk_total", 0) for tier in TIERS},
+            "risk_histogram": {str(b): score_buckets.get(str(b), 0) for b in range(0, 100, 10)},
+            "top_risks": top_risks,
+            "smell_types": types_at_least["1"],
+            "smell_severity": {key: sum(counter.values()) for key, counter in by_severity.items()},
+            "issue_levels": {
+                "critical": sum(by_severity["5"].values()),
+                "high": sum(by_severity["4"].values()),
+                "medium": sum(by_severity["3"].values()),
+                "low": sum(by_severity["2"].values()) + sum(by_severity["1"].values())
+            },
+            "smell_types_at_least": types_at_least,
+            "affected_files_at_least": affected_at_least,
+            "sample_issues": [_public(s) for s in sample_issues],
+            "languages": languages
+        }
+
+    @staticmethod
+    def version(summary: Optional[Dict[str, Any]]) -> Optional[tuple]:
+        """Identifies the scan a summary was computed for; changes with every rewrite."""
+        if not summary:
+            return None
+        return (summary.get("scan_id"), summary.get("computed_at"))
+
+    @staticmethod
+    def trend_metrics(summary: Dict[str, Any]) -> Dict[str, Any]:
+        """The headline numbers tracked across scans."""
+        levels = summary.get("issue_levels", {})
+        return {
+            "total_files": summary.get("total_files", 0),
+            "total_loc": summary.get("total_loc", 0),
+            "total_smells": summary.get("total_smells", 0),
+            "quality_score": summary.get("quality_score", 100),
+            "avg_risk": summary.get("avg_risk", 0),
+            "critical_issues": levels.get("critical", 0),
+            "high_issues": levels.get("high", 0),
+            "medium_issues": levels.get("medium", 0),
+            "low_issues": levels.get("low", 0)
+        }
+
+    @staticmethod
+    def snapshot(project_id: str, scan: Dict[str, Any], summary: Dict[str, Any],
+                 files: List[Dict[str, Any]], diff: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        The history entry of a completed scan: headline numbers plus key
+        metrics per file, and the counts of its diff against the previous scan
+        when one was recorded (see diff_service).
+        """
+        snapshot = {
+            "project_id": project_id,
+            "scan_id": scan["_id"],
+            "commit_sha": scan.get("commit_sha"),
+            "timestamp": scan.get("completed_at") or summary["computed_at"],
+            "metrics": SummaryService.trend_metrics(summary),
+            "files": files
+        }
+        if diff is not None:
+            snapshot["diff"] = diff
+        return snapshot
+
+    @staticmethod
+    async def materialize(project_id: str, scan: Optional[Dict[str, Any]] = None,
+                          metrics: Optional[List[Dict[str, Any]]] = None,
+                          diff: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Build the summary from the project's stored rows and save it; for a
+        completed scan, also append its snapshot to the project's history.
+
+        Built from what the database holds rather than the scan's own results,
+        so it always agrees with the row listings served next to it. Rows are
+        read uncapped (iter_rows): file counts, LOC, languages, the riskiest
+        files and the snapshot cover every file, not the first page.
+        """
+        db = get_database()
+        if metrics is None:
+            metrics = await db.read_rows(project_id, "metrics")
+        risks = await db.read_rows(project_id, "risks")
+        risk_tiers = await db.risk_summary(project_id)
+        risk_histogram = await db.metric_histogram(project_id, "risk_score", 10, table="risks")
+        smell_counts = await db.smell_counts(project_id)
+        sample_issues = await db.top_smells(project_id, SUMMARY_TOP_N)
+
+        summary = SummaryService.build(project_id, metrics, risks, risk_tiers, risk_histogram,
+                                       smell_counts, sample_issues, scan)
+        await db.set_summary(project_id, summary)
+        if scan and scan.get("_id"):
+            files = _file_entries(metrics, risks, smell_counts["files"])
+            await db.append_snapshot(SummaryService.snapshot(project_id, scan, summary, files, diff))
+        return summary
+
+    @staticmethod
+    async def apply_delta(project_id: str, previous_scan_id: Optional[str], scan: Dict[str, Any],
+                          old: tuple, new: tuple, diff: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Update the summary and snapshot of the project's previous scan with the
+        (metrics, risks, smells) rows an incremental scan replaced (old) and
+        wrote (new), then save them like materialize. Only those rows, the two
+        documents and the top issues are read, so the cost follows the diff,
+        not the project. Returns None, saving nothing, when the stored summary
+        or snapshot is not that of previous_scan_id; materialize instead.
+        """
+        db = get_database()
+        previous = await db.get_summary(project_id)
+        if not previous_scan_id or not previous or previous.get("scan_id") != previous_scan_id \
+                or "smell_types_at_least" not in previous:
+            return None
+        history = await db.get_snapshot(project_id, previous_scan_id, files=True)
+        if history is None:
+            return None
+        old_metrics, old_risks, old_smells = old
+        new_metrics, new_risks, new_smells = new
+        replaced = {_path(r) for rows in (*old, *new) for r in rows}
+
+        languages = {lang: dict(totals) for lang, totals in previous.get("languages", {}).items()}
+        for rows, sign in ((old_metrics, -1), (new_metrics, 1)):
+            for m in rows:
+                lang = languages.setdefault(m.get("language", "unknown"), {"files": 0, "loc": 0})
+                lang["files"] += sign
+                lang["loc"] += sign * m.get("loc", 0)
+        languages = {lang: totals for lang, totals in languages.items() if totals["files"] > 0}
+
+        risk_tiers = {
+            tier: {"count": count, "risk_total": previous.get("tier_risk_totals", {}).get(tier, 0)}
+            for tier, count in previous.get("tiers", {}).items()
+        }
+        score_buckets = Counter(previous.get("risk_histogram", {}))
+        for rows, sign in ((old_risks, -1), (new_risks, 1)):
+            for r in rows:
+                tier = risk_tiers.setdefault(r.get("tier", "Low"), {"count": 0, "risk_total": 0})
+                tier["count"] += sign
+                tier["risk_total"] += sign * r.get("risk_score", 0)
+                score_buckets[_risk_bucket(r.get("risk_score"))] += sign
+
+        # Files outside the diff score no higher than the last of the previous top list,
+        # so the merged list is exact down to it; refilled from the database when shorter
+        kept = [r for r in previous.get("top_risks", []) if _path(r) not in replaced]
+        top_risks = sorted(kept + [_public(r) for r in new_risks], key=lambda r: r.get("risk_score", 0), reverse=True)
+        if len(previous.get("top_risks", [])) >= SUMMARY_TOP_N:
+            cutoff = previous["top_risks"][-1].get("risk_score", 0)
+            if sum(r.get("risk_score", 0) >= cutoff for r in top_risks) < SUMMARY_TOP_N:
+                top_risks = [_public(r) for r in (await db.get_risks(project_id))[:SUMMARY_TOP_N]]
+        top_risks = top_risks[:SUMMARY_TOP_N]
+
+        # Per-severity counts back from the "at least" rollups, then adjusted
+        at_least = previous["smell_types_at_least"]
+        files_at_least = previous.get("affected_files_at_least", {})
+        by_severity: Dict[str, Counter] = {}
+        max_severity: Counter = Counter()
+        for severity in SEVERITIES:
+            above = str(severity + 1)
+            by_severity[str(severity)] = Counter(at_least.get(str(severity), {})) - Counter(at_least.get(above, {}))
+            max_severity[severity] = files_at_least.get(str(severity), 0) - files_at_least.get(above, 0)
+        for rows, sign in ((old_smells, -1), (new_smells, 1)):
+            for smell in rows:
+                by_severity[severity_key(smell.get("severity"))][smell.get("type", "Unknown")] += sign
+            for counts in _smell_files(rows).values():
+                max_severity[counts["max_severity"]] += sign
+        by_severity = {key: +counter for key, counter in by_severity.items()}
+
+        sample_issues = await db.top_smells(project_id, SUMMARY_TOP_N)
+        summary = SummaryService._assemble(project_id, scan, languages, risk_tiers, score_buckets, top_risks,
+                                           by_severity, max_severity, sample_issues)
+        await db.set_summary(project_id, summary)
+
+        files = [f for f in history.get("files", []) if f.get("path") not in replaced]
+        files += _file_entries(new_metrics, new_risks, _smell_files(new_smells))
+        await db.append_snapshot(SummaryService.snapshot(project_id, scan, summary, files, diff))
+        return summary
+
+    @staticmethod
+    async def get(project_id: str) -> Optional[Dict[str, Any]]:
+        """
+        The project's summary. Projects scanned before summaries existed get
+        theirs built on first read; None if the project has no results.
+        """
+        db = get_database()
+        summary = await db.get_summary(project_id)
+        if summary is not None:
+            return summary
+
+        metrics = await db.read_rows(project_id, "metrics")
+        if not metrics:
+            return None
+        return await SummaryService.materialize(project_id, metrics=metrics)
@@ -0,0 +1,209 @@
+"""Test database backends: InMemoryDB and SQLiteDB answer the same generation sequence alike"""
+import asyncio
+import copy
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, '.')
+
+PROJECT = "parity"
+
+
+def metric(path: str, loc: int, cyclomatic: int) -> dict:
+    return {"path": path, "loc": loc, "sloc": loc - 2, "cyclomatic_max": cyclomatic, "cyclomatic_avg": cyclomatic / 2,
+            "fn_count": 2, "class_count": 0, "nesting_max": 2, "dup_ratio": 0.0, "comment_ratio": 0.1,
+            "language": "python"}
+
+
+def risk(path: str, score: int, tier: str) -> dict:
+    return {"path": path, "risk_score": score, "tier": tier, "top_features": ["cyclomatic_max"]}
+
+
+def smell(path: str, smell_type: str, severity: int, line: int) -> dict:
+    return {"path": path, "type": smell_type, "severity": severity, "line": line,
+            "message": f"{smell_type} at line {line}", "suggestion": "fix it",
+            "fingerprint": f"{path}:{smell_type}:{line}"}
+
+
+def functions(path: str, complexities: list) -> dict:
+    from services.repo_analyzer import RepoAnalyzer, FunctionMetrics
+    return RepoAnalyzer.function_bucket(path, [
+        FunctionMetrics(name=f"f{i}", line=10 * i + 1, end_line=10 * i + 8, complexity=c, nesting=1, params=2, length=8)
+        for i, c in enumerate(complexities)
+    ])
+
+
+def scan(files: dict) -> dict:
+    """Result rows of a scan of files: path -> (loc, cyclomatic, risk, tier, smells, function complexities)."""
+    from services.llm_service import LLMService
+    metrics = [metric(p, f[0], f[1]) for p, f in files.items()]
+    smells = [smell(p, t, s, line) for p, f in files.items() for t, s, line in f[4]]
+    return {
+        "metrics": metrics,
+        "risks": [risk(p, f[2], f[3]) for p, f in files.items()],
+        "smells": smells,
+        "functions": [functions(p, f[5]) for p, f in files.items() if f[5]],
+        "suggestions": LLMService.build_suggestions(metrics, smells)
+    }
+
+
+FULL = scan({
+    "app/a.py": (120, 9, 71, "High", [("Magic Number", 2, 5), ("Deep Nesting", 4, 30)], [9, 3]),
+    "app/b.py": (40, 2, 12, "Low", [("Unresolved TODOs", 2, 1)], [2]),
+    "app/c.py": (300, 15, 88, "Critical", [("Long File", 3, 1), ("Magic Number", 2, 7), ("SQL Injection", 5, 40)],
+                 [15, 7, 1]),
+})
+# An incremental scan: a.py changed, b.py was removed, d.py is new; c.py is carried forward
+INCREMENTAL = scan({
+    "app/a.py": (130, 4, 35, "Medium", [("Magic Number", 2, 5)], [4, 3]),
+    "app/d.py": (60, 6, 50, "Medium", [("Deep Nesting", 4, 12)], [6]),
+})
+INCREMENTAL_STALE = ["app/a.py", "app/b.py", "app/d.py"]
+# A second incremental scan that only removes c.py
+REMOVAL = scan({})
+REMOVAL_STALE = ["app/c.py"]
+
+_BOOKKEEPING = {"project_id", "_id"}
+
+
+def clean(row: dict) -> dict:
+    return {k: v for k, v in row.items() if k not in _BOOKKEEPING}
+
+
+def rows(items: list) -> list:
+    """Rows in a backend-independent order."""
+    return sorted((clean(r) for r in items), key=lambda r: repr(sorted(r.items())))
+
+
+async def read_all(db) -> dict:
+    """Everything a reader sees of the project."""
+    from services.llm_service import LLMService
+    smells = [s async for batch in db.iter_smells(PROJECT, batch_size=2) for s in batch]
+    severe = [s async for batch in db.iter_smells(PROJECT, 3, fields=["path", "line"]) for s in batch]
+    suggestions = {
+        path: await db.get_suggestions(PROJECT, LLMService.file_id(path))
+        for path in ("app/a.py", "app/b.py", "app/c.py", "app/d.py")
+    }
+    return {
+        "generation": await db.current_generation(PROJECT),
+        "metrics": rows(await db.get_metrics(PROJECT)),
+        "metric_fields": rows(await db.get_metrics(PROJECT, fields=["path", "loc"])),
+        "metrics_of_paths": rows(await db.get_metrics(PROJECT, paths=["app/a.py", "app/b.py"])),
+        "risks": [clean(r) for r in await db.get_risks(PROJECT)],
+        "smells": rows(await db.get_smells(PROJECT)),
+        "smells_of_paths": rows(await db.get_smells(PROJECT, paths=["app/c.py"])),
+        "iter_smells": rows(smells),
+        "iter_smells_severe": rows(severe),
+        "iter_rows": {t: rows(await db.read_rows(PROJECT, t)) for t in ("metrics", "risks", "smells", "functions")},
+        "functions": rows(await db.get_functions(PROJECT)),
+        "top_functions": await db.top_functions(PROJECT, 3),
+        "suggestions": {p: clean(s) if s else None for p, s in suggestions.items()},
+        "risk_summary": await db.risk_summary(PROJECT),
+        "smell_counts": await db.smell_counts(PROJECT),
+        "top_smells": [clean(s) for s in await db.top_smells(PROJECT, 2)],
+        "histogram": await db.metric_histogram(PROJECT, "loc", 100),
+        "risk_histogram": await db.metric_histogram(PROJECT, "risk_score", 10, "risks"),
+    }
+
+
+async def write(db, results: dict, stale: list = None) -> int:
+    """Write a scan's rows into a new generation and commit it, as JobService does."""
+    generation = await db.begin_generation(PROJECT)
+    await db.set_metrics(PROJECT, copy.deepcopy(results["metrics"]), generation)
+    await db.set_risks(PROJECT, copy.deepcopy(results["risks"]), generation)
+    await db.set_smells(PROJECT, copy.deepcopy(results["smells"]), generation)
+    await db.set_functions(PROJECT, copy.deepcopy(results["functions"]), generation)
+    await db.set_suggestions(PROJECT, copy.deepcopy(results["suggestions"]), generation)
+    if stale is not None:
+        await db.carry_forward(PROJECT, generation, stale)
+    return await db.commit_generation(PROJECT, generation)
+
+
+async def run(db) -> list:
+    """The sequence under test; returns what was read after every step."""
+    reads = []
+    reads.append(("before any commit", await read_all(db)))
+
+    await write(db, FULL)
+    reads.append(("full scan", await read_all(db)))
+
+    # Rows of an open generation stay invisible until it commits
+    generation = await db.begin_generation(PROJECT)
+    await db.set_metrics(PROJECT, [metric("app/z.py", 1, 1)], generation)
+    await db.set_smells(PROJECT, [smell("app/z.py", "Magic Number", 5, 1)], generation)
+    reads.append(("open generation", await read_all(db)))
+    await db.drop_generation(PROJECT, generation)
+    reads.append(("dropped generation", await read_all(db)))
+
+    await db.sweep_generations(PROJECT)
+    await write(db, INCREMENTAL, INCREMENTAL_STALE)
+    reads.append(("incremental scan", await read_all(db)))
+    await db.sweep_generations(PROJECT)
+    reads.append(("sweep after the incremental scan", await read_all(db)))
+
+    await write(db, REMOVAL, REMOVAL_STALE)
+    await db.sweep_generations(PROJECT)
+    reads.append(("removal scan and sweep", await read_all(db)))
+
+    await write(db, FULL)
+    await db.sweep_generations(PROJECT)
+    reads.append(("full rescan and sweep", await read_all(db)))
+    return reads
+
+
+async def test():
+    from services.db import InMemoryDB
+    from services.sqlite_db import SQLiteDB
+
+    root = tempfile.mkdtemp(prefix="backends_test_")
+    memory = InMemoryDB()
+    sqlite = SQLiteDB(os.path.join(root, "parity.db"))
+    failures = 0
+
+    def check(ok: bool, message: str) -> None:
+        nonlocal failures
+        print(f"  {'ok' if ok else 'FAIL'}: {message}")
+        failures += not ok
+
+    try:
+        expected = await run(memory)
+        actual = await run(sqlite)
+        for (step, want), (_, got) in zip(expected, actual, strict=True):
+            print(step)
+            for key in want:
+                check(got[key] == want[key], f"{key} matches InMemoryDB" if got[key] == want[key] else
+                      f"{key}: SQLiteDB {got[key]!r} != InMemoryDB {want[key]!r}")
+
+        # The sequence itself, on the reference backend
+        reads = dict(expected)
+        print("InMemoryDB")
+        check(not reads["before any commit"]["metrics"] and reads["before any commit"]["generation"] is None,
+              "nothing is visible before the first commit")
+        check(reads["open generation"] == reads["full scan"], "an open generation's rows are invisible")
+        check(reads["dropped generation"] == reads["full scan"], "a dropped generation leaves nothing behind")
+        incremental = reads["incremental scan"]
+        check(sorted(m["path"] for m in incremental["metrics"]) == ["app/a.py", "app/c.py", "app/d.py"],
+              "an incremental scan replaces, removes and adds only its stale paths")
+        check(next(m for m in incremental["metrics"] if m["path"] == "app/a.py")["loc"] == 130,
+              "changed paths read their new rows")
+        check(incremental["suggestions"]["app/b.py"] is None and incremental["suggestions"]["app/d.py"] is not None,
+              "suggestions follow the paths")
+        check(reads["sweep after the incremental scan"] == incremental, "a sweep leaves the current rows alone")
+        check(sorted(m["path"] for m in reads["removal scan and sweep"]["metrics"]) == ["app/a.py", "app/d.py"],
+              "a scan writing no rows still removes its stale paths")
+        check({k: v for k, v in reads["full rescan and sweep"].items() if k != "generation"}
+              == {k: v for k, v in reads["full scan"].items() if k != "generation"},
+              "a full rescan replaces every path")
+        check(reads["full rescan and sweep"]["generation"] == 4, "every commit opens the next generation")
+    finally:
+        await sqlite.close()
+        shutil.rmtree(root, ignore_errors=True)
+
+    print(f"\n{'All checks passed' if not failures else f'{failures} checks failed'}")
+    return failures
+
+
+if __name__ == "__main__":
+    sys.exit(1 if asyncio.run(test()) else 0)
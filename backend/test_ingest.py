@@ -0,0 +1,165 @@
+"""Test repository ingestion: worktree, sparse and objects modes against a local bare repo"""
+import asyncio
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, '.')
+
+FILES = {
+    "app/main.py": "import os\n\n\ndef main(argv):\n    if argv:\n        for a in argv:\n            if a.startswith('-'):\n                print(a)\n    return 0\n",
+    "app/util_helpers.py": "def add(a, b):\n    return a + b\n\n\ndef sub(a, b):\n    try:\n        return a - b\n    except Exception:\n        pass\n",
+    "web/index.js": "function greet(name) {\n  if (name) {\n    console.log('hi ' + name)\n  }\n  return eval(name)\n}\n",
+    "README.md": "# demo\n",
+    "assets/logo.txt": "not analyzed\n",
+}
+
+
+def git(cwd, *args):
+    return subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True, text=True).stdout.strip()
+
+
+def make_repo(root: Path) -> tuple:
+    """A bare repo served over file:// and a work clone pushing to it."""
+    bare, work = root / "origin.git", root / "work"
+    git(root, "init", "-q", "--bare", "-b", "main", str(bare))
+    git(root, "clone", "-q", str(bare), str(work))
+    git(work, "config", "user.email", "test@example.com")
+    git(work, "config", "user.name", "test")
+    for path, content in FILES.items():
+        (work / path).parent.mkdir(parents=True, exist_ok=True)
+        (work / path).write_text(content)
+    git(work, "add", "-A")
+    git(work, "commit", "-qm", "initial")
+    git(work, "push", "-q", "origin", "HEAD:main")
+    return f"file://{bare}", work
+
+
+def push_changes(work: Path) -> None:
+    """Modify, add, delete and rename supported files."""
+    (work / "app/main.py").write_text(FILES["app/main.py"] + "\n\ndef extra(x):\n    return x * 2\n")
+    (work / "app/new_module.py").write_text("def fresh():\n    return eval('1')\n")
+    git(work, "rm", "-q", "web/index.js")
+    git(work, "mv", "app/util_helpers.py", "app/helpers.py")
+    git(work, "add", "-A")
+    git(work, "commit", "-qm", "changes")
+    git(work, "push", "-q", "origin", "HEAD:main")
+
+
+def by_path(rows: list) -> dict:
+    return {r["path"]: r for r in rows}
+
+
+def smell_keys(rows: list) -> set:
+    return {(s["path"], s["type"], s["line"]) for s in rows}
+
+
+async def test():
+    from services.repo_analyzer import RepoAnalyzer
+    from services.similarity_index import SimilarityIndex
+    from services.source_reader import SourceReader
+
+    root = Path(tempfile.mkdtemp(prefix="ingest_test_"))
+    url, work = make_repo(root)
+    analyzer = RepoAnalyzer()
+    failures = 0
+
+    def check(ok: bool, message: str) -> None:
+        nonlocal failures
+        print(f"  {'ok' if ok else 'FAIL'}: {message}")
+        failures += not ok
+
+    full = {}
+    for mode in RepoAnalyzer.INGEST_MODES:
+        print(f"\nFull scan ({mode})")
+        results = await analyzer.analyze_github_repo(url, mode, project_id="p1")
+        check(not results.get("error"), f"no error ({results.get('error')})")
+        check(results["ingest_mode"] == mode, f"ingest mode is {results['ingest_mode']}")
+        check(results["commit_sha"] == git(work, "rev-parse", "HEAD"), "analyzed the remote HEAD")
+        paths = set(by_path(results["metrics"]))
+        check(paths == {"app/main.py", "app/util_helpers.py", "web/index.js"}, f"supported files only: {sorted(paths)}")
+        full[mode] = results
+
+    worktree = full["worktree"]
+    for mode in ("sparse", "objects"):
+        check(by_path(full[mode]["metrics"]) == by_path(worktree["metrics"]), f"{mode} metrics match worktree")
+        check(smell_keys(full[mode]["smells"]) == smell_keys(worktree["smells"]), f"{mode} smells match worktree")
+
+    base_sha = worktree["commit_sha"]
+    push_changes(work)
+    head_sha = git(work, "rev-parse", "HEAD")
+
+    for mode in RepoAnalyzer.INGEST_MODES:
+        print(f"\nIncremental scan ({mode})")
+        results = await analyzer.analyze_incremental(url, base_sha, mode, project_id="p1")
+        check(results is not None, "incremental scan possible")
+        if results is None:
+            continue
+        check(results["commit_sha"] == head_sha, "analyzed the new HEAD")
+        vectors = SimilarityIndex.load(analyzer.vector_index_path({"_id": "p1", "local_path": results["local_path"]}))
+        check(vectors is not None and vectors.commit == head_sha, "project's vectors moved to the new HEAD")
+        check(sorted(results["changed"]) == ["app/helpers.py", "app/main.py", "app/new_module.py"],
+              f"changed: {sorted(results['changed'])}")
+        check(sorted(results["stale"]) == ["app/helpers.py", "app/main.py", "app/new_module.py",
+                                           "app/util_helpers.py", "web/index.js"],
+              f"stale: {sorted(results['stale'])}")
+        check(set(by_path(results["metrics"])) == set(results["changed"]), "metrics of the changed files only")
+
+        rescanned = await analyzer.analyze_github_repo(url, mode)
+        fresh = by_path(rescanned["metrics"])
+        check(all(fresh[p] == m for p, m in by_path(results["metrics"]).items()),
+              "changed files analyze the same as in a full scan")
+
+        # A project still at base_sha reads base_sha, not what is checked out in the shared mirror
+        reader = SourceReader()
+        project = {"local_path": results["local_path"], "ingest_mode": mode, "last_commit": base_sha}
+        try:
+            sources = {s.path: s.text for s in analyzer.read_project_sources(project, reader)}
+        finally:
+            reader.close()
+        check(sources == {p: FILES[p] for p in ("app/main.py", "app/util_helpers.py", "web/index.js")},
+              f"project sources are those of its last commit: {sorted(sources)}")
+
+    # Two projects of one URL share its mirror; their scans must take turns in it
+    shared = root / "shared"
+    shared.mkdir()
+    shared_url, shared_work = make_repo(shared)
+    for mode in RepoAnalyzer.INGEST_MODES:
+        print(f"\nConcurrent scans of one URL ({mode})")
+        first, second = await asyncio.gather(analyzer.analyze_github_repo(shared_url, mode, project_id="pa"),
+                                             analyzer.analyze_github_repo(shared_url, mode, project_id="pb"))
+        check(not first.get("error") and not second.get("error"),
+              f"both full scans succeed ({first.get('error')}, {second.get('error')})")
+        check(by_path(first["metrics"]) == by_path(second["metrics"]), "both full scans see the same files")
+    base_sha = git(shared_work, "rev-parse", "HEAD")
+    push_changes(shared_work)
+    for mode in RepoAnalyzer.INGEST_MODES:
+        print(f"\nConcurrent incremental and full scans of one URL ({mode})")
+        incremental, rescan = await asyncio.gather(
+            analyzer.analyze_incremental(shared_url, base_sha, mode, project_id="pa"),
+            analyzer.analyze_github_repo(shared_url, mode, project_id="pb"))
+        check(not rescan.get("error"), f"the full scan succeeds ({rescan.get('error')})")
+        check(incremental is not None and incremental["commit_sha"] == rescan["commit_sha"],
+              "the incremental scan reached the same commit")
+        if incremental is not None:
+            fresh = by_path(rescan["metrics"])
+            check(all(fresh[p] == m for p, m in by_path(incremental["metrics"]).items()),
+                  "changed files analyze the same in both scans")
+
+    print(f"\n{'All checks passed' if not failures else f'{failures} checks failed'}")
+    shutil.rmtree(root, ignore_errors=True)
+    return failures
+
+
+if __name__ == "__main__":
+    # Mirrors go into a directory of their own, not the shared mirror directory
+    mirrors = tempfile.mkdtemp(prefix="ingest_mirrors_")
+    os.environ["REPO_MIRROR_DIR"] = mirrors
+    try:
+        failed = asyncio.run(test())
+    finally:
+        shutil.rmtree(mirrors, ignore_errors=True)
+    sys.exit(1 if failed else 0)
@@ -1,6 +1,6 @@
 import React, { useState, useEffect, useMemo } from 'react'
 import { motion } from 'framer-motion'
-import { getSuggestions, getSmells } from '../services/api'
+import { getSuggestions, getSmells, fileId } from '../services/api'
 import { GlassCard, GradientButton, RiskBadge, Loader } from '../components/ui'
 import { BarChart, Bar, XAxis, YAxis, Tooltip, ResponsiveContainer } from 'recharts'
 
@@ -56,9 +56,7 @@ export default function FileDetail({ file, onBack, projectId }) {
       
       setLoadingSuggestions(true)
       try {
-        // Encode the path for the API (replace / and \ with _)
-        const encodedPath = (file.path || '').replace(/[\/\\]/g, '_')
-        const data = await getSuggestions(projectId, encodedPath, 5)
+        const data = await getSuggestions(projectId, fileId((file.path || '').replace(/\\/g, '/')), 5)
         setSuggestions(data.suggestions || [])
       } catch (err) {
         console.error('Failed to load suggestions:', err)
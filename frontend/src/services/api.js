@@ -77,6 +77,13 @@ export async function startScan(projectId) {
   return res.json();
 }
 
+// Stable id of a file path, as the backend keys suggestions: URL-safe base64 of its UTF-8 bytes
+export function fileId(path) {
+  let binary = '';
+  new TextEncoder().encode(path).forEach(b => { binary += String.fromCharCode(b); });
+  return btoa(binary).replace(/\+/g, '-').replace(/\//g, '_').replace(/=+$/, '');
+}
+
 export async function getSuggestions(projectId, fileId, limit = 5) {
   const url = new URL(`${BASE_URL}/suggestions/${projectId}/${fileId}`);
   if (limit) url.searchParams.set('limit', String(limit));